@@ -0,0 +1,89 @@
+"""
+Benchmark for root.helpers.datetime_parser over the smart-note corpus.
+
+Run from the api/ directory:
+
+    python -m benchmarks.bench_datetime_parser [--rounds N]
+
+Reports the share of phrases served by the fast path and per-call latency
+for the layered parser (cold and warm cache) against calling dateparser's
+search_dates directly for every phrase.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+import pytz
+
+from root.helpers import datetime_parser
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "smartnote_phrases.txt")
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def timed(fn, phrases, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for phrase in phrases:
+            fn(phrase)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(phrases)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    phrases = load_corpus()
+    tz = pytz.timezone("America/New_York")
+    now = datetime.now(tz)
+
+    fast_hits = 0
+    for phrase in phrases:
+        result = datetime_parser.fast_parse(datetime_parser.normalize(phrase), now, tz, date_order="DMY")
+        if result is not None:
+            fast_hits += 1
+
+    from dateparser.search import search_dates
+
+    def baseline(phrase):
+        search_dates(
+            phrase,
+            settings={
+                "PREFER_DATES_FROM": "future",
+                "RELATIVE_BASE": now,
+                "TIMEZONE": "America/New_York",
+                "TO_TIMEZONE": "America/New_York",
+                "RETURN_AS_TIMEZONE_AWARE": True,
+                "DATE_ORDER": "DMY",
+            },
+        )
+
+    def layered(phrase):
+        datetime_parser.extract_datetime(phrase, now)
+
+    datetime_parser._search_cache.clear()
+    cold = timed(layered, phrases, 1)
+    warm = timed(layered, phrases, args.rounds)
+    base = timed(baseline, phrases, args.rounds)
+
+    print(f"phrases:              {len(phrases)}")
+    print(f"fast-path coverage:   {fast_hits}/{len(phrases)} ({fast_hits / len(phrases):.0%})")
+    print(f"search_dates only:    {base:10.1f} us/phrase")
+    print(f"layered (cold cache): {cold:10.1f} us/phrase")
+    print(f"layered (warm cache): {warm:10.1f} us/phrase")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark for root.planner.merge on a synthetic planner week.
+
+Run from the api/ directory:
+
+    python -m benchmarks.bench_planner_merge [--events N] [--accounts N] [--rounds N]
+
+Builds N events spread over Google, Outlook and Dockly accounts (with a
+share of Google copies of Dockly items, so dedup has work to do) and
+compares the per-request merge step - member colors, dedup, email filter,
+sort - before and after the merge module.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from root.planner.merge import DEFAULT_DOCKLY_COLOR, MemberIndex, merge_events
+
+PROVIDERS = ["google", "outlook", "dockly"]
+
+
+def synthetic(n_events, n_accounts, seed=7):
+    rng = random.Random(seed)
+    members = [
+        {"user_id": f"u{i}", "email": f"member{i}@example.com", "color": f"#00{i:02d}FF"}
+        for i in range(n_accounts)
+    ]
+    base = datetime(2026, 1, 5, tzinfo=timezone.utc)
+    titles = [f"Event {i}" for i in range(n_events // 4)]
+
+    events = []
+    for i in range(n_events):
+        member = members[i % n_accounts]
+        provider = PROVIDERS[i % len(PROVIDERS)]
+        start = base + timedelta(minutes=15 * rng.randrange(7 * 96))
+        if provider == "dockly" or rng.random() < 0.2:
+            start_info = {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        else:
+            start_info = {"dateTime": start.isoformat()}
+        events.append(
+            {
+                "id": f"ev{i}",
+                "summary": rng.choice(titles),
+                "start": start_info,
+                "source_email": member["email"],
+                "provider": provider,
+                "user_id": member["user_id"],
+            }
+        )
+    return members, events
+
+
+def legacy(events, family_members, filtered_emails):
+    for e in events:
+        e["account_color"] = next(
+            (
+                fm.get("color")
+                for fm in family_members
+                if fm.get("user_id") == e["user_id"]
+                or (fm.get("email") or "").lower() == (e["source_email"] or "").lower()
+            ),
+            DEFAULT_DOCKLY_COLOR,
+        )
+
+    dockly_event_keys = set()
+    for e in events:
+        if e.get("provider") == "dockly":
+            dockly_event_keys.add(
+                (
+                    e.get("source_email", "").lower().strip(),
+                    e.get("summary", "").lower().strip(),
+                    e.get("start", {}).get("dateTime", "").split("T")[0],
+                )
+            )
+
+    seen, unique_events = set(), []
+    for e in events:
+        key = (
+            e.get("source_email", "").lower().strip(),
+            e.get("summary", "").lower().strip(),
+            e.get("start", {}).get("dateTime", "").split("T")[0],
+        )
+        if filtered_emails and e.get("source_email") not in filtered_emails:
+            continue
+        if e.get("provider") == "google" and key in dockly_event_keys:
+            continue
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_events.append(e)
+
+    unique_events.sort(
+        key=lambda e: datetime.fromisoformat(e["start"]["dateTime"].replace("Z", "+00:00"))
+    )
+    return unique_events
+
+
+def merged(events, family_members, filtered_emails):
+    index = MemberIndex(family_members)
+    for e in events:
+        e["account_color"] = index.color_for_account(
+            e["user_id"], e["source_email"], DEFAULT_DOCKLY_COLOR
+        )
+    return merge_events(events, filtered_emails)
+
+
+def timed(fn, events, members, filtered_emails, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn(events, members, filtered_emails)
+    elapsed = time.perf_counter() - start
+    return elapsed / rounds * 1e3, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    members, events = synthetic(args.events, args.accounts)
+    filtered_emails = [m["email"] for m in members[: max(1, len(members) - 2)]]
+
+    for label, emails in (("no filter", []), ("email filter", filtered_emails)):
+        old_ms, old = timed(legacy, events, members, emails, args.rounds)
+        new_ms, new = timed(merged, events, members, emails, args.rounds)
+        assert [e["id"] for e in old] == [e["id"] for e in new]
+        print(f"{label}: {len(events)} events / {len(members)} accounts -> {len(new)} kept")
+        print(f"  legacy merge:  {old_ms:8.2f} ms/request")
+        print(f"  merge module:  {new_ms:8.2f} ms/request ({old_ms / new_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
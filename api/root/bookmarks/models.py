@@ -5,8 +5,9 @@ import uuid
 from flask import request
 from flask_restful import Resource
 import time
-from root.planner.models import add_calendar_guests
+from root.calendar_sync import enqueue_guests as queue_calendar_guests
 from root.db.dbHelper import DBHelper
+from root import family_graph
 from root.config import EMAIL_PASSWORD, EMAIL_SENDER, SMTP_PORT, SMTP_SERVER, WEB_URL
 from root.helpers.logs import AuditLogger
 from root.auth.auth import auth_required
@@ -1064,29 +1065,14 @@ class ShareItem(Resource):
 
         invalid_members = []
 
-        # ✅ Only validate the provided tagged members
+        # ✅ Only validate the provided tagged members of the caller's family
+        family_by_email = family_graph.members_by_email(uid)
         for member_email in tagged_members:
-            family_member = DBHelper.find_one(
-                "family_members",
-                filters={"email": member_email},
-                select_fields=["name", "email", "fm_user_id"]
-            )
-
+            family_member = family_by_email.get((member_email or "").lower())
             if not family_member:
                 continue
 
-            user_id = family_member.get("fm_user_id")
-            if not user_id:
-                # fallback lookup in users table
-                user_record = DBHelper.find_one(
-                    "users",
-                    filters={"email": member_email},
-                    select_fields=["uid"]
-                )
-                user_id = user_record.get("uid") if user_record else None
-
-            if not user_id:
-                continue
+            user_id = family_member["user_id"]
 
             # Check if user has any of the required permissions
             has_permission = False
@@ -1171,15 +1157,11 @@ class ShareItem(Resource):
             )
 
             # Add calendar guests if applicable (for goals and todos)
-            if item_type in ["goal", "todo"] and item_record.get("google_calendar_id") and tagged_members:
+            if item_type in ["goal", "todo"] and tagged_members:
                 try:
-                    add_calendar_guests(
-                        user_id=uid,
-                        calendar_event_id=item_record["google_calendar_id"],
-                        guest_emails=[member for member in tagged_members if "@" in member],
-                    )
+                    queue_calendar_guests(uid, item_type, item_record["id"], tagged_members)
                 except Exception as e:
-                    print(f"⚠ Failed to add calendar guests: {str(e)}")
+                    print(f"⚠ Failed to queue calendar guests: {str(e)}")
 
         except Exception as e:
             AuditLogger.log(
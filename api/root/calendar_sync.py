@@ -0,0 +1,417 @@
+"""
+Outbound calendar sync queue.
+
+Write endpoints record the push they need (create/update, delete or adding
+guests to a Google / Outlook event) in `calendar_sync_queue` after their own
+DB write and return straight away. A pool of worker threads drains the queue:
+repeated updates to the same item while a push is still pending collapse into
+one row, failures are retried with exponential backoff, and the item's
+external event id and synced_to_google / synced_to_outlook flags are written
+back once the provider call succeeds.
+
+Run `python -m root.calendar_sync` from cron to drain leftovers (e.g. after a
+restart); the web process also drains the queue in the background whenever
+something is enqueued.
+"""
+
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from root.db.dbHelper import DBHelper
+from root.utilis import (
+    add_calendar_guests,
+    create_calendar_event,
+    delete_calendar_event,
+    update_calendar_event,
+)
+
+PROVIDERS = ("google", "outlook")
+OPERATIONS = ("upsert", "delete", "guests")
+
+# item_type -> table and, per provider, (external id column, synced flag column)
+ITEMS = {
+    "goal": {
+        "table": "goals",
+        "google": ("google_calendar_id", "synced_to_google"),
+        "outlook": ("outlook_calendar_id", "synced_to_outlook"),
+    },
+    "todo": {
+        "table": "todos",
+        "google": ("google_calendar_id", "synced_to_google"),
+        "outlook": ("outlook_calendar_id", "synced_to_outlook"),
+    },
+    "event": {
+        "table": "events",
+        "google": ("calendar_event_id", "synced_to_google"),
+        "outlook": ("outlook_calendar_id", "synced_to_outlook"),
+    },
+    "task": {
+        "table": "tasks",
+        "google": ("calendar_event_id", None),
+    },
+}
+
+SYNC_WORKERS = 4
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# A row left in "processing" longer than this belongs to a dead worker
+STALE_AFTER_MINUTES = 10
+POLL_SECONDS = 30
+
+
+class SyncSkipped(Exception):
+    """The push can't ever succeed (e.g. no connected account); don't retry it."""
+
+
+def enqueue(user_id, item_type, item_id, provider, operation="upsert", payload=None):
+    """Record a pending push and wake the background workers.
+
+    While a row for the same (item, provider) is still pending the new push is
+    folded into it: a delete wins over an update, guest lists are merged and
+    the latest title / times replace the older ones.
+    """
+    if item_type not in ITEMS or provider not in ITEMS[item_type]:
+        raise ValueError(f"Unsupported calendar sync target: {item_type}/{provider}")
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unsupported calendar sync operation: {operation}")
+
+    rows = DBHelper.execute_query(
+        """
+        INSERT INTO calendar_sync_queue (
+            user_id, item_type, item_id, provider, operation, payload,
+            status, attempts, next_attempt_at, created_at, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s::jsonb, 'pending', 0, NOW(), NOW(), NOW())
+        ON CONFLICT (item_type, item_id, provider) WHERE status = 'pending'
+        DO UPDATE SET
+            operation = CASE
+                WHEN EXCLUDED.operation = 'guests' THEN calendar_sync_queue.operation
+                ELSE EXCLUDED.operation
+            END,
+            payload = calendar_sync_queue.payload || EXCLUDED.payload || jsonb_build_object(
+                'guest_emails',
+                (
+                    SELECT COALESCE(jsonb_agg(DISTINCT guest), '[]'::jsonb)
+                    FROM jsonb_array_elements_text(
+                        COALESCE(calendar_sync_queue.payload -> 'guest_emails', '[]'::jsonb)
+                        || COALESCE(EXCLUDED.payload -> 'guest_emails', '[]'::jsonb)
+                    ) AS guest
+                )
+            ),
+            attempts = 0,
+            next_attempt_at = NOW(),
+            last_error = NULL,
+            updated_at = NOW()
+        RETURNING id
+        """,
+        (
+            user_id,
+            item_type,
+            str(item_id),
+            provider,
+            operation,
+            json.dumps(payload or {}, default=str),
+        ),
+    )
+    wake()
+    return rows[0]["id"] if rows else None
+
+
+def enqueue_upsert(user_id, item_type, item_id, title, start_dt, end_dt=None, providers=("google",)):
+    """Queue a create-or-update of the item's event for each provider."""
+    payload = {
+        "title": title,
+        "start": start_dt.isoformat(),
+        "end": end_dt.isoformat() if end_dt else None,
+    }
+    return [
+        enqueue(user_id, item_type, item_id, provider, "upsert", payload)
+        for provider in providers
+    ]
+
+
+def enqueue_delete(user_id, item_type, item_id, external_ids):
+    """Queue removal of the item's events; `external_ids` maps provider -> event id."""
+    return [
+        enqueue(user_id, item_type, item_id, provider, "delete", {"external_id": external_id})
+        for provider, external_id in external_ids.items()
+        if external_id
+    ]
+
+
+def _has_google_event(item_type, item_id):
+    """Whether the item has a Google event, or one is on its way."""
+    item = ITEMS[item_type]
+    id_column, flag_column = item["google"]
+    synced = f"s.{id_column} IS NOT NULL" + (f" OR s.{flag_column}" if flag_column else "")
+    rows = DBHelper.raw_sql(
+        f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {item["table"]} s WHERE s.id::text = %s AND ({synced})
+        ) OR EXISTS (
+            SELECT 1 FROM calendar_sync_queue q
+            WHERE q.item_type = %s AND q.item_id = %s AND q.provider = 'google'
+              AND q.operation = 'upsert' AND q.status IN ('pending', 'processing')
+        ) AS has_event
+        """,
+        (str(item_id), item_type, str(item_id)),
+    )
+    return bool(rows and rows[0]["has_event"])
+
+
+def enqueue_guests(user_id, item_type, item_id, guest_emails):
+    """Queue adding guests to the item's Google event.
+
+    Does nothing when the item has no Google event and no upsert creating
+    one is queued; a pending upsert absorbs the guests.
+    """
+    guest_emails = [email for email in guest_emails or [] if email and "@" in email]
+    if not guest_emails or not _has_google_event(item_type, item_id):
+        return None
+    return enqueue(user_id, item_type, item_id, "google", "guests", {"guest_emails": guest_emails})
+
+
+# ───── Processing ─────
+
+def _claim(limit):
+    """Move up to `limit` due rows to "processing", skipping rows other
+    workers hold and items that already have a push in flight."""
+    return DBHelper.execute_query(
+        """
+        UPDATE calendar_sync_queue q SET
+            status = 'processing',
+            attempts = q.attempts + 1,
+            updated_at = NOW()
+        WHERE q.id IN (
+            SELECT c.id FROM calendar_sync_queue c
+            WHERE (
+                (c.status = 'pending' AND c.next_attempt_at <= NOW())
+                OR (c.status = 'processing'
+                    AND c.updated_at < NOW() - make_interval(mins => %s))
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM calendar_sync_queue p
+                WHERE p.status = 'processing'
+                  AND p.id <> c.id
+                  AND p.item_type = c.item_type
+                  AND p.item_id = c.item_id
+                  AND p.provider = c.provider
+                  AND p.updated_at >= NOW() - make_interval(mins => %s)
+            )
+            ORDER BY c.next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING q.*
+        """,
+        (STALE_AFTER_MINUTES, STALE_AFTER_MINUTES, limit),
+    )
+
+
+def _parse_dt(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _outlook_token(user_id):
+    account = DBHelper.find_one(
+        "connected_accounts",
+        filters={"user_id": user_id, "provider": "outlook", "is_active": 1},
+        select_fields=["access_token"],
+    )
+    if not account:
+        raise SyncSkipped("No connected Outlook account found.")
+    return account["access_token"]
+
+
+def _push(job):
+    """Run one job against its provider; returns the item columns to write back."""
+    # Imported here: root.planner's package init pulls in planner.models, which enqueues
+    from root.planner.outlook import (
+        create_outlook_calendar_event,
+        delete_outlook_calendar_event,
+        update_outlook_calendar_event,
+    )
+
+    item = ITEMS[job["item_type"]]
+    id_column, flag_column = item[job["provider"]]
+    payload = job.get("payload") or {}
+    user_id = job["user_id"]
+
+    if job["provider"] == "google" and not DBHelper.find_one(
+        "connected_accounts", filters={"user_id": user_id}, select_fields=["id"]
+    ):
+        raise SyncSkipped("No connected Google account found.")
+
+    if job["operation"] == "delete":
+        external_id = payload.get("external_id")
+        if external_id:
+            if job["provider"] == "google":
+                if not delete_calendar_event(user_id, external_id):
+                    raise Exception(f"Failed to delete Google Calendar event {external_id}")
+            else:
+                delete_outlook_calendar_event(_outlook_token(user_id), external_id)
+        updates = {id_column: None}
+        if flag_column:
+            updates[flag_column] = False
+        return updates
+
+    # Re-read: the item may have been deleted since the push was queued
+    record = DBHelper.find_one(
+        item["table"], filters={"id": job["item_id"]}, select_fields=[id_column, "is_active"]
+    )
+    if not record or record.get("is_active") != 1:
+        raise SyncSkipped(f"{job['item_type']} {job['item_id']} no longer exists")
+    external_id = record.get(id_column)
+
+    if job["operation"] == "upsert":
+        title = payload.get("title") or ""
+        start_dt = _parse_dt(payload.get("start"))
+        end_dt = _parse_dt(payload.get("end"))
+        if job["provider"] == "google":
+            if external_id:
+                update_calendar_event(user_id, external_id, title, start_dt, end_dt)
+            else:
+                external_id = create_calendar_event(user_id, title, start_dt, end_dt)
+        else:
+            token = _outlook_token(user_id)
+            if external_id:
+                update_outlook_calendar_event(token, external_id, title, start_dt, end_dt)
+            else:
+                external_id = create_outlook_calendar_event(token, title, start_dt, end_dt)
+
+    guest_emails = payload.get("guest_emails") or []
+    if guest_emails and job["provider"] == "google":
+        if not external_id:
+            raise SyncSkipped("Item has no Google Calendar event to add guests to")
+        add_calendar_guests(user_id=user_id, calendar_event_id=external_id, guest_emails=guest_emails)
+
+    updates = {id_column: external_id}
+    if flag_column:
+        updates[flag_column] = True
+    return updates
+
+
+def _finish(job, updates):
+    item = ITEMS[job["item_type"]]
+    if updates:
+        DBHelper.update_one(item["table"], filters={"id": job["item_id"]}, updates=updates)
+    DBHelper.execute_query(
+        "UPDATE calendar_sync_queue SET status = 'done', last_error = NULL, updated_at = NOW() WHERE id = %s",
+        (job["id"],),
+    )
+
+
+def _fail(job, error, retry=True):
+    """Schedule a retry with backoff, or give up after MAX_ATTEMPTS.
+
+    A newer pending push for the same item supersedes the failed one.
+    """
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (job["attempts"] - 1), BACKOFF_MAX_SECONDS)
+    delay += random.uniform(0, delay / 2)
+    final_status = "failed" if retry else "skipped"
+
+    rows = DBHelper.execute_query(
+        """
+        UPDATE calendar_sync_queue q SET
+            status = CASE
+                WHEN EXISTS (
+                    SELECT 1 FROM calendar_sync_queue n
+                    WHERE n.status = 'pending'
+                      AND n.item_type = q.item_type
+                      AND n.item_id = q.item_id
+                      AND n.provider = q.provider
+                ) THEN 'superseded'
+                WHEN %s AND q.attempts < %s THEN 'pending'
+                ELSE %s
+            END,
+            next_attempt_at = NOW() + make_interval(secs => %s),
+            last_error = %s,
+            updated_at = NOW()
+        WHERE q.id = %s
+        RETURNING q.status
+        """,
+        (retry, MAX_ATTEMPTS, final_status, delay, str(error), job["id"]),
+    )
+
+    if rows and rows[0]["status"] == "failed":
+        flag_column = ITEMS[job["item_type"]][job["provider"]][1]
+        if flag_column and job["operation"] != "delete":
+            DBHelper.update_one(
+                ITEMS[job["item_type"]]["table"],
+                filters={"id": job["item_id"]},
+                updates={flag_column: False},
+            )
+
+
+def _run(job):
+    try:
+        _finish(job, _push(job))
+    except SyncSkipped as e:
+        _fail(job, e, retry=False)
+    except Exception as e:
+        print(f"⚠ Calendar sync {job['provider']} {job['item_type']} {job['item_id']} failed: {e}")
+        try:
+            _fail(job, e)
+        except Exception as db_error:
+            # Left in "processing"; reclaimed once it goes stale
+            print(f"⚠ Failed to record calendar sync failure: {db_error}")
+
+
+def process_pending(limit=BATCH_SIZE, max_workers=SYNC_WORKERS):
+    """Claim one batch of due pushes and run them concurrently; returns the batch size."""
+    jobs = _claim(limit)
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_run, jobs))
+    return len(jobs)
+
+
+def drain(max_workers=SYNC_WORKERS):
+    """Process batches until nothing is due; returns the number of jobs run."""
+    total = 0
+    while True:
+        processed = process_pending(max_workers=max_workers)
+        if not processed:
+            return total
+        total += processed
+
+
+# ───── Background worker ─────
+
+_wake_event = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _worker_loop():
+    while True:
+        _wake_event.clear()
+        try:
+            drain()
+        except Exception as e:
+            print(f"⚠ Calendar sync worker error: {e}")
+        # Sleep until the next enqueue, or poll for retries coming due
+        _wake_event.wait(POLL_SECONDS)
+
+
+def wake():
+    """Start the background worker on first use and nudge it to drain now."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="calendar-sync", daemon=True)
+            _worker.start()
+    _wake_event.set()
+
+
+if __name__ == "__main__":
+    from root.db.db import postgres
+
+    postgres.init_app()
+    print(f"Calendar sync: processed {drain()} pushes")
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv, find_dotenv
 import os
+import tempfile
 from datetime import timedelta
 import firebase_admin
 from firebase_admin import auth, credentials
@@ -28,6 +29,8 @@ G_ACCESS_EXPIRES = timedelta(minutes=50000000)
 G_REFRESH_EXPIRES = timedelta(days=30)
 G_SECRET_KEY = os.getenv("G_SECRET_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
+# base64 of 32 random bytes; wraps the per-user keys of encrypted columns
+FIELD_ENCRYPTION_KEY = os.getenv("FIELD_ENCRYPTION_KEY")
 SEND_GRID_EMAIL = os.getenv("SEND_GRID_EMAIL")
 
 AUTH_ENDPOINT = os.getenv("QUILTT_API_SECRET_KEY")
@@ -42,6 +45,10 @@ API_URL = os.getenv("API_URL", "http://localhost:5000/server/api")
 print(f"API_URL: {API_URL}")
 WEB_URL = os.getenv("WEB_URL", "http://localhost:3000")
 print(f"WEB_URL: {WEB_URL}")
+
+# Normalized file thumbnails (root.files.thumbnails)
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dockly-thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES") or 2 * 1024 * 1024 * 1024)
 uri = "https://oauth2.googleapis.com/token"
 
 SCOPE = (
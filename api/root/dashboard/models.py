@@ -4,6 +4,7 @@ import traceback
 from flask import request
 from flask_restful import Resource
 from root.common import Status
+from root.files import uploads
 from root.files.models import DriveBaseResource
 from root.utilis import ensure_drive_folder_structure
 from root.db.dbHelper import DBHelper
@@ -267,8 +268,7 @@ class RemoveConnectedAccount(Resource):
             return {"status": 0, "message": "Failed to disconnect account"}, 500
 
     
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
-import io
+from googleapiclient.http import MediaIoBaseDownload
 from werkzeug.utils import secure_filename
 
 class UploadDocklyRootFile(DriveBaseResource):
@@ -314,10 +314,7 @@ class UploadDocklyRootFile(DriveBaseResource):
                 "parents": [dockly_root_id],
             }
 
-            media = MediaIoBaseUpload(
-                io.BytesIO(file.read()),
-                mimetype=file.content_type or "application/octet-stream",
-            )
+            media = uploads.drive_media(file)
 
             uploaded = (
                 service.files()
@@ -17,7 +17,7 @@ class PostgreSQL:
         """Initialize the PostgreSQL connection pool."""
         if not self.connection_pool:
             try:
-                self.connection_pool = psycopg2.pool.SimpleConnectionPool(
+                self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
                     minconn=1, maxconn=10, dsn=self.dsn
                 )
                 print(f"✅ Connection pool created for: {self.dsn}")
@@ -91,6 +91,11 @@ def init_tables_from_json():
                     sql.SQL(", ").join(sql.SQL(col) for col in columns),
                 )
                 cur.execute(create_query)
+
+                # Idempotent follow-ups (ADD COLUMN IF NOT EXISTS, CREATE INDEX
+                # IF NOT EXISTS, ...) so existing databases pick up schema changes
+                for statement in table.get("migrations", []):
+                    cur.execute(statement)
                 created.append(table_name)
             except Exception as table_err:
                 errors.append({table_name: str(table_err)})
@@ -1,4 +1,5 @@
 import json
+from contextlib import contextmanager
 from root.db.db import postgres  # Import your PostgreSQL connection
 from psycopg2.extras import RealDictCursor
 from psycopg2 import sql
@@ -703,6 +704,59 @@ class DBHelper:
             if conn:
                 postgres.release_connection(conn)
 
+    @staticmethod
+    def execute_query(query, params=None):
+        """Run a raw statement and commit; returns the result rows when the
+        statement produces any (e.g. SELECT or ... RETURNING), else []."""
+        conn = None
+        cur = None
+        try:
+            conn = postgres.get_connection()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+
+            if params:
+                cur.execute(query, params)
+            else:
+                cur.execute(query)
+
+            rows = cur.fetchall() if cur.description else []
+            conn.commit()
+            return rows
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            raise e
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                postgres.release_connection(conn)
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """Cursor for several statements that must commit together.
+
+        Commits when the block exits normally, rolls back if it raises.
+        """
+        conn = None
+        cur = None
+        try:
+            conn = postgres.get_connection()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            yield cur
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            raise e
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                postgres.release_connection(conn)
+
     @staticmethod
     def find_with_or_and_array_match(
         table_name, select_fields, uid, array_field, filters=None, or_field="user_id"
@@ -0,0 +1,299 @@
+"""
+Cached Drive folder map.
+
+Hub files live under DOCKLY/<Hub>[/<Subfolder>] in each user's Drive.
+Finding those folders used to take one Drive search and one `files_index`
+lookup per level on every hub listing or upload (and once per family
+member's account in GetHubFiles). `drive_folder_map` remembers, per storage
+account, the Drive id and `files_index` id of each folder by parent and
+name:
+
+- entries verified within VERIFY_AFTER are used without asking Drive,
+  unless the catalog has since seen the folder trashed or removed;
+- older entries are re-checked with one search covering every requested
+  folder under the same parent; a trashed folder is not found by it and is
+  treated as missing;
+- missing folders are created by whichever request claims them in
+  `drive_folder_claims` (one row per account, parent and name), so
+  concurrent first requests don't create duplicate DOCKLY folders; the
+  others wait for the claimant to store them. No DB transaction or lock is
+  held while Drive is called;
+- a caller whose Drive request returns 404 for a cached folder calls
+  `forget` and resolves with `refresh=True`.
+"""
+
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+
+from root.db.dbHelper import DBHelper
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+ROOT_PARENT = "root"
+ROOT_NAME = "DOCKLY"
+HUB_FOLDERS = ["Home", "Family", "Finance", "Health", "Planner"]
+
+VERIFY_AFTER = timedelta(hours=6)
+# A claim older than this belongs to a request that died
+CLAIM_SECONDS = 60
+CLAIM_POLL_SECONDS = 0.5
+
+_FOLDER_FIELDS = "id, name, modifiedTime, webViewLink"
+
+
+def is_not_found(error):
+    return isinstance(error, HttpError) and getattr(error.resp, "status", None) == 404
+
+
+def _quote(value):
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def search(service, parent_id, names):
+    """name -> Drive folder for the `names` directly under `parent_id`.
+
+    One request for all of them; if a name exists more than once, the oldest
+    folder wins so every caller settles on the same one.
+    """
+    names_query = " or ".join(f"name = '{_quote(n)}'" for n in names)
+    response = service.files().list(
+        q=(
+            f"mimeType = '{FOLDER_MIME_TYPE}' and trashed = false "
+            f"and '{parent_id}' in parents and ({names_query})"
+        ),
+        orderBy="createdTime",
+        pageSize=100,
+        fields=f"files({_FOLDER_FIELDS})",
+    ).execute()
+    found = {}
+    for folder in response.get("files", []):
+        found.setdefault(folder["name"], folder)
+    return found
+
+
+def find_or_create(service, name, parent_id=ROOT_PARENT):
+    """Drive folder `name` under `parent_id`, created if missing. Not cached."""
+    folder = search(service, parent_id, [name]).get(name)
+    if folder:
+        return folder
+    return service.files().create(
+        body={"name": name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent_id]},
+        fields=_FOLDER_FIELDS,
+    ).execute()
+
+
+def _cached(account, parent_id, names):
+    rows = DBHelper.raw_sql(
+        """
+        SELECT m.name, m.google_id, m.db_id, m.verified_at,
+               EXISTS (
+                   SELECT 1 FROM files_index f
+                   WHERE f.storage_account_id::text = m.storage_account_id
+                     AND f.external_file_id = m.google_id
+                     AND (f.is_trashed OR f.removed_at IS NOT NULL)
+               ) AS gone
+        FROM drive_folder_map m
+        WHERE m.storage_account_id = %s AND m.parent_id = %s AND m.name = ANY(%s)
+        """,
+        (account, parent_id, names),
+    )
+    return {r["name"]: r for r in rows}
+
+
+def _index_folder(cur, user_id, account, folder, parent_db_id):
+    """files_index id of `folder`, inserting its row the first time."""
+    cur.execute(
+        "SELECT id FROM files_index WHERE external_file_id = %s AND user_id = %s LIMIT 1",
+        (folder["id"], user_id),
+    )
+    row = cur.fetchone()
+    if row:
+        return str(row["id"])
+
+    db_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    cur.execute(
+        """
+        INSERT INTO files_index (
+            id, user_id, storage_account_id, file_path, file_name, file_size, file_type,
+            mime_type, is_folder, parent_folder_id, external_file_id, last_modified,
+            created_at, indexed_at
+        )
+        VALUES (%s, %s, %s, %s, %s, 0, 'folder', %s, TRUE, %s, %s, %s, %s, %s)
+        """,
+        (
+            db_id,
+            user_id,
+            account,
+            folder.get("webViewLink") or folder["name"],
+            folder["name"],
+            FOLDER_MIME_TYPE,
+            parent_db_id,
+            folder["id"],
+            folder.get("modifiedTime") or now,
+            now,
+            now,
+        ),
+    )
+    return db_id
+
+
+def _claim(account, parent_id, names):
+    """The `names` this request may create; the rest are being created elsewhere."""
+    rows = DBHelper.execute_query(
+        """
+        INSERT INTO drive_folder_claims (storage_account_id, parent_id, name)
+        SELECT %s, %s, unnest(%s::text[])
+        ON CONFLICT (storage_account_id, parent_id, name) DO UPDATE SET claimed_at = NOW()
+        WHERE drive_folder_claims.claimed_at < NOW() - make_interval(secs => %s)
+        RETURNING name
+        """,
+        (account, parent_id, names, CLAIM_SECONDS),
+    )
+    return [r["name"] for r in rows or []]
+
+
+def _release(account, parent_id, names):
+    DBHelper.execute_query(
+        """
+        DELETE FROM drive_folder_claims
+        WHERE storage_account_id = %s AND parent_id = %s AND name = ANY(%s)
+        """,
+        (account, parent_id, names),
+    )
+
+
+def _fresh(row, now):
+    return not row["gone"] and row["verified_at"] and now - row["verified_at"] < VERIFY_AFTER
+
+
+def _store(cur, account, parent_id, name, google_id, db_id):
+    cur.execute(
+        """
+        INSERT INTO drive_folder_map (storage_account_id, parent_id, name, google_id, db_id)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (storage_account_id, parent_id, name) DO UPDATE SET
+            google_id = EXCLUDED.google_id,
+            db_id = EXCLUDED.db_id,
+            verified_at = NOW()
+        """,
+        (account, parent_id, name, google_id, db_id),
+    )
+
+
+def resolve(service, user_id, account, parent_id, names, parent_db_id=None, refresh=False):
+    """name -> (Drive id, files_index id) of folders `names` under `parent_id`.
+
+    Makes no Drive request when every entry is fresh, one search when some
+    need verifying, and creates what is missing once claimed. Drive is never
+    called while a DB transaction is open.
+    """
+    account = str(account)
+    names = list(dict.fromkeys(names))
+    cached = {} if refresh else _cached(account, parent_id, names)
+    now = datetime.utcnow()
+
+    result = {
+        name: (row["google_id"], row["db_id"])
+        for name, row in cached.items()
+        if _fresh(row, now)
+    }
+    stale = [n for n in names if n not in result]
+    if not stale:
+        return result
+
+    # The search skips trashed folders, so a trashed cached one is missing
+    found = search(service, parent_id, stale)
+    confirmed = [
+        n for n in stale if n in cached and n in found and found[n]["id"] == cached[n]["google_id"]
+    ]
+    if confirmed:
+        DBHelper.execute_query(
+            """
+            UPDATE drive_folder_map SET verified_at = NOW()
+            WHERE storage_account_id = %s AND parent_id = %s AND name = ANY(%s)
+            """,
+            (account, parent_id, confirmed),
+        )
+        result.update((n, (cached[n]["google_id"], cached[n]["db_id"])) for n in confirmed)
+
+    missing = [n for n in stale if n not in result]
+    deadline = time.monotonic() + 2 * CLAIM_SECONDS
+    while missing:
+        claimed = _claim(account, parent_id, missing)
+        if claimed:
+            try:
+                # A claimant before us may have created some already
+                found = search(service, parent_id, claimed)
+                folders = {
+                    name: found.get(name) or service.files().create(
+                        body={"name": name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent_id]},
+                        fields=_FOLDER_FIELDS,
+                    ).execute()
+                    for name in claimed
+                }
+                with DBHelper.transaction() as cur:
+                    for name, folder in folders.items():
+                        db_id = _index_folder(cur, user_id, account, folder, parent_db_id)
+                        _store(cur, account, parent_id, name, folder["id"], db_id)
+                        result[name] = (folder["id"], db_id)
+            finally:
+                _release(account, parent_id, claimed)
+
+        waiting = [n for n in missing if n not in result]
+        if waiting:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Timed out waiting for Drive folders to be created")
+            time.sleep(CLAIM_POLL_SECONDS)
+            now = datetime.utcnow()
+            result.update(
+                (name, (row["google_id"], row["db_id"]))
+                for name, row in _cached(account, parent_id, waiting).items()
+                if _fresh(row, now)
+            )
+        missing = [n for n in waiting if n not in result]
+    return result
+
+
+def ensure_structure(service, user_id, account, root_name=ROOT_NAME, subfolders=None, refresh=False):
+    """DOCKLY root and hub folders of `account` in the shape callers expect."""
+    subfolders = HUB_FOLDERS if subfolders is None else subfolders
+    root_id, root_db_id = resolve(
+        service, user_id, account, ROOT_PARENT, [root_name], refresh=refresh
+    )[root_name]
+    folders = resolve(
+        service, user_id, account, root_id, subfolders, parent_db_id=root_db_id, refresh=refresh
+    ) if subfolders else {}
+    return {
+        "root": root_id,
+        "root_db": root_db_id,
+        "subfolders": {name: ids[0] for name, ids in folders.items()},
+        "subfolders_db": {name: ids[1] for name, ids in folders.items()},
+    }
+
+
+def subfolder(service, user_id, account, name, parent_google_id, parent_db_id=None, refresh=False):
+    google_id, db_id = resolve(
+        service, user_id, account, parent_google_id, [name], parent_db_id=parent_db_id, refresh=refresh
+    )[name]
+    return {"google_id": google_id, "db_id": db_id}
+
+
+def forget(account, google_id=None):
+    """Drop cached folders of `account`: the one with `google_id` and its
+    children, or all of them."""
+    if google_id is None:
+        DBHelper.execute_query(
+            "DELETE FROM drive_folder_map WHERE storage_account_id = %s",
+            (str(account),),
+        )
+    else:
+        DBHelper.execute_query(
+            """
+            DELETE FROM drive_folder_map
+            WHERE storage_account_id = %s AND (google_id = %s OR parent_id = %s)
+            """,
+            (str(account), google_id, google_id),
+        )
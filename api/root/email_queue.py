@@ -0,0 +1,190 @@
+"""
+Outbound email queue.
+
+Endpoints that send mail as a side effect of a write (family invites, their
+OTPs) add the message to `email_queue`, usually in the same transaction as
+the write, and return without waiting on SendGrid. A background thread
+sends queued messages; failures are retried with exponential backoff.
+
+Run `python -m root.email_queue` from cron to drain leftovers (e.g. after a
+restart); the web process also drains the queue whenever something is
+enqueued.
+"""
+
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from root.db.dbHelper import DBHelper
+
+KINDS = ("invite", "otp")
+
+SEND_WORKERS = 4
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# A row left in "processing" longer than this belongs to a dead worker
+STALE_AFTER_MINUTES = 10
+POLL_SECONDS = 60
+
+_INSERT = """
+    INSERT INTO email_queue (user_id, kind, to_email, to_name, payload)
+    VALUES (%s, %s, %s, %s, %s::jsonb)
+    RETURNING id
+"""
+
+
+def message(user_id, kind, to_email, to_name="", **payload):
+    """Row values for one queued email; `payload` is what the sender needs
+    (the rendered `html` for invites, the `otp` code for OTP mails)."""
+    if kind not in KINDS:
+        raise ValueError(f"Unsupported email kind: {kind}")
+    return (user_id, kind, to_email, to_name or "", json.dumps(payload, default=str))
+
+
+def enqueue(messages, cur=None):
+    """Queue `messages` (see `message`); returns their ids.
+
+    With `cur` the rows are written inside the caller's transaction and the
+    caller calls `wake()` after committing.
+    """
+    if cur is not None:
+        ids = []
+        for values in messages:
+            cur.execute(_INSERT, values)
+            ids.append(cur.fetchone()["id"])
+        return ids
+
+    ids = [DBHelper.execute_query(_INSERT, values)[0]["id"] for values in messages]
+    wake()
+    return ids
+
+
+# ───── Processing ─────
+
+def _claim(limit):
+    return DBHelper.execute_query(
+        """
+        UPDATE email_queue q SET
+            status = 'processing',
+            attempts = q.attempts + 1,
+            updated_at = NOW()
+        WHERE q.id IN (
+            SELECT id FROM email_queue
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+               OR (status = 'processing'
+                   AND updated_at < NOW() - make_interval(mins => %s))
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING q.*
+        """,
+        (STALE_AFTER_MINUTES, limit),
+    )
+
+
+def _send(job):
+    # Imported here: both modules import half the app
+    from root.family.models import send_invitation_email
+    from root.users.models import send_otp_email
+
+    payload = job.get("payload") or {}
+    if job["kind"] == "invite":
+        sent = send_invitation_email(job["to_email"], job["to_name"], payload.get("html", ""))
+    else:
+        sent = send_otp_email(job["to_email"], payload.get("otp"))
+    if not sent:
+        raise Exception(f"SendGrid did not accept the {job['kind']} email")
+
+
+def _finish(job):
+    DBHelper.execute_query(
+        "UPDATE email_queue SET status = 'sent', last_error = NULL, updated_at = NOW() WHERE id = %s",
+        (job["id"],),
+    )
+
+
+def _fail(job, error):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (job["attempts"] - 1), BACKOFF_MAX_SECONDS)
+    delay += random.uniform(0, delay / 2)
+    DBHelper.execute_query(
+        """
+        UPDATE email_queue SET
+            status = CASE WHEN attempts < %s THEN 'pending' ELSE 'failed' END,
+            next_attempt_at = NOW() + make_interval(secs => %s),
+            last_error = %s,
+            updated_at = NOW()
+        WHERE id = %s
+        """,
+        (MAX_ATTEMPTS, delay, str(error), job["id"]),
+    )
+
+
+def _run(job):
+    try:
+        _send(job)
+        _finish(job)
+    except Exception as e:
+        print(f"⚠ Email {job['kind']} to {job['to_email']} failed: {e}")
+        try:
+            _fail(job, e)
+        except Exception as db_error:
+            # Left in "processing"; reclaimed once it goes stale
+            print(f"⚠ Failed to record email failure: {db_error}")
+
+
+def process_pending(limit=BATCH_SIZE, max_workers=SEND_WORKERS):
+    """Claim one batch of due emails and send them concurrently; returns the batch size."""
+    jobs = _claim(limit)
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_run, jobs))
+    return len(jobs)
+
+
+def drain(max_workers=SEND_WORKERS):
+    """Process batches until nothing is due; returns the number of emails handled."""
+    total = 0
+    while True:
+        processed = process_pending(max_workers=max_workers)
+        if not processed:
+            return total
+        total += processed
+
+
+# ───── Background worker ─────
+
+_wake_event = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _worker_loop():
+    while True:
+        _wake_event.clear()
+        try:
+            drain()
+        except Exception as e:
+            print(f"⚠ Email queue worker error: {e}")
+        _wake_event.wait(POLL_SECONDS)
+
+
+def wake():
+    """Start the background worker on first use and nudge it to drain now."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="email-queue", daemon=True)
+            _worker.start()
+    _wake_event.set()
+
+
+if __name__ == "__main__":
+    from root.db.db import postgres
+
+    postgres.init_app()
+    print(f"Email queue: sent {drain()} emails")
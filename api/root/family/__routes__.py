@@ -5,6 +5,7 @@ from . import family_api
 
 family_api.add_resource(InviteFamily, "/family/invite")
 family_api.add_resource(AddFamilyMembers, "/add/family-member")
+family_api.add_resource(BulkInviteFamilyMembers, "/add/family-members/bulk")
 family_api.add_resource(AddFamilyMemberWithoutInvite, "/add/family_without_invite")
 family_api.add_resource(GetFamilyMembers, "/get/family-members")
 family_api.add_resource(GetUserFamilyGroups, "/get/user-family-groups")
@@ -32,6 +33,7 @@ family_api.add_resource(AddContacts, "/add/contacts")
 family_api.add_resource(GetContacts, "/get/contacts")
 family_api.add_resource(AddGuardianEmergencyInfo, "/add/guardian-emergency-info")
 family_api.add_resource(GetGuardianEmergencyInfo, "/get/guardian-emergency-info")
+family_api.add_resource(GetFamilyHubSummary, "/get/family-hub-summary")
 
 
 family_api.add_resource(AddProject, "/add/project")
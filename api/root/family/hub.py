@@ -0,0 +1,271 @@
+"""
+Family hub summary.
+
+The family board used to call one endpoint per section (meals, chores,
+weekly tasks, schools, activities, pets, contacts, emergency info, shared
+tasks), each resolving the family again and most of them reading every row of the family
+and dropping inactive ones in Python. Here the family is resolved once from
+the family graph and every requested section is read in a single statement,
+one `json_agg` subquery per section, filtered by owner / family and
+`is_active` in SQL.
+
+Each section can be refreshed incrementally: with `<section>_since` it
+returns only rows changed after that cursor (inactive ones included, as
+`removed_ids`, so deletions propagate) plus the `next_since` /
+`next_since_id` to send next time. The cursor is (change time, id), so rows
+sharing a timestamp are neither skipped nor repeated; `updated_at` is
+stamped in UTC by the touch_updated_at trigger on insert and update.
+Sections whose rows are never edited or soft-deleted (pets, contacts,
+emergency info, shared tasks) use their creation time as the cursor, and
+those without an id compare on time alone.
+"""
+
+from datetime import datetime, timezone
+
+from psycopg2 import sql
+
+from root.db.dbHelper import DBHelper
+from root import family_graph
+
+# scope: rows owned by anyone in the family, by the user, or by the user's
+# family groups. `changed` is the cursor column and `key` its tie-breaker;
+# `soft_delete` sections filter on is_active and report removals.
+SECTIONS = {
+    "meals": {
+        "table": "meals",
+        "scope": "family",
+        "fields": ["id", "title", "day", "details", "assigned_to", "created_at",
+                   "updated_at", "user_id", "tagged_ids", "is_active"],
+        "changed": "updated_at",
+        "key": "id",
+        "soft_delete": True,
+    },
+    "chores": {
+        "table": "chores",
+        "scope": "family",
+        "fields": ["id", "title", "schedule", "assigned_to", "completed", "created_at",
+                   "updated_at", "user_id", "tagged_ids", "is_active"],
+        "changed": "updated_at",
+        "key": "id",
+        "soft_delete": True,
+    },
+    "tasks": {
+        "table": "weekly_tasks",
+        "scope": "family",
+        "fields": ["id", "title", "schedule", "assigned_to", "completed", "created_at",
+                   "updated_at", "user_id", "tagged_ids", "is_active"],
+        "changed": "updated_at",
+        "key": "id",
+        "soft_delete": True,
+    },
+    "schools": {
+        "table": "schools",
+        "scope": "user",
+        "fields": ["id", "name", "grade_level", "student_id", "custom_fields", "links",
+                   "created_at", "updated_at", "is_active"],
+        "changed": "updated_at",
+        "key": "id",
+        "soft_delete": True,
+    },
+    "activities": {
+        "table": "activities",
+        "scope": "user",
+        "fields": ["id", "name", "schedule", "custom_fields", "links", "created_at",
+                   "updated_at", "is_active"],
+        "changed": "updated_at",
+        "key": "id",
+        "soft_delete": True,
+    },
+    "pets": {
+        "table": "pets",
+        "scope": "group",
+        "fields": ["id", "name", "species", "breed", "guardian_email", "guardian_contact",
+                   "family_group_id", "user_id", "created_at"],
+        "changed": "created_at",
+        "key": "id",
+        "soft_delete": False,
+    },
+    "contacts": {
+        "table": "contacts",
+        "scope": "user",
+        "fields": ["id", "name", "role", "phone", "added_by", "added_time"],
+        "changed": "added_time",
+        "key": "id",
+        "soft_delete": False,
+    },
+    "emergency_info": {
+        "table": "guardian_emergency_info",
+        "scope": "family",
+        "fields": ["name", "relation", "phone", "details", "user_id"],
+        "changed": "COALESCE(updated_at, added_time)",
+        "soft_delete": False,
+    },
+    "shared_tasks": {
+        "table": "sharedtasks",
+        "scope": "family",
+        "fields": ["task", "assigned_to", "due_date", "completed", "added_by", "added_time"],
+        "changed": "COALESCE(updated_at, added_time)",
+        "soft_delete": False,
+    },
+}
+
+_SCOPES = {
+    "family": "user_id = ANY(%(family)s)",
+    "user": "user_id = %(uid)s",
+    "group": "family_group_id = ANY(%(groups)s)",
+}
+
+
+def parse_since(value):
+    """Cursor from a query param as naive UTC; ValueError when malformed."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _section_query(name, spec, since):
+    conditions = [sql.SQL(_SCOPES[spec["scope"]])]
+    changed = sql.SQL(spec["changed"])
+    key = sql.SQL("{}::text").format(sql.Identifier(spec["key"])) if spec.get("key") else sql.SQL("''")
+    if since is not None:
+        conditions.append(
+            sql.SQL("({}, {}) > ({}, {})").format(
+                changed,
+                key,
+                sql.Placeholder(f"since_{name}"),
+                sql.Placeholder(f"since_id_{name}"),
+            )
+            if spec.get("key")
+            else sql.SQL("{} > {}").format(changed, sql.Placeholder(f"since_{name}"))
+        )
+    elif spec["soft_delete"]:
+        conditions.append(sql.SQL("is_active = 1"))
+
+    return sql.SQL(
+        """(
+            SELECT json_build_object(
+                'items', COALESCE(
+                    json_agg(to_jsonb(s) - '_changed' - '_key' ORDER BY s._changed, s._key),
+                    '[]'::json
+                ),
+                'next_since', MAX(s._changed),
+                'next_since_id', (array_agg(s._key ORDER BY s._changed DESC, s._key DESC))[1]
+            )
+            FROM (
+                SELECT {fields}, {changed} AS _changed, {key} AS _key FROM {table} WHERE {where}
+            ) s
+        ) AS {alias}"""
+    ).format(
+        fields=sql.SQL(", ").join(map(sql.Identifier, spec["fields"])),
+        changed=changed,
+        key=key,
+        table=sql.Identifier(spec["table"]),
+        where=sql.SQL(" AND ").join(conditions),
+        alias=sql.Identifier(name),
+    )
+
+
+def query_summary(uid, sections, since=None, groups=None, since_ids=None):
+    """Read `sections` for `uid` in one round trip.
+
+    `since` / `since_ids` map section name -> cursor time / id for
+    incremental sections; `groups` overrides the family groups pets are read
+    from (callers check the user belongs to them). Returns
+    (family member ids, {section: {"items", "next_since"}}).
+    """
+    since = since or {}
+    since_ids = since_ids or {}
+    family = family_graph.member_ids(uid)
+    params = {
+        "uid": uid,
+        "family": family,
+        "groups": list(groups) if groups else family_graph.group_ids(uid),
+    }
+    columns = []
+    for name in sections:
+        if since.get(name) is not None:
+            params[f"since_{name}"] = since[name]
+            params[f"since_id_{name}"] = since_ids.get(name) or ""
+        columns.append(_section_query(name, SECTIONS[name], since.get(name)))
+
+    row = DBHelper.raw_sql(sql.SQL("SELECT {}").format(sql.SQL(", ").join(columns)), params)[0]
+    return family, {name: row[name] for name in sections}
+
+
+def _na(value):
+    return value or "N/A"
+
+
+def contact_type(role):
+    role = (role or "").lower()
+    if "emergency" in role:
+        return "emergency"
+    if "school" in role:
+        return "school"
+    if any(r in role for r in ["doctor", "dentist", "pediatrician"]):
+        return "professional"
+    return "other"
+
+
+def _format_item(name, item):
+    """Shape a row like the per-section endpoint does."""
+    if name in ("schools", "activities"):
+        formatted = {
+            "id": item["id"],
+            "name": item["name"],
+            "customFields": item.get("custom_fields") or [],
+            "links": item.get("links") or [],
+            "createdAt": item.get("created_at") or "",
+            "updatedAt": item.get("updated_at") or "",
+        }
+        if name == "schools":
+            formatted["gradeLevel"] = item.get("grade_level") or ""
+            formatted["studentId"] = item.get("student_id") or ""
+        else:
+            formatted["schedule"] = item.get("schedule") or ""
+        return formatted
+    if name == "pets":
+        return {
+            "id": item["id"],
+            "name": item["name"],
+            "species": item["species"],
+            "breed": _na(item["breed"]),
+            "guardian_email": _na(item["guardian_email"]),
+            "guardian_contact": _na(item["guardian_contact"]),
+        }
+    if name == "contacts":
+        return {**item, "phone": _na(item["phone"]), "type": contact_type(item["role"])}
+    if name == "emergency_info":
+        return {
+            "name": item["name"],
+            "relationship": item["relation"],
+            "phone": _na(item["phone"]),
+            "details": _na(item["details"]),
+            "user_id": item["user_id"],
+        }
+    return item
+
+
+def format_section(name, section, since=None, since_id=""):
+    """Items of a section plus its cursor; with `since`, also `removed_ids`.
+
+    The cursor stays at (`since`, `since_id`) when nothing changed.
+    """
+    items, removed_ids = [], []
+    for item in section["items"]:
+        if SECTIONS[name]["soft_delete"] and item.get("is_active", 1) != 1:
+            removed_ids.append(item["id"])
+        else:
+            items.append(_format_item(name, item))
+
+    if section["next_since"]:
+        next_since, next_since_id = section["next_since"], section["next_since_id"] or ""
+    else:
+        next_since, next_since_id = (since.isoformat() if since else None), since_id or ""
+    result = {"items": items, "next_since": next_since, "next_since_id": next_since_id}
+    if since is not None:
+        result["removed_ids"] = removed_ids
+    return result
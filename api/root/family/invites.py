@@ -0,0 +1,279 @@
+"""
+Bulk family invites.
+
+Adding a household used to take one request per person, each doing its own
+lookups, id allocation, notification / member inserts and a synchronous
+SendGrid call. `invite_members` takes the whole list: every invitee is
+checked with one query, new user ids and member colors are allocated in
+bulk, the members, hub access, notifications (which feed `family_invites`
+through their trigger) and the emails to send are written in one
+transaction, and the emails go out from the email queue afterwards.
+
+Each invitee gets its own result; one invalid entry doesn't stop the rest.
+Invitees are handled like the single-invite endpoints:
+
+- `method: "Direct"` adds a member without an account (AddFamilyMemberWithoutInvite)
+- an email of an existing user sends them a family request (AddFamilyMembers)
+- any other email gets a signup invite and an OTP (AddFamilyMembers)
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from root import email_queue, family_graph
+from root.common import HubsEnum, Permissions
+from root.config import WEB_URL
+from root.db.dbHelper import DBHelper
+from root.email import generate_invitation_email
+from root.users.models import generate_otp
+from root.utilis import FAMILY_MEMBER_COLORS, uniqueId, uniqueIds
+
+MAX_INVITEES = 20
+
+DIRECT = "Direct"
+
+
+def _failed(index, invitee, message):
+    return {
+        "index": index,
+        "name": invitee.get("name", ""),
+        "email": invitee.get("email") or "",
+        "status": "failed",
+        "message": message,
+    }
+
+
+def validate_invitees(uid, user, invitees):
+    """Split `invitees` into per-index failures and the ones to process.
+
+    Returns (results, accepted) where `results` maps index -> failure and
+    `accepted` lists (index, invitee, email, existing user or None).
+    Membership and existing accounts are looked up in a single query.
+    """
+    results, candidates, seen = {}, [], set()
+    own_email = (user.get("email") or "").strip().lower()
+
+    for index, invitee in enumerate(invitees):
+        if not isinstance(invitee, dict) or not (invitee.get("name") or "").strip():
+            results[index] = _failed(index, invitee if isinstance(invitee, dict) else {}, "Missing name")
+            continue
+        email = (invitee.get("email") or "").strip().lower()
+        if invitee.get("method") != DIRECT and "@" not in email:
+            results[index] = _failed(index, invitee, "Missing or invalid email")
+            continue
+        if email and email == own_email:
+            results[index] = _failed(index, invitee, "You cannot add yourself as a family member.")
+            continue
+        if email and email in seen:
+            results[index] = _failed(index, invitee, "Duplicate email in this batch.")
+            continue
+        if email:
+            seen.add(email)
+        candidates.append((index, invitee, email))
+
+    lookup = {}
+    if seen:
+        rows = DBHelper.raw_sql(
+            """
+            SELECT i.email,
+                   EXISTS (
+                       SELECT 1 FROM family_members fm
+                       WHERE fm.user_id = %s AND LOWER(fm.email) = i.email
+                   ) AS is_member,
+                   u.uid, u.user_name
+            FROM unnest(%s::text[]) AS i(email)
+            LEFT JOIN LATERAL (
+                SELECT uid, user_name FROM users
+                WHERE LOWER(email) = i.email
+                ORDER BY uid
+                LIMIT 1
+            ) u ON TRUE
+            """,
+            (uid, sorted(seen)),
+        )
+        lookup = {r["email"]: r for r in rows}
+
+    accepted = []
+    for index, invitee, email in candidates:
+        found = lookup.get(email) if email else None
+        if found and found["is_member"]:
+            results[index] = _failed(
+                index, invitee, "Family member with this email already exists in your family hub."
+            )
+            continue
+        existing = {"uid": found["uid"], "user_name": found["user_name"]} if found and found["uid"] else None
+        accepted.append((index, invitee, email, existing))
+    return results, accepted
+
+
+def _board_ids(invitees):
+    keys = sorted({key for inv in invitees for key in (inv.get("sharedItems") or {})})
+    if not keys:
+        return {}
+    rows = DBHelper.find_in(
+        table_name="boards", select_fields=["id", "board_name"], field="board_name", values=keys
+    )
+    return {r["board_name"]: r["id"] for r in rows}
+
+
+def _add_direct(cur, uid, user, direct, boards, now):
+    """Users, mirrored family_members rows and hub access for direct adds."""
+    gids = family_graph.group_ids(uid)
+    gid = gids[0] if gids else uniqueId(digit=5, isNum=True, prefix="G")
+    new_uids = uniqueIds(len(direct), digit=5, isNum=True, prefix="USERX")
+
+    execute_values(
+        cur,
+        """
+        INSERT INTO users (uid, user_name, email, email_verified, is_active, role, created_at, updated_at)
+        VALUES %s
+        """,
+        [(new_uid, inv["name"], None, 0, 1, 0, now, now) for new_uid, (_, inv, _, _) in zip(new_uids, direct)],
+    )
+
+    members = []
+    for new_uid, (_, inv, email, _) in zip(new_uids, direct):
+        shared = ",".join((inv.get("sharedItems") or {}).keys())
+        common = (inv.get("relationship", ""), inv.get("accessCode", ""), gid, DIRECT, shared, "", uid)
+        # (name, user_id, fm_user_id, email) + common; the color is the fm_user's
+        members.append((inv["name"], uid, new_uid, email or None) + common)
+        members.append((user.get("user_name", ""), new_uid, uid, None) + common)
+
+    rows = execute_values(
+        cur,
+        """
+        INSERT INTO family_members (
+            name, user_id, fm_user_id, email, relationship, access_code,
+            family_group_id, method, shared_items, permissions, invited_by, color, created_at
+        )
+        VALUES %s
+        RETURNING id, user_id, fm_user_id
+        """,
+        [m + (m[6], m[2], FAMILY_MEMBER_COLORS, now) for m in members],
+        template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, allocate_family_color(%s, %s, %s), %s)",
+        fetch=True,
+    )
+    member_ids = {(r["user_id"], r["fm_user_id"]): r["id"] for r in rows}
+
+    access, results = [], []
+    for new_uid, (index, inv, email, _) in zip(new_uids, direct):
+        fid = member_ids[(uid, new_uid)]
+        access.extend(
+            (uid, fid, boards[key], Permissions.Read.value, now)
+            for key in (inv.get("sharedItems") or {})
+            if key in boards
+        )
+        results.append(
+            {
+                "index": index,
+                "name": inv["name"],
+                "email": email,
+                "status": "added",
+                "message": "Family member added successfully without invite",
+                "memberId": fid,
+                "userId": new_uid,
+            }
+        )
+    if access:
+        execute_values(
+            cur,
+            """
+            INSERT INTO family_hubs_access_mapping (user_id, family_member_id, hubs, permissions, created_at)
+            VALUES %s
+            """,
+            access,
+        )
+    return results
+
+
+def _send_invites(cur, uid, user, invited, boards):
+    """Notifications (family_invites rows follow via trigger) and queued emails."""
+    notifications, emails = [], []
+    for index, inv, email, existing in invited:
+        shared_ids = [boards[key] for key in (inv.get("sharedItems") or {}) if key in boards]
+        metadata = {"input_data": inv, "shared_items_ids": shared_ids, "sender_user": user}
+        if existing:
+            link = f"{WEB_URL}/{existing['user_name']}/dashboard"
+            notifications.append(
+                (
+                    uid,
+                    existing["uid"],
+                    f"You have been invited to join {user['user_name']}'s Family Hub '{existing['user_name']}'",
+                    "family_request",
+                    True,
+                    json.dumps(metadata, default=str),
+                )
+            )
+        else:
+            otp = generate_otp()
+            token = json.dumps({"otp": otp, "email": inv["email"], "fuser": uid, "role": 5})
+            link = f"{WEB_URL}/signup?invite_token={base64.urlsafe_b64encode(token.encode()).decode()}"
+            notifications.append(
+                (
+                    uid,
+                    None,
+                    f"You've been invited to join {user['user_name']}'s Family Hub",
+                    "family_invite",
+                    False,
+                    json.dumps(metadata, default=str),
+                )
+            )
+            emails.append(email_queue.message(uid, "otp", inv["email"], inv["name"], otp=otp))
+
+        html = generate_invitation_email(inv, username=user["user_name"], invite_link=link)
+        emails.append(email_queue.message(uid, "invite", inv["email"], inv["name"], html=html))
+
+    rows = execute_values(
+        cur,
+        """
+        INSERT INTO notifications (sender_id, receiver_id, message, task_type, action_required, metadata, status, hub)
+        VALUES %s
+        RETURNING id, LOWER(TRIM(metadata -> 'input_data' ->> 'email')) AS email
+        """,
+        notifications,
+        template=f"(%s, %s, %s, %s, %s, %s::jsonb, 'pending', {HubsEnum.Family.value})",
+        fetch=True,
+    )
+    notification_ids = {r["email"]: r["id"] for r in rows}
+    email_queue.enqueue(emails, cur=cur)
+
+    return [
+        {
+            "index": index,
+            "name": inv["name"],
+            "email": email,
+            "status": "invited",
+            "message": "Family member invitation sent successfully",
+            "notificationId": notification_ids.get(email),
+            "existingUser": bool(existing),
+        }
+        for index, inv, email, existing in invited
+    ]
+
+
+def invite_members(uid, user, invitees):
+    """Invite / add every entry of `invitees`; results in input order."""
+    results, accepted = validate_invitees(uid, user, invitees)
+    if accepted:
+        boards = _board_ids([inv for _, inv, _, _ in accepted])
+        direct = [a for a in accepted if a[1].get("method") == DIRECT]
+        invited = [a for a in accepted if a[1].get("method") != DIRECT]
+        now = datetime.utcnow()
+
+        with DBHelper.transaction() as cur:
+            done = []
+            if direct:
+                done += _add_direct(cur, uid, user, direct, boards, now)
+            if invited:
+                done += _send_invites(cur, uid, user, invited, boards)
+
+        results.update((r["index"], r) for r in done)
+        if invited:
+            email_queue.wake()
+        if direct:
+            family_graph.invalidate(uid)
+
+    return [results[i] for i in sorted(results)]
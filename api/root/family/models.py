@@ -1,6 +1,6 @@
 # models.py
 import base64
-from datetime import date, datetime, time, timedelta
+from datetime import date, datetime, time, timedelta, timezone
 from email.message import EmailMessage
 import json
 import re
@@ -11,18 +11,21 @@ from root.helpers.logs import AuditLogger
 import requests
 
 # from root.planner.models import create_calendar_event, update_calendar_event
+from root.files import uploads
 from root.files.models import DriveBaseResource
 from root.common import DocklyUsers, HubsEnum, Permissions, Status
 from root.utilis import (
     assign_family_member_color,
-    create_calendar_event,
-    delete_calendar_event,
     ensure_drive_folder_structure,
     get_or_create_subfolder,
     uniqueId,
-    update_calendar_event,
+)
+from root.calendar_sync import (
+    enqueue_delete as queue_calendar_delete,
+    enqueue_upsert as queue_calendar_upsert,
 )
 from root.users.models import generate_otp, send_otp_email
+from root.recurrence import rule_input_error, sync_rule_from_input
 from root.config import (
     CLIENT_ID,
     CLIENT_SECRET,
@@ -40,7 +43,13 @@ from flask import Request, request, jsonify, send_file
 from root.auth.auth import auth_required
 from flask_restful import Resource
 from flask import request, jsonify
+from psycopg2 import sql
 from root.db.dbHelper import DBHelper
+from root import family_graph, field_crypto
+from root.family import hub as family_hub
+from root.family import invites as family_invites
+from root.family import notes as family_notes
+from root.family import projects as family_projects
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 
@@ -373,22 +382,151 @@ class AddFamilyMembers(Resource):
             }, 500
 
 
+
+class BulkInviteFamilyMembers(Resource):
+    """Invite or add several family members in one request.
+
+    Body: {"invitees": [{name, email, relationship, sharedItems, method}, ...]};
+    each invitee gets its own result in `payload.results`.
+    """
+
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        try:
+            inputData = request.get_json(silent=True) or {}
+            invitees = inputData.get("invitees")
+
+            if not isinstance(invitees, list) or not invitees:
+                return {
+                    "status": 0,
+                    "message": "No invitees provided",
+                    "payload": {},
+                }, 400
+
+            if len(invitees) > family_invites.MAX_INVITEES:
+                return {
+                    "status": 0,
+                    "message": f"At most {family_invites.MAX_INVITEES} invitees per request",
+                    "payload": {},
+                }, 400
+
+            # ✅ Only PaidMembers can send family invites
+            if user["role"] == DocklyUsers.Guests.value:
+                AuditLogger.log(
+                    user_id=uid,
+                    action="bulk_invite_family_members",
+                    resource_type="family_member",
+                    resource_id=None,
+                    success=False,
+                    error_message="Only paid members can add family members",
+                    metadata={"count": len(invitees)},
+                )
+                return {
+                    "status": 0,
+                    "message": "Only paid members can add family members.",
+                    "payload": {},
+                }, 403
+
+            results = family_invites.invite_members(uid, user, invitees)
+            succeeded = [r for r in results if r["status"] != "failed"]
+
+            AuditLogger.log(
+                user_id=uid,
+                action="bulk_invite_family_members",
+                resource_type="family_member",
+                resource_id=None,
+                success=bool(succeeded),
+                metadata={
+                    "results": [
+                        {k: r.get(k) for k in ("email", "status", "message")}
+                        for r in results
+                    ]
+                },
+            )
+
+            return {
+                "status": 1 if succeeded else 0,
+                "message": f"{len(succeeded)} of {len(results)} family members invited",
+                "payload": {"results": results},
+            }, (200 if succeeded else 400)
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="bulk_invite_family_members",
+                resource_type="family_member",
+                resource_id=None,
+                success=False,
+                error_message="Failed to invite family members",
+                metadata={"error": str(e)},
+            )
+            return {
+                "status": 0,
+                "message": f"Failed to invite family members: {str(e)}",
+                "payload": {},
+            }, 500
+
+def get_user_family_groups(uid: str, include_members: bool = False) -> list:
+    """
+    Family groups of the given user in one statement: per group the owner's
+    name (the member the group's first invite came from), the number of
+    distinct members and, optionally, the members as the user sees them
+    """
+    members = sql.SQL("")
+    if include_members:
+        members = sql.SQL(
+            """,
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', fg.member_id,
+                        'name', fg.name,
+                        'relationship', fg.relationship,
+                        'email', fg.email,
+                        'color', fg.color
+                    )
+                    ORDER BY fg.member_id <> fg.user_id, fg.name
+                )
+                FROM family_graph fg
+                WHERE fg.user_id = %(uid)s AND fg.family_group_id = g.id
+            ) AS members"""
+        )
+
+    query = sql.SQL(
+        """
+        WITH groups AS (
+            SELECT f.family_group_id AS id,
+                   COUNT(DISTINCT f.fm_user_id) AS member_count,
+                   (ARRAY_AGG(f.invited_by ORDER BY f.id)
+                        FILTER (WHERE f.invited_by IS NOT NULL))[1] AS owner_id
+            FROM family_members f
+            WHERE f.family_group_id IN (
+                SELECT family_group_id FROM family_members
+                WHERE fm_user_id = %(uid)s AND family_group_id IS NOT NULL
+            )
+            GROUP BY f.family_group_id
+        )
+        SELECT g.id, g.member_count,
+               (
+                   SELECT o.name FROM family_members o
+                   WHERE o.family_group_id = g.id AND o.fm_user_id = g.owner_id
+                   ORDER BY o.id
+                   LIMIT 1
+               ) AS owner_name{members}
+        FROM groups g
+        ORDER BY g.id
+        """
+    ).format(members=members)
+    return DBHelper.raw_sql(query, {"uid": uid})
+
+
 class GetUserFamilyGroups(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
         try:
-            # Get all family_group_ids where this user is a member
-            user_groups = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=[
-                    "family_group_id",
-                    "user_id",
-                    "fm_user_id",
-                    "method",
-                    "invited_by",
-                ],
-                filters={"fm_user_id": uid},
-            )
+            # Owner, member count (and members) of every group this user is in, in one query
+            include_members = request.args.get("include_members", "").lower() in ("1", "true")
+            user_groups = get_user_family_groups(uid, include_members)
 
             if not user_groups:
                 if user["role"] != DocklyUsers.Guests.value:
@@ -481,58 +619,33 @@ class GetUserFamilyGroups(Resource):
                     }
 
             # Case: user has groups
-            group_ids = list(
-                set([g["family_group_id"] for g in user_groups if g["family_group_id"]])
-            )
             family_groups = []
 
-            for group_id in group_ids:
-                group_members = DBHelper.find_all(
-                    table_name="family_members",
-                    select_fields=[
-                        "name",
-                        "relationship",
-                        "fm_user_id",
-                        "user_id",
-                        "method",
-                        "email",
-                        "invited_by",
-                    ],
-                    filters={"family_group_id": group_id},
-                )
-
-                # Find the owner by checking invited_by
-                owner_id = None
-                for m in group_members:
-                    if m.get("invited_by"):
-                        owner_id = m["invited_by"]
-                        break
-
-                owner_name = None
-                if owner_id:
-                    owner_member = next(
-                        (m for m in group_members if m["fm_user_id"] == owner_id), None
-                    )
-                    if owner_member:
-                        owner_name = owner_member.get("name")
-
-                if not owner_name:
-                    owner_name = user["user_name"]
-
-                # Count unique members
-                unique_members = list(
-                    set([m["fm_user_id"] for m in group_members if m["fm_user_id"]])
-                )
-                member_count = len(unique_members)
-
-                family_groups.append(
-                    {
-                        "id": group_id,
-                        "name": f"{owner_name}'s Family",
-                        "ownerName": owner_name,
-                        "memberCount": member_count,
-                    }
-                )
+            for g in user_groups:
+                owner_name = g["owner_name"] or user["user_name"]
+                group = {
+                    "id": g["id"],
+                    "name": f"{owner_name}'s Family",
+                    "ownerName": owner_name,
+                    "memberCount": g["member_count"],
+                }
+                if include_members:
+                    group["members"] = [
+                        {
+                            "id": m["id"],
+                            "name": m["name"],
+                            "role": m["relationship"],
+                            "type": "family",
+                            "color": m["color"] or "#0033FF",
+                            "initials": "".join(
+                                [p[0].upper() for p in (m["name"] or "").split() if p]
+                            )[:2],
+                            "status": "accepted",
+                            "isPet": False,
+                        }
+                        for m in g["members"] or []
+                    ]
+                family_groups.append(group)
 
             return {
                 "status": 1,
@@ -557,6 +670,56 @@ class GetUserFamilyGroups(Resource):
             }, 500
 
 
+def get_family_invites(sender_id: str) -> list:
+    """
+    Family invites sent by the given user, one per invited email (latest
+    invite wins). Rows are maintained by a trigger on notifications
+    """
+    return DBHelper.find_all(
+        table_name="family_invites",
+        select_fields=[
+            "email",
+            "name",
+            "relationship",
+            "invite_ref",
+            "shared_items",
+            "permissions",
+            "status",
+        ],
+        filters={"sender_id": sender_id},
+        order_by="id",
+    )
+
+
+def get_member_permissions(user_ids: list) -> dict:
+    """
+    user_id -> list of user_permissions entries for all given users in one
+    query, grouped in SQL
+    """
+    user_ids = [u for u in set(user_ids) if u]
+    if not user_ids:
+        return {}
+
+    rows = DBHelper.raw_sql(
+        """
+        SELECT user_id,
+               json_agg(
+                   json_build_object(
+                       'target_type', target_type,
+                       'target_id', target_id,
+                       'can_read', can_read,
+                       'can_write', can_write
+                   )
+               ) AS permissions
+        FROM user_permissions
+        WHERE user_id = ANY(%s)
+        GROUP BY user_id
+        """,
+        (user_ids,),
+    )
+    return {r["user_id"]: r["permissions"] for r in rows}
+
+
 class GetFamilyMembers(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
@@ -575,40 +738,28 @@ class GetFamilyMembers(Resource):
                     .strip()
                 )
 
-            # Preload notifications metadata for enrichment
-            notifications = DBHelper.find_all(
-                table_name="notifications",
-                filters={"sender_id": uid},
-                select_fields=["metadata", "status"],
-            )
-
-            email_to_metadata = {}
-            pending_invites = []
-
-            for notif in notifications:
-                meta = notif.get("metadata", {})
-                input_data = meta.get("input_data", {})
-                email = input_data.get("email", "")
+            # Invites this user has sent, kept current from their notifications
+            invites = get_family_invites(uid)
 
-                if email:
-                    email_to_metadata[email.lower().strip()] = {
-                        "sharedItems": input_data.get("sharedItems", {}),
-                        "permissions": input_data.get("permissions", {}),
-                    }
-
-                if notif.get("status") == "pending" and input_data:
-                    pending_invites.append(
-                        {
-                            "name": input_data.get("name", "Unknown"),
-                            "relationship": clean_relationship(
-                                input_data.get("relationship", "Unknown")
-                            ),
-                            "status": "pending",
-                            "email": input_data.get("email", ""),
-                            "id": input_data.get("id", ""),
-                            "color": "#7A7A7A",
-                        }
-                    )
+            email_to_metadata = {
+                inv["email"]: {
+                    "sharedItems": inv["shared_items"] or {},
+                    "permissions": inv["permissions"] or {},
+                }
+                for inv in invites
+            }
+            pending_invites = [
+                {
+                    "name": inv["name"] or "Unknown",
+                    "relationship": clean_relationship(inv["relationship"] or "Unknown"),
+                    "status": "pending",
+                    "email": inv["email"],
+                    "id": inv["invite_ref"] or "",
+                    "color": "#7A7A7A",
+                }
+                for inv in invites
+                if inv["status"] == "pending"
+            ]
 
             # Determine family group id
             if family_group_id:
@@ -674,6 +825,11 @@ class GetFamilyMembers(Resource):
                     unique_group_members.append(m)
             group_members = unique_group_members
 
+            # Actual permissions of every member, one grouped query
+            member_permissions = get_member_permissions(
+                [m["fm_user_id"] for m in group_members]
+            )
+
             # Build member list with actual permissions
             for member in group_members:
                 fm_user_id = member.get("fm_user_id")
@@ -684,22 +840,7 @@ class GetFamilyMembers(Resource):
                 metadata = email_to_metadata.get(email, {})
                 sharedItems = metadata.get("sharedItems", {})
 
-                # Fetch permissions from user_permissions table
-                permissions_records = DBHelper.find_all(
-                    table_name="user_permissions",
-                    filters={"user_id": fm_user_id},
-                    select_fields=["target_type", "target_id", "can_read", "can_write"]
-                )
-
-                permissions = [
-                    {
-                        "target_type": p["target_type"],
-                        "target_id": p["target_id"],
-                        "can_read": p.get("can_read", False),
-                        "can_write": p.get("can_write", False)
-                    }
-                    for p in permissions_records
-                ]
+                permissions = member_permissions.get(fm_user_id, [])
 
                 color = "#0033FF" if relationship == "me" else member.get("color")
 
@@ -1311,31 +1452,10 @@ class GetContacts(Resource):
 
 def get_connected_family_member_ids(uid: str) -> list:
     """
-    Returns a unique list of all family member IDs connected to the given user:
-    - Members this user has added (sent invites)
-    - Members who added this user (received invites)
-    - Includes the current user (uid) as well
+    Returns a unique list of all family member IDs connected to the given user,
+    including the current user (uid) as well
     """
-
-    sent_invites = DBHelper.find_all(
-        table_name="family_members",
-        select_fields=["fm_user_id"],
-        filters={"user_id": uid},
-    )
-
-    received_invites = DBHelper.find_all(
-        table_name="family_members",
-        select_fields=["user_id"],
-        filters={"fm_user_id": uid},
-    )
-
-    # Extract ids
-    sent_ids = [m["fm_user_id"] for m in sent_invites if m.get("fm_user_id")]
-    received_ids = [m["user_id"] for m in received_invites if m.get("user_id")]
-
-    # Combine and deduplicate, including current user
-    all_ids = list(set(sent_ids + received_ids + [uid]))
-    return all_ids
+    return family_graph.member_ids(uid)
 
 
 class GetGuardianEmergencyInfo(Resource):
@@ -1397,6 +1517,102 @@ class GetGuardianEmergencyInfo(Resource):
             }, 500
 
 
+
+class GetFamilyHubSummary(Resource):
+    """Every family board section in one request.
+
+    Query params: `sections` (comma separated, default all), `<section>_since`
+    for incremental refresh and `fuser` to read pets of one family group.
+    """
+
+    @auth_required(isOptional=True)
+    def get(self, uid, user):
+        try:
+            requested = [
+                s.strip()
+                for value in request.args.getlist("sections")
+                for s in value.split(",")
+                if s.strip()
+            ] or list(family_hub.SECTIONS)
+            unknown = [s for s in requested if s not in family_hub.SECTIONS]
+            if unknown:
+                return {
+                    "status": 0,
+                    "message": f"Unknown sections: {', '.join(unknown)}",
+                    "payload": {},
+                }, 400
+            sections = list(dict.fromkeys(requested))
+
+            try:
+                since = {
+                    name: family_hub.parse_since(request.args.get(f"{name}_since"))
+                    for name in sections
+                }
+            except ValueError:
+                return {
+                    "status": 0,
+                    "message": "Invalid since cursor, expected an ISO timestamp",
+                    "payload": {},
+                }, 400
+
+            since_ids = {name: request.args.get(f"{name}_since_id", "") for name in sections}
+
+            # Pets of another family group only if the caller belongs to it
+            fuser = request.args.get("fuser")
+            if fuser and fuser not in family_graph.group_ids(uid):
+                AuditLogger.log(
+                    user_id=uid,
+                    action="GET_FAMILY_HUB_SUMMARY_FAILED",
+                    resource_type="family_hub",
+                    resource_id=fuser,
+                    success=False,
+                    error_message="Not a member of this family group",
+                    metadata={"query_params": dict(request.args)},
+                )
+                return {
+                    "status": 0,
+                    "message": "You are not a member of this family group",
+                    "payload": {},
+                }, 403
+
+            family_ids, rows = family_hub.query_summary(
+                uid,
+                sections,
+                since=since,
+                groups=[fuser] if fuser else None,
+                since_ids=since_ids,
+            )
+
+            return {
+                "status": 1,
+                "message": "Family hub summary fetched successfully",
+                "payload": {
+                    "family_member_ids": family_ids,
+                    "sections": {
+                        name: family_hub.format_section(
+                            name, rows[name], since[name], since_ids[name]
+                        )
+                        for name in sections
+                    },
+                },
+            }, 200
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="GET_FAMILY_HUB_SUMMARY_FAILED",
+                resource_type="family_hub",
+                resource_id=None,
+                success=False,
+                error_message="Failed to fetch family hub summary",
+                metadata={"query_params": dict(request.args), "error": str(e)},
+            )
+            return {
+                "status": 0,
+                "message": f"Failed to fetch family hub summary: {str(e)}",
+                "payload": {},
+            }, 500
+
 class AddSharedTasks(Resource):
     @auth_required(isOptional=True)
     def post(self, uid, user):
@@ -1516,13 +1732,7 @@ class GetFamilyTasks(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
         try:
-            familyMembers = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id"],
-                filters={"user_id": uid},
-            )
-            familyMembersIds = [member["fm_user_id"] for member in familyMembers]
-            familyMembersIds.append(uid)
+            familyMembersIds = family_graph.member_ids(uid)
 
             familyMembersTasks = DBHelper.find_in(
                 table_name="sharedtasks",
@@ -1697,16 +1907,6 @@ def send_invitation_email(
         return False
 
 
-def get_category_name(category_id):
-    cat = DBHelper.find_one(
-        table_name="notes_categories",
-        filters={"id": category_id},
-        select_fields=["name"],  # Only get the 'name' field
-    )
-
-    return cat["name"] if cat else ""
-
-
 class AddNotes(Resource):
     @auth_required(isOptional=True)
     def post(self, uid=None, user=None):
@@ -2051,27 +2251,18 @@ class GetNotes(Resource):
             filters = {"is_active": True}
             if hub:
                 filters["hub"] = hub
+            search = (request.args.get("q") or "").strip() or None
 
             # 3. Fetch notes where:
             # - user_id == uid OR
             # - uid exists in tagged_ids[]
-            select_fields = [
-                "id",
-                "title",
-                "description",
-                "category_id",
-                "created_at",
-                "updated_at",
-                "hub",
-                "user_id",
-                "tagged_ids",
-            ]
-            notes_raw = DBHelper.find_with_or_and_array_match(
-                table_name="notes_lists",
-                select_fields=select_fields,
-                uid=uid,
-                array_field="tagged_ids",
-                filters=filters,
+            # with category names joined in (and matching `q` when given)
+            notes_raw = family_notes.query_notes(
+                uid,
+                hub=hub,
+                search=search,
+                limit=request.args.get("limit", type=int),
+                offset=request.args.get("offset", 0, type=int),
             )
 
             # 4. Format notes and include category_name
@@ -2083,7 +2274,7 @@ class GetNotes(Resource):
                         "title": note["title"],
                         "description": note["description"],
                         "category_id": note["category_id"],
-                        "category_name": get_category_name(note["category_id"]),
+                        "category_name": note["category_name"],
                         "hub": note.get("hub", "FAMILY"),
                         "created_at": (
                             note["created_at"].isoformat()
@@ -2676,102 +2867,69 @@ class GetProjects(Resource):
         try:
             source = request.args.get("source", None)
             family_group_id = request.args.get("family_group_id", None)
+            limit = request.args.get("limit", type=int)
+            offset = request.args.get("offset", 0, type=int)
+            since = request.args.get("since")
 
             # ✅ Collect all family groups for this user
             if family_group_id:
                 user_family_groups = [family_group_id]
             else:
-                user_groups = DBHelper.find_all(
-                    table_name="family_members",
-                    select_fields=["family_group_id"],
-                    filters={"fm_user_id": uid},
-                )
-                user_family_groups = [
-                    g["family_group_id"] for g in user_groups if g["family_group_id"]
-                ]
+                user_family_groups = family_projects.user_family_groups(uid)
 
-            # ✅ Fetch all projects (we don't filter by family_groups here, only later)
-            projects = DBHelper.find_all(
-                table_name="projects",
-                select_fields=[
-                    "id",
-                    "title",
-                    "description",
-                    "due_date",
-                    "meta",
-                    "progress",
-                    "created_at",
-                    "updated_at",
-                    "source",
-                    "user_id",
-                    "tagged_ids",
-                    "is_active",
-                ],
-                filters={},  # no restriction by uid
-            )
-
-            projects = [p for p in projects if p.get("is_active", 1) == 1]
-
-            # ✅ Preload creator names
-            creator_ids = list(set([p["user_id"] for p in projects if p["user_id"]]))
-            creators = {}
-            if creator_ids:
-                creator_data = DBHelper.find_in(
-                    table_name="users",
-                    select_fields=["uid", "user_name"],
-                    field="uid",
-                    values=creator_ids,
-                )
-                creators = {c["uid"]: c["user_name"] for c in creator_data}
-
-            # ✅ Filter projects based on new access rule
-            filtered_projects = []
-            for p in projects:
-                meta = p.get("meta") or {}
-                project_family_groups = meta.get("family_groups", [])
-                visibility = meta.get("visibility", "private")
-                src = p.get("source")
-
-                # Flags
-                is_owner = p["user_id"] == uid
-                in_family_group = any(
-                    fg in user_family_groups for fg in project_family_groups
-                )
-
-                if src == "familyhub":
-                    if is_owner or in_family_group:
-                        filtered_projects.append(p)
-
-                elif src == "planner":
-                    if visibility == "private":
-                        if is_owner:
-                            filtered_projects.append(p)
-                    elif visibility == "public":
-                        if is_owner or in_family_group:
-                            filtered_projects.append(p)
-
-            # ✅ Format output
-            formatted = [
-                {
-                    "id": p["id"],
-                    "title": p["title"],
-                    "description": p["description"],
-                    "due_date": p["due_date"].isoformat() if p["due_date"] else None,
-                    "meta": p["meta"],
-                    "progress": p["progress"],
-                    "created_at": p["created_at"].isoformat(),
-                    "updated_at": p["updated_at"].isoformat(),
-                    "source": p["source"],
-                    "created_by": p["user_id"],
-                    "creator_name": creators.get(p["user_id"], "Unknown"),
+            if since:
+                try:
+                    since_dt = datetime.fromisoformat(since.replace("Z", "+00:00"))
+                except ValueError:
+                    return {
+                        "status": 0,
+                        "message": "Invalid since format. Use ISO format",
+                        "payload": {},
+                    }, 400
+                # updated_at is stored as naive UTC
+                if since_dt.tzinfo:
+                    since_dt = since_dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+                rows, has_more = family_projects.query_projects(
+                    uid,
+                    user_family_groups,
+                    limit=limit,
+                    since=since_dt,
+                    since_id=request.args.get("since_id", ""),
+                )
+                last = rows[-1] if rows else None
+                return {
+                    "status": 1,
+                    "message": "Projects fetched successfully",
+                    "payload": {
+                        "projects": [
+                            family_projects.format_project(p)
+                            for p in rows
+                            if p["is_active"] == 1
+                        ],
+                        "removed_ids": [p["id"] for p in rows if p["is_active"] != 1],
+                        "has_more": has_more,
+                        "next_since": (
+                            last["updated_at"].isoformat() if last else since
+                        ),
+                        "next_since_id": (
+                            last["id"] if last else request.args.get("since_id", "")
+                        ),
+                    },
                 }
-                for p in filtered_projects
-            ]
+
+            # ✅ Only this user's and their family groups' projects, creators joined in SQL
+            rows, has_more = family_projects.query_projects(
+                uid, user_family_groups, limit=limit, offset=offset
+            )
 
             return {
                 "status": 1,
                 "message": "Projects fetched successfully",
-                "payload": {"projects": formatted},
+                "payload": {
+                    "projects": [family_projects.format_project(p) for p in rows],
+                    "has_more": has_more,
+                },
             }
 
         except Exception as e:
@@ -3128,11 +3286,6 @@ class AddTask(Resource):
             start_dt = datetime.strptime(due_date_str, "%Y-%m-%d")
             end_dt = start_dt + timedelta(days=1)  # All-day event
 
-            # Create Google Calendar event
-            calendar_event_id = create_calendar_event(
-                uid, f"{project['title']} - {title}", start_dt, end_dt
-            )
-
             # Insert task
             task_id = DBHelper.insert(
                 table_name="tasks",
@@ -3144,7 +3297,12 @@ class AddTask(Resource):
                 assignee=data.get("assignee"),
                 type=data.get("type"),
                 completed=data.get("completed", False),
-                calendar_event_id=calendar_event_id,
+                calendar_event_id=None,
+            )
+
+            # Google Calendar event is created in the background
+            queue_calendar_upsert(
+                uid, "task", task_id, f"{project['title']} - {title}", start_dt, end_dt
             )
 
             # ✅ Audit log for success
@@ -3160,14 +3318,16 @@ class AddTask(Resource):
                     "task_title": title,
                     "assignee": data.get("assignee"),
                     "due_date": due_date_str,
-                    "calendar_event_id": calendar_event_id,
                 },
             )
 
             return {
                 "status": 1,
                 "message": "Task added successfully",
-                "payload": {"task_id": task_id},
+                "payload": {
+                    "task_id": task_id,
+                    "rollup": family_projects.project_rollup(data.get("project_id")),
+                },
             }
 
         except Exception as e:
@@ -3195,45 +3355,10 @@ class GetTasks(Resource):
         resource_type = "TASKS"
 
         try:
-            sent_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id"],
-                filters={"user_id": uid},
-            )
-            received_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["user_id"],
-                filters={"fm_user_id": uid},
-            )
+            familyMembersIds = family_graph.member_ids(uid)
 
-            familyMembersIds = [m["fm_user_id"] for m in sent_invites] + [
-                m["user_id"] for m in received_invites
-            ]
-            familyMembersIds = list(set(familyMembersIds + [uid]))
-
-            tasks = DBHelper.find_in(
-                table_name="tasks",
-                select_fields=[
-                    "id",
-                    "title",
-                    "due_date",
-                    "assignee",
-                    "type",
-                    "completed",
-                    "project_id",
-                    "is_active",
-                ],
-                field="user_id",
-                values=familyMembersIds,
-            )
-
-            # Filter only tasks for the requested project
-            tasks = [
-                t
-                for t in tasks
-                if str(t.get("project_id")) == str(project_id)
-                and t.get("is_active", 1) == 1
-            ]
+            # Only the requested project's active tasks, straight off the index
+            tasks = family_projects.query_tasks(project_id, familyMembersIds)
 
             formatted_tasks = [
                 {
@@ -3324,13 +3449,19 @@ class UpdateTask(Resource):
             }
             updates = {k: v for k, v in updates.items() if v is not None}
 
-            calendar_event_id = task.get("calendar_event_id")
             calendar_log = ""
 
-            # ───── Google Calendar Sync ─────
+            # Update task in DB
+            DBHelper.update_one(
+                table_name="tasks",
+                filters={"id": task_id, "user_id": uid},
+                updates=updates,
+            )
+
+            # ───── Google Calendar Sync (queued) ─────
             try:
                 new_title = updates.get("title", task["title"])
-                new_due_date_str = updates.get("due_date", task["due_date"])
+                new_due_date_str = str(updates.get("due_date", task["due_date"]))
                 start_dt = datetime.strptime(new_due_date_str, "%Y-%m-%d")
                 end_dt = start_dt + timedelta(days=1)
 
@@ -3339,37 +3470,11 @@ class UpdateTask(Resource):
                 )
                 event_title = f"{project['title']} - {new_title}"
 
-                if calendar_event_id:
-                    try:
-                        update_calendar_event(
-                            uid, calendar_event_id, event_title, start_dt, end_dt
-                        )
-                        calendar_log = "Existing Google Calendar event updated"
-                    except Exception as e:
-                        new_event_id = create_calendar_event(
-                            uid, event_title, start_dt, end_dt
-                        )
-                        updates["calendar_event_id"] = new_event_id
-                        calendar_log = f"Failed to update existing event. Created new event {new_event_id}"
-                else:
-                    new_event_id = create_calendar_event(
-                        uid, event_title, start_dt, end_dt
-                    )
-                    updates["calendar_event_id"] = new_event_id
-                    calendar_log = (
-                        f"No existing calendar event. Created new event {new_event_id}"
-                    )
-
+                queue_calendar_upsert(uid, "task", task_id, event_title, start_dt, end_dt)
+                calendar_log = "Google Calendar update queued"
             except Exception as e:
                 calendar_log = f"Google Calendar sync failed: {str(e)}"
 
-            # Update task in DB
-            DBHelper.update_one(
-                table_name="tasks",
-                filters={"id": task_id, "user_id": uid},
-                updates=updates,
-            )
-
             # ✅ Audit log for success
             AuditLogger.log(
                 user_id=uid,
@@ -3387,7 +3492,10 @@ class UpdateTask(Resource):
             return {
                 "status": 1,
                 "message": "Task updated successfully",
-                "payload": {"task_id": task_id},
+                "payload": {
+                    "task_id": task_id,
+                    "rollup": family_projects.project_rollup(task["project_id"]),
+                },
             }
 
         except Exception as e:
@@ -3444,22 +3552,6 @@ class DeleteTask(Resource):
                 )
                 return {"status": 0, "message": "Task not found", "payload": {}}, 404
 
-            calendar_log = ""
-            try:
-                calendar_event_id = task.get("calendar_event_id")
-                if calendar_event_id:
-                    try:
-                        delete_calendar_event(uid, calendar_event_id)
-                        calendar_log = (
-                            f"Google Calendar event {calendar_event_id} deleted"
-                        )
-                    except Exception as e:
-                        calendar_log = (
-                            f"Failed to delete Google Calendar event: {str(e)}"
-                        )
-            except Exception as e:
-                calendar_log = f"Google Calendar processing failed: {str(e)}"
-
             # Soft delete task
             DBHelper.update_one(
                 table_name="tasks",
@@ -3467,6 +3559,17 @@ class DeleteTask(Resource):
                 updates={"is_active": 0, "updated_at": datetime.utcnow()},
             )
 
+            calendar_log = ""
+            try:
+                calendar_event_id = task.get("calendar_event_id")
+                if calendar_event_id:
+                    queue_calendar_delete(uid, "task", task_id, {"google": calendar_event_id})
+                    calendar_log = (
+                        f"Google Calendar event {calendar_event_id} deletion queued"
+                    )
+            except Exception as e:
+                calendar_log = f"Google Calendar processing failed: {str(e)}"
+
             # ✅ Audit log for success
             AuditLogger.log(
                 user_id=uid,
@@ -3480,7 +3583,10 @@ class DeleteTask(Resource):
             return {
                 "status": 1,
                 "message": "Task deleted successfully",
-                "payload": {"task_id": task_id},
+                "payload": {
+                    "task_id": task_id,
+                    "rollup": family_projects.project_rollup(task["project_id"]),
+                },
             }
 
         except Exception as e:
@@ -3513,7 +3619,10 @@ class AddPersonalInfo(Resource):
                     resource_id=None,
                     success=False,
                     error_message="Failed to save personal info",
-                    metadata={"input": inputData, "error": "No input data provided"},
+                    metadata={
+                        "input": field_crypto.redact("personal_information", inputData),
+                        "error": "No input data provided",
+                    },
                 )
                 return {
                     "status": 0,
@@ -3531,7 +3640,7 @@ class AddPersonalInfo(Resource):
                     success=False,
                     error_message="Failed to save personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": "No personal info data provided",
                     },
                 )
@@ -3554,7 +3663,7 @@ class AddPersonalInfo(Resource):
                     success=False,
                     error_message="Failed to save personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": f"Missing required fields: {', '.join(missing_fields)}",
                     },
                 )
@@ -3570,52 +3679,58 @@ class AddPersonalInfo(Resource):
             personal_id = DBHelper.insert(
                 table_name="personal_information",
                 return_column="id",
-                user_id=uid,
-                family_member_user_id=fm_user_id,
-                first_name=personal_info.get("firstName", ""),
-                middle_name=personal_info.get("middleName", ""),
-                last_name=personal_info.get("lastName", ""),
-                preferred_name=personal_info.get("preferredName", ""),
-                nicknames=personal_info.get("nicknames", ""),
-                relationship=personal_info.get("relationship", ""),
-                date_of_birth=personal_info.get("dateOfBirth") or None,
-                age=personal_info.get("age", ""),
-                birthplace=personal_info.get("birthplace", ""),
-                gender=personal_info.get("gender", ""),
-                phone_number=personal_info.get("phoneNumber", ""),
-                primary_email=personal_info.get("primaryEmail", ""),
-                additional_emails=personal_info.get("additionalEmails", ""),
-                same_as_primary=personal_info.get("sameAsPrimary", False),
-                birth_cert_number=personal_info.get("birthCertNumber", ""),
-                state_id=personal_info.get("stateId", ""),
-                passport=personal_info.get("passport", ""),
-                license=personal_info.get("license", ""),
-                birth_cert=personal_info.get("birthCert", ""),
-                primary_contact=personal_info.get("primaryContact", ""),
-                primary_phone=personal_info.get("primaryContactPhone", ""),
-                secondary_contact=personal_info.get("secondaryContact", ""),
-                secondary_phone=personal_info.get("secondaryContactPhone", ""),
-                emergency_contact=personal_info.get("emergencyContact", ""),
-                emergency_phone=personal_info.get("emergencyPhone", ""),
-                blood_type=personal_info.get("bloodType", ""),
-                height=personal_info.get("height", ""),
-                weight=personal_info.get("weight", ""),
-                eye_color=personal_info.get("eyeColor", ""),
-                insurance=personal_info.get("insurance", ""),
-                member_id=personal_info.get("memberId", ""),
-                group_num=personal_info.get("groupNum", ""),
-                last_checkup=personal_info.get("lastCheckup") or None,
-                allergies=personal_info.get("allergies", ""),
-                medications=personal_info.get("medications", ""),
-                notes=personal_info.get("notes", ""),
-                ssn=personal_info.get("ssn", ""),
-                student_id=personal_info.get("studentId", ""),
-                added_by=personal_info.get("addedBy", ""),
-                added_time=current_time,
-                edited_by=personal_info.get(
-                    "editedBy", personal_info.get("addedBy", "")
+                **field_crypto.encrypt_fields(
+                    "personal_information",
+                    uid,
+                    {
+                        "user_id": uid,
+                        "family_member_user_id": fm_user_id,
+                        "first_name": personal_info.get("firstName", ""),
+                        "middle_name": personal_info.get("middleName", ""),
+                        "last_name": personal_info.get("lastName", ""),
+                        "preferred_name": personal_info.get("preferredName", ""),
+                        "nicknames": personal_info.get("nicknames", ""),
+                        "relationship": personal_info.get("relationship", ""),
+                        "date_of_birth": personal_info.get("dateOfBirth") or None,
+                        "age": personal_info.get("age", ""),
+                        "birthplace": personal_info.get("birthplace", ""),
+                        "gender": personal_info.get("gender", ""),
+                        "phone_number": personal_info.get("phoneNumber", ""),
+                        "primary_email": personal_info.get("primaryEmail", ""),
+                        "additional_emails": personal_info.get("additionalEmails", ""),
+                        "same_as_primary": personal_info.get("sameAsPrimary", False),
+                        "birth_cert_number": personal_info.get("birthCertNumber", ""),
+                        "state_id": personal_info.get("stateId", ""),
+                        "passport": personal_info.get("passport", ""),
+                        "license": personal_info.get("license", ""),
+                        "birth_cert": personal_info.get("birthCert", ""),
+                        "primary_contact": personal_info.get("primaryContact", ""),
+                        "primary_phone": personal_info.get("primaryContactPhone", ""),
+                        "secondary_contact": personal_info.get("secondaryContact", ""),
+                        "secondary_phone": personal_info.get("secondaryContactPhone", ""),
+                        "emergency_contact": personal_info.get("emergencyContact", ""),
+                        "emergency_phone": personal_info.get("emergencyPhone", ""),
+                        "blood_type": personal_info.get("bloodType", ""),
+                        "height": personal_info.get("height", ""),
+                        "weight": personal_info.get("weight", ""),
+                        "eye_color": personal_info.get("eyeColor", ""),
+                        "insurance": personal_info.get("insurance", ""),
+                        "member_id": personal_info.get("memberId", ""),
+                        "group_num": personal_info.get("groupNum", ""),
+                        "last_checkup": personal_info.get("lastCheckup") or None,
+                        "allergies": personal_info.get("allergies", ""),
+                        "medications": personal_info.get("medications", ""),
+                        "notes": personal_info.get("notes", ""),
+                        "ssn": personal_info.get("ssn", ""),
+                        "student_id": personal_info.get("studentId", ""),
+                        "added_by": personal_info.get("addedBy", ""),
+                        "added_time": current_time,
+                        "edited_by": personal_info.get(
+                            "editedBy", personal_info.get("addedBy", "")
+                        ),
+                        "updated_at": current_time,
+                    },
                 ),
-                updated_at=current_time,
             )
 
             # ✅ Audit log for success
@@ -3625,7 +3740,9 @@ class AddPersonalInfo(Resource):
                 resource_type="personal_information",
                 resource_id=personal_id,
                 success=True,
-                metadata={"personal_info": personal_info},
+                metadata={
+                    "personal_info": field_crypto.redact("personal_information", personal_info)
+                },
             )
 
             return {
@@ -3642,7 +3759,10 @@ class AddPersonalInfo(Resource):
                 resource_id=None,
                 success=False,
                 error_message="Failed to save personal info",
-                metadata={"input": inputData, "error": str(e)},
+                metadata={
+                    "input": field_crypto.redact("personal_information", inputData),
+                    "error": str(e),
+                },
             )
             return {
                 "status": 0,
@@ -3705,9 +3825,11 @@ class GetPersonalInfo(Resource):
                     "added_time",
                     "edited_by",
                     "updated_at",
+                    "user_id",
                 ],
                 filters={"family_member_user_id": fm_user_id},
             )
+            field_crypto.decrypt_rows("personal_information", [personal_info])
 
             
             def serialize_datetime(dt):
@@ -3808,7 +3930,10 @@ class UpdatePersonalInfo(Resource):
                     resource_id=None,
                     success=False,
                     error_message="Failed to update personal info",
-                    metadata={"input": inputData, "error": "No input data provided"},
+                    metadata={
+                        "input": field_crypto.redact("personal_information", inputData),
+                        "error": "No input data provided",
+                    },
                 )
                 return {
                     "status": 0,
@@ -3826,7 +3951,7 @@ class UpdatePersonalInfo(Resource):
                     success=False,
                     error_message="Failed to update personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": "No personal info data provided",
                     },
                 )
@@ -3849,7 +3974,7 @@ class UpdatePersonalInfo(Resource):
                     success=False,
                     error_message="Failed to update personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": f"Missing required fields: {', '.join(missing_fields)}",
                     },
                 )
@@ -3870,7 +3995,7 @@ class UpdatePersonalInfo(Resource):
                     success=False,
                     error_message="Failed to update personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": f"User with ID {uid} not found",
                     },
                 )
@@ -3894,7 +4019,7 @@ class UpdatePersonalInfo(Resource):
                     success=False,
                     error_message="Failed to update personal info",
                     metadata={
-                        "input": inputData,
+                        "input": field_crypto.redact("personal_information", inputData),
                         "error": "Personal info record not found",
                     },
                 )
@@ -3963,7 +4088,9 @@ class UpdatePersonalInfo(Resource):
             DBHelper.update_one(
                 table_name="personal_information",
                 filters={"id": personal_id},
-                updates=updates,
+                updates=field_crypto.encrypt_fields(
+                    "personal_information", record_check["user_id"], updates
+                ),
             )
 
             # ✅ Audit log success
@@ -3973,7 +4100,9 @@ class UpdatePersonalInfo(Resource):
                 resource_type="personal_information",
                 resource_id=personal_id,
                 success=True,
-                metadata={"updated_fields": updates},
+                metadata={
+                    "updated_fields": field_crypto.redact("personal_information", updates)
+                },
             )
 
             return {
@@ -3990,7 +4119,10 @@ class UpdatePersonalInfo(Resource):
                 resource_id=None,
                 success=False,
                 error_message="Failed to update personal info",
-                metadata={"input": inputData, "error": str(e)},
+                metadata={
+                    "input": field_crypto.redact("personal_information", inputData),
+                    "error": str(e),
+                },
             )
             return {
                 "status": 0,
@@ -4394,7 +4526,10 @@ class AddAccountPassword(Resource):
                     resource_id=None,
                     success=False,
                     error_message="Failed to add account",
-                    metadata={"input": inputData, "error": "No input data provided"},
+                    metadata={
+                        "input": field_crypto.redact("account_passwords", inputData),
+                        "error": "No input data provided",
+                    },
                 )
                 return {
                     "status": 0,
@@ -4411,7 +4546,10 @@ class AddAccountPassword(Resource):
                     resource_id=None,
                     success=False,
                     error_message="Failed to add account",
-                    metadata={"input": inputData, "error": "No account data provided"},
+                    metadata={
+                        "input": field_crypto.redact("account_passwords", inputData),
+                        "error": "No account data provided",
+                    },
                 )
                 return {
                     "status": 0,
@@ -4430,7 +4568,7 @@ class AddAccountPassword(Resource):
                     success=False,
                     error_message="Failed to add account",
                     metadata={
-                        "input": account,
+                        "input": field_crypto.redact("account_passwords", account),
                         "error": f"Missing required fields: {', '.join(missing_fields)}",
                     },
                 )
@@ -4445,17 +4583,23 @@ class AddAccountPassword(Resource):
             account_id = DBHelper.insert(
                 table_name="account_passwords",
                 return_column="id",
-                user_id=uid,
-                family_member_user_id=account["userId"],
-                category=account["category"],
-                title=account["title"],
-                username=account.get("username", ""),
-                password=account.get("password", ""),
-                url=account.get("url", ""),
-                added_by=account["addedBy"],
-                added_time=now,
-                edited_by=account.get("editedBy", account["addedBy"]),
-                updated_at=now,
+                **field_crypto.encrypt_fields(
+                    "account_passwords",
+                    uid,
+                    {
+                        "user_id": uid,
+                        "family_member_user_id": account["userId"],
+                        "category": account["category"],
+                        "title": account["title"],
+                        "username": account.get("username", ""),
+                        "password": account.get("password", ""),
+                        "url": account.get("url", ""),
+                        "added_by": account["addedBy"],
+                        "added_time": now,
+                        "edited_by": account.get("editedBy", account["addedBy"]),
+                        "updated_at": now,
+                    },
+                ),
             )
 
             AuditLogger.log(
@@ -4464,7 +4608,7 @@ class AddAccountPassword(Resource):
                 resource_type="account_passwords",
                 resource_id=account_id,
                 success=True,
-                metadata={"account": account},
+                metadata={"account": field_crypto.redact("account_passwords", account)},
             )
 
             return {
@@ -4481,7 +4625,12 @@ class AddAccountPassword(Resource):
                 resource_id=None,
                 success=False,
                 error_message="Failed to add account",
-                metadata={"input": inputData, "error": str(e)},
+                metadata={
+                    "input": field_crypto.redact(
+                        "account_passwords", (inputData or {}).get("account")
+                    ),
+                    "error": str(e),
+                },
             )
             return {
                 "status": 0,
@@ -4490,7 +4639,31 @@ class AddAccountPassword(Resource):
             }, 500
 
 
+ACCOUNT_PASSWORD_FIELDS = [
+    "id",
+    "user_id",
+    "family_member_user_id",
+    "category",
+    "title",
+    "username",
+    "password",
+    "url",
+    "added_by",
+    "added_time",
+    "edited_by",
+    "updated_at",
+    "is_active",
+]
+
+
 class GetAccountPasswords(Resource):
+    """Accounts of a family member.
+
+    `?fields=id,title,category` returns only those columns, so list views
+    never read (or decrypt) usernames and passwords; `?id=` narrows the
+    result to one account, e.g. to reveal its password.
+    """
+
     @auth_required(isOptional=True)
     def get(self, uid, user):
         action = "GET_ACCOUNT_PASSWORDS"
@@ -4510,16 +4683,30 @@ class GetAccountPasswords(Resource):
                 )
                 return {"status": 0, "message": "Missing userId"}, 400
 
+            requested = [
+                f.strip() for f in (request.args.get("fields") or "").split(",") if f.strip()
+            ]
+            fields = [f for f in ACCOUNT_PASSWORD_FIELDS if f in requested] or ACCOUNT_PASSWORD_FIELDS
+
+            filters = {"family_member_user_id": user_id}
+            if request.args.get("id"):
+                filters["id"] = request.args.get("id")
+
+            # user_id keys the decryption; dropped again if not requested
             results = DBHelper.find_all(
                 table_name="account_passwords",
-                filters={"family_member_user_id": user_id},
+                select_fields=list(dict.fromkeys(fields + ["user_id"])),
+                filters=filters,
+                order_by="id",
             )
+            field_crypto.decrypt_rows("account_passwords", results, fields)
 
-            # Convert datetime objects to ISO strings
             for r in results:
-                for key in r:
-                    if isinstance(r[key], datetime):
+                for key in ("added_time", "updated_at"):
+                    if isinstance(r.get(key), datetime):
                         r[key] = r[key].isoformat()
+                if "user_id" not in fields:
+                    r.pop("user_id", None)
 
             # ✅ Log success
             AuditLogger.log(
@@ -4584,7 +4771,7 @@ class UpdateAccountPassword(Resource):
                     resource_id=None,
                     success=False,
                     error_message="Missing account ID or data",
-                    metadata={"input_data": account},
+                    metadata={"input_data": field_crypto.redact("account_passwords", account)},
                 )
                 return {"status": 0, "message": "Missing account ID or data"}, 400
 
@@ -4601,10 +4788,21 @@ class UpdateAccountPassword(Resource):
             # Remove None values
             update_fields = {k: v for k, v in update_fields.items() if v is not None}
 
+            # Secrets are encrypted under the key of the account's owner
+            owner = DBHelper.find_one(
+                table_name="account_passwords",
+                filters={"id": account["id"]},
+                select_fields=["user_id"],
+            )
+            if not owner:
+                return {"status": 0, "message": "Account not found"}, 404
+
             DBHelper.update_one(
                 table_name="account_passwords",
                 filters={"id": account["id"]},
-                updates=update_fields,
+                updates=field_crypto.encrypt_fields(
+                    "account_passwords", owner["user_id"], update_fields
+                ),
             )
 
             AuditLogger.log(
@@ -4613,7 +4811,9 @@ class UpdateAccountPassword(Resource):
                 resource_type="account_passwords",
                 resource_id=account["id"],
                 success=True,
-                metadata={"updated_fields": update_fields},
+                metadata={
+                    "updated_fields": field_crypto.redact("account_passwords", update_fields)
+                },
             )
 
             return {"status": 1, "message": "Account updated successfully"}, 200
@@ -4626,14 +4826,17 @@ class UpdateAccountPassword(Resource):
                 resource_id=account.get("id") if account else None,
                 success=False,
                 error_message="Failed to update account",
-                metadata={"input_data": inputData, "error": str(e)},
+                metadata={
+                    "input_data": field_crypto.redact(
+                        "account_passwords", (inputData or {}).get("account")
+                    ),
+                    "error": str(e),
+                },
             )
             return {"status": 0, "message": f"Failed to update account: {str(e)}"}, 500
 
 
 from werkzeug.utils import secure_filename
-from googleapiclient.http import MediaIoBaseUpload
-import io
 
 class UploadDriveFile(DriveBaseResource):
     @auth_required(isOptional=True)
@@ -4725,7 +4928,7 @@ class UploadDriveFile(DriveBaseResource):
 
             # Step 5: Upload file to Drive
             file_metadata = {"name": secure_filename(file.filename), "parents": [target_folder["google_id"]]}
-            media = MediaIoBaseUpload(io.BytesIO(file.read()), mimetype=file.content_type or "application/octet-stream")
+            media = uploads.drive_media(file)
             uploaded_file = service.files().create(body=file_metadata, media_body=media, fields="id, name, webViewLink, mimeType, size, modifiedTime").execute()
 
             # Step 6: Insert uploaded file into DB
@@ -5002,11 +5205,7 @@ class UploadDocumentRecordFile(DriveBaseResource):
                 "name": secure_filename(file.filename),
                 "parents": [documents_folder["google_id"]],
             }
-            media = MediaIoBaseUpload(
-                io.BytesIO(file.read()),
-                mimetype=file.content_type or "application/octet-stream",
-                resumable=True,
-            )
+            media = uploads.drive_media(file)
             uploaded_file = (
                 service.files()
                 .create(
@@ -5275,7 +5474,7 @@ class UploadMedicalRecordFile(DriveBaseResource):
 
             # Upload file to Google Drive
             file_metadata = {"name": secure_filename(file.filename), "parents": [medical_folder["google_id"]]}
-            media = MediaIoBaseUpload(io.BytesIO(file.read()), mimetype=file.content_type or "application/octet-stream", resumable=True)
+            media = uploads.drive_media(file)
             uploaded_file = service.files().create(
                 body=file_metadata,
                 media_body=media,
@@ -6097,7 +6296,7 @@ class ShareProject(Resource):
             DBHelper.update_one(
                 table_name="projects",
                 filters={"id": project.get("id")},
-                updates={"tagged_ids": pg_array_str},
+                updates={"tagged_ids": pg_array_str, "updated_at": datetime.utcnow()},
             )
 
             AuditLogger.log(
@@ -6864,6 +7063,10 @@ class AddOrUpdateMeal(Resource):
         editing = data.get("editing")
         meal_id = data.get("id")
 
+        rule_error = rule_input_error(data)
+        if rule_error:
+            return {"status": 0, "message": rule_error, "payload": {}}, 400
+
         # Helper: Convert Python list to PostgreSQL array
         def format_pg_array(py_list):
             if not py_list:
@@ -6917,6 +7120,7 @@ class AddOrUpdateMeal(Resource):
                     filters={"id": meal_id},  # ✅ no user_id restriction
                     updates=payload,
                 )
+                sync_rule_from_input(existing_meal["user_id"], "meal", meal_id, data)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -6946,6 +7150,7 @@ class AddOrUpdateMeal(Resource):
                 }
 
                 DBHelper.insert("meals", **payload)
+                sync_rule_from_input(uid, "meal", new_id, data)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -6974,22 +7179,7 @@ class GetMeals(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
         try:
-            # Get family members (similar to GetTasks implementation)
-            sent_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id"],
-                filters={"user_id": uid},
-            )
-            received_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["user_id"],
-                filters={"fm_user_id": uid},
-            )
-
-            familyMembersIds = [m["fm_user_id"] for m in sent_invites] + [
-                m["user_id"] for m in received_invites
-            ]
-            familyMembersIds = list(set(familyMembersIds + [uid]))
+            familyMembersIds = family_graph.member_ids(uid)
 
             # Fetch meals
             meals = DBHelper.find_in(
@@ -7107,6 +7297,10 @@ class AddOrUpdateChore(Resource):
         editing = data.get("editing")
         chore_id = data.get("id")
 
+        rule_error = rule_input_error(data)
+        if rule_error:
+            return {"status": 0, "message": rule_error, "payload": {}}, 400
+
         # Helper: Convert Python list to PostgreSQL array
         def format_pg_array(py_list):
             if not py_list:
@@ -7160,6 +7354,7 @@ class AddOrUpdateChore(Resource):
                     filters={"id": chore_id},  # ✅ no longer restricted by user_id
                     updates=payload,
                 )
+                sync_rule_from_input(existing_chore["user_id"], "chore", chore_id, data)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -7189,6 +7384,7 @@ class AddOrUpdateChore(Resource):
                 }
 
                 DBHelper.insert("chores", **payload)
+                sync_rule_from_input(uid, "chore", new_id, data)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -7218,22 +7414,7 @@ class GetChores(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
         try:
-            # Get family members (similar to GetTasks implementation)
-            sent_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id"],
-                filters={"user_id": uid},
-            )
-            received_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["user_id"],
-                filters={"fm_user_id": uid},
-            )
-
-            familyMembersIds = [m["fm_user_id"] for m in sent_invites] + [
-                m["user_id"] for m in received_invites
-            ]
-            familyMembersIds = list(set(familyMembersIds + [uid]))
+            familyMembersIds = family_graph.member_ids(uid)
 
             # Fetch chores
             chores = DBHelper.find_in(
@@ -7461,22 +7642,7 @@ class GetWeeklyTasks(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
         try:
-            # Get family members (similar to GetTasks implementation)
-            sent_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id"],
-                filters={"user_id": uid},
-            )
-            received_invites = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["user_id"],
-                filters={"fm_user_id": uid},
-            )
-
-            familyMembersIds = [m["fm_user_id"] for m in sent_invites] + [
-                m["user_id"] for m in received_invites
-            ]
-            familyMembersIds = list(set(familyMembersIds + [uid]))
+            familyMembersIds = family_graph.member_ids(uid)
 
             # Fetch tasks
             tasks = DBHelper.find_in(
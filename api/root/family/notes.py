@@ -0,0 +1,76 @@
+"""
+Notes read model.
+
+Notes are listed with their category names joined in SQL, and searched
+through the `search_vector` column (title weighted above description) and
+its GIN index instead of the client filtering the full list.
+"""
+
+from psycopg2 import sql
+
+from root.db.dbHelper import DBHelper
+
+SEARCH_CONFIG = "english"
+
+NOTE_FIELDS = [
+    "id",
+    "title",
+    "description",
+    "category_id",
+    "created_at",
+    "updated_at",
+    "hub",
+    "user_id",
+    "tagged_ids",
+]
+
+
+def query_notes(uid, hub=None, search=None, limit=None, offset=0):
+    """Active notes owned by or tagged to `uid`, with `category_name`.
+
+    With `search`, only notes matching it (web-search syntax: words,
+    "phrases", -exclusions, OR) are returned, best matches first.
+    """
+    conditions = [
+        sql.SQL("n.is_active = TRUE"),
+        # @> (not = ANY) so the GIN index on tagged_ids can serve it
+        sql.SQL("(n.user_id = %(uid)s OR n.tagged_ids @> ARRAY[%(uid)s]::text[])"),
+    ]
+    params = {"uid": uid, "config": SEARCH_CONFIG, "offset": max(offset or 0, 0)}
+
+    if hub:
+        conditions.append(sql.SQL("n.hub = %(hub)s"))
+        params["hub"] = hub
+
+    order = sql.SQL("n.id")
+    if search:
+        conditions.append(
+            sql.SQL("n.search_vector @@ websearch_to_tsquery(%(config)s::regconfig, %(search)s)")
+        )
+        params["search"] = search
+        order = sql.SQL(
+            "ts_rank(n.search_vector, websearch_to_tsquery(%(config)s::regconfig, %(search)s)) DESC, "
+            "n.updated_at DESC"
+        )
+
+    page = sql.SQL("")
+    if limit and limit > 0:
+        params["limit"] = limit
+        page = sql.SQL("LIMIT %(limit)s OFFSET %(offset)s")
+
+    query = sql.SQL(
+        """
+        SELECT {fields}, COALESCE(c.name, '') AS category_name
+        FROM notes_lists n
+        LEFT JOIN notes_categories c ON c.id = n.category_id
+        WHERE {where}
+        ORDER BY {order}
+        {page}
+        """
+    ).format(
+        fields=sql.SQL(", ").join(sql.SQL("n.") + sql.Identifier(f) for f in NOTE_FIELDS),
+        where=sql.SQL(" AND ").join(conditions),
+        order=order,
+        page=page,
+    )
+    return DBHelper.raw_sql(query, params)
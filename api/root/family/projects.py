@@ -0,0 +1,176 @@
+"""
+Family-scoped project queries.
+
+A user sees the projects they created plus the ones shared with them:
+FamilyHub projects of any of their family groups (meta.family_groups) or
+that tag them (tagged_ids), and Planner projects in the same way once they
+are public. The rule is evaluated in SQL so each request reads only the
+family's projects through the owner / family-group / tagged_ids indexes,
+with creator names joined in.
+
+Task counts and progress are rolled up onto the project row by a trigger on
+`tasks` (see tables.json), inside the same transaction as the task write,
+so neither list needs to aggregate tasks on read.
+"""
+
+from psycopg2 import sql
+
+from root.db.dbHelper import DBHelper
+
+PROJECT_SOURCES = ["familyhub", "planner"]
+
+PROJECT_FIELDS = [
+    "id",
+    "title",
+    "description",
+    "due_date",
+    "meta",
+    "progress",
+    "created_at",
+    "updated_at",
+    "source",
+    "user_id",
+    "is_active",
+    "task_count",
+    "done_count",
+    "last_activity_at",
+]
+
+TASK_FIELDS = [
+    "id",
+    "title",
+    "due_date",
+    "assignee",
+    "type",
+    "completed",
+    "project_id",
+]
+
+MAX_PAGE_SIZE = 500
+
+
+def user_family_groups(uid):
+    rows = DBHelper.find_all(
+        table_name="family_members",
+        select_fields=["family_group_id"],
+        filters={"fm_user_id": uid},
+    )
+    return sorted({r["family_group_id"] for r in rows if r["family_group_id"]})
+
+
+def query_projects(uid, family_groups, limit=None, offset=0, since=None, since_id=""):
+    """Projects visible to `uid`, newest first, joined with the creator's name.
+
+    With `since`, returns every visible project (inactive ones included, so
+    deletions propagate) changed after (`since`, `since_id`) in change order
+    instead. `limit` rows are returned at most; one extra row is read to
+    tell whether another page follows. Returns (rows, has_more).
+    """
+    conditions = [
+        sql.SQL("p.source = ANY(%(sources)s)"),
+        sql.SQL(
+            """(
+                p.user_id = %(uid)s
+                OR (
+                    (p.source = 'familyhub' OR p.meta ->> 'visibility' = 'public')
+                    AND (
+                        p.meta -> 'family_groups' ?| %(groups)s::text[]
+                        OR p.tagged_ids @> ARRAY[%(uid)s]::text[]
+                    )
+                )
+            )"""
+        ),
+    ]
+    params = {
+        "uid": uid,
+        "groups": list(family_groups),
+        "sources": PROJECT_SOURCES,
+        "offset": max(offset or 0, 0),
+    }
+
+    if since is not None:
+        conditions.append(sql.SQL("(p.updated_at, p.id) > (%(since)s, %(since_id)s)"))
+        params.update(since=since, since_id=since_id or "")
+        order = sql.SQL("p.updated_at, p.id")
+    else:
+        conditions.append(sql.SQL("p.is_active = 1"))
+        order = sql.SQL("p.created_at DESC, p.id")
+
+    page = sql.SQL("")
+    if limit:
+        params["limit"] = min(limit, MAX_PAGE_SIZE) + 1
+        page = sql.SQL("LIMIT %(limit)s OFFSET %(offset)s")
+
+    query = sql.SQL(
+        """
+        SELECT {fields}, COALESCE(u.user_name, 'Unknown') AS creator_name
+        FROM projects p
+        LEFT JOIN users u ON u.uid = p.user_id
+        WHERE {where}
+        ORDER BY {order}
+        {page}
+        """
+    ).format(
+        fields=sql.SQL(", ").join(sql.SQL("p.") + sql.Identifier(f) for f in PROJECT_FIELDS),
+        where=sql.SQL(" AND ").join(conditions),
+        order=order,
+        page=page,
+    )
+    rows = DBHelper.raw_sql(query, params)
+
+    has_more = bool(limit) and len(rows) > min(limit, MAX_PAGE_SIZE)
+    if has_more:
+        rows = rows[:-1]
+    return rows, has_more
+
+
+def format_project(p):
+    return {
+        "id": p["id"],
+        "title": p["title"],
+        "description": p["description"],
+        "due_date": p["due_date"].isoformat() if p["due_date"] else None,
+        "meta": p["meta"],
+        "progress": p["progress"],
+        "created_at": p["created_at"].isoformat(),
+        "updated_at": p["updated_at"].isoformat(),
+        "source": p["source"],
+        "created_by": p["user_id"],
+        "creator_name": p["creator_name"],
+        **format_rollup(p),
+    }
+
+
+def format_rollup(p):
+    last_activity = p.get("last_activity_at") or p.get("updated_at")
+    return {
+        "task_count": p.get("task_count") or 0,
+        "done_count": p.get("done_count") or 0,
+        "progress": p.get("progress"),
+        "last_activity_at": last_activity.isoformat() if last_activity else None,
+    }
+
+
+def project_rollup(project_id):
+    """Current task rollup of a project, None if it doesn't exist."""
+    row = DBHelper.find_one(
+        table_name="projects",
+        filters={"id": project_id},
+        select_fields=["task_count", "done_count", "progress", "last_activity_at", "updated_at"],
+    )
+    return {"project_id": project_id, **format_rollup(row)} if row else None
+
+
+def query_tasks(project_id, user_ids):
+    """Active tasks of a project created by any of `user_ids`.
+
+    Served by the (project_id, is_active) index.
+    """
+    query = sql.SQL(
+        """
+        SELECT {fields} FROM tasks
+        WHERE project_id = %s AND is_active = 1 AND user_id = ANY(%s)
+        ORDER BY id
+        """
+    ).format(fields=sql.SQL(", ").join(map(sql.Identifier, TASK_FIELDS)))
+    return DBHelper.raw_sql(query, (str(project_id), list(user_ids)))
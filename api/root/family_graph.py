@@ -0,0 +1,143 @@
+"""
+Family graph: who is connected to whom.
+
+`family_members` stores one row per (viewer, member) pair as each side saw
+it when the connection was made, so answering "who is in my family" used to
+take several queries with slightly different rules in every module. The
+graph is now materialized in `family_graph`, a closure table with one row
+per (user, connected user, group) carrying the name / email / relationship
+/ color as that user sees them. A trigger on `family_members` rebuilds a
+group's rows in the same transaction as any change to it and bumps the
+`family_graph_versions` row of each user who was or is in that group.
+
+Reads go through a per-process cache keyed by user. An entry is reused
+while that user's stored version is unchanged, so a membership change only
+invalidates the users it touches; each user's version is read at most once
+per request.
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import g, has_request_context
+
+from root.db.dbHelper import DBHelper
+
+DEFAULT_MEMBER_COLOR = "#0033FF"
+
+CACHE_SIZE = 10000
+
+_cache = OrderedDict()  # user_id -> (version, rows)
+_lock = threading.Lock()
+
+
+def current_version(user_id):
+    versions = g.setdefault("family_graph_versions", {}) if has_request_context() else {}
+    if user_id in versions:
+        return versions[user_id]
+
+    row = DBHelper.find_one(
+        table_name="family_graph_versions",
+        filters={"user_id": user_id},
+        select_fields=["version"],
+    )
+    versions[user_id] = row["version"] if row else 0
+    return versions[user_id]
+
+
+def invalidate(user_id=None):
+    """Drop cached rows (all users when `user_id` is None).
+
+    Writes are picked up through the version anyway; this is for callers
+    that change `family_members` and read the graph again in the same
+    request.
+    """
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+    if has_request_context():
+        if user_id is None:
+            g.pop("family_graph_versions", None)
+        else:
+            g.get("family_graph_versions", {}).pop(user_id, None)
+
+
+def _rows(user_id):
+    version = current_version(user_id)
+    with _lock:
+        hit = _cache.get(user_id)
+        if hit and hit[0] == version:
+            _cache.move_to_end(user_id)
+            return hit[1]
+
+    rows = DBHelper.raw_sql(
+        """
+        SELECT member_id, family_group_id, name, email, relationship, color
+        FROM family_graph
+        WHERE user_id = %s
+        ORDER BY family_group_id, (member_id = user_id) DESC, member_id
+        """,
+        (user_id,),
+    )
+    rows = [dict(r) for r in rows]
+
+    with _lock:
+        _cache[user_id] = (version, rows)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+
+def group_ids(user_id):
+    """Family groups the user belongs to."""
+    return list(dict.fromkeys(r["family_group_id"] for r in _rows(user_id)))
+
+
+def members(user_id, family_group_id=None):
+    """Everyone connected to `user_id` (themselves included), one entry per
+    person; with `family_group_id`, only that group's members.
+
+    Empty when the user isn't in any (or that) group.
+    """
+    result, seen = [], set()
+    for r in _rows(user_id):
+        if family_group_id and r["family_group_id"] != family_group_id:
+            continue
+        if r["member_id"] in seen:
+            continue
+        seen.add(r["member_id"])
+        result.append(
+            {
+                "user_id": r["member_id"],
+                "email": r["email"],
+                "name": r["name"],
+                "relationship": r["relationship"],
+                "color": r["color"],
+                "family_group_id": r["family_group_id"],
+            }
+        )
+    return result
+
+
+def member_ids(user_id, family_group_id=None):
+    """IDs of everyone connected to `user_id`, always including the user."""
+    ids = [m["user_id"] for m in members(user_id, family_group_id)]
+    if user_id not in ids:
+        ids.append(user_id)
+    return ids
+
+
+def members_by_email(user_id):
+    """email (lowercased) -> member, for resolving tagged members."""
+    index = {}
+    for m in members(user_id):
+        if m["email"]:
+            index.setdefault(m["email"].lower(), m)
+    return index
+
+
+def is_connected(user_id, other_id):
+    return user_id == other_id or any(r["member_id"] == other_id for r in _rows(user_id))
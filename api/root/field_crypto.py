@@ -0,0 +1,235 @@
+"""
+Field-level encryption for vault columns.
+
+The secret columns listed in ENCRYPTED_FIELDS (account passwords and
+usernames, document numbers in personal information) are stored encrypted
+with AES-GCM under a data key of the row's owner (`user_id`). Data keys
+are random per user, kept in `user_data_keys` wrapped by the application
+key (FIELD_ENCRYPTION_KEY) and cached unwrapped per process for a few
+minutes.
+
+Reads decrypt only the columns a caller asks for, over the whole result
+set at once: the owners' keys are fetched in one query and values that are
+never requested (a list showing titles only) are never decrypted. Values
+written before encryption was enabled are returned as they are until
+`python -m root.field_crypto` (or the next write) encrypts them.
+"""
+
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from root.config import FIELD_ENCRYPTION_KEY
+from root.db.dbHelper import DBHelper
+
+ENCRYPTED_FIELDS = {
+    "account_passwords": ["username", "password"],
+    "personal_information": [
+        "ssn",
+        "passport",
+        "license",
+        "birth_cert_number",
+        "birth_cert",
+        "state_id",
+    ],
+}
+
+PREFIX = "enc:v1:"
+NONCE_SIZE = 12
+
+KEY_CACHE_SIZE = 1000
+KEY_CACHE_TTL = 600
+
+_keys = OrderedDict()  # user_id -> (expires_at, AESGCM)
+_lock = threading.Lock()
+_master = None
+
+
+def _master_key():
+    global _master
+    if _master is None:
+        # A dedicated key: deriving it from a secret rotated for other
+        # reasons would make every vault value undecryptable
+        if not FIELD_ENCRYPTION_KEY:
+            raise RuntimeError("FIELD_ENCRYPTION_KEY is not configured")
+        _master = AESGCM(base64.b64decode(FIELD_ENCRYPTION_KEY))
+    return _master
+
+
+def _seal(aead, plaintext, aad):
+    nonce = os.urandom(NONCE_SIZE)
+    return base64.b64encode(nonce + aead.encrypt(nonce, plaintext, aad)).decode()
+
+
+def _open(aead, token, aad):
+    raw = base64.b64decode(token)
+    return aead.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], aad)
+
+
+def _cache_get(user_id, now):
+    hit = _keys.get(user_id)
+    if hit and hit[0] > now:
+        _keys.move_to_end(user_id)
+        return hit[1]
+    return None
+
+
+def data_keys(user_ids, create=False):
+    """user_id -> AESGCM for `user_ids`; cached keys first, the rest in one query.
+
+    With `create`, users without a key get one; otherwise they are left out
+    (they have nothing encrypted yet).
+    """
+    now = time.monotonic()
+    wanted = {u for u in user_ids if u}
+    with _lock:
+        found = {u: k for u in wanted if (k := _cache_get(u, now)) is not None}
+    missing = sorted(wanted - found.keys())
+
+    if missing:
+        rows = DBHelper.find_in(
+            table_name="user_data_keys",
+            select_fields=["user_id", "wrapped_key"],
+            field="user_id",
+            values=missing,
+        )
+        if create:
+            have = {r["user_id"] for r in rows}
+            for user_id in missing:
+                if user_id not in have:
+                    rows.extend(_create_key(user_id))
+
+        master = _master_key()
+        loaded = {
+            r["user_id"]: AESGCM(_open(master, r["wrapped_key"], r["user_id"].encode()))
+            for r in rows
+        }
+        with _lock:
+            for user_id, key in loaded.items():
+                _keys[user_id] = (now + KEY_CACHE_TTL, key)
+                _keys.move_to_end(user_id)
+            while len(_keys) > KEY_CACHE_SIZE:
+                _keys.popitem(last=False)
+        found.update(loaded)
+    return found
+
+
+def _create_key(user_id):
+    wrapped = _seal(_master_key(), AESGCM.generate_key(bit_length=256), user_id.encode())
+    DBHelper.execute_query(
+        """
+        INSERT INTO user_data_keys (user_id, wrapped_key) VALUES (%s, %s)
+        ON CONFLICT (user_id) DO NOTHING
+        """,
+        (user_id, wrapped),
+    )
+    # Re-read: a concurrent request may have created it first
+    return DBHelper.find_in(
+        table_name="user_data_keys",
+        select_fields=["user_id", "wrapped_key"],
+        field="user_id",
+        values=[user_id],
+    )
+
+
+def is_encrypted(value):
+    return isinstance(value, str) and value.startswith(PREFIX)
+
+
+def _aad(table, column):
+    return f"{table}.{column}".encode()
+
+
+def encrypt_fields(table, owner_id, values):
+    """Copy of `values` (column -> value) with the table's secret columns
+    encrypted under `owner_id`'s key. Empty values are stored as they are."""
+    secret = [c for c in ENCRYPTED_FIELDS.get(table, []) if values.get(c) and not is_encrypted(values[c])]
+    if not secret:
+        return dict(values)
+
+    key = data_keys([owner_id], create=True)[owner_id]
+    encrypted = dict(values)
+    for column in secret:
+        encrypted[column] = PREFIX + _seal(key, str(values[column]).encode(), _aad(table, column))
+    return encrypted
+
+
+def decrypt_rows(table, rows, columns=None, owner_field="user_id"):
+    """Decrypt `columns` (default: every secret column present) of `rows` in place.
+
+    Only the requested columns are touched; all owners' keys are loaded in
+    one go. Returns `rows`.
+    """
+    secret = ENCRYPTED_FIELDS.get(table, [])
+    targets = [c for c in (columns if columns is not None else secret) if c in secret]
+    if not rows or not targets:
+        return rows
+
+    owners = {r[owner_field] for r in rows if any(is_encrypted(r.get(c)) for c in targets)}
+    if not owners:
+        return rows
+
+    keys = data_keys(owners)
+    for row in rows:
+        key = keys.get(row[owner_field])
+        for column in targets:
+            value = row.get(column)
+            if key and is_encrypted(value):
+                row[column] = _open(key, value[len(PREFIX):], _aad(table, column)).decode()
+    return rows
+
+
+def _camel(column):
+    head, *rest = column.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+def redact(table, values):
+    """Copy of `values` safe for audit logs: secret columns (by column or
+    camelCase request name) masked, in nested request objects too."""
+    if not isinstance(values, dict):
+        return values
+    secret = set(ENCRYPTED_FIELDS.get(table, []))
+    secret |= {_camel(c) for c in secret}
+    return {
+        k: "***" if k in secret and v else redact(table, v)
+        for k, v in values.items()
+    }
+
+
+def encrypt_existing(batch_size=500):
+    """Encrypt plaintext values written before encryption was enabled.
+
+    Returns the number of rows rewritten per table.
+    """
+    counts = {}
+    for table, columns in ENCRYPTED_FIELDS.items():
+        plaintext = " OR ".join(
+            f"({c} IS NOT NULL AND {c} <> '' AND {c} NOT LIKE '{PREFIX}%%')" for c in columns
+        )
+        counts[table] = 0
+        while True:
+            rows = DBHelper.raw_sql(
+                f"SELECT id, user_id, {', '.join(columns)} FROM {table} "
+                f"WHERE user_id IS NOT NULL AND ({plaintext}) ORDER BY id LIMIT %s",
+                (batch_size,),
+            )
+            if not rows:
+                break
+            data_keys({r["user_id"] for r in rows}, create=True)
+            for r in rows:
+                updates = encrypt_fields(table, r["user_id"], {c: r[c] for c in columns})
+                DBHelper.update_one(table_name=table, filters={"id": r["id"]}, updates=updates)
+            counts[table] += len(rows)
+    return counts
+
+
+if __name__ == "__main__":
+    from root.db.db import postgres
+
+    postgres.init_app()
+    print(f"Field encryption: {encrypt_existing()}")
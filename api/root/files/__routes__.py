@@ -41,6 +41,7 @@ from .models import (
     CopyDriveFile,
     DeleteHubFile,
     FindDuplicateFiles,
+    FindCrossProviderDuplicates,
     GetActivityLog,
     GetHubFiles,
     GetStorageAnalytics,
@@ -57,6 +58,8 @@ from .models import (
     GetDriveFileInfo,
     GetDriveStorage,
     UploadHubFile,
+    UploadSession,
+    GetThumbnail,
 )
 from . import google_drive_api
 
@@ -88,6 +91,7 @@ google_drive_api.add_resource(AdvancedSearch, "/search/advanced")
 
 # Duplicate Detection
 google_drive_api.add_resource(FindDuplicateFiles, "/duplicates/find")
+google_drive_api.add_resource(FindCrossProviderDuplicates, "/duplicates/all")
 
 # Storage Analytics
 google_drive_api.add_resource(GetStorageAnalytics, "/analytics/storage")
@@ -151,5 +155,7 @@ google_drive_api.add_resource(CreateOutlookFolder, "/outlook/folder/create")
 # google_drive_api.add_resource(ShareOutlookFile, "/outlook/share")
 
 google_drive_api.add_resource(UploadHubFile, "/upload/hub-file")
+google_drive_api.add_resource(UploadSession, "/uploads", "/uploads/<string:upload_id>")
+google_drive_api.add_resource(GetThumbnail, "/thumbnails/<string:token>")
 google_drive_api.add_resource(GetHubFiles, "/get/hub-files")
 google_drive_api.add_resource(DeleteHubFile, "/delete/hub-file")
\ No newline at end of file
@@ -0,0 +1,830 @@
+"""
+Local catalog of cloud files.
+
+`files_index` mirrors the files of every connected Google Drive, Dropbox and
+OneDrive account, so search, storage analytics, hub listings and duplicate
+detection are answered from Postgres instead of live provider requests
+(analytics used to see only the first 1000 files). Each account's sync
+state is a row of `file_catalog_accounts`:
+
+- the first sync lists the whole account; rows it didn't see get
+  `removed_at`. Drive takes a Changes API start page token before listing,
+  Dropbox and OneDrive return their cursor / delta link with the last page;
+- later syncs read only the changes since the saved cursor, which is
+  advanced in the same transaction as the rows of each page;
+- removed files keep their row with `removed_at` set (other rows and the
+  Drive folder map may point at them), trashed ones have `is_trashed`.
+
+A file created while the first listing runs may be missed or marked
+removed by it; the changes since the cursor fix it on the next sync, which
+is scheduled right away.
+
+A background thread syncs accounts every SYNC_INTERVAL_MINUTES and then
+hashes what duplicate detection needs (see root.files.duplicates); run
+`python -m root.files.catalog` from cron to do the same without the web
+process.
+"""
+
+import mimetypes
+import posixpath
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import dropbox
+import requests
+from dropbox.exceptions import ApiError
+from google.auth.transport.requests import AuthorizedSession
+from psycopg2.extras import execute_values
+from requests import HTTPError
+
+from root.db.dbHelper import DBHelper
+from root.files import duplicates, thumbnails
+from root.files.drive_listing import DRIVE_FILES_URL, FOLDER_MIME_TYPE, credentials
+from root.files.outlook import MS_GRAPH_BASE_URL, get_outlook_headers
+
+PROVIDERS = ("google", "dropbox", "outlook")
+
+DRIVE_CHANGES_URL = "https://www.googleapis.com/drive/v3/changes"
+DRIVE_FIELDS = (
+    "id, name, mimeType, size, quotaBytesUsed, md5Checksum, parents, trashed, starred, "
+    "shared, ownedByMe, webViewLink, thumbnailLink, createdTime, modifiedTime"
+)
+
+ONEDRIVE_FIELDS = (
+    "id,name,size,file,folder,root,deleted,parentReference,webUrl,shared,"
+    "createdDateTime,lastModifiedDateTime"
+)
+
+PAGE_SIZE = 1000
+DROPBOX_PAGE_SIZE = 2000
+REQUEST_TIMEOUT = 60
+SYNC_INTERVAL_MINUTES = 5
+SYNC_WORKERS = 4
+BATCH_SIZE = 8
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 3600
+# A first sync of a large Drive heartbeats once per page; a row left in
+# "syncing" without one for this long belongs to a dead worker
+STALE_AFTER_MINUTES = 15
+# How often a read re-checks that a user's accounts are catalogued
+REFRESH_SECONDS = 300
+POLL_SECONDS = 60
+
+_COLUMNS = (
+    "id, storage_account_id, user_id, provider, external_file_id, external_parent_id, "
+    "file_name, file_path, file_size, file_type, mime_type, is_folder, checksum, "
+    "checksum_type, content_hash, is_trashed, is_starred, is_shared, owned_by_me, "
+    "thumbnail_link, created_time, last_modified, synced_at"
+)
+
+_UPSERT = f"""
+    WITH incoming ({_COLUMNS}) AS (VALUES %s),
+    updated AS (
+        UPDATE files_index f SET
+            user_id = i.user_id,
+            external_parent_id = i.external_parent_id,
+            file_name = i.file_name,
+            file_path = i.file_path,
+            file_size = i.file_size,
+            file_type = i.file_type,
+            mime_type = i.mime_type,
+            is_folder = i.is_folder,
+            checksum = i.checksum,
+            checksum_type = i.checksum_type,
+            -- A computed content hash holds until the content changes
+            content_hash = CASE
+                WHEN f.checksum IS NOT DISTINCT FROM i.checksum
+                 AND f.file_size IS NOT DISTINCT FROM i.file_size
+                THEN COALESCE(i.content_hash, f.content_hash)
+                ELSE i.content_hash
+            END,
+            content_hashed_at = CASE
+                WHEN f.checksum IS NOT DISTINCT FROM i.checksum
+                 AND f.file_size IS NOT DISTINCT FROM i.file_size
+                THEN f.content_hashed_at
+            END,
+            is_trashed = i.is_trashed,
+            is_starred = i.is_starred,
+            is_shared = i.is_shared,
+            owned_by_me = i.owned_by_me,
+            thumbnail_link = i.thumbnail_link,
+            created_time = i.created_time,
+            last_modified = i.last_modified,
+            synced_at = i.synced_at,
+            indexed_at = i.synced_at,
+            removed_at = NULL
+        FROM incoming i
+        WHERE f.storage_account_id = i.storage_account_id
+          AND f.external_file_id = i.external_file_id
+        RETURNING f.external_file_id
+    )
+    INSERT INTO files_index ({_COLUMNS}, created_at, indexed_at)
+    SELECT i.*, i.synced_at, i.synced_at FROM incoming i
+    WHERE i.external_file_id NOT IN (SELECT external_file_id FROM updated)
+"""
+
+_TEMPLATE = (
+    "(%s::uuid, %s::int, %s, %s, %s, %s, %s, %s, %s::bigint, %s, %s, %s::boolean, %s, %s, %s, "
+    "%s::boolean, %s::boolean, %s::boolean, %s::boolean, %s, %s::timestamp, %s::timestamp, "
+    "%s::timestamp)"
+)
+
+
+# ───── Accounts ─────
+
+def enroll(user_ids=None):
+    """Add the active storage accounts of `user_ids` (default: everyone) to
+    the catalog; accounts disabled earlier are synced again."""
+    where = "AND c.user_id = ANY(%s)" if user_ids is not None else ""
+    DBHelper.execute_query(
+        f"""
+        INSERT INTO file_catalog_accounts (storage_account_id, user_id, provider)
+        SELECT c.id, c.user_id, c.provider FROM connected_accounts c
+        WHERE c.provider = ANY(%s) AND c.is_active = 1 {where}
+          AND NOT EXISTS (
+              SELECT 1 FROM file_catalog_accounts a
+              WHERE a.storage_account_id = c.id AND a.status <> 'disabled'
+          )
+        ON CONFLICT (storage_account_id) DO UPDATE SET
+            status = 'idle', next_sync_at = NOW(), updated_at = NOW()
+        WHERE file_catalog_accounts.status = 'disabled'
+        """,
+        (list(PROVIDERS), list(user_ids)) if user_ids is not None else (list(PROVIDERS),),
+    )
+
+
+_refreshed = {}  # user_id -> monotonic time of the last enroll
+_refreshed_lock = threading.Lock()
+
+
+def refresh(user_ids):
+    """Make sure `user_ids`' accounts are catalogued and the worker runs.
+
+    Called on reads, so each user is checked at most every REFRESH_SECONDS
+    per process.
+    """
+    now = time.monotonic()
+    with _refreshed_lock:
+        due = [u for u in user_ids if _refreshed.get(u, 0) + REFRESH_SECONDS <= now]
+        _refreshed.update((u, now) for u in due)
+    if due:
+        enroll(due)
+    wake()
+
+
+def accounts(user_ids, providers=PROVIDERS):
+    """Catalog state of the storage accounts of `user_ids`, by storage account id."""
+    rows = DBHelper.raw_sql(
+        """
+        SELECT a.storage_account_id, a.user_id, a.provider, c.email, a.status,
+               a.full_synced_at, a.last_synced_at
+        FROM file_catalog_accounts a
+        JOIN connected_accounts c ON c.id = a.storage_account_id
+        WHERE a.user_id = ANY(%s) AND a.provider = ANY(%s) AND c.is_active = 1
+        """,
+        (list(user_ids), list(providers)),
+    )
+    return {r["storage_account_id"]: r for r in rows}
+
+
+def summary(user_ids, providers=PROVIDERS):
+    """Catalog summary for responses served from it."""
+    rows = accounts(user_ids, providers).values()
+    return {
+        "complete": bool(rows) and all(r["full_synced_at"] for r in rows),
+        "accounts": [
+            {
+                "email": r["email"],
+                "provider": r["provider"],
+                "status": r["status"],
+                "indexed": bool(r["full_synced_at"]),
+                "last_synced_at": r["last_synced_at"].isoformat() if r["last_synced_at"] else None,
+            }
+            for r in rows
+        ],
+    }
+
+
+# ───── Queries ─────
+
+_LIVE = "removed_at IS NULL AND NOT COALESCE(is_trashed, FALSE)"
+
+
+def _escape_like(value):
+    """`value` matched literally inside a LIKE pattern (backslash is the default escape)."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _iso(value):
+    return value.isoformat() + "Z" if value else None
+
+
+def as_drive_file(row):
+    """Catalog row in the shape of a Drive API file."""
+    item = {
+        "id": row["external_file_id"],
+        "name": row["file_name"],
+        "mimeType": row["mime_type"],
+        "modifiedTime": _iso(row["last_modified"]),
+        "createdTime": _iso(row["created_time"]),
+        "webViewLink": row["file_path"],
+        "thumbnailLink": None,
+        "parents": [row["external_parent_id"]] if row["external_parent_id"] else [],
+        "shared": bool(row["is_shared"]),
+        "starred": bool(row["is_starred"]),
+        "ownedByMe": bool(row["owned_by_me"]),
+    }
+    if not row["is_folder"]:
+        item["size"] = str(row["file_size"] or 0)
+        item["md5Checksum"] = row["checksum"]
+        if row["thumbnail_link"]:
+            item["thumbnailLink"] = thumbnails.drive_url(
+                row["storage_account_id"], {**item, "thumbnailLink": row["thumbnail_link"]}
+            )
+    return item
+
+
+_SELECT = """
+    SELECT storage_account_id, external_file_id, external_parent_id, file_name, file_path,
+           file_size, mime_type, is_folder, checksum, is_shared, is_starred, owned_by_me,
+           thumbnail_link, created_time, last_modified
+"""
+
+
+def children(storage_account_id, parent_id):
+    """Live files directly in `parent_id` of one account, newest first."""
+    rows = DBHelper.raw_sql(
+        f"""
+        {_SELECT}
+        FROM files_index
+        WHERE storage_account_id = %s AND external_parent_id = %s AND {_LIVE}
+        ORDER BY last_modified DESC NULLS LAST
+        """,
+        (storage_account_id, parent_id),
+    )
+    return [as_drive_file(r) for r in rows]
+
+
+def search(user_id, query=None, mime_type=None, modified_from=None, modified_to=None,
+           min_size=None, max_size=None, starred=None, shared=None, owned_by_me=None,
+           parent_id=None, provider="google", limit=100, offset=0):
+    """Live catalogued files of `user_id` in `provider` matching every given filter.
+
+    Sizes are in bytes. Returns (files, total matches).
+    """
+    conditions = ["user_id = %(uid)s", "provider = %(provider)s", _LIVE]
+    params = {"uid": user_id, "provider": provider, "limit": limit, "offset": offset}
+    filters = {
+        "query": (query, "file_name ILIKE %(query)s", lambda v: f"%{_escape_like(v)}%"),
+        "mime_type": (mime_type, "mime_type = %(mime_type)s", None),
+        "modified_from": (modified_from, "last_modified >= %(modified_from)s::timestamp", None),
+        "modified_to": (modified_to, "last_modified <= %(modified_to)s::timestamp", None),
+        "min_size": (min_size, "file_size >= %(min_size)s", None),
+        "max_size": (max_size, "file_size <= %(max_size)s", None),
+        "starred": (starred, "is_starred = %(starred)s", bool),
+        "shared": (shared, "is_shared = %(shared)s", bool),
+        "owned_by_me": (owned_by_me, "owned_by_me = %(owned_by_me)s", bool),
+        "parent_id": (parent_id, "external_parent_id = %(parent_id)s", None),
+    }
+    for name, (value, condition, convert) in filters.items():
+        if value is not None and value != "":
+            conditions.append(condition)
+            params[name] = convert(value) if convert else value
+
+    rows = DBHelper.raw_sql(
+        f"""
+        {_SELECT}, COUNT(*) OVER () AS total
+        FROM files_index
+        WHERE {" AND ".join(conditions)}
+        ORDER BY last_modified DESC NULLS LAST
+        LIMIT %(limit)s OFFSET %(offset)s
+        """,
+        params,
+    )
+    total = rows[0]["total"] if rows else 0
+    return [as_drive_file(r) for r in rows], total
+
+
+def analytics(user_id, provider="google"):
+    """Count and bytes of `user_id`'s live `provider` files per main MIME type."""
+    rows = DBHelper.raw_sql(
+        f"""
+        SELECT COALESCE(NULLIF(split_part(mime_type, '/', 1), ''), 'unknown') AS main_type,
+               COUNT(*) AS count,
+               COALESCE(SUM(file_size), 0) AS total_size
+        FROM files_index
+        WHERE user_id = %s AND provider = %s AND {_LIVE} AND NOT COALESCE(is_folder, FALSE)
+        GROUP BY 1
+        ORDER BY 3 DESC
+        """,
+        (user_id, provider),
+    )
+    return {r["main_type"]: {"count": r["count"], "total_size": int(r["total_size"])} for r in rows}
+
+
+# ───── Sync ─────
+
+class _CursorExpired(Exception):
+    """The saved cursor is no longer accepted; the account is listed again."""
+
+
+def _entry(account, provider, external_id, parent_id, name, path, size, mime_type, is_folder,
+           checksum_type, checksum, synced_at, content_hash=None, trashed=False, starred=False,
+           shared=False, owned_by_me=True, thumbnail_link=None, created=None, modified=None):
+    """Row values in _COLUMNS order."""
+    return (
+        str(uuid.uuid4()),
+        account["id"],
+        account["user_id"],
+        provider,
+        external_id,
+        parent_id,
+        (name or "")[:500],
+        path,
+        int(size or 0),
+        "folder" if is_folder else (mime_type or "file")[:100],
+        (mime_type or "")[:100] or None,
+        is_folder,
+        checksum,
+        checksum_type if checksum else None,
+        content_hash,
+        bool(trashed),
+        bool(starred),
+        bool(shared),
+        True if owned_by_me is None else bool(owned_by_me),
+        thumbnail_link,
+        created,
+        modified,
+        synced_at,
+    )
+
+
+def _upsert(cur, rows):
+    if rows:
+        execute_values(cur, _UPSERT, rows, template=_TEMPLATE)
+
+
+def _heartbeat(cur, job):
+    cur.execute(
+        "UPDATE file_catalog_accounts SET updated_at = NOW() WHERE storage_account_id = %s",
+        (job["storage_account_id"],),
+    )
+
+
+def _finish(cur, job, cursor, full=False):
+    cur.execute(
+        """
+        UPDATE file_catalog_accounts SET
+            cursor = %s,
+            status = 'idle',
+            attempts = 0,
+            last_error = NULL,
+            last_synced_at = NOW(),
+            full_synced_at = CASE WHEN %s THEN NOW() ELSE full_synced_at END,
+            next_sync_at = CASE WHEN %s THEN NOW()
+                                ELSE NOW() + make_interval(mins => %s) END,
+            updated_at = NOW()
+        WHERE storage_account_id = %s
+        """,
+        (cursor, full, full, SYNC_INTERVAL_MINUTES, job["storage_account_id"]),
+    )
+
+
+def _save_page(job, rows, removed_ids=(), removed_paths=(), cursor=None, done=False):
+    """Write one page of a sync and record the progress in the same transaction.
+
+    Removals are applied before `rows`. `removed_paths` (Dropbox) also
+    removes everything below them.
+    """
+    _save_runs(job, [(removed_ids, removed_paths, rows)], cursor, done)
+
+
+def _save_runs(job, runs, cursor=None, done=False):
+    """`_save_page` for a page made of several (removed_ids, removed_paths,
+    rows) runs, applied in order."""
+    with DBHelper.transaction() as cur:
+        for removed_ids, removed_paths, rows in runs:
+            _apply(cur, job, rows, removed_ids, removed_paths)
+        if done:
+            _finish(cur, job, cursor)
+        elif cursor:
+            cur.execute(
+                """
+                UPDATE file_catalog_accounts SET cursor = %s, updated_at = NOW()
+                WHERE storage_account_id = %s
+                """,
+                (cursor, job["storage_account_id"]),
+            )
+        else:
+            _heartbeat(cur, job)
+
+
+def _apply(cur, job, rows, removed_ids, removed_paths):
+    now = datetime.utcnow()
+    if removed_ids:
+        cur.execute(
+            """
+            UPDATE files_index SET removed_at = %s
+            WHERE storage_account_id = %s AND external_file_id = ANY(%s)
+              AND removed_at IS NULL
+            """,
+            (now, job["storage_account_id"], list(removed_ids)),
+        )
+    if removed_paths:
+        cur.execute(
+            """
+            UPDATE files_index f SET removed_at = %s
+            WHERE f.storage_account_id = %s AND f.removed_at IS NULL
+              AND EXISTS (
+                  SELECT 1 FROM unnest(%s::text[]) AS p(path)
+                  WHERE LOWER(f.file_path) = p.path
+                     OR starts_with(LOWER(f.file_path), p.path || '/')
+              )
+            """,
+            (now, job["storage_account_id"], list(removed_paths)),
+        )
+    _upsert(cur, rows)
+    duplicates.adopt_known(cur, job["storage_account_id"], [row[4] for row in rows if not row[14]])
+
+
+def _finish_full(job, started, cursor):
+    """After a full listing: rows it didn't touch are gone from the account."""
+    with DBHelper.transaction() as cur:
+        cur.execute(
+            """
+            UPDATE files_index SET removed_at = %s
+            WHERE storage_account_id = %s AND removed_at IS NULL
+              AND (synced_at IS NULL OR synced_at < %s)
+            """,
+            (started, job["storage_account_id"], started),
+        )
+        _finish(cur, job, cursor, full=True)
+
+
+# Google Drive
+
+def _get(session, url, params):
+    response = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def _drive_row(account, item, synced_at):
+    mime_type = item.get("mimeType") or ""
+    return _entry(
+        account,
+        "google",
+        item["id"],
+        (item.get("parents") or [None])[0],
+        item.get("name"),
+        item.get("webViewLink"),
+        item.get("size") or item.get("quotaBytesUsed"),
+        mime_type,
+        mime_type == FOLDER_MIME_TYPE,
+        "md5",
+        item.get("md5Checksum"),
+        synced_at,
+        trashed=item.get("trashed"),
+        starred=item.get("starred"),
+        shared=item.get("shared"),
+        owned_by_me=item.get("ownedByMe"),
+        thumbnail_link=item.get("thumbnailLink"),
+        created=item.get("createdTime"),
+        modified=item.get("modifiedTime"),
+    )
+
+
+def _drive_full(job, account):
+    session = AuthorizedSession(credentials(account))
+    try:
+        start_token = _get(session, f"{DRIVE_CHANGES_URL}/startPageToken", {})["startPageToken"]
+        started = datetime.utcnow()
+        params = {
+            "q": "trashed = false",
+            "pageSize": PAGE_SIZE,
+            "fields": f"nextPageToken, files({DRIVE_FIELDS})",
+        }
+        while True:
+            data = _get(session, DRIVE_FILES_URL, params)
+            _save_page(job, [_drive_row(account, f, started) for f in data.get("files", [])])
+            if not data.get("nextPageToken"):
+                break
+            params["pageToken"] = data["nextPageToken"]
+        _finish_full(job, started, start_token)
+    finally:
+        session.close()
+
+
+def _drive_changes(job, account):
+    session = AuthorizedSession(credentials(account))
+    params = {
+        "pageToken": job["cursor"],
+        "pageSize": PAGE_SIZE,
+        "includeRemoved": "true",
+        "spaces": "drive",
+        "fields": f"nextPageToken, newStartPageToken, changes(fileId, removed, file({DRIVE_FIELDS}))",
+    }
+    try:
+        while True:
+            try:
+                data = _get(session, DRIVE_CHANGES_URL, params)
+            except HTTPError as e:
+                if e.response is not None and e.response.status_code in (400, 404, 410):
+                    raise _CursorExpired(str(e))
+                raise
+            now = datetime.utcnow()
+            # Only the last change of a file in the page matters
+            latest = {}
+            for change in data.get("changes", []):
+                # Shared drive changes (changeType "drive") have no fileId
+                file_id = change.get("fileId")
+                if file_id:
+                    latest[file_id] = None if change.get("removed") else change.get("file")
+            next_token = data.get("nextPageToken")
+            _save_page(
+                job,
+                [_drive_row(account, item, now) for item in latest.values() if item],
+                removed_ids=[file_id for file_id, item in latest.items() if item is None],
+                cursor=next_token or data.get("newStartPageToken"),
+                done=not next_token,
+            )
+            if not next_token:
+                return
+            params["pageToken"] = next_token
+    finally:
+        session.close()
+
+
+# Dropbox
+
+def _dropbox_row(account, entry, synced_at):
+    is_folder = isinstance(entry, dropbox.files.FolderMetadata)
+    content_hash = None if is_folder else entry.content_hash
+    return _entry(
+        account,
+        "dropbox",
+        entry.id,
+        posixpath.dirname(entry.path_lower),
+        entry.name,
+        entry.path_display,
+        0 if is_folder else entry.size,
+        None if is_folder else mimetypes.guess_type(entry.name)[0] or "application/octet-stream",
+        is_folder,
+        "dropbox",
+        content_hash,
+        synced_at,
+        # The provider checksum is the content hash other providers are compared by
+        content_hash=content_hash,
+        modified=None if is_folder else entry.server_modified,
+    )
+
+
+def _dropbox_page(job, account, result, synced_at, done):
+    # Entries must be applied in order: a path deleted and created again in
+    # the same page has to stay. A deletion after an entry starts a new run.
+    runs = [((), [], [])]
+    for entry in result.entries:
+        _, removed, rows = runs[-1]
+        if isinstance(entry, dropbox.files.DeletedMetadata):
+            if rows:
+                runs.append(((), [entry.path_lower], []))
+            else:
+                removed.append(entry.path_lower)
+        else:
+            rows.append(_dropbox_row(account, entry, synced_at))
+    _save_runs(job, runs, cursor=result.cursor if done else None, done=done)
+
+
+def _dropbox_full(job, account):
+    dbx = dropbox.Dropbox(account["access_token"], timeout=REQUEST_TIMEOUT)
+    started = datetime.utcnow()
+    result = dbx.files_list_folder("", recursive=True, limit=DROPBOX_PAGE_SIZE)
+    while True:
+        _dropbox_page(job, account, result, started, done=False)
+        if not result.has_more:
+            break
+        result = dbx.files_list_folder_continue(result.cursor)
+    _finish_full(job, started, result.cursor)
+
+
+def _dropbox_changes(job, account):
+    dbx = dropbox.Dropbox(account["access_token"], timeout=REQUEST_TIMEOUT)
+    cursor = job["cursor"]
+    while True:
+        try:
+            result = dbx.files_list_folder_continue(cursor)
+        except ApiError as e:
+            if getattr(e.error, "is_reset", lambda: False)():
+                raise _CursorExpired(str(e))
+            raise
+        _dropbox_page(job, account, result, datetime.utcnow(), done=not result.has_more)
+        if not result.has_more:
+            return
+        cursor = result.cursor
+
+
+# OneDrive
+
+def _onedrive_row(account, item, synced_at):
+    is_folder = "folder" in item
+    file = item.get("file") or {}
+    return _entry(
+        account,
+        "outlook",
+        item["id"],
+        (item.get("parentReference") or {}).get("id"),
+        item.get("name"),
+        item.get("webUrl"),
+        0 if is_folder else item.get("size"),
+        file.get("mimeType"),
+        is_folder,
+        "quickxor",
+        (file.get("hashes") or {}).get("quickXorHash"),
+        synced_at,
+        shared="shared" in item,
+        created=item.get("createdDateTime"),
+        modified=item.get("lastModifiedDateTime"),
+    )
+
+
+def _onedrive_delta(job, account, url, params, full):
+    """Follow a delta query to its end; returns (delta link, synced_at of its rows)."""
+    headers = get_outlook_headers(account["access_token"])
+    synced_at = datetime.utcnow()
+    while True:
+        response = requests.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 410 and not full:
+            raise _CursorExpired(response.text)
+        response.raise_for_status()
+        data = response.json()
+        if not full:
+            synced_at = datetime.utcnow()
+
+        # An item can appear more than once; its last state counts
+        latest = {item["id"]: item for item in data.get("value", [])}
+        rows, removed = [], []
+        for item in latest.values():
+            if "deleted" in item:
+                removed.append(item["id"])
+            elif "root" not in item:
+                rows.append(_onedrive_row(account, item, synced_at))
+
+        next_link = data.get("@odata.nextLink")
+        delta_link = data.get("@odata.deltaLink")
+        if full:
+            _save_page(job, rows, removed_ids=removed)
+        else:
+            _save_page(job, rows, removed_ids=removed, cursor=next_link or delta_link, done=not next_link)
+        if not next_link:
+            return delta_link, synced_at
+        # Next links carry the query already
+        url, params = next_link, None
+
+
+def _onedrive_full(job, account):
+    delta_link, started = _onedrive_delta(
+        job, account, f"{MS_GRAPH_BASE_URL}/me/drive/root/delta", {"$select": ONEDRIVE_FIELDS}, full=True
+    )
+    _finish_full(job, started, delta_link)
+
+
+def _onedrive_changes(job, account):
+    _onedrive_delta(job, account, job["cursor"], None, full=False)
+
+
+SYNCERS = {
+    "google": (_drive_full, _drive_changes),
+    "dropbox": (_dropbox_full, _dropbox_changes),
+    "outlook": (_onedrive_full, _onedrive_changes),
+}
+
+
+def _claim(limit):
+    return DBHelper.execute_query(
+        """
+        UPDATE file_catalog_accounts a SET
+            status = 'syncing',
+            attempts = a.attempts + 1,
+            updated_at = NOW()
+        WHERE a.storage_account_id IN (
+            SELECT storage_account_id FROM file_catalog_accounts
+            WHERE (status IN ('idle', 'error') AND next_sync_at <= NOW())
+               OR (status = 'syncing'
+                   AND updated_at < NOW() - make_interval(mins => %s))
+            ORDER BY next_sync_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING a.*
+        """,
+        (STALE_AFTER_MINUTES, limit),
+    )
+
+
+def _fail(job, error):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (job["attempts"] - 1), BACKOFF_MAX_SECONDS)
+    delay += random.uniform(0, delay / 2)
+    DBHelper.execute_query(
+        """
+        UPDATE file_catalog_accounts SET
+            status = 'error',
+            next_sync_at = NOW() + make_interval(secs => %s),
+            last_error = %s,
+            updated_at = NOW()
+        WHERE storage_account_id = %s
+        """,
+        (delay, str(error), job["storage_account_id"]),
+    )
+
+
+def _run(job):
+    account = DBHelper.find_one(
+        "connected_accounts",
+        filters={"id": job["storage_account_id"], "is_active": 1},
+        select_fields=["id", "user_id", "email", "access_token", "refresh_token"],
+    )
+    if not account or job["provider"] not in SYNCERS:
+        DBHelper.execute_query(
+            "UPDATE file_catalog_accounts SET status = 'disabled', updated_at = NOW() WHERE storage_account_id = %s",
+            (job["storage_account_id"],),
+        )
+        return
+
+    full_sync, sync_changes = SYNCERS[job["provider"]]
+    try:
+        if job["cursor"]:
+            try:
+                sync_changes(job, account)
+                return
+            except _CursorExpired:
+                print(f"⚠ {job['provider']} cursor of {account['email']} expired; listing again")
+        full_sync(job, account)
+    except Exception as e:
+        print(f"⚠ Catalog sync of {job['provider']} account {account['email']} failed: {e}")
+        try:
+            _fail(job, e)
+        except Exception as db_error:
+            # Left in "syncing"; reclaimed once it goes stale
+            print(f"⚠ Failed to record catalog sync failure: {db_error}")
+
+
+def process_pending(limit=BATCH_SIZE, max_workers=SYNC_WORKERS):
+    """Claim one batch of due accounts and sync them concurrently; returns the batch size."""
+    jobs = _claim(limit)
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_run, jobs))
+    return len(jobs)
+
+
+def drain(max_workers=SYNC_WORKERS):
+    """Enroll new accounts, sync until none is due, then hash duplicate
+    candidates; returns the number of syncs."""
+    enroll()
+    total = 0
+    while True:
+        processed = process_pending(max_workers=max_workers)
+        if not processed:
+            break
+        total += processed
+    duplicates.hash_pending()
+    return total
+
+
+# ───── Background worker ─────
+
+_wake_event = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _worker_loop():
+    while True:
+        _wake_event.clear()
+        try:
+            drain()
+        except Exception as e:
+            print(f"⚠ File catalog worker error: {e}")
+        _wake_event.wait(POLL_SECONDS)
+
+
+def wake():
+    """Start the background worker on first use and nudge it to sync now."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="file-catalog", daemon=True)
+            _worker.start()
+    _wake_event.set()
+
+
+if __name__ == "__main__":
+    from root.db.db import postgres
+
+    postgres.init_app()
+    print(f"File catalog: synced {drain()} accounts")
@@ -0,0 +1,270 @@
+"""
+Paged folder listing across a user's Google accounts.
+
+`list_folder` asks every connected account for its next page at the same
+time (one thread and HTTP session per account), so a request takes as long
+as the slowest account rather than the sum of all of them, and merges the
+pages by the requested sort order.
+
+Each account's results arrive already sorted by Drive, so the merge stops
+as soon as the page is full or an account runs out of fetched items while
+it still has more on Drive (its next item could sort anywhere after that).
+Where each account stopped is returned as one opaque continuation token:
+per account, the Drive page token it was read from and how many items of
+that page were already returned. Accounts that are done are left out.
+"""
+
+import base64
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.credentials import Credentials
+
+from root.config import CLIENT_ID, CLIENT_SECRET
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_ACCOUNT_WORKERS = 8
+REQUEST_TIMEOUT = 30
+
+# sortBy -> (Drive orderBy field, merge key)
+SORT_FIELDS = {
+    "name": ("name", lambda item: (item.get("name") or "").lower()),
+    "modifiedTime": ("modifiedTime", lambda item: item.get("modifiedTime") or ""),
+    "size": ("quotaBytesUsed", lambda item: int(item.get("quotaBytesUsed") or 0)),
+}
+
+# Response field -> Drive field it is read from
+FILE_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "mimeType": "mimeType",
+    "size": "size",
+    "modifiedTime": "modifiedTime",
+    "createdTime": "createdTime",
+    "thumbnailLink": "thumbnailLink",
+    "webViewLink": "webViewLink",
+    "webContentLink": "webContentLink",
+    "owners": "owners",
+    "shared": "shared",
+    "starred": "starred",
+    "parents": "parents",
+}
+
+# Always returned, whatever the field mask
+REQUIRED_FIELDS = {"id", "name", "mimeType", "source_email", "account_name"}
+
+
+class InvalidPageToken(ValueError):
+    pass
+
+
+def encode_token(scope, cursors):
+    if not cursors:
+        return None
+    raw = json.dumps({"q": scope, "a": cursors}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token, scope):
+    """email -> [Drive page token or None, items already returned]."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        cursors = {
+            email: [cursor[0], int(cursor[1])] for email, cursor in data["a"].items()
+        }
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        raise InvalidPageToken("Invalid page token")
+    if data.get("q") != scope:
+        raise InvalidPageToken("Page token belongs to a different listing")
+    return cursors
+
+
+def drive_mask(fields, sort_by):
+    """Drive `fields` parameter for the requested response fields."""
+    wanted = set(FILE_FIELDS) if not fields else {f for f in fields if f in FILE_FIELDS}
+    drive_fields = {FILE_FIELDS[f] for f in wanted | {"id", "name", "mimeType"}}
+    drive_fields.add(SORT_FIELDS[sort_by][0])
+    # Thumbnail URLs change with the file version
+    if "thumbnailLink" in drive_fields:
+        drive_fields.add("modifiedTime")
+    return f"nextPageToken, files({', '.join(sorted(drive_fields))})"
+
+
+def credentials(account):
+    return Credentials(
+        token=account.get("access_token"),
+        refresh_token=account.get("refresh_token"),
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+    )
+
+
+def _fetch(account, cursor, params):
+    """(items after the cursor, Drive token of the page after them) for one account."""
+    page_token, skip = cursor
+    params = dict(params, pageSize=min(params["pageSize"] + skip, MAX_PAGE_SIZE))
+    if page_token:
+        params["pageToken"] = page_token
+
+    session = AuthorizedSession(credentials(account))
+    try:
+        response = session.get(DRIVE_FILES_URL, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    finally:
+        session.close()
+    return data.get("files", [])[skip:], data.get("nextPageToken")
+
+
+class _Reversed:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _merge(pages, key, descending, page_size):
+    """Take up to `page_size` items from the per-account `pages` in order.
+
+    `pages` maps email -> (items, has_more). Returns the picked
+    (email, item) pairs and how many items of each account were consumed.
+    """
+    wrap = _Reversed if descending else (lambda value: value)
+    heap = []
+    for order, (email, (items, _)) in enumerate(pages.items()):
+        if items:
+            heap.append((wrap(key(items[0])), order, email, 0))
+    heapq.heapify(heap)
+
+    picked, consumed, seen = [], {email: 0 for email in pages}, set()
+    while heap and len(picked) < page_size:
+        _, order, email, position = heapq.heappop(heap)
+        items, has_more = pages[email]
+        item = items[position]
+        consumed[email] = position + 1
+        # The same shared file can be listed by several accounts
+        if item["id"] not in seen:
+            seen.add(item["id"])
+            picked.append((email, item))
+
+        if position + 1 < len(items):
+            heapq.heappush(heap, (wrap(key(items[position + 1])), order, email, position + 1))
+        elif has_more:
+            # This account's next item is on Drive and may sort before the rest
+            break
+    return picked, consumed
+
+
+def format_item(item, email, account_name, fields=None):
+    """Shape a Drive item like ListDriveFiles always has; `fields` filters it."""
+    formatted = {
+        "id": item.get("id"),
+        "name": item.get("name"),
+        "mimeType": item.get("mimeType", ""),
+        "modifiedTime": item.get("modifiedTime"),
+        "shared": item.get("shared", False),
+        "parents": item.get("parents", []),
+        "source_email": email,
+        "account_name": account_name,
+    }
+    if item.get("mimeType") != FOLDER_MIME_TYPE:
+        formatted.update(
+            {
+                "size": int(item["size"]) if item.get("size") else None,
+                "createdTime": item.get("createdTime"),
+                "thumbnailLink": item.get("thumbnailLink"),
+                "webViewLink": item.get("webViewLink"),
+                "webContentLink": item.get("webContentLink"),
+                "owners": item.get("owners", []),
+                "starred": item.get("starred", False),
+                "trashed": False,
+            }
+        )
+    if fields:
+        keep = REQUIRED_FIELDS | set(fields)
+        formatted = {k: v for k, v in formatted.items() if k in keep}
+    return formatted
+
+
+def list_folder(
+    accounts,
+    folder_id="root",
+    sort_by="modifiedTime",
+    sort_order="desc",
+    page_size=DEFAULT_PAGE_SIZE,
+    page_token=None,
+    fields=None,
+):
+    """One merged page of `folder_id` over `accounts` (connected_accounts rows).
+
+    Returns {"items": [(email, Drive item)], "counts": {email: items on this
+    page}, "errors": {email: exception}, "next_page_token": str or None}.
+    Raises InvalidPageToken for a token not issued for this listing.
+    """
+    sort_by = sort_by if sort_by in SORT_FIELDS else "modifiedTime"
+    descending = sort_order == "desc"
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    scope = [folder_id, sort_by, "desc" if descending else "asc"]
+
+    by_email = {a["email"]: a for a in accounts}
+    if page_token:
+        cursors = {e: c for e, c in decode_token(page_token, scope).items() if e in by_email}
+    else:
+        cursors = {email: [None, 0] for email in by_email}
+
+    order_field = SORT_FIELDS[sort_by][0]
+    params = {
+        "q": f"'{folder_id}' in parents and trashed=false",
+        "orderBy": f"{order_field} desc" if descending else order_field,
+        "fields": drive_mask(fields, sort_by),
+        "pageSize": page_size,
+    }
+
+    results, errors = {}, {}
+    if cursors:
+        with ThreadPoolExecutor(max_workers=min(len(cursors), MAX_ACCOUNT_WORKERS)) as executor:
+            futures = {
+                email: executor.submit(_fetch, by_email[email], cursor, params)
+                for email, cursor in cursors.items()
+            }
+            for email, future in futures.items():
+                try:
+                    results[email] = future.result()
+                except Exception as e:
+                    errors[email] = e
+
+    pages = {email: (items, bool(next_token)) for email, (items, next_token) in results.items()}
+    picked, consumed = _merge(pages, SORT_FIELDS[sort_by][1], descending, page_size)
+
+    next_cursors = {}
+    for email, (items, next_token) in results.items():
+        used = consumed[email]
+        if used < len(items):
+            page, skip = cursors[email]
+            next_cursors[email] = [page, skip + used]
+        elif next_token:
+            next_cursors[email] = [next_token, 0]
+    # Failed accounts are retried with the next page, as long as the listing goes on
+    if next_cursors or picked:
+        next_cursors.update((email, cursors[email]) for email in errors)
+
+    counts = {email: 0 for email in results}
+    for email, _ in picked:
+        counts[email] += 1
+    return {
+        "items": picked,
+        "counts": counts,
+        "errors": errors,
+        "next_page_token": encode_token(scope, next_cursors),
+    }
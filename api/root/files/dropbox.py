@@ -8,16 +8,31 @@ from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import io
-import zipfile
 import hashlib
 import dropbox
 from dropbox import files
 from root.helpers.logs import AuditLogger
-from dropbox.files import WriteMode
 
 from root.auth.auth import auth_required
 from root.common import Status
 from root.db.dbHelper import DBHelper
+from root.files import catalog, duplicates, thumbnails, uploads
+from root.files.zipstream import CHUNK_SIZE, ZipEntry, stream_zip, zip_response
+
+
+def dropbox_zip_entry(access_token, file_path):
+    """ZipEntry streaming one Dropbox file; each entry uses its own client
+    so entries can be fetched on parallel threads."""
+    entry = ZipEntry(os.path.basename(file_path.rstrip("/")) or file_path, None, label=file_path)
+
+    def open_chunks():
+        metadata, response = dropbox.Dropbox(access_token).files_download(file_path)
+        entry.name = metadata.name
+        with response:
+            yield from response.iter_content(CHUNK_SIZE)
+
+    entry.open = open_chunks
+    return entry
 
 
 class DropboxBaseResource(Resource):
@@ -161,7 +176,7 @@ class ListDropboxFiles(DropboxBaseResource):
             page_size = data.get("pageSize", 100)
 
             # Get all Dropbox accounts for the user
-            select_fields = ["access_token", "email", "provider", "user_object"]
+            select_fields = ["id", "access_token", "email", "provider", "user_object"]
 
             all_accounts = DBHelper.find(
                 "connected_accounts",
@@ -290,6 +305,7 @@ class ListDropboxFiles(DropboxBaseResource):
                                 "is_downloadable": True,
                                 "mimeType": self.get_mime_type_from_name(entry.name),
                                 "webViewLink": f"https://www.dropbox.com/home{entry.path_display}",
+                                "thumbnailLink": thumbnails.dropbox_url(account.get("id"), entry),
                                 "starred": False,
                             }
                             account_files.append(file_info)
@@ -492,53 +508,26 @@ class UploadDropboxFile(DropboxBaseResource):
                 folder_path += "/"
             file_path = f"{folder_path}{filename}" if folder_path else f"/{filename}"
 
-            # Read file content
-            file_content = file.read()
-
-            # Upload file
-            if len(file_content) <= 150 * 1024 * 1024:  # 150MB simple upload
-                uploaded_file = dbx.files_upload(
-                    file_content,
-                    file_path,
-                    mode=WriteMode("overwrite"),
-                    autorename=True,
-                )
-            else:
-                # Upload session for large files
-                session_start_result = dbx.files_upload_session_start(
-                    file_content[: 4 * 1024 * 1024]
-                )
-                cursor = dropbox.files.UploadSessionCursor(
-                    session_id=session_start_result.session_id,
-                    offset=4 * 1024 * 1024,
-                )
-
-                remaining_content = file_content[4 * 1024 * 1024 :]
-                while len(remaining_content) > 4 * 1024 * 1024:
-                    chunk = remaining_content[: 4 * 1024 * 1024]
-                    dbx.files_upload_session_append_v2(chunk, cursor)
-                    cursor.offset += len(chunk)
-                    remaining_content = remaining_content[4 * 1024 * 1024 :]
-
-                uploaded_file = dbx.files_upload_session_finish(
-                    remaining_content,
-                    cursor,
-                    dropbox.files.CommitInfo(
-                        path=file_path, mode=WriteMode("overwrite"), autorename=True
-                    ),
-                )
+            # Streamed through an upload session in fixed-size chunks
+            uploaded_file = uploads.upload_file(
+                "dropbox",
+                {"access_token": self.get_user_credentials(uid)},
+                file,
+                filename,
+                {"path": file_path, "mode": "overwrite"},
+            )
 
             # Log successful upload
             AuditLogger.log(
                 user_id=uid,
                 action="upload_dropbox_file",
                 resource_type="dropbox_file",
-                resource_id=uploaded_file.path_lower,
+                resource_id=uploaded_file["path_lower"],
                 success=True,
                 metadata={
-                    "file_name": uploaded_file.name,
-                    "file_path": uploaded_file.path_display,
-                    "size": uploaded_file.size,
+                    "file_name": uploaded_file["name"],
+                    "file_path": uploaded_file["path_display"],
+                    "size": uploaded_file["size"],
                 },
             )
 
@@ -547,15 +536,11 @@ class UploadDropboxFile(DropboxBaseResource):
                 "message": f"File '{file.filename}' uploaded successfully",
                 "payload": {
                     "file": {
-                        "id": uploaded_file.path_lower,
-                        "name": uploaded_file.name,
-                        "path": uploaded_file.path_display,
-                        "size": uploaded_file.size,
-                        "server_modified": (
-                            uploaded_file.server_modified.isoformat()
-                            if uploaded_file.server_modified
-                            else None
-                        ),
+                        "id": uploaded_file["path_lower"],
+                        "name": uploaded_file["name"],
+                        "path": uploaded_file["path_display"],
+                        "size": uploaded_file["size"],
+                        "server_modified": uploaded_file["server_modified"],
                     }
                 },
             }
@@ -1384,8 +1369,8 @@ class BulkDownloadDropboxFiles(DropboxBaseResource):
                 )
                 return {"status": 0, "message": "File paths required", "payload": {}}
 
-            dbx = self.get_dropbox_client(uid)
-            if not dbx:
+            access_token = self.get_user_credentials(uid)
+            if not access_token:
                 AuditLogger.log(
                     user_id=uid,
                     action="bulk_download_dropbox_files",
@@ -1400,54 +1385,29 @@ class BulkDownloadDropboxFiles(DropboxBaseResource):
                     "payload": {},
                 }
 
-            # Create a zip file in memory
-            zip_buffer = io.BytesIO()
-            downloaded_files = []
-            failed_files = []
-
-            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                for file_path in file_paths:
-                    try:
-                        # Download file
-                        metadata, response = dbx.files_download(file_path)
-                        file_content = response.content
-
-                        # Add file to zip
-                        zip_file.writestr(metadata.name, file_content)
-                        downloaded_files.append(metadata.name)
-                    except Exception as e:
-                        print(f"Error downloading file {file_path}: {str(e)}")
-                        failed_files.append({"file_path": file_path, "error": str(e)})
-                        continue
-
-            zip_buffer.seek(0)
-
-            # Log successful bulk download
-            AuditLogger.log(
-                user_id=uid,
-                action="bulk_download_dropbox_files",
-                resource_type="dropbox_files",
-                resource_id=", ".join(downloaded_files) if downloaded_files else "none",
-                success=True if downloaded_files else False,
-                metadata={
-                    "requested_files_count": len(file_paths),
-                    "downloaded_files_count": len(downloaded_files),
-                    "failed_files": failed_files,
-                },
-            )
-
-            if not downloaded_files:
-                return {
-                    "status": 0,
-                    "message": "Failed to download any files",
-                    "payload": {"errors": failed_files},
-                }
+            def log_download(downloaded_files, failed_files):
+                AuditLogger.log(
+                    user_id=uid,
+                    action="bulk_download_dropbox_files",
+                    resource_type="dropbox_files",
+                    resource_id=", ".join(downloaded_files) if downloaded_files else "none",
+                    success=True if downloaded_files else False,
+                    metadata={
+                        "requested_files_count": len(file_paths),
+                        "downloaded_files_count": len(downloaded_files),
+                        "failed_files": [
+                            {"file_path": path, "error": error} for path, error in failed_files
+                        ],
+                    },
+                )
 
-            return send_file(
-                zip_buffer,
-                as_attachment=True,
-                download_name="bulk_download.zip",
-                mimetype="application/zip",
+            # Streamed as the files download (see root.files.zipstream);
+            # failures are listed inside the archive and in the audit log
+            return zip_response(
+                stream_zip(
+                    [dropbox_zip_entry(access_token, path) for path in file_paths],
+                    on_complete=log_download,
+                )
             )
 
         except Exception as e:
@@ -1892,70 +1852,40 @@ class FindDuplicateDropboxFiles(DropboxBaseResource):
                     "payload": {},
                 }
 
-            # Get all files in the specified folder
-            result = dbx.files_list_folder(folder_path if folder_path else "", recursive=True)
-            entries = result.entries
-
-            # Handle pagination
-            while result.has_more:
-                result = dbx.files_list_folder_continue(result.cursor)
-                entries.extend(result.entries)
-
-            # Filter only files
-            files = [entry for entry in entries if isinstance(entry, dropbox.files.FileMetadata)]
-
-            # Group files by name and size
-            file_groups = {}
-            for file in files:
-                key = f"{file.name}_{file.size}"
-                if key not in file_groups:
-                    file_groups[key] = []
-                file_groups[key].append(
-                    {
-                        "id": file.path_lower,
-                        "name": file.name,
-                        "path": file.path_display,
-                        "size": file.size,
-                        "server_modified": file.server_modified.isoformat() if file.server_modified else None,
-                        "content_hash": getattr(file, "content_hash", None),
-                    }
-                )
-
-            # Find duplicates
-            duplicates = []
-            for group in file_groups.values():
-                if len(group) > 1:
-                    duplicates.append(
-                        {
-                            "name": group[0]["name"],
-                            "size": group[0]["size"],
-                            "files": group,
-                            "count": len(group),
-                            "total_size": sum(f["size"] for f in group),
-                        }
-                    )
+            # Same content anywhere under the folder, from the catalog
+            catalog.refresh([uid])
+            result = duplicates.find_sets(
+                uid,
+                providers=["dropbox"],
+                path_prefix=folder_path,
+                limit=data.get("pageSize"),
+                offset=data.get("offset"),
+            )
+            duplicate_sets = result["sets"]
 
             # Log activity
             AuditLogger.log(
                 user_id=uid,
                 action="find_duplicate_dropbox_files",
                 resource_type="dropbox_files",
-                resource_id=", ".join([f["id"] for g in duplicates for f in g["files"]]) if duplicates else "none",
+                resource_id=", ".join([f["id"] for g in duplicate_sets for f in g["files"]]) if duplicate_sets else "none",
                 success=True,
                 metadata={
                     "folderPath": folder_path,
-                    "total_files_scanned": len(files),
-                    "total_duplicate_sets": len(duplicates),
+                    "total_files_scanned": result["files_scanned"],
+                    "total_duplicate_sets": result["total_sets"],
                 },
             )
 
             return {
                 "status": 1,
-                "message": f"Found {len(duplicates)} sets of duplicate files",
+                "message": f"Found {result['total_sets']} sets of duplicate files",
                 "payload": {
-                    "duplicates": duplicates,
-                    "total_duplicate_sets": len(duplicates),
-                    "total_files_scanned": len(files),
+                    "duplicates": duplicate_sets,
+                    "total_duplicate_sets": result["total_sets"],
+                    "total_files_scanned": result["files_scanned"],
+                    "reclaimable_bytes": result["reclaimable_bytes"],
+                    "catalog": catalog.summary([uid], ["dropbox"]),
                 },
             }
 
@@ -0,0 +1,364 @@
+"""
+Duplicate files across a user's Drive, Dropbox and OneDrive accounts.
+
+Duplicates are found in the file catalog (root.files.catalog) by content,
+not by name: each `files_index` row has a generated `dedupe_key` built from
+
+- `content_hash`, the Dropbox content hash of the file, when it is known:
+  Dropbox reports it for every file, other files get it computed here;
+- otherwise the provider checksum (`md5:<md5Checksum>` for Drive,
+  `quickxor:<quickXorHash>` for OneDrive).
+
+Files with the same key and size form a set; an index on (user_id,
+dedupe_key, file_size) makes that one grouped scan however many files a
+user has.
+
+Providers' checksums can't be compared with each other, so a Drive or
+OneDrive file gets a content hash only when some file of another provider
+has exactly its size, the only case in which it can be a cross-provider
+duplicate. `hash_pending` (run by the catalog worker after each sync)
+claims its candidates, so workers never download the same files, reuses a
+hash already known for the same checksum and size and downloads the file
+otherwise; the catalog drops the hash when the file's checksum or size
+changes, so edited files are re-evaluated on the next run.
+
+A hash is stored on every row with the same checksum and size, and the
+catalog gives rows it writes the hash known for their checksum
+(`adopt_known`), so identical files always share one key: they never split
+between a `content:` and a checksum group.
+"""
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from google.auth.transport.requests import AuthorizedSession
+
+from root.db.dbHelper import DBHelper
+from root.files.drive_listing import DRIVE_FILES_URL, credentials
+from root.files.outlook import MS_GRAPH_BASE_URL, get_outlook_headers
+
+PROVIDERS = ("google", "dropbox", "outlook")
+
+# Dropbox content hash: SHA-256 of the concatenated SHA-256s of 4 MiB blocks
+BLOCK_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Checksum types that need a download to be compared across providers
+HASHABLE = ("md5", "quickxor")
+HASH_BATCH = 200
+HASH_WORKERS = 4
+# Bigger files are only matched within their provider
+MAX_HASH_BYTES = 2 * 1024 * 1024 * 1024
+# A failed download is retried after this long
+RETRY_HOURS = 24
+REQUEST_TIMEOUT = 60
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def content_hash(chunks):
+    """Dropbox content hash of the bytes yielded by `chunks`."""
+    overall = hashlib.sha256()
+    block, filled = hashlib.sha256(), 0
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            take = min(BLOCK_SIZE - filled, len(view))
+            block.update(view[:take])
+            filled += take
+            view = view[take:]
+            if filled == BLOCK_SIZE:
+                overall.update(block.digest())
+                block, filled = hashlib.sha256(), 0
+    if filled:
+        overall.update(block.digest())
+    return overall.hexdigest()
+
+
+# ───── Hashing ─────
+
+def adopt_known(cur, storage_account_id, file_ids):
+    """Give unhashed rows of `file_ids` the content hash known for their checksum."""
+    if not file_ids:
+        return
+    cur.execute(
+        """
+        UPDATE files_index f SET content_hash = k.content_hash, content_hashed_at = NOW()
+        FROM files_index k
+        WHERE f.storage_account_id = %s AND f.external_file_id = ANY(%s)
+          AND f.content_hash IS NULL AND f.checksum_type = ANY(%s)
+          AND k.checksum_type = f.checksum_type AND k.checksum = f.checksum
+          AND k.file_size = f.file_size AND k.content_hash IS NOT NULL
+        """,
+        (storage_account_id, list(file_ids), list(HASHABLE)),
+    )
+
+
+def _candidates(limit):
+    """Claim unhashed Drive/OneDrive files whose size matches another provider's file.
+
+    Claimed rows get `content_hashed_at` set, which keeps them away from
+    other workers until the hash is recorded (or for RETRY_HOURS if the
+    worker dies).
+    """
+    return DBHelper.execute_query(
+        """
+        WITH picked AS (
+            SELECT f.id
+            FROM files_index f
+            WHERE f.content_hash IS NULL
+              AND f.checksum_type = ANY(%(hashable)s)
+              AND f.removed_at IS NULL AND NOT COALESCE(f.is_trashed, FALSE)
+              AND f.file_size > 0 AND f.file_size <= %(max_bytes)s
+              AND (f.content_hashed_at IS NULL
+                   OR f.content_hashed_at < NOW() - make_interval(hours => %(retry)s))
+              AND EXISTS (
+                  SELECT 1 FROM files_index o
+                  WHERE o.user_id = f.user_id AND o.file_size = f.file_size
+                    AND o.provider <> f.provider AND o.checksum IS NOT NULL
+                    AND o.removed_at IS NULL AND NOT COALESCE(o.is_trashed, FALSE)
+              )
+            ORDER BY f.file_size
+            LIMIT %(limit)s
+            FOR UPDATE OF f SKIP LOCKED
+        )
+        UPDATE files_index f SET content_hashed_at = NOW()
+        FROM picked
+        WHERE f.id = picked.id
+        RETURNING f.id, f.user_id, f.storage_account_id, f.provider, f.external_file_id,
+                  f.checksum_type, f.checksum, f.file_size
+        """,
+        {
+            "hashable": list(HASHABLE),
+            "max_bytes": MAX_HASH_BYTES,
+            "retry": RETRY_HOURS,
+            "limit": limit,
+        },
+    )
+
+
+def _known(keys):
+    """(checksum_type, checksum, size) -> content hash already computed for it."""
+    rows = DBHelper.raw_sql(
+        """
+        SELECT DISTINCT ON (f.checksum_type, f.checksum, f.file_size)
+               f.checksum_type, f.checksum, f.file_size, f.content_hash
+        FROM files_index f
+        JOIN unnest(%s::text[], %s::text[], %s::bigint[]) AS k(checksum_type, checksum, file_size)
+          ON f.checksum_type = k.checksum_type AND f.checksum = k.checksum
+         AND f.file_size = k.file_size
+        WHERE f.content_hash IS NOT NULL
+        """,
+        ([k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys]),
+    )
+    return {(r["checksum_type"], r["checksum"], r["file_size"]): r["content_hash"] for r in rows}
+
+
+def _record(key, value):
+    """Store `value` (None for a failed download) on every unhashed row with `key`."""
+    DBHelper.execute_query(
+        """
+        UPDATE files_index SET content_hash = %s, content_hashed_at = NOW()
+        WHERE checksum_type = %s AND checksum = %s AND file_size = %s
+          AND content_hash IS NULL
+        """,
+        (value, *key),
+    )
+
+
+def _download(account, row):
+    """Iterator over the content of catalogued file `row`."""
+    if row["provider"] == "google":
+        session = AuthorizedSession(credentials(account))
+        try:
+            response = session.get(
+                f"{DRIVE_FILES_URL}/{row['external_file_id']}",
+                params={"alt": "media"},
+                stream=True,
+                timeout=REQUEST_TIMEOUT,
+            )
+            response.raise_for_status()
+            with response:
+                yield from response.iter_content(CHUNK_SIZE)
+        finally:
+            session.close()
+    else:
+        response = requests.get(
+            f"{MS_GRAPH_BASE_URL}/me/drive/items/{row['external_file_id']}/content",
+            headers=get_outlook_headers(account["access_token"]),
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        with response:
+            yield from response.iter_content(CHUNK_SIZE)
+
+
+def _hash_one(account, row):
+    key = (row["checksum_type"], row["checksum"], row["file_size"])
+    try:
+        value = content_hash(_download(account, row)) if account else None
+    except Exception as e:
+        print(f"⚠ Failed to hash {row['provider']} file {row['external_file_id']}: {e}")
+        value = None
+    _record(key, value)
+    return value is not None
+
+
+def hash_pending(limit=HASH_BATCH, max_workers=HASH_WORKERS):
+    """Compute content hashes of up to `limit` cross-provider candidates.
+
+    Returns (checksums resolved from hashes already known, files downloaded).
+    """
+    rows = _candidates(limit) or []
+    if not rows:
+        return 0, 0
+
+    # One download per distinct content
+    by_key = {}
+    for row in rows:
+        by_key.setdefault((row["checksum_type"], row["checksum"], row["file_size"]), row)
+
+    known = _known(list(by_key))
+    for key, value in known.items():
+        _record(key, value)
+
+    pending = [row for key, row in by_key.items() if key not in known]
+    if not pending:
+        return len(known), 0
+
+    accounts = {
+        a["id"]: a
+        for a in DBHelper.find_in(
+            table_name="connected_accounts",
+            select_fields=["id", "access_token", "refresh_token", "is_active"],
+            field="id",
+            values=list({row["storage_account_id"] for row in pending}),
+        )
+        if a["is_active"] == 1
+    }
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        downloaded = sum(
+            executor.map(lambda row: _hash_one(accounts.get(row["storage_account_id"]), row), pending)
+        )
+    return len(known), downloaded
+
+
+# ───── Queries ─────
+
+def find_sets(user_id, providers=PROVIDERS, parent_id=None, path_prefix=None,
+              limit=DEFAULT_LIMIT, offset=0):
+    """Duplicate sets among `user_id`'s live files of `providers`, most
+    reclaimable bytes first.
+
+    `parent_id` limits the files to one folder, `path_prefix` to a Dropbox
+    folder and everything below it. Returns {"sets", "total_sets",
+    "total_files", "reclaimable_bytes", "files_scanned"}.
+    """
+    conditions = [
+        "f.user_id = %(uid)s",
+        "f.provider = ANY(%(providers)s)",
+        "f.removed_at IS NULL",
+        "NOT COALESCE(f.is_trashed, FALSE)",
+        "NOT COALESCE(f.is_folder, FALSE)",
+        "f.file_size > 0",
+    ]
+    params = {
+        "uid": user_id,
+        "providers": list(providers),
+        "limit": max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT)),
+        "offset": max(0, int(offset or 0)),
+    }
+    if parent_id:
+        conditions.append("f.external_parent_id = %(parent_id)s")
+        params["parent_id"] = parent_id
+    if path_prefix and path_prefix.strip("/"):
+        conditions.append("starts_with(LOWER(f.file_path), %(prefix)s)")
+        params["prefix"] = "/" + path_prefix.strip("/").lower() + "/"
+
+    rows = DBHelper.raw_sql(
+        f"""
+        WITH scope AS (
+            SELECT f.* FROM files_index f WHERE {" AND ".join(conditions)}
+        ),
+        groups AS (
+            SELECT dedupe_key, file_size, COUNT(*) AS count
+            FROM scope
+            WHERE dedupe_key IS NOT NULL
+            GROUP BY dedupe_key, file_size
+            HAVING COUNT(*) > 1
+        ),
+        page AS (
+            SELECT g.*,
+                   COUNT(*) OVER () AS total_sets,
+                   SUM(g.count) OVER () AS total_files,
+                   SUM((g.count - 1) * g.file_size) OVER () AS total_reclaimable
+            FROM groups g
+            ORDER BY (g.count - 1) * g.file_size DESC, g.dedupe_key
+            LIMIT %(limit)s OFFSET %(offset)s
+        )
+        SELECT p.dedupe_key, p.file_size, p.count, p.total_sets, p.total_files,
+               p.total_reclaimable,
+               (SELECT COUNT(*) FROM scope) AS files_scanned,
+               json_agg(
+                   json_build_object(
+                       'id', CASE WHEN s.provider = 'dropbox' THEN LOWER(s.file_path)
+                                  ELSE s.external_file_id END,
+                       'file_id', s.external_file_id,
+                       'name', s.file_name,
+                       'path', s.file_path,
+                       'size', s.file_size,
+                       'provider', s.provider,
+                       'storage_account_id', s.storage_account_id,
+                       'source_email', c.email,
+                       'modifiedTime', s.last_modified,
+                       'checksum', s.checksum,
+                       'content_hash', s.content_hash
+                   )
+                   ORDER BY s.last_modified NULLS LAST
+               ) AS files
+        FROM page p
+        JOIN scope s ON s.dedupe_key = p.dedupe_key AND s.file_size = p.file_size
+        LEFT JOIN connected_accounts c ON c.id = s.storage_account_id
+        GROUP BY p.dedupe_key, p.file_size, p.count, p.total_sets, p.total_files,
+                 p.total_reclaimable
+        ORDER BY (p.count - 1) * p.file_size DESC, p.dedupe_key
+        """,
+        params,
+    )
+
+    sets = [
+        {
+            "name": r["files"][0]["name"],
+            "size": r["file_size"],
+            "files": r["files"],
+            "count": r["count"],
+            "total_size": r["count"] * r["file_size"],
+            "reclaimable_bytes": (r["count"] - 1) * r["file_size"],
+            "providers": sorted({f["provider"] for f in r["files"]}),
+            "match": "content" if r["dedupe_key"].startswith("content:") else "checksum",
+        }
+        for r in rows
+    ]
+    if rows:
+        first = rows[0]
+        totals = {
+            "total_sets": first["total_sets"],
+            "total_files": int(first["total_files"]),
+            "reclaimable_bytes": int(first["total_reclaimable"]),
+            "files_scanned": first["files_scanned"],
+        }
+    else:
+        scanned = DBHelper.raw_sql(
+            f"SELECT COUNT(*) AS n FROM files_index f WHERE {' AND '.join(conditions)}",
+            params,
+        )
+        totals = {
+            "total_sets": 0,
+            "total_files": 0,
+            "reclaimable_bytes": 0,
+            "files_scanned": scanned[0]["n"] if scanned else 0,
+        }
+    return {"sets": sets, **totals}
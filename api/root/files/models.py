@@ -4,21 +4,115 @@ import traceback
 import uuid
 import requests
 from datetime import datetime, timedelta
-from flask import Request, request, jsonify, send_file
+from flask import Request, Response, request, jsonify, send_file
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
 from google.oauth2.credentials import Credentials
 import io
 from root.auth.auth import auth_required
 from root.common import Status
 from root.config import CLIENT_ID, CLIENT_SECRET, SCOPE
 from root.db.dbHelper import DBHelper
+from root import drive_folders, family_graph
 from google.auth.exceptions import RefreshError
 from root.utilis import ensure_drive_folder_structure, get_or_create_subfolder
 from root.helpers.logs import AuditLogger
+from root.files import catalog, drive_batch, drive_listing, duplicates, thumbnails, uploads
+from root.files.drive_listing import DRIVE_FILES_URL
+from root.files.zipstream import CHUNK_SIZE, ZipEntry, stream_zip, zip_response
+from google.auth.transport.requests import AuthorizedSession
+
+# Google Docs / Sheets / Slides have no binary content; they are exported
+DRIVE_EXPORTS = {
+    "application/vnd.google-apps.document": ("application/pdf", ".pdf"),
+    "application/vnd.google-apps.spreadsheet": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ".xlsx",
+    ),
+    "application/vnd.google-apps.presentation": ("application/pdf", ".pdf"),
+    "application/vnd.google-apps.drawing": ("image/png", ".png"),
+}
+
+
+def drive_zip_entry(credentials, file_id):
+    """ZipEntry streaming one Drive file over its own HTTP session, so
+    entries can be fetched on parallel threads."""
+    entry = ZipEntry(file_id, None)
+
+    def open_chunks():
+        session = AuthorizedSession(credentials)
+        try:
+            meta = session.get(
+                f"{DRIVE_FILES_URL}/{file_id}",
+                params={"fields": "name,mimeType", "supportsAllDrives": "true"},
+                timeout=30,
+            )
+            meta.raise_for_status()
+            meta = meta.json()
+            entry.name = meta.get("name") or file_id
+
+            export = DRIVE_EXPORTS.get(meta.get("mimeType"))
+            if export:
+                entry.name += export[1]
+                url, params = f"{DRIVE_FILES_URL}/{file_id}/export", {"mimeType": export[0]}
+            else:
+                url, params = f"{DRIVE_FILES_URL}/{file_id}", {"alt": "media", "supportsAllDrives": "true"}
+
+            with session.get(url, params=params, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                yield from response.iter_content(CHUNK_SIZE)
+        finally:
+            session.close()
+
+    entry.open = open_chunks
+    return entry
+
+
+def hub_folder_ids(service, user_id, account_id, hub, refresh=False):
+    """(Google id, files_index id) of DOCKLY/<hub> in a storage account."""
+    folder_info = ensure_drive_folder_structure(service, user_id, account_id, refresh=refresh)
+    if hub in folder_info["subfolders"]:
+        return folder_info["subfolders"][hub], folder_info["subfolders_db"][hub]
+    # Hubs outside the default list are created on demand
+    hub_folder = get_or_create_subfolder(
+        service,
+        hub,
+        parent_google_id=folder_info["root"],
+        parent_db_id=folder_info["root_db"],
+        user_id=user_id,
+        storage_account_id=account_id,
+        refresh=refresh,
+    )
+    return hub_folder["google_id"], hub_folder["db_id"]
+
+
+def index_hub_file(user_id, account_id, uploaded_file, hub_google_id, hub_db_id):
+    """files_index row of a file uploaded to a hub folder; returns its id."""
+    return DBHelper.insert(
+        table_name="files_index",
+        id=str(uuid.uuid4()),
+        return_column="id",
+        user_id=user_id,
+        storage_account_id=account_id,
+        file_path=uploaded_file.get("webViewLink"),
+        file_name=uploaded_file.get("name"),
+        file_size=int(uploaded_file.get("size", 0)),
+        file_type=uploaded_file.get("mimeType"),
+        mime_type=uploaded_file.get("mimeType"),
+        is_folder=False,
+        parent_folder_id=hub_db_id,
+        external_file_id=uploaded_file["id"],
+        external_parent_id=hub_google_id,
+        last_modified=uploaded_file.get("modifiedTime", datetime.now().isoformat()),
+        created_at=datetime.now().isoformat(),
+        indexed_at=datetime.now().isoformat(),
+    )
+
 
 class DriveBaseResource(Resource):
     """Base class for Google Drive operations"""
@@ -124,10 +218,15 @@ class ListDriveFiles(DriveBaseResource):
             folder_id = data.get("folderId", "root")
             sort_by = data.get("sortBy", "modifiedTime")
             sort_order = data.get("sortOrder", "desc")
-            page_size = data.get("pageSize", 100)
+            page_size = data.get("pageSize", drive_listing.DEFAULT_PAGE_SIZE)
+            page_token = data.get("pageToken")
+            fields = data.get("fields")
+            if isinstance(fields, str):
+                fields = [f.strip() for f in fields.split(",") if f.strip()]
 
             # Get all Google accounts for the user
             select_fields = [
+                "id",
                 "access_token",
                 "refresh_token",
                 "email",
@@ -154,179 +253,93 @@ class ListDriveFiles(DriveBaseResource):
                         "folders": [],
                         "connected_accounts": [],
                         "errors": [],
+                        "nextPageToken": None,
                     },
                 }
 
-            merged_files = []
-            merged_folders = []
-            connected_accounts = []
-            errors = []
-
-            # Track processed files to avoid duplicates
-            processed_file_ids = set()
-            processed_folder_ids = set()
+            try:
+                listing = drive_listing.list_folder(
+                    all_accounts,
+                    folder_id=folder_id,
+                    sort_by=sort_by,
+                    sort_order=sort_order,
+                    page_size=page_size,
+                    page_token=page_token,
+                    fields=fields,
+                )
+            except drive_listing.InvalidPageToken as e:
+                return {"status": 0, "message": str(e)}, 400
 
+            account_names = {}
+            account_ids = {}
             for account in all_accounts:
                 email = account.get("email")
-                access_token = account.get("access_token")
-                refresh_token = account.get("refresh_token")
-                user_object = account.get("user_object")
-
+                account_ids[email] = account.get("id")
                 try:
-                    user_object_data = json.loads(user_object) if user_object else {}
+                    user_object_data = json.loads(account.get("user_object") or "{}")
                 except json.JSONDecodeError:
                     user_object_data = {}
+                account_names[email] = (
+                    user_object_data.get("name", email.split("@")[0]),
+                    user_object_data.get("picture", ""),
+                )
 
-                try:
-                    # Create account-specific Drive service
-                    service = self.get_drive_service_for_account(
-                        access_token, refresh_token, email
-                    )
-                    if not service:
-                        errors.append(
-                            {
-                                "email": email,
-                                "error": "Failed to create Drive service - token may be expired",
-                            }
-                        )
-                        continue
-
-                    # Build query
-                    query = f"'{folder_id}' in parents and trashed=false"
+            merged_files = []
+            merged_folders = []
+            folder_counts = {}
+            for email, item in listing["items"]:
+                formatted = drive_listing.format_item(
+                    item, email, account_names[email][0], fields
+                )
+                if "thumbnailLink" in formatted:
+                    formatted["thumbnailLink"] = thumbnails.drive_url(account_ids[email], item)
+                if item.get("mimeType") == drive_listing.FOLDER_MIME_TYPE:
+                    merged_folders.append(formatted)
+                    folder_counts[email] = folder_counts.get(email, 0) + 1
+                else:
+                    merged_files.append(formatted)
 
-                    # Sort mapping
-                    sort_mapping = {
-                        "name": "name",
-                        "modifiedTime": "modifiedTime",
-                        "size": "quotaBytesUsed",
+            connected_accounts = []
+            for email, count in listing["counts"].items():
+                name, picture = account_names[email]
+                connected_accounts.append(
+                    {
+                        "email": email,
+                        "provider": "google",
+                        "userName": name,
+                        "displayName": name,
+                        "picture": picture,
+                        "files_count": count - folder_counts.get(email, 0),
+                        "folders_count": folder_counts.get(email, 0),
                     }
+                )
 
-                    order_by = f"{sort_mapping.get(sort_by, 'modifiedTime')} {'desc' if sort_order == 'desc' else ''}".strip()
-
-                    # Get files from Drive
-                    results = (
-                        service.files()
-                        .list(
-                            q=query,
-                            pageSize=page_size,
-                            orderBy=order_by,
-                            fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, thumbnailLink, webViewLink, webContentLink, owners, shared, starred, parents)",
-                        )
-                        .execute()
-                    )
-
-                    items = results.get("files", [])
-
-                    # Process files and folders
-                    account_files = []
-                    account_folders = []
-
-                    for item in items:
-                        item_id = item.get("id")
-                        mime_type = item.get("mimeType", "")
-                        is_folder = mime_type == "application/vnd.google-apps.folder"
-
-                        # Skip if we've already processed this file/folder
-                        if is_folder:
-                            if item_id in processed_folder_ids:
-                                continue
-                            processed_folder_ids.add(item_id)
-                        else:
-                            if item_id in processed_file_ids:
-                                continue
-                            processed_file_ids.add(item_id)
-
-                        base_info = {
-                            "id": item_id,
-                            "name": item.get("name"),
-                            "modifiedTime": item.get("modifiedTime"),
-                            "shared": item.get("shared", False),
-                            "parents": item.get("parents", []),
-                            "source_email": email,
-                            "account_name": user_object_data.get(
-                                "name", email.split("@")[0]
-                            ),
-                        }
-
-                        if is_folder:
-                            account_folders.append(base_info)
-                        else:
-                            account_files.append(
-                                {
-                                    **base_info,
-                                    "mimeType": mime_type,
-                                    "size": (
-                                        int(item.get("size", 0))
-                                        if item.get("size")
-                                        else None
-                                    ),
-                                    "createdTime": item.get("createdTime"),
-                                    "thumbnailLink": item.get("thumbnailLink"),
-                                    "webViewLink": item.get("webViewLink"),
-                                    "webContentLink": item.get("webContentLink"),
-                                    "owners": item.get("owners", []),
-                                    "starred": item.get("starred", False),
-                                    "trashed": False,
-                                }
-                            )
-
-                    merged_files.extend(account_files)
-                    merged_folders.extend(account_folders)
-
-                    # Add to connected accounts
-                    connected_accounts.append(
-                        {
+            errors = []
+            for email, error in listing["errors"].items():
+                error_msg = str(error)
+                print(f"Error fetching Drive files for {email}: {error_msg}")
+                errors.append({"email": email, "error": error_msg})
+
+                # Mark token as inactive if it's an auth error
+                if isinstance(error, RefreshError) or any(
+                    keyword in error_msg.lower()
+                    for keyword in [
+                        "invalid_grant",
+                        "401",
+                        "invalid_token",
+                        "expired",
+                    ]
+                ):
+                    DBHelper.update_one(
+                        table_name="connected_accounts",
+                        filters={
+                            "user_id": uid,
                             "email": email,
                             "provider": "google",
-                            "userName": user_object_data.get(
-                                "name", email.split("@")[0]
-                            ),
-                            "displayName": user_object_data.get(
-                                "name", email.split("@")[0]
-                            ),
-                            "picture": user_object_data.get("picture", ""),
-                            "files_count": len(account_files),
-                            "folders_count": len(account_folders),
-                        }
-                    )
-
-                    print(
-                        f"[GOOGLE DRIVE] {email}: {len(account_files)} files, {len(account_folders)} folders fetched"
+                        },
+                        updates={"is_active": Status.REMOVED.value},
                     )
 
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"Error fetching Drive files for {email}: {error_msg}")
-                    errors.append({"email": email, "error": error_msg})
-
-                    # Mark token as inactive if it's an auth error
-                    if any(
-                        keyword in error_msg.lower()
-                        for keyword in [
-                            "invalid_grant",
-                            "401",
-                            "invalid_token",
-                            "expired",
-                        ]
-                    ):
-                        DBHelper.update_one(
-                            table_name="connected_accounts",
-                            filters={
-                                "user_id": uid,
-                                "email": email,
-                                "provider": "google",
-                            },
-                            updates={"is_active": Status.REMOVED.value},
-                        )
-
-            # Sort merged results
-            merged_files.sort(
-                key=lambda f: f.get("modifiedTime", ""), reverse=(sort_order == "desc")
-            )
-            merged_folders.sort(
-                key=lambda f: f.get("modifiedTime", ""), reverse=(sort_order == "desc")
-            )
-
             return {
                 "status": 1,
                 "message": (
@@ -339,7 +352,7 @@ class ListDriveFiles(DriveBaseResource):
                     "folders": merged_folders,
                     "connected_accounts": connected_accounts,
                     "errors": errors,
-                    "nextPageToken": None,  # For future pagination support
+                    "nextPageToken": listing["next_page_token"],
                 },
             }
 
@@ -356,29 +369,6 @@ class ListDriveFiles(DriveBaseResource):
                 },
             }
 
-    def get_drive_service_for_account(self, access_token, refresh_token, email):
-        """Create a Drive service for a specific account using its tokens"""
-        try:
-            from google.oauth2.credentials import Credentials
-            from googleapiclient.discovery import build
-
-            # Create credentials from the account's tokens
-            credentials = Credentials(
-                token=access_token,
-                refresh_token=refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=CLIENT_ID,  # You'll need to implement this
-                client_secret=CLIENT_SECRET,  # You'll need to implement this
-            )
-
-            # Build the Drive service
-            service = build("drive", "v3", credentials=credentials)
-            return service
-
-        except Exception as e:
-            print(f"Error creating Drive service for {email}: {str(e)}")
-            return None
-
 
 class UploadDriveFile(DriveBaseResource):
     @auth_required(isOptional=True)
@@ -408,11 +398,8 @@ class UploadDriveFile(DriveBaseResource):
             }
 
             # Create media upload
-            media = MediaIoBaseUpload(
-                io.BytesIO(file.read()),
-                mimetype=file.content_type or "application/octet-stream",
-                resumable=True,
-            )
+            # Streamed to a resumable session in fixed-size chunks
+            media = uploads.drive_media(file)
 
             # Upload file
             uploaded_file = (
@@ -915,49 +902,18 @@ class BulkDownloadFiles(DriveBaseResource):
             if not file_ids:
                 return {"status": 0, "message": "File IDs required", "payload": {}}
 
-            service = self.get_drive_service(uid)
-            if not service:
+            credentials = self.get_user_credentials(uid)
+            if not credentials:
                 return {
                     "status": 0,
                     "message": "Google Drive not connected or token expired",
                     "payload": {},
                 }
 
-            # Create a zip file in memory
-            import zipfile
-
-            zip_buffer = io.BytesIO()
-
-            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                for file_id in file_ids:
-                    try:
-                        # Get file metadata
-                        file_metadata = service.files().get(fileId=file_id).execute()
-                        file_name = file_metadata["name"]
-
-                        # Download file
-                        request_download = service.files().get_media(fileId=file_id)
-                        file_buffer = io.BytesIO()
-                        downloader = MediaIoBaseDownload(file_buffer, request_download)
-
-                        done = False
-                        while done is False:
-                            status, done = downloader.next_chunk()
-
-                        file_buffer.seek(0)
-                        zip_file.writestr(file_name, file_buffer.read())
-
-                    except Exception as e:
-                        print(f"Error downloading file {file_id}: {str(e)}")
-                        continue
-
-            zip_buffer.seek(0)
-
-            return send_file(
-                zip_buffer,
-                as_attachment=True,
-                download_name="bulk_download.zip",
-                mimetype="application/zip",
+            # Files are streamed into the archive as they download; the
+            # next few are prefetched while the current one is sent
+            return zip_response(
+                stream_zip([drive_zip_entry(credentials, file_id) for file_id in file_ids])
             )
 
         except Exception as e:
@@ -979,31 +935,22 @@ class BulkDeleteFiles(DriveBaseResource):
             if not file_ids:
                 return {"status": 0, "message": "File IDs required", "payload": {}}
 
-            service = self.get_drive_service(uid)
-            if not service:
+            credentials = self.get_user_credentials(uid)
+            if not credentials:
                 return {
                     "status": 0,
                     "message": "Google Drive not connected or token expired",
                     "payload": {},
                 }
 
-            deleted_files = []
-            errors = []
-
-            for file_id in file_ids:
-                try:
-                    # Get file name before deletion
-                    file_metadata = (
-                        service.files().get(fileId=file_id, fields="name").execute()
-                    )
-                    file_name = file_metadata.get("name", "Unknown file")
-
-                    # Delete file
-                    service.files().delete(fileId=file_id).execute()
-                    deleted_files.append({"id": file_id, "name": file_name})
-
-                except Exception as e:
-                    errors.append({"id": file_id, "error": str(e)})
+            # Names are read and files deleted in batches of calls
+            done, errors = drive_batch.bulk(
+                credentials, file_ids, lambda file_id, meta: drive_batch.delete(file_id)
+            )
+            deleted_files = [
+                {"id": file_id, "name": meta.get("name", "Unknown file")}
+                for file_id, meta, _ in done
+            ]
 
             return {
                 "status": 1,
@@ -1040,44 +987,26 @@ class BulkMoveFiles(DriveBaseResource):
                     "payload": {},
                 }
 
-            service = self.get_drive_service(uid)
-            if not service:
+            credentials = self.get_user_credentials(uid)
+            if not credentials:
                 return {
                     "status": 0,
                     "message": "Google Drive not connected or token expired",
                     "payload": {},
                 }
 
-            moved_files = []
-            errors = []
-
-            for file_id in file_ids:
-                try:
-                    # Get current parents
-                    file_metadata = (
-                        service.files()
-                        .get(fileId=file_id, fields="parents,name")
-                        .execute()
-                    )
-                    previous_parents = ",".join(file_metadata.get("parents", []))
-
-                    # Move file
-                    service.files().update(
-                        fileId=file_id,
-                        addParents=target_folder_id,
-                        removeParents=previous_parents,
-                        fields="id,parents",
-                    ).execute()
-
-                    moved_files.append(
-                        {
-                            "id": file_id,
-                            "name": file_metadata.get("name", "Unknown file"),
-                        }
-                    )
-
-                except Exception as e:
-                    errors.append({"id": file_id, "error": str(e)})
+            done, errors = drive_batch.bulk(
+                credentials,
+                file_ids,
+                lambda file_id, meta: drive_batch.move(
+                    file_id, target_folder_id, meta.get("parents", [])
+                ),
+                fields="id, name, parents",
+            )
+            moved_files = [
+                {"id": file_id, "name": meta.get("name", "Unknown file")}
+                for file_id, meta, _ in done
+            ]
 
             return {
                 "status": 1,
@@ -1114,47 +1043,25 @@ class BulkCopyFiles(DriveBaseResource):
                     "payload": {},
                 }
 
-            service = self.get_drive_service(uid)
-            if not service:
+            credentials = self.get_user_credentials(uid)
+            if not credentials:
                 return {
                     "status": 0,
                     "message": "Google Drive not connected or token expired",
                     "payload": {},
                 }
 
-            copied_files = []
-            errors = []
-
-            for file_id in file_ids:
-                try:
-                    # Get original file metadata
-                    original_file = (
-                        service.files().get(fileId=file_id, fields="name").execute()
-                    )
-
-                    # Copy file
-                    copied_file = (
-                        service.files()
-                        .copy(
-                            fileId=file_id,
-                            body={
-                                "name": f"Copy of {original_file['name']}",
-                                "parents": [target_folder_id],
-                            },
-                        )
-                        .execute()
-                    )
-
-                    copied_files.append(
-                        {
-                            "original_id": file_id,
-                            "copy_id": copied_file["id"],
-                            "name": copied_file["name"],
-                        }
-                    )
-
-                except Exception as e:
-                    errors.append({"id": file_id, "error": str(e)})
+            done, errors = drive_batch.bulk(
+                credentials,
+                file_ids,
+                lambda file_id, meta: drive_batch.copy(
+                    file_id, f"Copy of {meta['name']}", target_folder_id
+                ),
+            )
+            copied_files = [
+                {"original_id": file_id, "copy_id": copy["id"], "name": copy["name"]}
+                for file_id, _, copy in done
+            ]
 
             return {
                 "status": 1,
@@ -1192,39 +1099,23 @@ class BulkShareFiles(DriveBaseResource):
                     "payload": {},
                 }
 
-            service = self.get_drive_service(uid)
-            if not service:
+            credentials = self.get_user_credentials(uid)
+            if not credentials:
                 return {
                     "status": 0,
                     "message": "Google Drive not connected or token expired",
                     "payload": {},
                 }
 
-            shared_files = []
-            errors = []
-
-            for file_id in file_ids:
-                try:
-                    # Get file name
-                    file_metadata = (
-                        service.files().get(fileId=file_id, fields="name").execute()
-                    )
-
-                    # Create permission
-                    permission = {"type": "user", "role": role, "emailAddress": email}
-                    service.permissions().create(
-                        fileId=file_id, body=permission, sendNotificationEmail=True
-                    ).execute()
-
-                    shared_files.append(
-                        {
-                            "id": file_id,
-                            "name": file_metadata.get("name", "Unknown file"),
-                        }
-                    )
-
-                except Exception as e:
-                    errors.append({"id": file_id, "error": str(e)})
+            done, errors = drive_batch.bulk(
+                credentials,
+                file_ids,
+                lambda file_id, meta: drive_batch.share(file_id, email, role),
+            )
+            shared_files = [
+                {"id": file_id, "name": meta.get("name", "Unknown file")}
+                for file_id, meta, _ in done
+            ]
 
             return {
                 "status": 1,
@@ -1456,6 +1347,60 @@ class StarDriveFile(DriveBaseResource):
             }
 
 
+def _drive_literal(value):
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+
+def search_drive(service, data, page_size, min_size=None, max_size=None):
+    """AdvancedSearch straight from Drive, for accounts not catalogued yet."""
+    parts = ["trashed = false"]
+    if data.get("query"):
+        parts.append(f"name contains '{_drive_literal(data['query'])}'")
+    if data.get("mimeType"):
+        parts.append(f"mimeType = '{_drive_literal(data['mimeType'])}'")
+    modified_time_range = data.get("modifiedTimeRange") or {}
+    if modified_time_range.get("start"):
+        parts.append(f"modifiedTime >= '{_drive_literal(modified_time_range['start'])}'")
+    if modified_time_range.get("end"):
+        parts.append(f"modifiedTime <= '{_drive_literal(modified_time_range['end'])}'")
+    for field, key in (("starred", "starred"), ("shared", "shared")):
+        if data.get(key) is not None:
+            parts.append(f"{field} = {str(bool(data[key])).lower()}")
+    if data.get("ownedByMe") is not None:
+        parts.append("'me' in owners" if data["ownedByMe"] else "not 'me' in owners")
+    if data.get("parentId"):
+        parts.append(f"'{_drive_literal(data['parentId'])}' in parents")
+
+    results = service.files().list(
+        q=" and ".join(parts),
+        pageSize=page_size,
+        fields="files(id, name, mimeType, size, modifiedTime, createdTime, thumbnailLink, webViewLink, owners, shared, starred, parents)",
+    ).execute()
+
+    files = []
+    for file in results.get("files", []):
+        size = int(file.get("size") or 0)
+        if (min_size is not None and size < min_size) or (max_size is not None and size > max_size):
+            continue
+        files.append(file)
+    return files
+
+
+def drive_type_analysis(service):
+    """Count and bytes per main MIME type over Drive's first page of files."""
+    results = service.files().list(
+        q="trashed = false", pageSize=1000, fields="files(mimeType, size)"
+    ).execute()
+    type_analysis = {}
+    for file in results.get("files", []):
+        mime_type = file.get("mimeType") or "unknown"
+        main_type = mime_type.split("/")[0]
+        entry = type_analysis.setdefault(main_type, {"count": 0, "total_size": 0})
+        entry["count"] += 1
+        entry["total_size"] += int(file.get("size") or 0)
+    return type_analysis
+
+
 # Advanced Search
 class AdvancedSearch(DriveBaseResource):
     @auth_required(isOptional=True)
@@ -1464,104 +1409,55 @@ class AdvancedSearch(DriveBaseResource):
             data = request.get_json() or {}
             query = data.get("query", "")
             mime_type = data.get("mimeType")
-            modified_time_range = data.get("modifiedTimeRange")
-            size_range = data.get("sizeRange")
-            starred = data.get("starred")
-            shared = data.get("shared")
-            owned_by_me = data.get("ownedByMe")
-            parent_id = data.get("parentId")
-
-            service = self.get_drive_service(uid)
-            if not service:
-                return {
-                    "status": 0,
-                    "message": "Google Drive not connected or token expired",
-                    "payload": {},
-                }
-
-            # Build search query
-            search_parts = []
-
-            if query:
-                search_parts.append(f"name contains '{query}'")
-
-            if mime_type:
-                search_parts.append(f"mimeType='{mime_type}'")
-
-            if modified_time_range:
-                if modified_time_range.get("start"):
-                    search_parts.append(
-                        f"modifiedTime >= '{modified_time_range['start']}'"
-                    )
-                if modified_time_range.get("end"):
-                    search_parts.append(
-                        f"modifiedTime <= '{modified_time_range['end']}'"
-                    )
-
-            if starred is not None:
-                search_parts.append(f"starred = {str(starred).lower()}")
-
-            if shared is not None:
-                search_parts.append(f"shared = {str(shared).lower()}")
-
-            if owned_by_me is not None:
-                search_parts.append(
-                    "'me' in owners" if owned_by_me else "not 'me' in owners"
-                )
-
-            if parent_id:
-                search_parts.append(f"'{parent_id}' in parents")
-
-            # Always exclude trashed files
-            search_parts.append("trashed = false")
-
-            search_query = (
-                " and ".join(search_parts) if search_parts else "trashed = false"
-            )
-
-            # Execute search
-            results = (
-                service.files()
-                .list(
-                    q=search_query,
-                    pageSize=100,
-                    fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, thumbnailLink, webViewLink, owners, shared, starred, parents)",
+            modified_time_range = data.get("modifiedTimeRange") or {}
+            size_range = data.get("sizeRange") or {}
+            page_size = min(int(data.get("pageSize", 100)), 1000)
+            offset = max(int(data.get("offset", 0)), 0)
+
+            catalog.refresh([uid])
+            catalog_state = catalog.summary([uid], ["google"])
+
+            # Sizes come in MB
+            mb = 1024 * 1024
+            min_size = size_range["min"] * mb if size_range.get("min") is not None else None
+            max_size = size_range["max"] * mb if size_range.get("max") is not None else None
+
+            if catalog_state["complete"]:
+                files, total = catalog.search(
+                    uid,
+                    query=query,
+                    mime_type=mime_type,
+                    modified_from=modified_time_range.get("start"),
+                    modified_to=modified_time_range.get("end"),
+                    min_size=min_size,
+                    max_size=max_size,
+                    starred=data.get("starred"),
+                    shared=data.get("shared"),
+                    owned_by_me=data.get("ownedByMe"),
+                    parent_id=data.get("parentId"),
+                    limit=page_size,
+                    offset=offset,
                 )
-                .execute()
-            )
-
-            files = results.get("files", [])
-
-            # Filter by size if specified
-            if size_range:
-                min_size = size_range.get("min")
-                max_size = size_range.get("max")
-
-                if min_size is not None or max_size is not None:
-                    filtered_files = []
-                    for file in files:
-                        file_size = int(file.get("size", 0)) if file.get("size") else 0
-
-                        if (
-                            min_size is not None and file_size < min_size * 1024 * 1024
-                        ):  # Convert MB to bytes
-                            continue
-                        if (
-                            max_size is not None and file_size > max_size * 1024 * 1024
-                        ):  # Convert MB to bytes
-                            continue
-
-                        filtered_files.append(file)
-
-                    files = filtered_files
+            else:
+                # Until the first catalog sync finishes, search Drive itself
+                service = self.get_drive_service(uid)
+                if not service:
+                    return {
+                        "status": 0,
+                        "message": "Google Drive not connected or token expired",
+                        "payload": {},
+                    }
+                files = search_drive(service, data, page_size, min_size, max_size)
+                total = len(files)
 
             return {
                 "status": 1,
-                "message": f"Advanced search completed. Found {len(files)} files",
+                "message": f"Advanced search completed. Found {total} files",
                 "payload": {
                     "files": files,
-                    "search_query": search_query,
-                    "total_results": len(files),
+                    "search_query": query,
+                    "total_results": total,
+                    "catalog": catalog_state,
                 },
             }
 
@@ -1580,7 +1476,7 @@ class FindDuplicateFiles(DriveBaseResource):
     def post(self, uid, user):
         try:
             data = request.get_json() or {}
-            folder_id = data.get("folderId", "root")
+            folder_id = data.get("folderId")
 
             service = self.get_drive_service(uid)
             if not service:
@@ -1590,50 +1486,72 @@ class FindDuplicateFiles(DriveBaseResource):
                     "payload": {},
                 }
 
-            # Get all files in the specified folder
-            query = f"'{folder_id}' in parents and trashed=false and mimeType != 'application/vnd.google-apps.folder'"
-
-            results = (
-                service.files()
-                .list(
-                    q=query,
-                    pageSize=1000,
-                    fields="files(id, name, size, md5Checksum, modifiedTime)",
-                )
-                .execute()
+            # Same content across every Drive account, from the catalog
+            catalog.refresh([uid])
+            result = duplicates.find_sets(
+                uid,
+                providers=["google"],
+                parent_id=folder_id if folder_id and folder_id != "root" else None,
+                limit=data.get("pageSize"),
+                offset=data.get("offset"),
             )
 
-            files = results.get("files", [])
-
-            # Group files by name and size
-            file_groups = {}
-            for file in files:
-                key = f"{file['name']}_{file.get('size', 0)}"
-                if key not in file_groups:
-                    file_groups[key] = []
-                file_groups[key].append(file)
-
-            # Find duplicates
-            duplicates = []
-            for group in file_groups.values():
-                if len(group) > 1:
-                    duplicates.append(
-                        {
-                            "name": group[0]["name"],
-                            "size": group[0].get("size", 0),
-                            "files": group,
-                            "count": len(group),
-                            "total_size": sum(int(f.get("size", 0)) for f in group),
-                        }
-                    )
+            return {
+                "status": 1,
+                "message": f"Found {result['total_sets']} sets of duplicate files",
+                "payload": {
+                    "duplicates": result["sets"],
+                    "total_duplicate_sets": result["total_sets"],
+                    "total_files_scanned": result["files_scanned"],
+                    "reclaimable_bytes": result["reclaimable_bytes"],
+                    "catalog": catalog.summary([uid], ["google"]),
+                },
+            }
+
+        except Exception as e:
+            traceback.print_exc()
+            return {
+                "status": 0,
+                "message": f"Failed to find duplicates: {str(e)}",
+                "payload": {},
+            }
+
+
+class FindCrossProviderDuplicates(Resource):
+    """Duplicate sets across the user's Drive, Dropbox and OneDrive accounts."""
+
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        try:
+            data = request.get_json() or {}
+            providers = [
+                p for p in (data.get("providers") or duplicates.PROVIDERS) if p in duplicates.PROVIDERS
+            ]
+            if not providers:
+                return {
+                    "status": 0,
+                    "message": f"providers must be any of {', '.join(duplicates.PROVIDERS)}",
+                    "payload": {},
+                }
+
+            catalog.refresh([uid])
+            result = duplicates.find_sets(
+                uid,
+                providers=providers,
+                limit=data.get("pageSize"),
+                offset=data.get("offset"),
+            )
 
             return {
                 "status": 1,
-                "message": f"Found {len(duplicates)} sets of duplicate files",
+                "message": f"Found {result['total_sets']} sets of duplicate files",
                 "payload": {
-                    "duplicates": duplicates,
-                    "total_duplicate_sets": len(duplicates),
-                    "total_files_scanned": len(files),
+                    "duplicates": result["sets"],
+                    "total_duplicate_sets": result["total_sets"],
+                    "total_duplicate_files": result["total_files"],
+                    "total_files_scanned": result["files_scanned"],
+                    "reclaimable_bytes": result["reclaimable_bytes"],
+                    "catalog": catalog.summary([uid], providers),
                 },
             }
 
@@ -1663,37 +1581,16 @@ class GetStorageAnalytics(DriveBaseResource):
             about = service.about().get(fields="storageQuota").execute()
             storage_quota = about.get("storageQuota", {})
 
-            # Get file type breakdown
-            results = (
-                service.files()
-                .list(q="trashed=false", pageSize=1000, fields="files(mimeType, size)")
-                .execute()
-            )
-
-            files = results.get("files", [])
-
-            # Analyze by file type
-            type_analysis = {}
-            total_files = len(files)
-
-            for file in files:
-                mime_type = file.get("mimeType", "unknown")
-                size = int(file.get("size", 0)) if file.get("size") else 0
-
-                # Group by main type
-                main_type = mime_type.split("/")[0] if "/" in mime_type else mime_type
-
-                if main_type not in type_analysis:
-                    type_analysis[main_type] = {
-                        "count": 0,
-                        "total_size": 0,
-                        "percentage": 0,
-                    }
-
-                type_analysis[main_type]["count"] = 1
-                type_analysis[main_type]["total_size"] = size
+            # File type breakdown over every catalogued file
+            catalog.refresh([uid])
+            catalog_state = catalog.summary([uid], ["google"])
+            if catalog_state["complete"]:
+                type_analysis = catalog.analytics(uid)
+            else:
+                # Until the first catalog sync finishes, from Drive's first page
+                type_analysis = drive_type_analysis(service)
 
-            # Calculate percentages
+            total_files = sum(data["count"] for data in type_analysis.values())
             total_size = sum(data["total_size"] for data in type_analysis.values())
             for data in type_analysis.values():
                 data["percentage"] = (
@@ -1718,6 +1615,7 @@ class GetStorageAnalytics(DriveBaseResource):
                     "file_type_analysis": type_analysis,
                     "total_files": total_files,
                     "total_size": total_size,
+                    "catalog": catalog_state,
                 },
             }
 
@@ -1846,52 +1744,30 @@ class UploadHubFile(DriveBaseResource):
             if not account:
                 return {"status": 0, "message": "Google Drive not connected"}, 401
 
-            # Ensure DOCKLY root and subfolders
-            folder_info = ensure_drive_folder_structure(service, uid, account["id"])
-            if hub not in folder_info["subfolders"]:
-                # create dynamically if hub not in default list
-                hub_folder = get_or_create_subfolder(
-                    service,
-                    hub,
-                    parent_google_id=folder_info["root"],
-                    parent_db_id=folder_info["root_db"],
-                    user_id=uid,
-                    storage_account_id=account["id"],
-                )
-                hub_google_id = hub_folder["google_id"]
-                hub_db_id = hub_folder["db_id"]
-            else:
-                hub_google_id = folder_info["subfolders"][hub]
-                hub_db_id = folder_info["subfolders_db"][hub]
+            # DOCKLY root and hub folder, from the folder map
+            hub_google_id, hub_db_id = hub_folder_ids(service, uid, account["id"], hub)
+
+            def upload(parent_id):
+                file_metadata = {"name": secure_filename(file.filename), "parents": [parent_id]}
+                return service.files().create(
+                    body=file_metadata,
+                    media_body=uploads.drive_media(file),
+                    fields="id, name, webViewLink, mimeType, size, modifiedTime",
+                ).execute()
 
             # Upload file to Google Drive
-            file_metadata = {"name": secure_filename(file.filename), "parents": [hub_google_id]}
-            media = MediaIoBaseUpload(io.BytesIO(file.read()), mimetype=file.content_type or "application/octet-stream", resumable=True)
-            uploaded_file = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields="id, name, webViewLink, mimeType, size, modifiedTime",
-            ).execute()
+            try:
+                uploaded_file = upload(hub_google_id)
+            except HttpError as e:
+                if not drive_folders.is_not_found(e):
+                    raise
+                # The cached hub folder was deleted in Drive
+                drive_folders.forget(account["id"])
+                hub_google_id, hub_db_id = hub_folder_ids(service, uid, account["id"], hub, refresh=True)
+                uploaded_file = upload(hub_google_id)
 
             # Insert file in DB
-            file_db_id = DBHelper.insert(
-                table_name="files_index",
-                id=str(uuid.uuid4()),
-                return_column="id",
-                user_id=uid,
-                storage_account_id=account["id"],
-                file_path=uploaded_file.get("webViewLink"),
-                file_name=uploaded_file.get("name"),
-                file_size=int(uploaded_file.get("size", 0)),
-                file_type=uploaded_file.get("mimeType"),
-                mime_type=uploaded_file.get("mimeType"),
-                is_folder=False,
-                parent_folder_id=hub_db_id,
-                external_file_id=uploaded_file["id"],
-                last_modified=uploaded_file.get("modifiedTime", datetime.now().isoformat()),
-                created_at=datetime.now().isoformat(),
-                indexed_at=datetime.now().isoformat(),
-            )
+            file_db_id = index_hub_file(uid, account["id"], uploaded_file, hub_google_id, hub_db_id)
 
             return {
                 "status": 1,
@@ -1904,6 +1780,161 @@ class UploadHubFile(DriveBaseResource):
             return {"status": 0, "message": f"Failed to upload file: {str(e)}"}, 500
 
 
+class UploadSession(DriveBaseResource):
+    """Resumable upload of a raw file body to Drive, Dropbox or OneDrive.
+
+    POST opens a session, PUT sends bytes from the committed offset (any
+    number of requests), GET returns the committed offset to resume from
+    and DELETE cancels it.
+    """
+
+    def _account(self, uid, provider):
+        return DBHelper.find_one(
+            "connected_accounts",
+            filters={"user_id": uid, "provider": provider, "is_active": Status.ACTIVE.value},
+            select_fields=["id", "user_id", "email", "access_token", "refresh_token"],
+        )
+
+    def _error(self, e):
+        payload = {"offset": e.offset} if e.offset is not None else {}
+        return {"status": 0, "message": str(e), "payload": payload}, e.status
+
+    @staticmethod
+    def _on_complete(row, uploaded_file):
+        target = row["target"]
+        if target.get("hub"):
+            uploaded_file = dict(
+                uploaded_file,
+                db_id=index_hub_file(
+                    row["user_id"], row["storage_account_id"], uploaded_file,
+                    target["parent_id"], target["hub_db_id"],
+                ),
+            )
+        return uploaded_file
+
+    @auth_required(isOptional=True)
+    def post(self, uid, user, upload_id=None):
+        try:
+            data = request.get_json() or {}
+            provider = data.get("provider", "google")
+            name = secure_filename(data.get("fileName") or "")
+            mime_type = data.get("mimeType") or "application/octet-stream"
+            hub = (data.get("hub") or "").capitalize()
+            try:
+                size = int(data.get("size"))
+            except (TypeError, ValueError):
+                size = 0
+
+            if not name or size <= 0:
+                return {"status": 0, "message": "fileName and size required", "payload": {}}, 400
+
+            account = self._account(uid, provider)
+            if not account:
+                return {"status": 0, "message": f"{provider} account not connected", "payload": {}}, 401
+
+            if provider == "dropbox":
+                target = {"path": uploads.dropbox_path(data.get("folderPath"), name), "mode": "add"}
+            elif hub and provider == "google":
+                service = self.get_drive_service(uid)
+                if not service:
+                    return {"status": 0, "message": "Google Drive not connected or token expired", "payload": {}}, 401
+                hub_google_id, hub_db_id = hub_folder_ids(service, uid, account["id"], hub)
+                target = {"parent_id": hub_google_id, "hub": hub, "hub_db_id": hub_db_id}
+            else:
+                target = {"parent_id": data.get("parentId", "root")}
+
+            session = uploads.create(uid, account, provider, name, mime_type, size, target)
+            return {"status": 1, "message": "Upload session created", "payload": session}, 201
+
+        except uploads.UploadError as e:
+            return self._error(e)
+        except Exception as e:
+            traceback.print_exc()
+            return {"status": 0, "message": f"Failed to start upload: {str(e)}", "payload": {}}, 500
+
+    @auth_required(isOptional=True)
+    def put(self, uid, user, upload_id=None):
+        try:
+            # "Content-Range: bytes <start>-<end>/<size>" or "X-Upload-Offset: <start>"
+            offset = request.headers.get("X-Upload-Offset")
+            content_range = request.headers.get("Content-Range", "")
+            if offset is None and content_range.startswith("bytes ") and "-" in content_range:
+                offset = content_range[6:].split("-", 1)[0]
+            try:
+                offset = int(offset) if offset is not None else None
+            except ValueError:
+                return {"status": 0, "message": "Invalid upload offset", "payload": {}}, 400
+
+            session = uploads.receive(
+                upload_id, uid, request.stream, offset, on_complete=self._on_complete
+            )
+            message = "Upload complete" if session["complete"] else f"Received {session['offset']} of {session['size']} bytes"
+            return {"status": 1, "message": message, "payload": session}
+
+        except uploads.UploadError as e:
+            return self._error(e)
+        except Exception as e:
+            traceback.print_exc()
+            return {"status": 0, "message": f"Failed to upload file: {str(e)}", "payload": {}}, 500
+
+    @auth_required(isOptional=True)
+    def get(self, uid, user, upload_id=None):
+        try:
+            return {"status": 1, "message": "Upload status", "payload": uploads.status(upload_id, uid, on_complete=self._on_complete)}
+        except uploads.UploadError as e:
+            return self._error(e)
+        except Exception as e:
+            traceback.print_exc()
+            return {"status": 0, "message": f"Failed to get upload status: {str(e)}", "payload": {}}, 500
+
+    @auth_required(isOptional=True)
+    def delete(self, uid, user, upload_id=None):
+        try:
+            uploads.cancel(upload_id, uid)
+            return {"status": 1, "message": "Upload cancelled", "payload": {}}
+        except uploads.UploadError as e:
+            return self._error(e)
+        except Exception as e:
+            traceback.print_exc()
+            return {"status": 0, "message": f"Failed to cancel upload: {str(e)}", "payload": {}}, 500
+
+
+class GetThumbnail(Resource):
+    """Cached thumbnail of a listed file; the signed token in the URL is the credential."""
+
+    def get(self, token):
+        size = request.args.get("size", thumbnails.DEFAULT_SIZE)
+        if size not in thumbnails.SIZES:
+            return Response(f"Unknown thumbnail size: {size}", status=400, mimetype="text/plain")
+
+        try:
+            digest, data = thumbnails.get(token, size)
+        except thumbnails.InvalidToken:
+            return Response("Thumbnail not found", status=404, mimetype="text/plain")
+        except Exception as e:
+            traceback.print_exc()
+            return Response(f"Failed to fetch thumbnail: {str(e)}", status=502, mimetype="text/plain")
+
+        if digest is None:
+            # Asked again once the provider may have made one
+            return Response(
+                "No thumbnail for this file",
+                status=404,
+                mimetype="text/plain",
+                headers={"Cache-Control": f"private, max-age={thumbnails.MISSING_MAX_AGE}"},
+            )
+
+        # The URL changes with the file, so the image never does; private
+        # documents must stay out of shared caches
+        headers = {"Cache-Control": f"private, max-age={thumbnails.CACHE_MAX_AGE}, immutable"}
+        if not is_resource_modified(request.environ, etag=digest):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(data, mimetype=thumbnails.MIME_TYPE, headers=headers)
+        response.set_etag(digest)
+        return response
+
+
 class GetHubFiles(DriveBaseResource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
@@ -1934,6 +1965,9 @@ class GetHubFiles(DriveBaseResource):
                 all_user_ids,
             ).get("connected_accounts", [])
 
+            catalog.refresh(all_user_ids)
+            catalog_accounts = catalog.accounts(all_user_ids, ["google"])
+
             for account in connected_accounts:
                 user_id = account.get("user_id")
                 email = account.get("email")
@@ -1962,28 +1996,32 @@ class GetHubFiles(DriveBaseResource):
 
                     service = build("drive", "v3", credentials=creds, cache_discovery=False)
 
-                    # Ensure folders
-                    folder_info = ensure_drive_folder_structure(service, user_id, account["id"])
-                    if hub not in folder_info["subfolders"]:
-                        hub_folder = get_or_create_subfolder(
-                            service,
-                            hub,
-                            parent_google_id=folder_info["root"],
-                            parent_db_id=folder_info["root_db"],
-                            user_id=user_id,
-                            storage_account_id=account["id"],
-                        )
-                        hub_google_id = hub_folder["google_id"]
-                    else:
-                        hub_google_id = folder_info["subfolders"][hub]
+                    # Hub folder from the folder map; files from the catalog
+                    hub_google_id, _ = hub_folder_ids(service, user_id, account["id"], hub)
 
                     # Fetch files from Google Drive
-                    query = f"'{hub_google_id}' in parents and trashed=false"
-                    results = service.files().list(
-                        q=query,
-                        fields="files(id, name, mimeType, size, modifiedTime, webViewLink)",
-                    ).execute()
-                    member_files = results.get("files", [])
+                    def list_hub(parent_id):
+                        return service.files().list(
+                            q=f"'{parent_id}' in parents and trashed=false",
+                            fields="files(id, name, mimeType, size, modifiedTime, webViewLink, thumbnailLink)",
+                        ).execute()
+
+                    indexed = catalog_accounts.get(account["id"], {}).get("full_synced_at")
+                    if indexed:
+                        member_files = catalog.children(account["id"], hub_google_id)
+                    else:
+                        # Not catalogued yet
+                        try:
+                            results = list_hub(hub_google_id)
+                        except HttpError as e:
+                            if not drive_folders.is_not_found(e):
+                                raise
+                            drive_folders.forget(account["id"])
+                            hub_google_id, _ = hub_folder_ids(service, user_id, account["id"], hub, refresh=True)
+                            results = list_hub(hub_google_id)
+                        member_files = results.get("files", [])
+                        for item in member_files:
+                            item["thumbnailLink"] = thumbnails.drive_url(account["id"], item)
 
                     files_by_member.append({
                         "user_id": user_id,
@@ -2019,15 +2057,8 @@ class GetHubFiles(DriveBaseResource):
     def _get_family_members(self, user_id):
         """Get all family members (including the current user) for a user."""
         try:
-            # Step 1: Get the family group ID for the user
-            gid = DBHelper.find_one(
-                table_name="family_members",
-                select_fields=["family_group_id"],
-                filters={"user_id": user_id}
-            )
-
-            family_group_id = gid.get("family_group_id") if gid else None
-            if not family_group_id:
+            unique_members = family_graph.members(user_id)
+            if not unique_members:
                 # No family group — return just the current user
                 user = DBHelper.find_one(
                     table_name="users",
@@ -2041,28 +2072,6 @@ class GetHubFiles(DriveBaseResource):
                     "relationship": "me"
                 }]
 
-            # Step 2: Get all members of that family group
-            group_members = DBHelper.find_all(
-                table_name="family_members",
-                select_fields=["fm_user_id", "email", "name", "relationship", "user_id","color"],
-                filters={"family_group_id": family_group_id}
-            )
-
-            # Step 3: Remove duplicates by fm_user_id
-            seen_fm_ids = set()
-            unique_members = []
-            for m in group_members:
-                fm_uid = m.get("fm_user_id") or m.get("user_id")
-                if fm_uid not in seen_fm_ids:
-                    seen_fm_ids.add(fm_uid)
-                    unique_members.append({
-                        "user_id": fm_uid,
-                        "email": m.get("email"),
-                        "name": m.get("name"),
-                        "relationship": "me" if fm_uid == user_id else m.get("relationship"),
-                        "color":m.get("color")
-                    })
-
             return unique_members
 
         except Exception as e:
@@ -248,12 +248,16 @@ class ListOutlookFiles(Resource):
             files = []
             folders = []
 
+            # (imported here: root.files.thumbnails imports this module)
+            from root.files import thumbnails
+
             for item in items:
                 transformed = transform_onedrive_item(item, email)
                 if transformed:
                     if transformed["isFolder"]:
                         folders.append(transformed)
                     else:
+                        transformed["thumbnailLink"] = thumbnails.onedrive_url(account.get("id"), item)
                         files.append(transformed)
 
             return {
@@ -310,11 +314,19 @@ class UploadOutlookFile(Resource):
             if not account or not account.get("access_token"):
                 return {"status": 0, "message": "No valid Outlook account"}
 
-            # Upload file
-            file_data = file.read()
-            result = upload_onedrive_file(
-                account["access_token"], file_data, file.filename, parent_id
-            )
+            # Upload file, streamed through an upload session
+            # (imported here: root.files.uploads imports this module)
+            from root.files import uploads
+
+            if uploads.stream_size(file.stream):
+                result = uploads.upload_file(
+                    "outlook", account, file, file.filename, {"parent_id": parent_id}
+                )
+            else:
+                # Sessions can't create empty files
+                result = upload_onedrive_file(
+                    account["access_token"], b"", file.filename, parent_id
+                )
 
             if result:
                 return {
@@ -0,0 +1,406 @@
+"""
+Cached file thumbnails for Drive, Dropbox and OneDrive listings.
+
+Listings used to hand out Drive's `thumbnailLink`, which expires and sends
+every client back to Google for every view, and nothing at all for Dropbox
+and OneDrive. Listings now link to `GET /drive/thumbnails/<token>`:
+
+- the token names the file (provider, storage account, file id and
+  version) and is signed with SECRET_KEY, so it is the only credential the
+  URL needs and can be put in an <img> tag;
+- the file version (modified time or revision) is part of the token, so an
+  edited file gets a new URL and browsers can cache responses for a year
+  (privately: thumbnails show private documents);
+- the provider thumbnail is fetched once per file version, normalized with
+  Pillow to every size in SIZES and stored in an on-disk cache addressed
+  by the SHA-256 of the normalized image, so identical thumbnails (a file
+  shared with several accounts, copies) share one blob and the hash doubles
+  as the ETag;
+- `file_thumbnails` maps each file to its blobs; files without a thumbnail
+  are remembered too and asked for again after MISSING_RETRY_HOURS;
+- the cache is kept under THUMBNAIL_CACHE_MAX_BYTES by removing the least
+  recently served blobs; a file whose blob is gone is fetched again.
+"""
+
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import re
+import threading
+import uuid
+import weakref
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import dropbox
+import requests
+from dropbox.exceptions import ApiError
+from dropbox.files import PathOrLink, ThumbnailFormat, ThumbnailMode, ThumbnailSize
+from google.auth.transport.requests import AuthorizedSession
+from PIL import Image, ImageOps
+
+from root.common import Status
+from root.config import API_URL, SECRET_KEY, THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES
+from root.db.dbHelper import DBHelper
+from root.files.drive_listing import DRIVE_FILES_URL, credentials
+from root.files.outlook import MS_GRAPH_BASE_URL, get_outlook_headers
+
+# Size name -> longest edge in pixels
+SIZES = {"small": 128, "medium": 512}
+DEFAULT_SIZE = "small"
+MIME_TYPE = "image/jpeg"
+JPEG_QUALITY = 82
+
+CACHE_MAX_AGE = 365 * 24 * 3600
+MISSING_MAX_AGE = 3600
+MISSING_RETRY_HOURS = 24
+# Eviction removes blobs down to this share of the limit
+EVICT_TO = 0.9
+# A blob's mtime (its LRU position) is bumped at most this often
+TOUCH_SECONDS = 3600
+REQUEST_TIMEOUT = 30
+
+# Files Dropbox makes thumbnails of, up to 20 MB
+DROPBOX_EXTENSIONS = {"jpg", "jpeg", "png", "tiff", "tif", "gif", "webp", "ppm", "bmp"}
+DROPBOX_MAX_BYTES = 20 * 1024 * 1024
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+# ───── URLs ─────
+
+def _signature(raw):
+    # Tokens are the only credential of the endpoint; an empty key would make them forgeable
+    if not SECRET_KEY:
+        raise RuntimeError("SECRET_KEY is not configured")
+    return hmac.new(SECRET_KEY.encode(), raw, hashlib.sha256).digest()[:16]
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(provider, account_id, file_ref, version):
+    raw = json.dumps([provider, account_id, file_ref, version or ""], separators=(",", ":")).encode()
+    return f"{_b64(raw)}.{_b64(_signature(raw))}"
+
+
+def read_token(token):
+    """(provider, storage account id, file id, version) of a token from `sign`."""
+    try:
+        body, signature = token.split(".")
+        raw = _unb64(body)
+        valid = hmac.compare_digest(_unb64(signature), _signature(raw))
+        provider, account_id, file_ref, version = json.loads(raw)
+        account_id = int(account_id)
+    except (ValueError, TypeError):
+        raise InvalidToken("Invalid thumbnail token")
+    if not valid or provider not in FETCHERS:
+        raise InvalidToken("Invalid thumbnail token")
+    return provider, account_id, file_ref, version
+
+
+def url(provider, account_id, file_ref, version, size=DEFAULT_SIZE):
+    return f"{API_URL}/drive/thumbnails/{sign(provider, account_id, file_ref, version)}?size={size}"
+
+
+def _version(timestamp):
+    """An ISO timestamp to the second, however the listing formatted it."""
+    return re.sub(r"\D", "", timestamp or "")[:14]
+
+
+def drive_url(account_id, item):
+    """Thumbnail URL of a Drive item, None when Drive has no thumbnail for it."""
+    if not account_id or not item.get("thumbnailLink"):
+        return None
+    return url("google", account_id, item["id"], _version(item.get("modifiedTime")))
+
+
+def dropbox_url(account_id, entry):
+    """Thumbnail URL of a Dropbox FileMetadata, None for files Dropbox can't preview."""
+    if not account_id or (getattr(entry, "size", 0) or 0) > DROPBOX_MAX_BYTES:
+        return None
+    extension = entry.name.rsplit(".", 1)[-1].lower() if "." in entry.name else ""
+    if extension not in DROPBOX_EXTENSIONS:
+        return None
+    return url("dropbox", account_id, entry.id, entry.rev)
+
+
+def onedrive_url(account_id, item):
+    """Thumbnail URL of a OneDrive driveItem, None for folders and files without previews."""
+    mime_type = (item.get("file") or {}).get("mimeType") or ""
+    previewable = mime_type.startswith(("image/", "video/")) or mime_type == "application/pdf"
+    if not account_id or not previewable:
+        return None
+    return url("outlook", account_id, item["id"], _version(item.get("lastModifiedDateTime")))
+
+
+# ───── Provider thumbnails ─────
+
+def _fetch_drive(account, file_ref):
+    session = AuthorizedSession(credentials(account))
+    try:
+        response = session.get(
+            f"{DRIVE_FILES_URL}/{quote(file_ref, safe='')}",
+            params={"fields": "thumbnailLink", "supportsAllDrives": "true"},
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        link = response.json().get("thumbnailLink")
+        if not link:
+            return None
+        # Drive links end in the requested size (=s220 by default)
+        link = re.sub(r"=s\d+$", "", link) + f"=s{max(SIZES.values())}"
+        response = session.get(link, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    finally:
+        session.close()
+
+
+def _fetch_dropbox(account, file_ref):
+    dbx = dropbox.Dropbox(account["access_token"], timeout=REQUEST_TIMEOUT)
+    try:
+        _, response = dbx.files_get_thumbnail_v2(
+            PathOrLink.path(file_ref),
+            format=ThumbnailFormat.jpeg,
+            size=ThumbnailSize.w640h480,
+            mode=ThumbnailMode.fitone_bestfit,
+        )
+    except ApiError as e:
+        error = e.error
+        if error.is_path() or error.is_unsupported_extension() or error.is_unsupported_image() \
+                or error.is_conversion_error():
+            return None
+        raise
+    with response:
+        return response.content
+
+
+def _fetch_onedrive(account, file_ref):
+    response = requests.get(
+        f"{MS_GRAPH_BASE_URL}/me/drive/items/{quote(file_ref, safe='')}/thumbnails/0/large/content",
+        headers=get_outlook_headers(account["access_token"]),
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+# connected_accounts.provider -> function returning the thumbnail bytes or None
+FETCHERS = {
+    "google": _fetch_drive,
+    "dropbox": _fetch_dropbox,
+    "outlook": _fetch_onedrive,
+}
+
+
+def normalize(data):
+    """size name -> JPEG of the image `data` scaled to fit that size."""
+    largest = max(SIZES.values())
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs decode straight at a reduced scale
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    normalized = {}
+    for name, edge in sorted(SIZES.items(), key=lambda size: -size[1]):
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        normalized[name] = buffer.getvalue()
+    return normalized
+
+
+# ───── Disk cache ─────
+
+_usage = {"bytes": None}
+_usage_lock = threading.Lock()
+
+
+def _path(digest):
+    return os.path.join(THUMBNAIL_CACHE_DIR, digest[:2], f"{digest}.jpg")
+
+
+def _blobs():
+    """(mtime, size, path) of every cached blob."""
+    entries = []
+    if not os.path.isdir(THUMBNAIL_CACHE_DIR):
+        return entries
+    for directory in os.scandir(THUMBNAIL_CACHE_DIR):
+        if not directory.is_dir():
+            continue
+        for entry in os.scandir(directory.path):
+            if entry.name.endswith(".jpg"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def _evict(added, keep):
+    """Count `added` bytes and drop the least recently used blobs when over the
+    limit, except blob `keep` just written."""
+    with _usage_lock:
+        if _usage["bytes"] is None:
+            _usage["bytes"] = sum(size for _, size, _ in _blobs())
+        else:
+            _usage["bytes"] += added
+        if _usage["bytes"] <= THUMBNAIL_CACHE_MAX_BYTES:
+            return
+
+        # Other workers write to the same directory; start from what is there
+        blobs = sorted(_blobs())
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in blobs:
+            if total <= THUMBNAIL_CACHE_MAX_BYTES * EVICT_TO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+            except OSError:
+                continue
+        _usage["bytes"] = total
+
+
+def _store(data):
+    """Write `data` to the cache; returns its SHA-256."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _path(digest)
+    if os.path.exists(path):
+        os.utime(path)
+        return digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+    _evict(len(data), path)
+    return digest
+
+
+def _load(digest):
+    """Cached blob `digest`, None when it was evicted."""
+    path = _path(digest)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if os.stat(path).st_mtime < datetime.now().timestamp() - TOUCH_SECONDS:
+            os.utime(path)
+    except FileNotFoundError:
+        return None
+    return data
+
+
+# ───── Lookup ─────
+
+# One fetch per file at a time within a worker
+_locks = weakref.WeakValueDictionary()
+_locks_lock = threading.Lock()
+
+
+def _lock(key):
+    with _locks_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+        return lock
+
+
+def _entry(account_id, file_ref):
+    return DBHelper.find_one(
+        "file_thumbnails",
+        filters={"storage_account_id": account_id, "file_ref": file_ref},
+    )
+
+
+def _cached(row, version, size):
+    """(digest, data) or (None, None) when `row` answers the request, else None."""
+    if not row or row["version"] != (version or ""):
+        return None
+    if row["status"] == "missing":
+        retry_at = row["fetched_at"] + timedelta(hours=MISSING_RETRY_HOURS)
+        return (None, None) if retry_at > datetime.utcnow() else None
+    digest = (row["hashes"] or {}).get(size)
+    data = _load(digest) if digest else None
+    return (digest, data) if data is not None else None
+
+
+def _save(provider, account_id, file_ref, version, status, hashes):
+    DBHelper.execute_query(
+        """
+        INSERT INTO file_thumbnails
+            (storage_account_id, provider, file_ref, version, status, hashes, fetched_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (storage_account_id, file_ref) DO UPDATE SET
+            provider = EXCLUDED.provider,
+            version = EXCLUDED.version,
+            status = EXCLUDED.status,
+            hashes = EXCLUDED.hashes,
+            fetched_at = EXCLUDED.fetched_at
+        """,
+        (account_id, provider, file_ref, version or "", status, json.dumps(hashes), datetime.utcnow()),
+    )
+
+
+def get(token, size=DEFAULT_SIZE):
+    """(SHA-256, JPEG bytes) of the thumbnail named by `token`.
+
+    Returns (None, None) when the provider has no thumbnail for the file.
+    Raises InvalidToken for a bad token or an account no longer connected;
+    provider errors are raised as they are and not remembered.
+    """
+    provider, account_id, file_ref, version = read_token(token)
+    cached = _cached(_entry(account_id, file_ref), version, size)
+    if cached:
+        return cached
+
+    with _lock((account_id, file_ref)):
+        # Another request may have fetched it meanwhile
+        cached = _cached(_entry(account_id, file_ref), version, size)
+        if cached:
+            return cached
+
+        account = DBHelper.find_one(
+            "connected_accounts",
+            filters={"id": account_id, "provider": provider, "is_active": Status.ACTIVE.value},
+            select_fields=["id", "access_token", "refresh_token"],
+        )
+        if not account:
+            raise InvalidToken("Storage account is no longer connected")
+
+        data = FETCHERS[provider](account, file_ref)
+        if not data:
+            _save(provider, account_id, file_ref, version, "missing", {})
+            return None, None
+
+        normalized = normalize(data)
+        hashes = {name: _store(blob) for name, blob in normalized.items()}
+        _save(provider, account_id, file_ref, version, "ready", hashes)
+        return hashes[size], normalized[size]
@@ -0,0 +1,565 @@
+"""
+Streamed, resumable uploads to Drive, Dropbox and OneDrive.
+
+Uploads used to read the whole file into memory and send it in one call.
+Here the bytes go to the provider's own resumable session (Drive resumable
+upload, Dropbox upload session, OneDrive createUploadSession) in
+CHUNK_SIZE pieces as they are read, so a worker holds at most one chunk
+per upload whatever the file size:
+
+- `drive_media` / `upload_file` stream a multipart upload (Werkzeug spools
+  it to disk past a small size) for the endpoints taking `request.files`;
+- `create` / `receive` / `status` keep a provider session in
+  `upload_sessions` for clients sending the raw file body. A client that
+  loses its connection asks for the committed offset and sends the rest
+  from there, in as many requests as it likes.
+
+Drive takes chunks in multiples of 256 KiB and OneDrive in multiples of
+320 KiB (except the last), so when a request ends mid-chunk only a
+multiple of GRANULARITY is sent and the committed offset tells the client
+where to continue.
+"""
+
+import json
+import os
+import posixpath
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import dropbox
+import requests
+from dropbox.exceptions import ApiError
+from dropbox.files import (
+    CommitInfo,
+    UploadSessionCursor,
+    UploadSessionFinishError,
+    UploadSessionLookupError,
+    WriteMode,
+)
+from google.auth.transport.requests import AuthorizedSession
+from googleapiclient.http import MediaIoBaseUpload
+from werkzeug.exceptions import ClientDisconnected
+
+from root.db.dbHelper import DBHelper
+from root.files.drive_listing import credentials
+from root.files.outlook import MS_GRAPH_BASE_URL, get_outlook_headers
+
+# A multiple of both providers' granularity
+GRANULARITY = 1280 * 1024
+CHUNK_SIZE = 8 * GRANULARITY
+READ_SIZE = 256 * 1024
+
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+DRIVE_FILE_FIELDS = "id, name, mimeType, size, modifiedTime, webViewLink"
+REQUEST_TIMEOUT = 120
+
+# Provider sessions last about a week; ours are dropped a bit earlier
+SESSION_DAYS = 6
+# An "uploading" session not touched for this long lost its request
+STALE_SECONDS = 300
+
+
+class UploadError(Exception):
+    """Upload request that can't proceed; `status` is the HTTP status to return."""
+
+    status = 400
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadNotFound(UploadError):
+    status = 404
+
+
+class UploadBusy(UploadError):
+    status = 409
+
+
+class OffsetMismatch(UploadError):
+    status = 409
+
+
+class UploadExpired(UploadError):
+    status = 410
+
+
+def drive_media(file):
+    """Drive media body streaming Werkzeug upload `file` in CHUNK_SIZE chunks."""
+    file.stream.seek(0)
+    return MediaIoBaseUpload(
+        file.stream,
+        mimetype=file.content_type or "application/octet-stream",
+        chunksize=CHUNK_SIZE,
+        resumable=True,
+    )
+
+
+def stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+# ───── Provider sessions ─────
+
+class DriveUpload:
+    def start(self, account, name, mime_type, size, target):
+        metadata = {"name": name, "mimeType": mime_type}
+        if target.get("parent_id") and target["parent_id"] != "root":
+            metadata["parents"] = [target["parent_id"]]
+        session = AuthorizedSession(credentials(account))
+        try:
+            response = session.post(
+                DRIVE_UPLOAD_URL,
+                params={"uploadType": "resumable", "fields": DRIVE_FILE_FIELDS},
+                json=metadata,
+                headers={
+                    "X-Upload-Content-Type": mime_type,
+                    "X-Upload-Content-Length": str(size),
+                },
+                timeout=REQUEST_TIMEOUT,
+            )
+            response.raise_for_status()
+        finally:
+            session.close()
+        return response.headers["Location"]
+
+    def _put(self, account, handle, data, content_range):
+        session = AuthorizedSession(credentials(account))
+        try:
+            response = session.put(
+                handle, data=data, headers={"Content-Range": content_range}, timeout=REQUEST_TIMEOUT
+            )
+        finally:
+            session.close()
+        if response.status_code in (200, 201):
+            return None, response.json()
+        if response.status_code == 308:
+            # "bytes=0-<last byte received>", absent when nothing was
+            committed = response.headers.get("Range")
+            return (int(committed.rsplit("-", 1)[1]) + 1 if committed else 0), None
+        if response.status_code in (404, 410):
+            raise UploadExpired("Upload session expired; start a new upload")
+        response.raise_for_status()
+        raise UploadError(f"Unexpected Drive response {response.status_code}")
+
+    def send(self, account, handle, offset, chunk, size, target):
+        content_range = (
+            f"bytes {offset}-{offset + len(chunk) - 1}/{size}" if chunk else f"bytes */{size}"
+        )
+        committed, file = self._put(account, handle, chunk, content_range)
+        return (size, file) if file else (committed, None)
+
+    def committed(self, account, handle, size, target):
+        committed, file = self._put(account, handle, b"", f"bytes */{size}")
+        return (size, file) if file else (committed, None)
+
+
+class DropboxUpload:
+    def _client(self, account):
+        return dropbox.Dropbox(account["access_token"], timeout=REQUEST_TIMEOUT)
+
+    def start(self, account, name, mime_type, size, target):
+        return self._client(account).files_upload_session_start(b"").session_id
+
+    def send(self, account, handle, offset, chunk, size, target):
+        dbx = self._client(account)
+        cursor = UploadSessionCursor(session_id=handle, offset=offset)
+        try:
+            if offset + len(chunk) >= size:
+                metadata = dbx.files_upload_session_finish(
+                    chunk,
+                    cursor,
+                    CommitInfo(
+                        path=target["path"],
+                        mode=WriteMode(target.get("mode", "add")),
+                        autorename=True,
+                    ),
+                )
+                return size, {
+                    "id": metadata.id,
+                    "name": metadata.name,
+                    "path_lower": metadata.path_lower,
+                    "path_display": metadata.path_display,
+                    "size": metadata.size,
+                    "content_hash": metadata.content_hash,
+                    "server_modified": metadata.server_modified.isoformat(),
+                }
+            dbx.files_upload_session_append_v2(chunk, cursor)
+            return offset + len(chunk), None
+        except ApiError as e:
+            # Append errors are lookup errors; finish errors wrap one
+            lookup = e.error
+            if isinstance(lookup, UploadSessionFinishError):
+                lookup = lookup.get_lookup_failed() if lookup.is_lookup_failed() else None
+            if isinstance(lookup, UploadSessionLookupError):
+                if lookup.is_incorrect_offset():
+                    return lookup.get_incorrect_offset().correct_offset, None
+                if lookup.is_not_found() or lookup.is_closed():
+                    raise UploadExpired("Upload session expired; start a new upload")
+            raise
+
+    def committed(self, account, handle, size, target):
+        # Dropbox has no status call; an append at a wrong offset reports the right one
+        return None, None
+
+
+class OneDriveUpload:
+    def start(self, account, name, mime_type, size, target):
+        parent = target.get("parent_id") or "root"
+        item = "root" if parent == "root" else f"items/{quote(parent, safe='')}"
+        response = requests.post(
+            f"{MS_GRAPH_BASE_URL}/me/drive/{item}:/{quote(name)}:/createUploadSession",
+            headers=get_outlook_headers(account["access_token"]),
+            json={"item": {"@microsoft.graph.conflictBehavior": "rename"}},
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()["uploadUrl"]
+
+    def _next(self, data):
+        ranges = data.get("nextExpectedRanges") or []
+        return int(ranges[0].split("-", 1)[0]) if ranges else None
+
+    def send(self, account, handle, offset, chunk, size, target):
+        if not size:
+            raise UploadError("OneDrive upload sessions can't create empty files")
+        # The upload URL carries its own authorization
+        response = requests.put(
+            handle,
+            data=chunk,
+            headers={
+                "Content-Length": str(len(chunk)),
+                "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}",
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code in (200, 201):
+            return size, response.json()
+        if response.status_code == 202:
+            committed = self._next(response.json())
+            return (offset + len(chunk) if committed is None else committed), None
+        if response.status_code == 416:
+            return self.committed(account, handle, size, target)
+        if response.status_code == 404:
+            raise UploadExpired("Upload session expired; start a new upload")
+        response.raise_for_status()
+        raise UploadError(f"Unexpected OneDrive response {response.status_code}")
+
+    def committed(self, account, handle, size, target):
+        response = requests.get(handle, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 404:
+            raise UploadExpired("Upload session expired; start a new upload")
+        response.raise_for_status()
+        return self._next(response.json()), None
+
+
+PROVIDERS = {
+    "google": DriveUpload(),
+    "dropbox": DropboxUpload(),
+    "outlook": OneDriveUpload(),
+}
+
+
+def pump(provider, account, handle, stream, offset, size, target, on_progress=None):
+    """Send `stream` to the provider session `handle` from `offset`.
+
+    Reads READ_SIZE at a time into one CHUNK_SIZE buffer. If the stream
+    ends before `size`, the buffer is sent down to a multiple of
+    GRANULARITY. Returns (committed offset, provider file once complete).
+    """
+    uploader = PROVIDERS[provider]
+    buffer, ended = bytearray(), False
+    # An empty file is one empty final chunk
+    while offset < size or not size:
+        while len(buffer) < CHUNK_SIZE and not ended and offset + len(buffer) < size:
+            try:
+                data = stream.read(min(READ_SIZE, CHUNK_SIZE - len(buffer), size - offset - len(buffer)))
+            except ClientDisconnected:
+                data = b""
+            if data:
+                buffer += data
+            else:
+                ended = True
+
+        final = offset + len(buffer) >= size
+        length = len(buffer) if final or len(buffer) == CHUNK_SIZE else len(buffer) - len(buffer) % GRANULARITY
+        if not length and not final:
+            break
+
+        committed, file = uploader.send(account, handle, offset, bytes(buffer[:length]), size, target)
+        if file is not None:
+            if on_progress:
+                on_progress(size)
+            return size, file
+        if on_progress:
+            on_progress(committed)
+        if not offset < committed <= offset + len(buffer):
+            # No progress, or the provider is elsewhere: the client resends from there
+            return committed, None
+        del buffer[:committed - offset]
+        offset = committed
+    return offset, None
+
+
+def upload_file(provider, account, file, name, target):
+    """Stream Werkzeug upload `file` through a new provider session; returns the file."""
+    size = stream_size(file.stream)
+    mime_type = file.content_type or "application/octet-stream"
+    uploader = PROVIDERS[provider]
+    handle = uploader.start(account, name, mime_type, size, target)
+    file.stream.seek(0)
+    committed, uploaded = pump(provider, account, handle, file.stream, 0, size, target)
+    if uploaded is None:
+        raise UploadError(f"Upload stopped at {committed} of {size} bytes", offset=committed)
+    return uploaded
+
+
+# ───── Client sessions ─────
+
+def _serialize(row):
+    return {
+        "uploadId": str(row["id"]),
+        "provider": row["provider"],
+        "fileName": row["file_name"],
+        "size": row["total_size"],
+        "offset": row["committed"],
+        "complete": row["status"] == "complete",
+        "file": row["result"],
+        "chunkSize": CHUNK_SIZE,
+        "granularity": GRANULARITY,
+        "expiresAt": row["expires_at"].isoformat() + "Z" if row["expires_at"] else None,
+    }
+
+
+def _account(row):
+    account = DBHelper.find_one(
+        "connected_accounts",
+        filters={"id": row["storage_account_id"], "user_id": row["user_id"], "is_active": 1},
+        select_fields=["id", "user_id", "email", "access_token", "refresh_token"],
+    )
+    if not account:
+        raise UploadExpired("Storage account is no longer connected")
+    return account
+
+
+def create(user_id, account, provider, name, mime_type, size, target):
+    """Open a provider session for a client upload of `size` bytes."""
+    if provider not in PROVIDERS:
+        raise UploadError(f"Unsupported provider: {provider}")
+    if not size or size < 0:
+        raise UploadError("File size required")
+
+    handle = PROVIDERS[provider].start(account, name, mime_type, size, target)
+    DBHelper.execute_query(
+        "DELETE FROM upload_sessions WHERE user_id = %s AND expires_at < %s",
+        (user_id, datetime.utcnow()),
+    )
+    rows = DBHelper.execute_query(
+        """
+        INSERT INTO upload_sessions (
+            user_id, provider, storage_account_id, handle, file_name, mime_type,
+            total_size, target, expires_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s)
+        RETURNING *
+        """,
+        (
+            user_id,
+            provider,
+            account["id"],
+            handle,
+            name,
+            mime_type,
+            size,
+            json.dumps(target),
+            datetime.utcnow() + timedelta(days=SESSION_DAYS),
+        ),
+    )
+    return _serialize(rows[0])
+
+
+def _find(upload_id, user_id):
+    try:
+        upload_id = str(uuid.UUID(str(upload_id)))
+    except ValueError:
+        raise UploadNotFound("Upload not found")
+    rows = DBHelper.raw_sql(
+        "SELECT * FROM upload_sessions WHERE id = %s AND user_id = %s",
+        (upload_id, user_id),
+    )
+    if not rows:
+        raise UploadNotFound("Upload not found")
+    row = rows[0]
+    if row["status"] in ("expired", "cancelled") or (
+        row["status"] != "complete" and row["expires_at"] < datetime.utcnow()
+    ):
+        raise UploadExpired("Upload session expired; start a new upload")
+    return row
+
+
+def _claim(row):
+    rows = DBHelper.execute_query(
+        """
+        UPDATE upload_sessions SET status = 'uploading', updated_at = NOW()
+        WHERE id = %s
+          AND (status = 'active'
+               OR (status = 'uploading'
+                   AND updated_at < NOW() - make_interval(secs => %s)))
+        RETURNING *
+        """,
+        (row["id"], STALE_SECONDS),
+    )
+    if not rows:
+        raise UploadBusy("Another request is uploading this file", offset=row["committed"])
+    return rows[0]
+
+
+def _save(upload_id, committed, status=None, result=None):
+    DBHelper.execute_query(
+        """
+        UPDATE upload_sessions SET
+            committed = %s,
+            status = COALESCE(%s, status),
+            result = COALESCE(%s::jsonb, result),
+            updated_at = NOW()
+        WHERE id = %s
+        """,
+        (committed, status, json.dumps(result) if result is not None else None, upload_id),
+    )
+
+
+def _release(row):
+    DBHelper.execute_query(
+        "UPDATE upload_sessions SET status = 'active', updated_at = NOW() WHERE id = %s AND status = 'uploading'",
+        (row["id"],),
+    )
+
+
+def _finish(row, file, on_complete=None):
+    """Mark claimed upload `row` complete with provider file `file`.
+
+    The provider file is stored first, so if `on_complete` fails (or the
+    worker dies) the next `receive`/`status` finishes from it instead of
+    losing the upload.
+    """
+    _save(row["id"], row["total_size"], result=file)
+    file = on_complete(row, file) if on_complete else file
+    _save(row["id"], row["total_size"], status="complete", result=file)
+    row.update(committed=row["total_size"], status="complete", result=file)
+    return _serialize(row)
+
+
+def receive(upload_id, user_id, stream, offset=None, on_complete=None):
+    """Append the request body `stream` to upload `upload_id` from `offset`.
+
+    `offset` (default: the committed offset) must match what the provider
+    committed. `on_complete(row, file)` runs once when the file is complete
+    and returns the file shown to the client.
+    """
+    row = _find(upload_id, user_id)
+    if row["status"] == "complete":
+        return _serialize(row)
+    delivered = row["result"] is not None
+    if not delivered and offset is not None and offset != row["committed"]:
+        raise OffsetMismatch(
+            f"Upload is at byte {row['committed']}, not {offset}", offset=row["committed"]
+        )
+
+    row = _claim(row)
+    committed = row["committed"]
+    try:
+        if row["result"] is not None:
+            # The provider finished earlier but completing it here didn't
+            return _finish(row, row["result"], on_complete)
+        account = _account(row)
+        committed, file = pump(
+            row["provider"],
+            account,
+            row["handle"],
+            stream,
+            committed,
+            row["total_size"],
+            row["target"],
+            on_progress=lambda position: _save(row["id"], position),
+        )
+        if file is None and committed >= row["total_size"]:
+            # Everything was sent before, but the provider file wasn't kept
+            committed, file = PROVIDERS[row["provider"]].committed(
+                account, row["handle"], row["total_size"], row["target"]
+            )
+            committed = row["total_size"] if committed is None else committed
+        if file is not None:
+            return _finish(row, file, on_complete)
+        row["committed"] = committed
+        return _serialize(row)
+    except UploadExpired:
+        _save(row["id"], committed, status="expired")
+        raise
+    finally:
+        _release(row)
+
+
+def status(upload_id, user_id, on_complete=None):
+    """Upload state, with the committed offset checked with the provider.
+
+    An upload the provider has finished is completed here (running
+    `on_complete` as `receive` would) if no request is uploading it.
+    """
+    row = _find(upload_id, user_id)
+    if row["status"] not in ("active", "uploading"):
+        return _serialize(row)
+
+    file = row["result"]
+    if file is None:
+        try:
+            committed, file = PROVIDERS[row["provider"]].committed(
+                _account(row), row["handle"], row["total_size"], row["target"]
+            )
+        except UploadExpired:
+            _save(row["id"], row["committed"], status="expired")
+            raise
+        if file is None:
+            if committed is not None and committed != row["committed"] and row["status"] == "active":
+                _save(row["id"], committed)
+                row["committed"] = committed
+            return _serialize(row)
+
+    try:
+        row = _claim(row)
+    except UploadBusy:
+        return _serialize(row)
+    try:
+        return _finish(row, row["result"] if row["result"] is not None else file, on_complete)
+    finally:
+        _release(row)
+
+
+def cancel(upload_id, user_id):
+    row = _find(upload_id, user_id)
+    if row["status"] != "complete":
+        _save(row["id"], row["committed"], status="cancelled")
+        if row["provider"] in ("google", "outlook"):
+            # Ends the provider session; failures only leave it to expire
+            try:
+                if row["provider"] == "google":
+                    session = AuthorizedSession(credentials(_account(row)))
+                    try:
+                        session.delete(row["handle"], timeout=REQUEST_TIMEOUT)
+                    finally:
+                        session.close()
+                else:
+                    requests.delete(row["handle"], timeout=REQUEST_TIMEOUT)
+            except Exception as e:
+                print(f"⚠ Failed to cancel upload session {upload_id}: {e}")
+
+
+def dropbox_path(folder_path, filename):
+    folder_path = "/" + (folder_path or "").strip("/")
+    return posixpath.join(folder_path, filename)
+
@@ -0,0 +1,192 @@
+"""
+Streaming ZIP archives for bulk downloads.
+
+`stream_zip` turns a list of files into a generator of ZIP bytes. Each
+file's content is pulled from its provider in chunks and written into the
+archive as it arrives, so the response starts with the first chunk and a
+worker holds a few chunks per file instead of the whole selection (twice,
+as the in-memory ZipFile did).
+
+The next `prefetch` files are downloaded by background threads into
+bounded queues while the current one is being sent. A file that fails
+before its first byte is left out; every failure is listed in
+`_download_errors.txt` at the end of the archive.
+"""
+
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, stream_with_context
+
+CHUNK_SIZE = 1024 * 1024
+PREFETCH_FILES = 2
+# Chunks buffered per prefetched file
+QUEUE_CHUNKS = 4
+ERRORS_NAME = "_download_errors.txt"
+
+# Already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {
+    ".zip", ".gz", ".7z", ".rar", ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".heic", ".mp3", ".mp4", ".mov", ".m4a", ".pdf", ".docx", ".xlsx", ".pptx",
+}
+
+_DONE = object()
+
+
+class ZipEntry:
+    """One file of the archive: `name` and `open`, a callable returning an
+    iterator of byte chunks. `label` identifies it in the error list.
+
+    `open` runs on a prefetch thread and may set `name` (e.g. from metadata
+    fetched there) before yielding its first chunk.
+    """
+
+    def __init__(self, name, open, label=None):
+        self.name = name
+        self.open = open
+        self.label = label or name
+
+
+class _Sink:
+    """Write-only, unseekable file object collecting what ZipFile writes."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _fill(entry, q, stop):
+    """Producer: push `entry`'s chunks into `q` until done, failed or stopped."""
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for chunk in entry.open():
+            if chunk and not put(chunk):
+                return
+        put(_DONE)
+    except Exception as e:
+        put(_Failed(e))
+
+
+def _unique(name, used):
+    base, ext = os.path.splitext(name or "file")
+    candidate, n = name or "file", 1
+    while candidate in used:
+        candidate = f"{base} ({n}){ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(entries, prefetch=PREFETCH_FILES, on_complete=None):
+    """Yield a ZIP archive of `entries` (ZipEntry) chunk by chunk.
+
+    `on_complete(written, failed)` is called with the names written and the
+    (label, error) pairs of failed files once the archive is finished.
+    """
+    entries = list(entries)
+    sink = _Sink()
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=QUEUE_CHUNKS) for _ in entries]
+    executor = ThreadPoolExecutor(max_workers=max(prefetch, 0) + 1)
+    started = set()
+
+    def start(i):
+        if i < len(entries) and i not in started:
+            started.add(i)
+            executor.submit(_fill, entries[i], queues[i], stop)
+
+    written, failed, used = [], [], set()
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+            for i, entry in enumerate(entries):
+                for j in range(i, i + max(prefetch, 0) + 1):
+                    start(j)
+
+                dest, name = None, None
+                try:
+                    while True:
+                        item = queues[i].get()
+                        if item is _DONE:
+                            break
+                        if isinstance(item, _Failed):
+                            raise item.error
+                        if dest is None:
+                            name = _unique(entry.name, used)
+                            info = zipfile.ZipInfo(name, time.localtime()[:6])
+                            if os.path.splitext(name)[1].lower() not in STORED_EXTENSIONS:
+                                info.compress_type = zipfile.ZIP_DEFLATED
+                            dest = archive.open(info, "w", force_zip64=True)
+                        dest.write(item)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                    if dest is None:
+                        # Empty file
+                        name = _unique(entry.name, used)
+                        archive.writestr(name, b"")
+                    written.append(name)
+                except Exception as e:
+                    print(f"Error downloading file {entry.label}: {str(e)}")
+                    failed.append((entry.label, str(e)))
+                finally:
+                    if dest is not None:
+                        dest.close()
+                data = sink.drain()
+                if data:
+                    yield data
+
+            if failed:
+                archive.writestr(
+                    ERRORS_NAME,
+                    "\n".join(f"{label}: {error}" for label, error in failed),
+                )
+        yield sink.drain()
+
+        if on_complete:
+            on_complete(written, failed)
+    finally:
+        # Also runs when the client disconnects mid-download
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def zip_response(chunks, download_name="bulk_download.zip"):
+    """Streamed attachment response for a `stream_zip` generator."""
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{download_name}"',
+            # Let proxies pass chunks through instead of buffering the archive
+            "X-Accel-Buffering": "no",
+        },
+    )
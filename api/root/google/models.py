@@ -1,22 +1,23 @@
 import calendar
-from datetime import datetime, time, timedelta
+from datetime import datetime, timedelta
 import json
 import re
 import traceback
 from flask import make_response, redirect, request, session
 from flask_jwt_extended import create_access_token
 from flask_restful import Resource
-import pytz
 from root.common import Status
 from root.family.models import send_invitation_email
-from root.utilis import create_calendar_event, uniqueId, update_calendar_event
+from root.utilis import uniqueId, update_calendar_event
+from root.calendar_sync import enqueue_upsert as queue_calendar_upsert
+from root.planner.spans import to_range
+from root.recurrence import rule_input_error, sync_rule_from_input
 from root.db.dbHelper import DBHelper
 from root.config import API_URL, CLIENT_ID, CLIENT_SECRET, WEB_URL, uri, SCOPE
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from urllib.parse import quote
-import dateparser
-from dateparser.search import search_dates
+from root.helpers.datetime_parser import extract_datetime_us as parse_natural_datetime_us
 from pytz import timezone, utc
 from root.planner.models import UpdateWeeklyGoals, UpdateWeeklyTodos
 
@@ -487,6 +488,10 @@ class AddEvent(Resource):
             "is_active": 1,
         }
 
+        rule_error = rule_input_error(inputData)
+        if rule_error:
+            return {"status": 0, "message": rule_error, "payload": {}}
+
         try:
             # ───── Parse dates ─────
             if is_all_day:
@@ -559,14 +564,17 @@ class AddEvent(Resource):
                         )
                         return {"status": 0, "message": "Event not found", "payload": {}}
 
-                    calendar_event_id = existing_event.get("calendar_event_id")
-                    if calendar_event_id:
-                        update_calendar_event(uid, calendar_event_id, title, start_dt, end_dt)
-                    else:
-                        calendar_event_id = create_calendar_event(uid, title, start_dt, end_dt)
-
-                    insert_data["calendar_event_id"] = calendar_event_id
-                    DBHelper.update_one("events", filters={"id": pure_id, "user_id": uid}, updates=insert_data)
+                    DBHelper.update_one(
+                        "events",
+                        filters={"id": pure_id, "user_id": uid},
+                        updates={**insert_data, "span": to_range(start_dt, end_dt)},
+                    )
+                    queue_calendar_upsert(uid, "event", pure_id, title, start_dt, end_dt)
+                    sync_rule_from_input(
+                        uid, "event", pure_id, inputData,
+                        default_dtstart=start_dt,
+                        duration_minutes=int((end_dt - start_dt).total_seconds() // 60),
+                    )
                     insert_data["id"] = f"event_{pure_id}"
 
                     AuditLogger.log(
@@ -594,11 +602,15 @@ class AddEvent(Resource):
 
             else:
                 # ───── New Event ─────
-                calendar_event_id = create_calendar_event(uid, title, start_dt, end_dt)
-                insert_data["calendar_event_id"] = calendar_event_id
                 pure_id = uniqueId(digit=6)
                 insert_data["id"] = pure_id
-                DBHelper.insert("events", **insert_data)
+                DBHelper.insert("events", span=to_range(start_dt, end_dt), **insert_data)
+                queue_calendar_upsert(uid, "event", pure_id, title, start_dt, end_dt)
+                sync_rule_from_input(
+                    uid, "event", pure_id, inputData,
+                    default_dtstart=start_dt,
+                    duration_minutes=int((end_dt - start_dt).total_seconds() // 60),
+                )
                 insert_data["id"] = f"event_{pure_id}"
 
                 AuditLogger.log(
@@ -765,62 +777,8 @@ class AddGoogleCalendarEvent(Resource):
 
 
 def extract_datetime_us(text: str, now=None) -> str:
-    detroit_tz = pytz.timezone("America/Detroit")
-    now = now or datetime.now(detroit_tz)
-
-    def to_us_iso(dt: datetime) -> str:
-        return dt.astimezone(detroit_tz).replace(microsecond=0).isoformat()
-
-    def extract_time_manually(text: str) -> time | None:
-        match = re.search(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b", text, re.IGNORECASE)
-        if match:
-            hour = int(match.group(1))
-            minute = int(match.group(2) or 0)
-            meridian = match.group(3).lower()
-            if meridian == "pm" and hour != 12:
-                hour += 12
-            if meridian == "am" and hour == 12:
-                hour = 0
-            return time(hour, minute)
-        return None
-
-    # Step 1: Try search_dates (for full datetime matches)
-    results = search_dates(
-        text,
-        settings={
-            "PREFER_DATES_FROM": "future",
-            "RELATIVE_BASE": now,
-            "TIMEZONE": "America/Detroit",
-            "TO_TIMEZONE": "America/Detroit",
-            "RETURN_AS_TIMEZONE_AWARE": True,
-        },
-    )
-
-    if results:
-        results = sorted(results, key=lambda x: len(x[0]), reverse=True)
-        matched_text, parsed_dt = results[0]
-        parsed_dt = parsed_dt.astimezone(detroit_tz)
-
-        # Handle "only time" (like "10pm") by combining with today's date
-        if re.fullmatch(
-            r"(at\s*)?\d{1,2}(:\d{2})?\s*(am|pm)", matched_text.strip(), re.IGNORECASE
-        ):
-            manual_time = extract_time_manually(matched_text)
-            if manual_time:
-                parsed_dt = detroit_tz.localize(
-                    datetime.combine(now.date(), manual_time)
-                )
-
-        return to_us_iso(parsed_dt)
-
-    # Step 2: If search_dates fails but there's a time manually
-    manual_time = extract_time_manually(text)
-    if manual_time:
-        parsed_dt = detroit_tz.localize(datetime.combine(now.date(), manual_time))
-        return to_us_iso(parsed_dt)
-
-    # Step 3: fallback to current time
-    return to_us_iso(now)
+    parsed = parse_natural_datetime_us(text, now)
+    return parsed.replace(microsecond=0).isoformat()
 
 
 def get_future_dates_from_mode(base_date: datetime, mode: str):
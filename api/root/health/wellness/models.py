@@ -7,6 +7,7 @@ from root.helpers.logs import AuditLogger
 from email.message import EmailMessage
 import smtplib
 from root.config import EMAIL_PASSWORD, EMAIL_SENDER, SMTP_PORT, SMTP_SERVER
+from root.recurrence import rule_input_error, sync_rule_from_input
 
 
 class AddWellnessTask(Resource):
@@ -69,6 +70,10 @@ class AddWellnessTask(Resource):
             # Validation for recurring tasks: both dates are required
             if recurring and (not start_date or not due_date):
                 return {"status": 0, "message": "Recurring tasks require both start date and due date", "payload": {}}, 400
+
+            rule_error = rule_input_error(inputData)
+            if rule_error:
+                return {"status": 0, "message": rule_error, "payload": {}}, 400
             
             # Validation: start_date should be <= due_date (when both are provided)
             if start_date and due_date and start_date > due_date:
@@ -102,6 +107,7 @@ class AddWellnessTask(Resource):
                     filters={"id": task_id, "user_id": uid},
                     updates=payload,
                 )
+                sync_rule_from_input(uid, "wellness", task_id, inputData, default_dtstart=start_date)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -130,6 +136,7 @@ class AddWellnessTask(Resource):
                 }
 
                 new_id = DBHelper.insert("wellness_tasks", return_column="id", **payload)
+                sync_rule_from_input(uid, "wellness", new_id, inputData, default_dtstart=start_date)
 
                 AuditLogger.log(
                     user_id=uid,
@@ -299,6 +306,10 @@ class UpdateWellnessTask(Resource):
             start_date = parse_date(inputData.get("start_date")) if "start_date" in inputData else existing_task["start_date"]
             due_date = parse_date(inputData.get("due_date")) if "due_date" in inputData else existing_task["due_date"]
             recurring = inputData.get("recurring", existing_task["recurring"])
+
+            rule_error = rule_input_error(inputData)
+            if rule_error:
+                return {"status": 0, "message": rule_error, "payload": {}}, 400
             
             # Legacy support: if 'date' is provided instead of 'due_date'
             if "date" in inputData and "due_date" not in inputData:
@@ -338,6 +349,7 @@ class UpdateWellnessTask(Resource):
                 filters={"id": task_id, "user_id": uid},
                 updates=payload,
             )
+            sync_rule_from_input(uid, "wellness", task_id, inputData, default_dtstart=start_date)
 
             AuditLogger.log(
                 user_id=uid,
@@ -0,0 +1,482 @@
+"""
+Natural-language datetime parsing for smart notes and quick events.
+
+Layered so the common case never touches dateparser:
+
+1. A small hand-written grammar over precompiled regexes covers the usual
+   US phrasings ("tomorrow 5pm", "on friday", "12/3 at 9:30am",
+   "in 2 hours") and text with no date at all.
+2. Anything the grammar doesn't fully understand falls back to the original
+   dateparser-based logic. dateparser is imported once, on first use, and
+   its search results are memoized per (normalized text, reference minute).
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+import pytz
+
+DEFAULT_TIME = time(10, 0)
+TONIGHT_TIME = time(20, 0)
+
+WEEKDAYS = {
+    "monday": 0,
+    "tuesday": 1,
+    "wednesday": 2,
+    "thursday": 3,
+    "friday": 4,
+    "saturday": 5,
+    "sunday": 6,
+}
+
+RELATIVE_DAYS = {
+    "today": 0,
+    "tonight": 0,
+    "tomorrow": 1,
+    "tmrw": 1,
+    "tmr": 1,
+    "day after tomorrow": 2,
+}
+
+DELTA_UNITS = {
+    "min": "minutes",
+    "mins": "minutes",
+    "minute": "minutes",
+    "minutes": "minutes",
+    "hr": "hours",
+    "hrs": "hours",
+    "hour": "hours",
+    "hours": "hours",
+    "day": "days",
+    "days": "days",
+    "week": "weeks",
+    "weeks": "weeks",
+}
+
+SMALL_NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+
+MENTION_RE = re.compile(r"@+\w+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+TIME_12H_RE = re.compile(r"\b(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)(?!\w)", re.I)
+TIME_24H_RE = re.compile(r"\b(?:at\s+)?(\d{1,2}):(\d{2})\b", re.I)
+TIME_WORD_RE = re.compile(r"\b(?:at\s+)?(noon|midday|midnight)\b", re.I)
+RELATIVE_DAY_RE = re.compile(r"\b(day after tomorrow|tomorrow|tmrw|tmr|today|tonight)\b", re.I)
+WEEKDAY_RE = re.compile(
+    r"\b(?:(on|this|next|coming)\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.I,
+)
+NUMERIC_DATE_RE = re.compile(r"\b(?:on\s+)?(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2,4}))?\b", re.I)
+DELTA_RE = re.compile(
+    r"\bin\s+(\d+|an?|one|two|three|four|five)\s+"
+    r"(mins?|minutes?|hrs?|hours?|days?|weeks?)\b",
+    re.I,
+)
+
+# Anything date-like left over after the grammar has consumed what it knows
+# means the phrase needs the full parser.
+FALLBACK_HINT_RE = re.compile(
+    r"\d"
+    r"|\b(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b"
+    r"|\b(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)\b"
+    r"|\b(yesterday|now|weekend|week|weeks|month|months|year|years|fortnight"
+    r"|morning|afternoon|evening|night|tonite|noon|midnight|ago|hence|later"
+    r"|hour|hours|minute|minutes|day|days|eod|eow)\b",
+    re.I,
+)
+
+# Relative-time phrases depend on the current time, not just the day, so
+# their dateparser results are never memoized.
+RELATIVE_TIME_RE = re.compile(r"\b(ago|hence|hours?|minutes?|mins?|now|later)\b", re.I)
+
+LEGACY_DATE_PATTERNS = [
+    re.compile(r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b", re.I),
+    re.compile(r"\b\d{1,2}(st|nd|rd|th)?\s+\w+\b", re.I),
+    re.compile(r"\bon\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", re.I),
+    re.compile(r"\b(this|next)?\s*(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", re.I),
+    re.compile(r"\b\d{1,2}(st|nd|rd|th)\b", re.I),
+]
+LEGACY_FULL_NUMERIC_RE = re.compile(r"\d{1,2}[./-]\d{1,2}[./-]\d{2,4}")
+LEGACY_ORDINAL_RE = re.compile(r"\d{1,2}(st|nd|rd|th)", re.I)
+LEGACY_ORDINAL_SUFFIX_RE = re.compile(r"(st|nd|rd|th)", re.I)
+LEGACY_SPLIT_RE = re.compile(r"[./-]")
+ONLY_TIME_RE = re.compile(r"(at\s*)?\d{1,2}(:\d{2})?\s*(am|pm)", re.I)
+
+NO_DATE = object()
+
+
+class _LRUCache:
+    """Tiny thread-safe LRU for dateparser results."""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_search_cache = _LRUCache()
+_search_dates = None
+
+
+def _load_search_dates():
+    global _search_dates
+    if _search_dates is None:
+        from dateparser.search import search_dates
+
+        _search_dates = search_dates
+    return _search_dates
+
+
+def normalize(text):
+    """Strip @mentions and collapse whitespace; the memoization key."""
+    return WHITESPACE_RE.sub(" ", MENTION_RE.sub("", text or "")).strip()
+
+
+def cached_search_dates(text, now, tz_name, date_order=None):
+    """dateparser.search.search_dates memoized per (text, reference minute).
+
+    dateparser takes the time of day of its results from RELATIVE_BASE, so
+    the key holds the time as well as the day, and the base is truncated to
+    the minute so every caller sharing a key gets the same answer.
+    """
+    now = now.replace(second=0, microsecond=0)
+    settings = {
+        "PREFER_DATES_FROM": "future",
+        "RELATIVE_BASE": now,
+        "TIMEZONE": tz_name,
+        "TO_TIMEZONE": tz_name,
+        "RETURN_AS_TIMEZONE_AWARE": True,
+    }
+    if date_order:
+        settings["DATE_ORDER"] = date_order
+
+    if RELATIVE_TIME_RE.search(text):
+        return _load_search_dates()(text, settings=settings)
+
+    key = (text.lower(), now.replace(tzinfo=None), tz_name, date_order)
+    cached = _search_cache.get(key, NO_DATE)
+    if cached is not NO_DATE:
+        return cached
+
+    results = _load_search_dates()(text, settings=settings)
+    _search_cache.set(key, results)
+    return results
+
+
+def _parse_time(text, spans):
+    match = TIME_12H_RE.search(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if not 1 <= hour <= 12 or minute > 59:
+            return None, False
+        meridian = match.group(3).lower().replace(".", "")
+        if meridian == "pm" and hour != 12:
+            hour += 12
+        if meridian == "am" and hour == 12:
+            hour = 0
+        spans.append(match.span())
+        return time(hour, minute), True
+
+    match = TIME_24H_RE.search(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None, False
+        spans.append(match.span())
+        return time(hour, minute), True
+
+    match = TIME_WORD_RE.search(text)
+    if match:
+        spans.append(match.span())
+        return (time(0, 0) if match.group(1).lower() == "midnight" else time(12, 0)), True
+
+    return None, True
+
+
+def _residual(text, spans):
+    pieces = []
+    last = 0
+    for start, end in sorted(spans):
+        pieces.append(text[last:start])
+        last = max(last, end)
+    pieces.append(text[last:])
+    return " ".join(pieces)
+
+
+def fast_parse(text, now, tz, date_order="MDY", default_time=DEFAULT_TIME, roll_forward=True):
+    """Parse the common phrasings without dateparser.
+
+    Returns an aware datetime in `tz` (a pytz zone), NO_DATE when the text holds
+    nothing date-like, or None when the full parser is needed.
+    `default_time=None` keeps now's time of day for date-only phrases;
+    `roll_forward` pushes a bare time that already passed to tomorrow, and a
+    default time that already passed today to the next hour.
+    """
+    spans = []
+    lowered = text.lower()
+
+    clock, ok = _parse_time(lowered, spans)
+    if not ok:
+        return None
+
+    delta = DELTA_RE.search(lowered)
+    relative = RELATIVE_DAY_RE.search(lowered)
+    weekday = WEEKDAY_RE.search(lowered)
+    numeric = NUMERIC_DATE_RE.search(lowered)
+
+    date_parts = [m for m in (relative, weekday, numeric) if m]
+    if len(date_parts) > 1 or (delta and (date_parts or clock)):
+        return None
+
+    for match in date_parts + ([delta] if delta else []):
+        spans.append(match.span())
+
+    if FALLBACK_HINT_RE.search(_residual(lowered, spans)):
+        return None
+
+    if delta:
+        amount = delta.group(1)
+        amount = int(amount) if amount.isdigit() else SMALL_NUMBERS[amount]
+        unit = DELTA_UNITS[delta.group(2)]
+        return now + timedelta(**{unit: amount})
+
+    if not date_parts and clock is None:
+        return NO_DATE
+
+    today = now.date()
+    target = None
+
+    if relative:
+        word = relative.group(1)
+        target = today + timedelta(days=RELATIVE_DAYS[word])
+        if clock is None and word == "tonight":
+            clock = TONIGHT_TIME
+
+    elif weekday:
+        qualifier = (weekday.group(1) or "").lower()
+        days_ahead = (WEEKDAYS[weekday.group(2)] - today.weekday()) % 7
+        if days_ahead == 0 and qualifier == "next":
+            days_ahead = 7
+        target = today + timedelta(days=days_ahead)
+
+    elif numeric:
+        first, second, year = numeric.groups()
+        month, day = (int(second), int(first)) if date_order == "DMY" else (int(first), int(second))
+        try:
+            if year:
+                year = int(year)
+                if year < 100:
+                    year += 2000 if year < 70 else 1900
+                target = datetime(year, month, day).date()
+            else:
+                target = datetime(today.year, month, day).date()
+                if target < today:
+                    target = target.replace(year=today.year + 1)
+        except ValueError:
+            return None
+
+    defaulted = clock is None
+    if defaulted:
+        clock = default_time or now.time().replace(second=0, microsecond=0)
+
+    day = target or today
+    result = tz.localize(datetime.combine(day, clock))
+    if defaulted and roll_forward and day == today and result < now and now.hour < 23:
+        result = tz.localize(datetime.combine(today, time(now.hour + 1, 0)))
+
+    if target is None and roll_forward and result < now:
+        result += timedelta(days=1)
+    if weekday and roll_forward and result < now:
+        result += timedelta(days=7)
+
+    return result
+
+
+def _legacy_extract_datetime(cleaned_text, now, us_tz):
+    """The original dateparser-driven logic behind root.utilis.extract_datetime."""
+    DEFAULT_HOUR, DEFAULT_MINUTE = DEFAULT_TIME.hour, DEFAULT_TIME.minute
+
+    time_match = TIME_12H_RE.search(cleaned_text) or TIME_24H_RE.search(cleaned_text)
+
+    explicit_hour = explicit_minute = None
+    if time_match:
+        explicit_hour = int(time_match.group(1))
+        explicit_minute = int(time_match.group(2) or 0)
+
+        meridian = (
+            time_match.group(3).lower().replace(".", "")
+            if len(time_match.groups()) >= 3 and time_match.group(3)
+            else None
+        )
+        if meridian == "pm" and explicit_hour != 12:
+            explicit_hour += 12
+        if meridian == "am" and explicit_hour == 12:
+            explicit_hour = 0
+        if explicit_hour > 23 or explicit_minute > 59:
+            explicit_hour = explicit_minute = None
+
+    for pattern in LEGACY_DATE_PATTERNS:
+        match = pattern.search(cleaned_text)
+        if not match:
+            continue
+
+        date_part = match.group(0).strip()
+
+        if LEGACY_FULL_NUMERIC_RE.fullmatch(date_part):
+            day_str, month_str, year_str = LEGACY_SPLIT_RE.split(date_part)
+            day = int(day_str)
+            month = int(month_str)
+            year = int(year_str)
+            if year < 100:
+                year += 2000 if year < 70 else 1900
+
+            hour = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
+            minute = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
+
+            try:
+                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
+            except ValueError:
+                pass
+            else:
+                return candidate
+
+        if LEGACY_ORDINAL_RE.fullmatch(date_part):
+            day = int(LEGACY_ORDINAL_SUFFIX_RE.sub("", date_part))
+            hour = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
+            minute = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
+            year, month = now.year, now.month
+            try:
+                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
+            except ValueError:
+                month += 1
+                if month == 13:
+                    month, year = 1, year + 1
+                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
+
+            if candidate < now:
+                month += 1
+                if month == 13:
+                    month, year = 1, year + 1
+                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
+
+            return candidate
+
+        hh = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
+        mm = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
+        parsed = cached_search_dates(f"{date_part} {hh}:{mm:02d}", now, us_tz.zone, "DMY")
+        if parsed:
+            return parsed[0][1].astimezone(us_tz)
+
+    if explicit_hour is not None:
+        target_date = now.date()
+        lowered = cleaned_text.lower()
+        # Detect words like "tomorrow" or "day after"
+        if "tomorrow" in lowered:
+            target_date += timedelta(days=1)
+        elif "day after" in lowered:
+            target_date += timedelta(days=2)
+        elif "next" in lowered:
+            target_date += timedelta(days=7)
+
+        combined = us_tz.localize(
+            datetime.combine(target_date, time(explicit_hour, explicit_minute))
+        )
+        if combined < now:
+            combined += timedelta(days=1)
+        return combined
+
+    results = cached_search_dates(cleaned_text, now, us_tz.zone, "DMY")
+    if results:
+        dt = results[0][1].astimezone(us_tz)
+        if dt.hour == 0 and dt.minute == 0 and explicit_hour is None:
+            dt = dt.replace(hour=DEFAULT_HOUR, minute=DEFAULT_MINUTE)
+        if dt < now:
+            dt += timedelta(days=1)
+        return dt
+
+    return now
+
+
+def _legacy_extract_datetime_us(text, now, tz):
+    """The original dateparser-driven logic behind google.models.extract_datetime_us."""
+
+    def manual_time(value):
+        match = TIME_12H_RE.search(value)
+        if not match:
+            return None
+        hour = int(match.group(1))
+        minute = int(match.group(2) or 0)
+        meridian = match.group(3).lower().replace(".", "")
+        if meridian == "pm" and hour != 12:
+            hour += 12
+        if meridian == "am" and hour == 12:
+            hour = 0
+        if hour > 23 or minute > 59:
+            return None
+        return time(hour, minute)
+
+    results = cached_search_dates(text, now, tz.zone)
+    if results:
+        results = sorted(results, key=lambda x: len(x[0]), reverse=True)
+        matched_text, parsed_dt = results[0]
+        parsed_dt = parsed_dt.astimezone(tz)
+
+        # Handle "only time" (like "10pm") by combining with today's date
+        if ONLY_TIME_RE.fullmatch(matched_text.strip()):
+            clock = manual_time(matched_text)
+            if clock:
+                parsed_dt = tz.localize(datetime.combine(now.date(), clock))
+        return parsed_dt
+
+    clock = manual_time(text)
+    if clock:
+        return tz.localize(datetime.combine(now.date(), clock))
+    return now
+
+
+def extract_datetime(text, now=None, tz_name="America/New_York"):
+    """Smart-note parser: DMY numeric dates, 10:00 default time, future-biased."""
+    tz = pytz.timezone(tz_name)
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    cleaned = normalize(text)
+
+    parsed = fast_parse(cleaned, now, tz, date_order="DMY", default_time=DEFAULT_TIME)
+    if parsed is NO_DATE:
+        return now
+    if parsed is not None:
+        return parsed
+    return _legacy_extract_datetime(cleaned, now, tz)
+
+
+def extract_datetime_us(text, now=None, tz_name="America/Detroit"):
+    """Quick-event parser: MDY numeric dates, keeps now's time for date-only text."""
+    tz = pytz.timezone(tz_name)
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    cleaned = normalize(text)
+
+    parsed = fast_parse(cleaned, now, tz, date_order="MDY", default_time=None, roll_forward=False)
+    if parsed is NO_DATE:
+        return now
+    if parsed is not None:
+        return parsed
+    return _legacy_extract_datetime_us(cleaned, now, tz)
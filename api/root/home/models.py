@@ -7,8 +7,10 @@ import json
 from flask_restful import Resource
 import logging
 from datetime import datetime, date
+from root.files import uploads
 from root.files.models import DriveBaseResource
 from root.utilis import ensure_drive_folder_structure, get_or_create_subfolder
+from root.recurrence import rule_input_error, sync_rule_from_input
 from root.db.dbHelper import DBHelper
 from root.auth.auth import auth_required
 import random
@@ -38,6 +40,10 @@ class AddMaintenanceTask(Resource):
         if not name or not date:
             return {"status": 0, "message": "Name and date are required", "payload": {}}
 
+        rule_error = rule_input_error(input_data)
+        if rule_error:
+            return {"status": 0, "message": rule_error, "payload": {}}
+
         task_data = {
             "user_id": uid,
             "name": name,
@@ -57,6 +63,9 @@ class AddMaintenanceTask(Resource):
                 "property_maintenance", return_column="id", **task_data
             )
             task_data["id"] = inserted_id
+            sync_rule_from_input(
+                uid, "maintenance", inserted_id, input_data, default_dtstart=date
+            )
 
             # ✅ Log success in audit
             AuditLogger.log(
@@ -188,6 +197,10 @@ class UpdateMaintenanceTask(Resource):
             )
             return {"status": 0, "message": "No input data received", "payload": {}}
 
+        rule_error = rule_input_error(input_data)
+        if rule_error:
+            return {"status": 0, "message": rule_error, "payload": {}}
+
         updates = {}
         if "name" in input_data and input_data["name"].strip():
             updates["name"] = input_data["name"].strip()
@@ -232,6 +245,10 @@ class UpdateMaintenanceTask(Resource):
             )
 
             if result:
+                sync_rule_from_input(
+                    uid, "maintenance", result["id"], input_data,
+                    default_dtstart=result["date"],
+                )
                 updated_task = {
                     "id": str(result["id"]),
                     "name": result["name"],
@@ -2447,8 +2464,6 @@ def uniqueId(digit=15, isNum=True):
 
 
 from werkzeug.utils import secure_filename
-from googleapiclient.http import MediaIoBaseUpload
-import io
 
 
 class DeleteHomeDriveFile(DriveBaseResource):
@@ -2560,7 +2575,7 @@ class UploadHomeDriveFile(DriveBaseResource):
 
             # Upload file
             file_metadata = {"name": secure_filename(file.filename), "parents": [home_folder["google_id"]]}
-            media = MediaIoBaseUpload(io.BytesIO(file.read()), mimetype=file.content_type or "application/octet-stream", resumable=True)
+            media = uploads.drive_media(file)
             uploaded_file = service.files().create(
                 body=file_metadata,
                 media_body=media,
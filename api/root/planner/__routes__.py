@@ -7,6 +7,7 @@ from .models import (
     DeleteWeeklyGoal,
     DeleteWeeklyTodo,
     GetHabits,
+    GetHabitHeatmap,
     GetSmartNotes,
     ShareGoal,
     ShareTodo,
@@ -17,11 +18,19 @@ from .models import (
     GetPlannerDataComprehensive, 
     EditHabit,
     DeleteHabit, # New comprehensive endpoint
+    GetOccurrences,
+    GetPlannerRange,
+    CreateCalendarFeed,
+    RevokeCalendarFeed,
+    GetCalendarFeed,
+    SetRecurrence,
+    SetRecurrenceOverride,
 )
 from . import planner_api
 
 # New comprehensive endpoint for optimal loading
 planner_api.add_resource(GetPlannerDataComprehensive, "/get/planner-data-comprehensive")
+planner_api.add_resource(GetPlannerRange, "/get/planner/range")
 
 planner_api.add_resource(AddWeeklyGoals, "/add/weekly-goals")
 planner_api.add_resource(UpdateWeeklyGoals, "/update/weekly-goals")
@@ -48,6 +57,15 @@ planner_api.add_resource(ShareTodo, "/share/todo")
 
 planner_api.add_resource(AddHabit, "/add/habit")
 planner_api.add_resource(GetHabits, "/get/habits")
+planner_api.add_resource(GetHabitHeatmap, "/get/habits/heatmap")
 planner_api.add_resource(UpdateHabitProgress, "/update/habit")
 planner_api.add_resource(EditHabit, "/edit/habit")
-planner_api.add_resource(DeleteHabit, "/delete/habit")
\ No newline at end of file
+planner_api.add_resource(DeleteHabit, "/delete/habit")
+
+planner_api.add_resource(SetRecurrence, "/set/recurrence")
+planner_api.add_resource(SetRecurrenceOverride, "/set/recurrence/occurrence")
+planner_api.add_resource(GetOccurrences, "/get/occurrences")
+
+planner_api.add_resource(CreateCalendarFeed, "/add/calendar-feed")
+planner_api.add_resource(RevokeCalendarFeed, "/delete/calendar-feed")
+planner_api.add_resource(GetCalendarFeed, "/calendar/feed/<string:token>.ics")
@@ -0,0 +1,236 @@
+"""
+Habits engine.
+
+Loads progress for many habits over a date range in one query, creates
+missing progress rows with a single multi-row insert and keeps the
+streak / completion counters on `habits` up to date as progress changes,
+so habit pages cost a constant number of queries regardless of how many
+habits a user tracks.
+"""
+
+from datetime import date, datetime, timedelta
+
+from root.db.dbHelper import DBHelper
+
+STATS_FIELDS = ["current_streak", "longest_streak", "completed_days", "last_completed_date"]
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)[:10]).date()
+
+
+def load_progress(habit_ids, start_date, end_date=None):
+    """Return {habit_id: {date: status}} for every habit between both dates (inclusive)."""
+    if not habit_ids:
+        return {}
+    end_date = end_date or start_date
+
+    rows = DBHelper.raw_sql(
+        """
+        SELECT habit_id, progress_date, status
+        FROM habit_progress
+        WHERE habit_id = ANY(%s) AND progress_date BETWEEN %s AND %s
+        """,
+        (list(habit_ids), _to_date(start_date), _to_date(end_date)),
+    )
+
+    progress = {habit_id: {} for habit_id in habit_ids}
+    for row in rows:
+        progress.setdefault(row["habit_id"], {})[row["progress_date"]] = bool(row["status"])
+    return progress
+
+
+def ensure_progress_rows(habit_ids, progress_date):
+    """Create the (habit, day) progress rows that don't exist yet in one insert."""
+    if not habit_ids:
+        return 0
+    progress_date = _to_date(progress_date)
+    rows = [
+        {"habit_id": habit_id, "progress_date": progress_date, "status": False}
+        for habit_id in habit_ids
+    ]
+    return DBHelper.bulk_insert_ignore_duplicates(
+        "habit_progress", rows, unique_key="habit_id, progress_date"
+    )
+
+
+def recompute_stats(habit_ids):
+    """Rebuild streak counters from habit_progress for the given habits.
+
+    Used to backfill habits created before the counters existed and as the
+    fallback when a change can't be applied incrementally (editing history).
+    """
+    if not habit_ids:
+        return {}
+
+    rows = DBHelper.execute_query(
+        """
+        WITH done AS (
+            SELECT habit_id, progress_date,
+                   progress_date - (ROW_NUMBER() OVER (
+                       PARTITION BY habit_id ORDER BY progress_date
+                   ))::int AS grp
+            FROM habit_progress
+            WHERE habit_id = ANY(%s) AND status = TRUE
+        ), runs AS (
+            SELECT habit_id, MAX(progress_date) AS run_end, COUNT(*) AS run_length
+            FROM done
+            GROUP BY habit_id, grp
+        ), stats AS (
+            SELECT habit_id,
+                   SUM(run_length)::int AS completed_days,
+                   MAX(run_length)::int AS longest_streak,
+                   (ARRAY_AGG(run_length ORDER BY run_end DESC))[1]::int AS current_streak,
+                   MAX(run_end) AS last_completed_date
+            FROM runs
+            GROUP BY habit_id
+        )
+        UPDATE habits h SET
+            current_streak = COALESCE(s.current_streak, 0),
+            longest_streak = COALESCE(s.longest_streak, 0),
+            completed_days = COALESCE(s.completed_days, 0),
+            last_completed_date = s.last_completed_date
+        FROM (SELECT UNNEST(%s::int[]) AS habit_id) ids
+        LEFT JOIN stats s ON s.habit_id = ids.habit_id
+        WHERE h.id = ids.habit_id
+        RETURNING h.id, h.current_streak, h.longest_streak,
+                  h.completed_days, h.last_completed_date
+        """,
+        (list(habit_ids), list(habit_ids)),
+    )
+    return {row["id"]: row for row in rows}
+
+
+def record_progress(habit_id, progress_date, status=None):
+    """Set (or toggle when status is None) a day's progress and update the counters.
+
+    Checking off a day after the last completed one is applied incrementally
+    in a single UPDATE; anything else (unchecking, back-filling older days)
+    falls back to recompute_stats for that one habit.
+    """
+    progress_date = _to_date(progress_date)
+
+    if status is None:
+        new_status_sql = "NOT habit_progress.status"
+        insert_status = True
+    else:
+        new_status_sql = "EXCLUDED.status"
+        insert_status = bool(status)
+
+    row = DBHelper.execute_query(
+        f"""
+        WITH prev AS (
+            SELECT status FROM habit_progress
+            WHERE habit_id = %s AND progress_date = %s
+        )
+        INSERT INTO habit_progress (habit_id, progress_date, status)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (habit_id, progress_date)
+        DO UPDATE SET status = {new_status_sql}
+        RETURNING status, (SELECT status FROM prev) AS previous_status
+        """,
+        (habit_id, progress_date, habit_id, progress_date, insert_status),
+    )[0]
+
+    new_status = bool(row["status"])
+    previous_status = bool(row["previous_status"])
+
+    if new_status == previous_status:
+        stats = DBHelper.find_one("habits", filters={"id": habit_id}, select_fields=STATS_FIELDS)
+        return new_status, stats
+
+    stats = None
+    if new_status:
+        updated = DBHelper.execute_query(
+            """
+            UPDATE habits SET
+                current_streak = CASE
+                    WHEN last_completed_date = %s::date - 1 THEN COALESCE(current_streak, 0) + 1
+                    ELSE 1
+                END,
+                longest_streak = GREATEST(
+                    COALESCE(longest_streak, 0),
+                    CASE
+                        WHEN last_completed_date = %s::date - 1 THEN COALESCE(current_streak, 0) + 1
+                        ELSE 1
+                    END
+                ),
+                completed_days = COALESCE(completed_days, 0) + 1,
+                last_completed_date = %s
+            WHERE id = %s
+              AND completed_days IS NOT NULL
+              AND (last_completed_date IS NULL OR last_completed_date < %s)
+            RETURNING current_streak, longest_streak, completed_days, last_completed_date
+            """,
+            (progress_date, progress_date, progress_date, habit_id, progress_date),
+        )
+        stats = updated[0] if updated else None
+
+    if stats is None:
+        stats = recompute_stats([habit_id]).get(habit_id)
+
+    return new_status, stats
+
+
+def summarize(habit, today=None):
+    """Read-time view of the maintained counters.
+
+    The stored current_streak belongs to the latest completed run, so it only
+    counts while that run reached today or yesterday. The completion rate is
+    completed days over days since the habit was added.
+    """
+    today = today or date.today()
+    last_completed = habit.get("last_completed_date")
+    current_streak = habit.get("current_streak") or 0
+    if not last_completed or _to_date(last_completed) < today - timedelta(days=1):
+        current_streak = 0
+
+    completed_days = habit.get("completed_days") or 0
+    added = habit.get("added_time")
+    tracked_days = max((today - _to_date(added)).days + 1, 1) if added else 1
+
+    return {
+        "current_streak": current_streak,
+        "longest_streak": habit.get("longest_streak") or 0,
+        "completed_days": completed_days,
+        "completion_rate": round(min(completed_days / tracked_days, 1) * 100, 1),
+    }
+
+
+def load_habits(user_id, start_date, end_date=None, create_for=None):
+    """Active habits for a user with their progress over a date range.
+
+    Runs a fixed number of queries: habits, a one-off stats backfill when
+    needed, an optional bulk insert of missing rows for `create_for`, and
+    one progress range read.
+    """
+    habits = DBHelper.find_all(
+        "habits", filters={"user_id": user_id, "is_active": 1}, order_by="id"
+    )
+    habit_ids = [habit["id"] for habit in habits]
+
+    stale = [habit["id"] for habit in habits if habit.get("completed_days") is None]
+    if stale:
+        refreshed = recompute_stats(stale)
+        for habit in habits:
+            habit.update(refreshed.get(habit["id"], {}))
+
+    if create_for is not None:
+        ensure_progress_rows(habit_ids, create_for)
+
+    return habits, load_progress(habit_ids, start_date, end_date)
+
+
+def heatmap_window(view, anchor):
+    """(start, end) dates for a "week" (Mon-Sun) or "month" view around anchor."""
+    anchor = _to_date(anchor)
+    if view == "month":
+        start = anchor.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    start = anchor - timedelta(days=anchor.weekday())
+    return start, start + timedelta(days=6)
@@ -0,0 +1,256 @@
+"""
+iCalendar (RFC 5545) feed for planner data.
+
+A feed token belongs to one user (their events, goals and todos) or to one
+family group (every member's events plus the owner's goals and todos, the
+same view as the planner). The rows are read up front and only the text is
+streamed, so no database connection is held while a slow client reads the
+body, and a validator built from the latest `updated_at` lets unchanged
+feeds be answered with a 304 after a single aggregate query.
+
+Planner times are wall-clock times without a zone, so timed events are
+written as floating times (no `Z`): they show at the same hour in every
+subscriber's calendar, as in the planner.
+"""
+
+import hashlib
+import re
+from datetime import datetime, timezone
+
+from root import family_graph
+from root.common import GoalStatus, Status
+from root.db.dbHelper import DBHelper
+from root.planner.spans import ALL_DAY_END_TIMES, backfill_spans, day_span, event_span
+
+PRODID = "-//Dockly//Planner Feed//EN"
+
+# Bump when the generated output changes shape so cached copies are refetched
+FEED_VERSION = 2
+
+# Dockly goal priority (0 low, 1 medium, 2 high) / todo priority -> ICS PRIORITY
+GOAL_PRIORITIES = {0: 9, 1: 5, 2: 1}
+TODO_PRIORITIES = {"low": 9, "medium": 5, "high": 1}
+
+
+def feed_user_ids(feed):
+    """Users whose events the feed shows; None when the owner has left the group."""
+    if not feed.get("family_group_id"):
+        return [feed["user_id"]]
+
+    members = family_graph.members(feed["user_id"], feed["family_group_id"])
+    if not members:
+        return None
+    return sorted({m["user_id"] for m in members} | {feed["user_id"]})
+
+
+def feed_validators(owner_id, user_ids):
+    """(last_modified, etag) for a feed from one aggregate query.
+
+    Inactive rows are included so soft deletes (which bump updated_at) and
+    row counts so hard deletes both change the validators.
+    """
+    row = DBHelper.raw_sql(
+        """
+        SELECT
+            (SELECT MAX(updated_at) FROM events WHERE user_id = ANY(%s)) AS events_at,
+            (SELECT COUNT(*) FROM events WHERE user_id = ANY(%s)) AS events_count,
+            (SELECT MAX(updated_at) FROM recurrence_rules
+              WHERE source_type = 'event' AND user_id = ANY(%s)) AS rules_at,
+            (SELECT MAX(updated_at) FROM goals
+              WHERE user_id = %s OR tagged_ids @> ARRAY[%s]::text[]) AS goals_at,
+            (SELECT COUNT(*) FROM goals
+              WHERE user_id = %s OR tagged_ids @> ARRAY[%s]::text[]) AS goals_count,
+            (SELECT MAX(updated_at) FROM todos
+              WHERE user_id = %s OR tagged_ids @> ARRAY[%s]::text[]) AS todos_at,
+            (SELECT COUNT(*) FROM todos
+              WHERE user_id = %s OR tagged_ids @> ARRAY[%s]::text[]) AS todos_count
+        """,
+        [user_ids, user_ids, user_ids] + [owner_id, owner_id] * 4,
+    )[0]
+
+    stamps = [row[key] for key in ("events_at", "rules_at", "goals_at", "todos_at") if row[key]]
+    last_modified = max(stamps).replace(tzinfo=timezone.utc, microsecond=0) if stamps else None
+
+    fingerprint = "|".join(
+        [str(FEED_VERSION), ",".join(user_ids)]
+        + [str(row[key]) for key in sorted(row.keys())]
+    )
+    return last_modified, hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+
+
+def escape_text(value):
+    return (
+        str(value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Fold a content line at 75 octets (RFC 5545 3.1) and terminate it."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    parts, current, limit = [], b"", 75
+    for char in line:
+        char_bytes = char.encode("utf-8")
+        if len(current) + len(char_bytes) > limit:
+            parts.append(current.decode("utf-8"))
+            current, limit = b"", 74  # continuation lines start with a space
+        current += char_bytes
+    parts.append(current.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _utc_stamp(value):
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _local_stamp(value):
+    """Floating date-time: the wall-clock time as stored, no zone."""
+    return value.replace(tzinfo=None).strftime("%Y%m%dT%H%M%S")
+
+
+def _date_stamp(value):
+    return value.strftime("%Y%m%d")
+
+
+def _component(kind, lines):
+    yield fold(f"BEGIN:{kind}")
+    for line in lines:
+        if line:
+            yield fold(line)
+    yield fold(f"END:{kind}")
+
+
+def _event_lines(row):
+    span = row.get("span") or event_span(
+        row.get("date"), row.get("end_date"), row.get("start_time"), row.get("end_time")
+    )
+    if not span:
+        return None
+
+    all_day = row.get("start_time") == "12:00 AM" and row.get("end_time") in ALL_DAY_END_TIMES
+    if all_day:
+        start = f"DTSTART;VALUE=DATE:{_date_stamp(span.lower)}"
+        end = f"DTEND;VALUE=DATE:{_date_stamp(span.upper)}"
+    else:
+        start = f"DTSTART:{_local_stamp(span.lower)}"
+        end = f"DTEND:{_local_stamp(span.upper or span.lower)}"
+
+    rule = row.get("rrule")
+    if rule and rule.upper().startswith("RRULE:"):
+        rule = rule[len("RRULE:"):]
+    if rule and not all_day:
+        # UNTIL has to be floating like DTSTART (RFC 5545 3.3.10)
+        rule = re.sub(r"(UNTIL=\d{8}T\d{6})Z", r"\1", rule, flags=re.I)
+
+    return [
+        f"UID:event-{row['id']}@dockly",
+        f"DTSTAMP:{_utc_stamp(row.get('updated_at') or row.get('created_at'))}",
+        start,
+        end,
+        f"RRULE:{rule}" if rule else None,
+        f"SUMMARY:{escape_text(row.get('title'))}",
+        f"DESCRIPTION:{escape_text(row.get('description'))}" if row.get("description") else None,
+        f"LOCATION:{escape_text(row.get('location'))}" if row.get("location") else None,
+    ]
+
+
+def _todo_lines(kind, row, summary, completed, priority):
+    span = row.get("span") or day_span(row.get("date"))
+    return [
+        f"UID:{kind}-{row['id']}@dockly",
+        f"DTSTAMP:{_utc_stamp(row.get('updated_at') or row.get('created_at'))}",
+        f"DUE;VALUE=DATE:{_date_stamp(span.lower)}" if span else None,
+        f"SUMMARY:{escape_text(summary)}",
+        f"CATEGORIES:{kind.upper()}",
+        f"PRIORITY:{priority}" if priority else None,
+        "STATUS:COMPLETED" if completed else "STATUS:NEEDS-ACTION",
+    ]
+
+
+def _feed_rows(owner_id, user_ids):
+    """(events, goals, todos) rows of a feed."""
+    for table in ("events", "goals", "todos"):
+        backfill_spans(table)
+
+    events = DBHelper.raw_sql(
+        """
+        SELECT e.id, e.title, e.description, e.location, e.date, e.end_date,
+               e.start_time, e.end_time, e.span, e.created_at, e.updated_at, r.rrule
+        FROM events e
+        LEFT JOIN recurrence_rules r
+               ON r.source_type = 'event' AND r.source_id = e.id AND r.is_active = 1
+        WHERE e.user_id = ANY(%s) AND e.is_active = 1
+        """,
+        (user_ids,),
+    )
+    goals = DBHelper.raw_sql(
+        """
+        SELECT id, goal, date, span, priority, goal_status, created_at, updated_at
+        FROM goals
+        WHERE (user_id = %s OR tagged_ids @> ARRAY[%s]::text[])
+          AND is_active = 1 AND status = %s
+        """,
+        (owner_id, owner_id, Status.ACTIVE.value),
+    )
+    todos = DBHelper.raw_sql(
+        """
+        SELECT id, text, date, span, priority, completed, created_at, updated_at
+        FROM todos
+        WHERE (user_id = %s OR tagged_ids @> ARRAY[%s]::text[]) AND is_active = 1
+        """,
+        (owner_id, owner_id),
+    )
+    return events, goals, todos
+
+
+def _render(events, goals, todos, name):
+    yield fold("BEGIN:VCALENDAR")
+    yield fold("VERSION:2.0")
+    yield fold(f"PRODID:{PRODID}")
+    yield fold("CALSCALE:GREGORIAN")
+    yield fold("METHOD:PUBLISH")
+    yield fold(f"X-WR-CALNAME:{escape_text(name)}")
+    yield fold("REFRESH-INTERVAL;VALUE=DURATION:PT1H")
+
+    for row in events:
+        lines = _event_lines(row)
+        if lines:
+            yield "".join(_component("VEVENT", lines))
+
+    for row in goals:
+        lines = _todo_lines(
+            "goal",
+            row,
+            row.get("goal"),
+            row.get("goal_status") == GoalStatus.COMPLETED.value,
+            GOAL_PRIORITIES.get(row.get("priority")),
+        )
+        yield "".join(_component("VTODO", lines))
+
+    for row in todos:
+        lines = _todo_lines(
+            "todo",
+            row,
+            row.get("text"),
+            bool(row.get("completed")),
+            TODO_PRIORITIES.get(row.get("priority")),
+        )
+        yield "".join(_component("VTODO", lines))
+
+    yield fold("END:VCALENDAR")
+
+
+def generate_feed(owner_id, user_ids, name="Dockly Planner"):
+    """Read the feed's rows now; returns an iterator over the calendar text."""
+    return _render(*_feed_rows(owner_id, user_ids), name)
@@ -3,21 +3,23 @@ from datetime import date, timedelta, datetime
 from email.message import EmailMessage
 import json
 import smtplib
-from flask import request
+import secrets
+from flask import Response, request, stream_with_context
 from flask_restful import Resource
+from werkzeug.http import is_resource_modified
 from datetime import datetime
 from root.helpers.logs import AuditLogger
 from .outlook import (
-    create_outlook_calendar_event,
     fetch_outlook_calendar_events,
     transform_outlook_event,
 )
 from root.db.dbHelper import DBHelper
 from root.common import GoalStatus, Priority, Status
-from root.utilis import create_calendar_event, uniqueId, update_calendar_event
+from root.utilis import create_calendar_event, uniqueId
 from root.auth.auth import auth_required
 from google.oauth2.credentials import Credentials
 from root.config import (
+    API_URL,
     CLIENT_ID,
     CLIENT_SECRET,
     EMAIL_PASSWORD,
@@ -31,6 +33,41 @@ from googleapiclient.discovery import build
 from google.auth.exceptions import GoogleAuthError
 from datetime import datetime
 from root.utilis import extract_datetime
+from root.planner.ics import feed_user_ids, feed_validators, generate_feed
+from root import family_graph
+from root.family_graph import DEFAULT_MEMBER_COLOR
+from root.planner.merge import (
+    DEFAULT_DOCKLY_COLOR,
+    MemberIndex,
+    merge_events,
+    upcoming_events,
+)
+from root.planner.spans import (
+    attach_span_strings,
+    backfill_spans,
+    day_span,
+    event_span,
+    load_range,
+    parse_window,
+    span_strings,
+)
+from root.calendar_sync import (
+    enqueue_guests as queue_calendar_guests,
+    enqueue_upsert as queue_calendar_upsert,
+)
+from root.recurrence import (
+    clear_rule as clear_recurrence_rule,
+    occurrences as recurrence_occurrences,
+    serialize_occurrence,
+    set_override as set_recurrence_override,
+    set_rule as set_recurrence_rule,
+)
+from .habits import (
+    heatmap_window,
+    load_habits,
+    record_progress as record_habit_progress,
+    summarize as summarize_habit,
+)
 from google.auth.transport.requests import Request
 import requests
 
@@ -47,6 +84,48 @@ light_colors = [
     "#5C6BC0",
 ]
 
+PLANNER_EVENT_FIELDS = [
+    "id",
+    "user_id",
+    "title",
+    "date",
+    "end_date",
+    "start_time",
+    "end_time",
+    "outlook_calendar_id",
+    "synced_to_google",
+    "synced_to_outlook",
+]
+
+PLANNER_GOAL_FIELDS = [
+    "id",
+    "user_id",
+    "goal",
+    "date",
+    "time",
+    "priority",
+    "goal_status",
+    "status",
+    "google_calendar_id",
+    "outlook_calendar_id",
+    "synced_to_google",
+    "synced_to_outlook",
+]
+
+PLANNER_TODO_FIELDS = [
+    "id",
+    "user_id",
+    "text",
+    "date",
+    "completed",
+    "priority",
+    "goal_id",
+    "google_calendar_id",
+    "outlook_calendar_id",
+    "synced_to_google",
+    "synced_to_outlook",
+]
+
 class GetPlannerDataComprehensive(Resource):
     @auth_required(isOptional=True)
     def get(self, uid, user):
@@ -89,83 +168,78 @@ class GetPlannerDataComprehensive(Resource):
 
             response_data["family_members"] = family_members
 
+            # Optional window: only Dockly items overlapping [start, end)
+            window = None
+            if request.args.get("start") or request.args.get("end"):
+                window = parse_window(request.args.get("start"), request.args.get("end"))
+                response_data["filters"]["start"] = window[0].isoformat()
+                response_data["filters"]["end"] = window[1].isoformat()
+
+            for table in ("events", "goals", "todos"):
+                backfill_spans(table)
+
             # --- Core DB fetch in one go ---
-            query_results = DBHelper.find_multi_users(
-                {
-                    "events": {
-                        "filters": {"is_active": 1},
-                        "select_fields": [
-                            "id",
-                            "user_id",
-                            "title",
-                            "date",
-                            "end_date",
-                            "start_time",
-                            "end_time",
-                            "outlook_calendar_id",
-                            "synced_to_google",
-                            "synced_to_outlook",
-                        ],
-                    },
-                    "connected_accounts": {
-                        "filters": {"is_active": Status.ACTIVE.value},
-                        "select_fields": [
-                            "user_id",
-                            "access_token",
-                            "refresh_token",
-                            "email",
-                            "provider",
-                            "user_object",
-                        ],
-                    },
+            table_queries = {
+                "connected_accounts": {
+                    "filters": {"is_active": Status.ACTIVE.value},
+                    "select_fields": [
+                        "user_id",
+                        "access_token",
+                        "refresh_token",
+                        "email",
+                        "provider",
+                        "user_object",
+                    ],
                 },
-                all_user_ids,
-            )
+            }
+            if window is None:
+                table_queries["events"] = {
+                    "filters": {"is_active": 1},
+                    "select_fields": PLANNER_EVENT_FIELDS + ["span"],
+                }
+            query_results = DBHelper.find_multi_users(table_queries, all_user_ids)
+            if window is None:
+                attach_span_strings(query_results.get("events", []))
+            else:
+                query_results["events"] = load_range(
+                    "events", PLANNER_EVENT_FIELDS, *window, user_ids=all_user_ids
+                )
 
             # --- Dockly goals/todos/notes (skip if disabled) ---
             goals, todos, all_notes = [], [], []
-            if show_dockly:
+            if show_dockly and window is not None:
+                goals = load_range(
+                    "goals",
+                    PLANNER_GOAL_FIELDS,
+                    *window,
+                    user_ids=[uid],
+                    tagged_uid=uid,
+                    filters={"status": Status.ACTIVE.value},
+                )
+                todos = load_range(
+                    "todos", PLANNER_TODO_FIELDS, *window, user_ids=[uid], tagged_uid=uid
+                )
+            elif show_dockly:
                 # Fetch weekly goals with tagged_ids logic
-                goals = DBHelper.find_with_or_and_array_match(
-                    table_name="goals",
-                    select_fields=[
-                        "id",
-                        "user_id",
-                        "goal",
-                        "date",
-                        "time",
-                        "priority",
-                        "goal_status",
-                        "status",
-                        "google_calendar_id",
-                        "outlook_calendar_id",
-                        "synced_to_google",
-                        "synced_to_outlook",
-                    ],
-                    uid=uid,
-                    array_field="tagged_ids",
-                    filters={"status": Status.ACTIVE.value, "is_active": 1},
+                goals = attach_span_strings(
+                    DBHelper.find_with_or_and_array_match(
+                        table_name="goals",
+                        select_fields=PLANNER_GOAL_FIELDS + ["span"],
+                        uid=uid,
+                        array_field="tagged_ids",
+                        filters={"status": Status.ACTIVE.value, "is_active": 1},
+                    )
                 )
 
                 # Fetch weekly todos with tagged_ids logic
-                todos = DBHelper.find_with_or_and_array_match(
-                    table_name="todos",
-                    select_fields=[
-                        "id",
-                        "user_id",
-                        "text",
-                        "date",
-                        "completed",
-                        "priority",
-                        "goal_id",
-                        "google_calendar_id",
-                        "outlook_calendar_id",
-                        "synced_to_google",
-                        "synced_to_outlook",
-                    ],
-                    uid=uid,
-                    array_field="tagged_ids",
-                    filters={"is_active": 1},
+                todos = attach_span_strings(
+                    DBHelper.find_with_or_and_array_match(
+                        table_name="todos",
+                        select_fields=PLANNER_TODO_FIELDS + ["span"],
+                        uid=uid,
+                        array_field="tagged_ids",
+                        filters={"is_active": 1},
+                    )
                 )
 
             # Put into query_results format for later logic
@@ -196,19 +270,13 @@ class GetPlannerDataComprehensive(Resource):
 
             # --- Connected accounts (Dockly + external) ---
             connected_accounts_data = query_results.get("connected_accounts", [])
-            all_events, dockly_event_keys = [], set()
+            all_events = []
+            member_index = MemberIndex(family_members)
 
             if show_dockly:
                 # Add Dockly pseudo-accounts for ALL family members
                 for user_id in all_user_ids:
-                    fm_color = next(
-                        (
-                            fm.get("color")
-                            for fm in family_members
-                            if fm.get("user_id") == user_id
-                        ),
-                        None,
-                    )
+                    fm_color = member_index.color_for_user(user_id)
                     user_info = user_details.get(user_id, {})
                     dockly_account = {
                         "user_id": user_id,
@@ -231,16 +299,9 @@ class GetPlannerDataComprehensive(Resource):
                 email = cred_data.get("email")
                 user_id = cred_data.get("user_id")
 
-                fm_color = next(
-                    (
-                        fm.get("color")
-                        for fm in family_members
-                        if fm.get("user_id") == user_id
-                        or (fm.get("email") or "").lower() == (email or "").lower()
-                    ),
-                    None,
+                color = member_index.color_for_account(
+                    user_id, email, light_colors[i % len(light_colors)]
                 )
-                color = fm_color or light_colors[i % len(light_colors)]
                 try:
                     user_object = json.loads(cred_data.get("user_object") or "{}")
                 except:
@@ -297,58 +358,18 @@ class GetPlannerDataComprehensive(Resource):
                             "notes": all_notes,
                             "events": query_results.get("events", []),
                         },
-                        family_members,
+                        member_index,
                         user_details,
                     )
                 )
-                for e in all_events:
-                    if e.get("provider") == "dockly":
-                        dockly_event_keys.add(
-                            (
-                                e.get("source_email", "").lower().strip(),
-                                e.get("summary", "").lower().strip(),
-                                e.get("start", {}).get("dateTime", "").split("T")[0],
-                            )
-                        )
-
-            # --- Deduplicate & filter ---
-            seen, unique_events = set(), []
-            for e in all_events:
-                key = (
-                    e.get("source_email", "").lower().strip(),
-                    e.get("summary", "").lower().strip(),
-                    e.get("start", {}).get("dateTime", "").split("T")[0],
-                )
-                if filtered_emails and e.get("source_email") not in filtered_emails:
-                    continue
-                if e.get("provider") == "google" and key in dockly_event_keys:
-                    continue
-                if key in seen:
-                    continue
-                seen.add(key)
-                unique_events.append(e)
 
+            # --- Deduplicate, filter & sort ---
+            unique_events = merge_events(all_events, filtered_emails)
             response_data["events"] = unique_events
 
             # --- Upcoming events ---
-            providers = [a.get("provider") for a in response_data["connected_accounts"]]
-            if "google" in providers:
-                upcoming = [
-                    e
-                    for e in unique_events
-                    if e.get("provider") == "google" and e.get("user_id") == uid
-                ]
-            else:
-                upcoming = (
-                    [
-                        e
-                        for e in unique_events
-                        if e.get("provider") == "dockly" and e.get("user_id") == uid
-                    ]
-                    if show_dockly
-                    else []
-                )
-            response_data["upcoming_events"] = upcoming
+            providers = {a.get("provider") for a in response_data["connected_accounts"]}
+            response_data["upcoming_events"] = upcoming_events(unique_events, uid, providers)
 
             return {
                 "status": 1,
@@ -365,7 +386,7 @@ class GetPlannerDataComprehensive(Resource):
                 "error": str(e),
             }
     # helper to generate Dockly events from goals/todos/notes/events
-    def _dockly_events_from_data(self, data, family_members, user_details):
+    def _dockly_events_from_data(self, data, member_index, user_details):
         all_events = []
         # Goals → Events
         for goal in data.get("goals", []):
@@ -375,23 +396,14 @@ class GetPlannerDataComprehensive(Resource):
                 {
                     "id": f"goal_{goal.get('id')}",
                     "summary": goal.get("goal"),
-                    "start": {
-                        "dateTime": f"{self._format_date(goal.get('date'))}T00:00:00Z"
-                    },
-                    "end": {
-                        "dateTime": f"{self._format_date(goal.get('date'))}T23:59:59Z"
-                    },
+                    "start": {"dateTime": f"{self._item_day(goal)}T00:00:00Z"},
+                    "end": {"dateTime": f"{self._item_day(goal)}T23:59:59Z"},
                     "type": "goal",
                     "source": "dockly",
                     "source_email": user_info.get("email", f"dockly@user{uid}.com"),
                     "provider": "dockly",
-                    "account_color": next(
-                        (
-                            fm.get("color")
-                            for fm in family_members
-                            if fm.get("user_id") == uid
-                        ),
-                        "#0033FF",
+                    "account_color": member_index.color_for_user(
+                        uid, DEFAULT_DOCKLY_COLOR
                     ),
                     "priority": self._get_priority_text(goal.get("priority")),
                     "status": self._get_goal_status_text(goal.get("goal_status")),
@@ -409,23 +421,14 @@ class GetPlannerDataComprehensive(Resource):
                 {
                     "id": f"todo_{todo.get('id')}",
                     "summary": todo.get("text"),
-                    "start": {
-                        "dateTime": f"{self._format_date(todo.get('date'))}T00:00:00Z"
-                    },
-                    "end": {
-                        "dateTime": f"{self._format_date(todo.get('date'))}T23:59:59Z"
-                    },
+                    "start": {"dateTime": f"{self._item_day(todo)}T00:00:00Z"},
+                    "end": {"dateTime": f"{self._item_day(todo)}T23:59:59Z"},
                     "type": "todo",
                     "source": "dockly",
                     "source_email": user_info.get("email", f"dockly@user{uid}.com"),
                     "provider": "dockly",
-                    "account_color": next(
-                        (
-                            fm.get("color")
-                            for fm in family_members
-                            if fm.get("user_id") == uid
-                        ),
-                        "#0033FF",
+                    "account_color": member_index.color_for_user(
+                        uid, DEFAULT_DOCKLY_COLOR
                     ),
                     "priority": todo.get("priority", "medium"),
                     "completed": todo.get("completed", False),
@@ -473,13 +476,8 @@ class GetPlannerDataComprehensive(Resource):
                     "source": "dockly",
                     "source_email": user_info.get("email", f"dockly@user{uid}.com"),
                     "provider": "dockly",
-                    "account_color": next(
-                        (
-                            fm.get("color")
-                            for fm in family_members
-                            if fm.get("user_id") == uid
-                        ),
-                        "#0033FF",
+                    "account_color": member_index.color_for_user(
+                        uid, DEFAULT_DOCKLY_COLOR
                     ),
                     "members": note.get("members"),
                     "created_at": self._serialize_datetime(note.get("created_at")),
@@ -492,43 +490,26 @@ class GetPlannerDataComprehensive(Resource):
         for ev in data.get("events", []):
             uid = ev.get("user_id")
             user_info = user_details.get(uid, {})
-            start_date = self._format_date(ev.get("date"))
-            end_date = self._format_date(ev.get("end_date") or ev.get("date"))
-
-            # adjust if all-day
-            if ev.get("start_time") == "12:00 AM" and ev.get("end_time") in [
-                "11:59 PM",
-                "11:59:59 PM",
-            ]:
-                try:
-                    end_date_obj = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(
-                        days=1
-                    )
-                    end_date = end_date_obj.strftime("%Y-%m-%d")
-                except:
-                    pass
+
+            # Normalized at write time (span); rows not backfilled yet are computed here
+            start_at, end_at = ev.get("start_at"), ev.get("end_at")
+            if not start_at:
+                start_at, end_at = span_strings(event_span(
+                    ev.get("date"), ev.get("end_date"), ev.get("start_time"), ev.get("end_time")
+                ))
 
             all_events.append(
                 {
                     "id": f"event_{ev.get('id')}",
                     "summary": ev.get("title"),
-                    "start": {
-                        "dateTime": f"{start_date}T{self._normalize_time(ev.get('start_time'),'09:00:00')}"
-                    },
-                    "end": {
-                        "dateTime": f"{end_date}T{self._normalize_time(ev.get('end_time'),'10:00:00')}"
-                    },
+                    "start": {"dateTime": start_at or ""},
+                    "end": {"dateTime": end_at or ""},
                     "type": "event",
                     "source": "dockly",
                     "source_email": user_info.get("email", f"dockly@user{uid}.com"),
                     "provider": "dockly",
-                    "account_color": next(
-                        (
-                            fm.get("color")
-                            for fm in family_members
-                            if fm.get("user_id") == uid
-                        ),
-                        "#0033FF",
+                    "account_color": member_index.color_for_user(
+                        uid, DEFAULT_DOCKLY_COLOR
                     ),
                     "synced_to_google": ev.get("synced_to_google", False),
                     "synced_to_outlook": ev.get("synced_to_outlook", False),
@@ -541,123 +522,28 @@ class GetPlannerDataComprehensive(Resource):
     def _get_family_members(self, user_id, family_group_id=None):
         """Get family members filtered by family group ID if provided."""
         try:
-            if family_group_id:
-                # If family_group_id is specified, get members from that specific group
-                members = DBHelper.find_all(
-                    table_name="family_members",
-                    select_fields=[
-                        "fm_user_id",
-                        "user_id",
-                        "email",
-                        "name",
-                        "relationship",
-                        "color",
-                        "family_group_id",
-                    ],
-                    filters={"family_group_id": family_group_id},
-                )
-
-                # Format the response
-                unique_members = []
-                seen = set()
-
-                for m in members:
-                    fm_uid = m.get("fm_user_id") or m.get("user_id")
-                    if not fm_uid or fm_uid in seen:
-                        continue
-
-                    seen.add(fm_uid)
-                    unique_members.append(
-                        {
-                            "user_id": fm_uid,
-                            "email": m.get("email"),
-                            "name": m.get("name"),
-                            "relationship": (
-                                "me" if fm_uid == user_id else m.get("relationship")
-                            ),
-                            "color": m.get("color") or "#0033FF",
-                            "family_group_id": m.get("family_group_id"),
-                        }
-                    )
-
-                return unique_members
-            else:
-                # Original logic for when no family_group_id is specified
-                # Step 1: Get all family group IDs where this user is a member
-                user_groups = DBHelper.find_all(
-                    table_name="family_members",
-                    select_fields=["family_group_id"],
-                    filters={"fm_user_id": user_id},
-                )
-
-                group_ids = list(
-                    set(
-                        [
-                            g["family_group_id"]
-                            for g in user_groups
-                            if g.get("family_group_id")
-                        ]
-                    )
+            unique_members = family_graph.members(user_id, family_group_id)
+
+            if not unique_members and not family_group_id:
+                # No family groups — return just the current user
+                user = DBHelper.find_one(
+                    table_name="users",
+                    filters={"uid": user_id},
+                    select_fields=["uid", "email", "user_name"],
                 )
+                return [
+                    {
+                        "user_id": user_id,
+                        "email": user.get("email"),
+                        "name": user.get("user_name"),
+                        "relationship": "me",
+                        "color": "#FFD1DC",
+                    }
+                ]
 
-                if not group_ids:
-                    # No family groups — return just the current user
-                    user = DBHelper.find_one(
-                        table_name="users",
-                        filters={"uid": user_id},
-                        select_fields=["uid", "email", "user_name"],
-                    )
-                    return [
-                        {
-                            "user_id": user_id,
-                            "email": user.get("email"),
-                            "name": user.get("user_name"),
-                            "relationship": "me",
-                            "color": "#FFD1DC",
-                        }
-                    ]
-
-                # Step 2: Get all members from these family groups
-                all_members = []
-                for gid in group_ids:
-                    members = DBHelper.find_all(
-                        table_name="family_members",
-                        select_fields=[
-                            "fm_user_id",
-                            "user_id",
-                            "email",
-                            "name",
-                            "relationship",
-                            "color",
-                            "family_group_id",
-                        ],
-                        filters={"family_group_id": gid},
-                    )
-                    all_members.extend(members)
-
-                # Step 3: Deduplicate by fm_user_id / user_id
-                seen = set()
-                unique_members = []
-                for m in all_members:
-                    fm_uid = m.get("fm_user_id") or m.get("user_id")
-                    if not fm_uid:
-                        continue
-                    if fm_uid not in seen:
-                        seen.add(fm_uid)
-                        unique_members.append(
-                            {
-                                "user_id": fm_uid,
-                                "email": m.get("email"),
-                                "name": m.get("name"),
-                                "relationship": (
-                                    "me" if fm_uid == user_id else m.get("relationship")
-                                ),
-                                "color": m.get("color") or "#0033FF",
-                                "family_group_id": m.get("family_group_id"),
-                            }
-                        )
-
-                return unique_members
+            for m in unique_members:
+                m["color"] = m["color"] or DEFAULT_MEMBER_COLOR
+            return unique_members
 
         except Exception as e:
             print(f"Error fetching family members (multi-group): {e}")
@@ -781,6 +667,12 @@ class GetPlannerDataComprehensive(Resource):
                 return date_obj
         return str(date_obj) if date_obj else ""
 
+    def _item_day(self, item):
+        """Day of a goal / todo from its span, falling back to the stored date."""
+        if item.get("start_at"):
+            return item["start_at"][:10]
+        return self._format_date(item.get("date"))
+
     def _get_goal_status_text(self, status_value):
         """Convert goal status enum to text"""
         status_map = {0: "Yet to Start", 1: "In Progress", 2: "Completed"}
@@ -791,23 +683,6 @@ class GetPlannerDataComprehensive(Resource):
         priority_map = {0: "low", 1: "medium", 2: "high"}
         return priority_map.get(priority_value, "low")
 
-    def _normalize_time(self, time_str, fallback=None):
-        if not time_str:
-            return fallback
-        try:
-            parsed = datetime.strptime(time_str.strip(), "%I:%M %p")
-            return parsed.strftime("%H:%M:%S")
-        except:
-            try:
-                parsed = datetime.strptime(time_str.strip(), "%H:%M:%S")
-                return parsed.strftime("%H:%M:%S")
-            except:
-                try:
-                    parsed = datetime.strptime(time_str.strip(), "%H:%M")
-                    return parsed.strftime("%H:%M:%S")
-                except:
-                    return fallback
-
 class AddWeeklyGoals(Resource):
     @auth_required(isOptional=True)
     def post(self, uid, user):
@@ -845,47 +720,19 @@ class AddWeeklyGoals(Resource):
                 "synced_to_outlook": False,
             }
 
-            # Calendar sync
             start_dt = datetime.strptime(goal_date, "%Y-%m-%d")
             end_dt = start_dt + timedelta(days=1)
 
-            def log_failure(provider, error):
-                AuditLogger.log(
-                    user_id=uid,
-                    action="add_weekly_goal",
-                    resource_type="goal",
-                    resource_id=str(goal_id),
-                    success=False,
-                    error_message=f"Failed to sync goal to {provider} Calendar",
-                    metadata={"input": data, "error": str(error)},
-                )
-
-            # Google Calendar sync
-            if sync_to_google:
-                try:
-                    event_id = create_calendar_event(uid, goal["goal"], start_dt, end_dt)
-                    goal.update({"google_calendar_id": event_id, "synced_to_google": True})
-                except Exception as e:
-                    log_failure("Google", e)
-
-            # Outlook Calendar sync
-            if sync_to_outlook:
-                try:
-                    outlook_account = DBHelper.find_one(
-                        "connected_accounts",
-                        filters={"user_id": uid, "provider": "outlook", "is_active": 1},
-                        select_fields=["access_token"],
-                    )
-                    if outlook_account:
-                        event_id = create_outlook_calendar_event(
-                            outlook_account["access_token"], goal["goal"], start_dt, end_dt
-                        )
-                        goal.update({"outlook_calendar_id": event_id, "synced_to_outlook": True})
-                except Exception as e:
-                    log_failure("Outlook", e)
-
             # Store in DB
-            DBHelper.insert("goals", return_column="id", **goal)
+            DBHelper.insert("goals", return_column="id", span=day_span(goal_date), **goal)
+
+            # Calendar sync runs in the background; flags flip once pushed
+            providers = [
+                provider
+                for provider, enabled in (("google", sync_to_google), ("outlook", sync_to_outlook))
+                if enabled
+            ]
+            queue_calendar_upsert(uid, "goal", goal_id, goal["goal"], start_dt, end_dt, providers)
 
             # Success log
             AuditLogger.log(
@@ -930,20 +777,15 @@ class UpdateWeeklyGoals(Resource):
                 )
                 return {"status": 0, "message": "Goal ID is required", "payload": {}}
 
-            # Fetch existing goal (for sync checks)
-            existing_goal = DBHelper.find_one(
-                "goals",
-                filters={"id": goal_id, "user_id": uid},
-                select_fields=["google_calendar_id", "synced_to_google"],
-            )
-
             # Prepare updates
+            sync_to_google = data.get("sync_to_google", True)
             updates = {
                 "goal": data.get("goal", ""),
                 "date": data.get("date", ""),
                 "time": data.get("time", ""),
-                "synced_to_google": data.get("sync_to_google", True),
             }
+            if not sync_to_google:
+                updates["synced_to_google"] = False
 
             # Validate date
             try:
@@ -961,43 +803,17 @@ class UpdateWeeklyGoals(Resource):
                 )
                 return {"status": 0, "message": "Invalid date format", "payload": {}}
 
-            # --- Google Calendar Sync ---
-            if updates["synced_to_google"]:
-                try:
-                    if existing_goal and existing_goal.get("google_calendar_id"):
-                        # Update existing event
-                        update_calendar_event(
-                            uid,
-                            existing_goal["google_calendar_id"],
-                            updates["goal"],
-                            start_dt,
-                            end_dt,
-                        )
-                    else:
-                        # Create new event
-                        google_event_id = create_calendar_event(
-                            uid, updates["goal"], start_dt, end_dt
-                        )
-                        updates["google_calendar_id"] = google_event_id
-                except Exception as e:
-                    updates["synced_to_google"] = False
-                    AuditLogger.log(
-                        user_id=uid,
-                        action="update_weekly_goal",
-                        resource_type="goal",
-                        resource_id=str(goal_id),
-                        success=False,
-                        error_message="Failed to sync goal update to Google Calendar",
-                        metadata={"input": data, "error": str(e)},
-                    )
-
             # --- Save Updates ---
-            DBHelper.update_one(
+            updated = DBHelper.update_one(
                 table_name="goals",
                 filters={"id": goal_id, "user_id": uid},
-                updates=updates,
+                updates={**updates, "span": day_span(start_dt)},
             )
 
+            # --- Google Calendar Sync (queued) ---
+            if updated and sync_to_google:
+                queue_calendar_upsert(uid, "goal", goal_id, updates["goal"], start_dt, end_dt)
+
             # --- Success Log ---
             AuditLogger.log(
                 user_id=uid,
@@ -1066,43 +882,16 @@ class AddWeeklyTodos(Resource):
             start_dt = datetime.strptime(todo_date, "%Y-%m-%d")
             end_dt = start_dt + timedelta(days=1)
 
-            def log_failure(provider, error):
-                AuditLogger.log(
-                    user_id=uid,
-                    action="add_weekly_todo",
-                    resource_type="todo",
-                    resource_id=str(todo_id),
-                    success=False,
-                    error_message=f"Failed to sync todo to {provider} Calendar",
-                    metadata={"input": data, "error": str(error)},
-                )
-
-            # Google sync
-            if sync_to_google:
-                try:
-                    event_id = create_calendar_event(uid, todo["text"], start_dt, end_dt)
-                    todo.update({"google_calendar_id": event_id, "synced_to_google": True})
-                except Exception as e:
-                    log_failure("Google", e)
-
-            # Outlook sync
-            if sync_to_outlook:
-                try:
-                    outlook_account = DBHelper.find_one(
-                        "connected_accounts",
-                        filters={"user_id": uid, "provider": "outlook", "is_active": 1},
-                        select_fields=["access_token"],
-                    )
-                    if outlook_account:
-                        event_id = create_outlook_calendar_event(
-                            outlook_account["access_token"], todo["text"], start_dt, end_dt
-                        )
-                        todo.update({"outlook_calendar_id": event_id, "synced_to_outlook": True})
-                except Exception as e:
-                    log_failure("Outlook", e)
-
             # Store in DB
-            DBHelper.insert("todos", return_column="id", **todo)
+            DBHelper.insert("todos", return_column="id", span=day_span(todo_date), **todo)
+
+            # Calendar sync runs in the background; flags flip once pushed
+            providers = [
+                provider
+                for provider, enabled in (("google", sync_to_google), ("outlook", sync_to_outlook))
+                if enabled
+            ]
+            queue_calendar_upsert(uid, "todo", todo_id, todo["text"], start_dt, end_dt, providers)
 
             # Success log
             AuditLogger.log(
@@ -1147,22 +936,17 @@ class UpdateWeeklyTodos(Resource):
                 )
                 return {"status": 0, "message": "Todo ID is required", "payload": {}}
 
-            # Fetch existing todo (for sync checks)
-            existing_todo = DBHelper.find_one(
-                "todos",
-                filters={"id": todo_id, "user_id": uid},
-                select_fields=["google_calendar_id", "synced_to_google"],
-            )
-
             # Prepare update fields
+            sync_to_google = data.get("sync_to_google", True)
             updates = {
                 "text": data.get("text", ""),
                 "date": data.get("date", ""),
                 "time": data.get("time", ""),
                 "priority": data.get("priority", "medium"),
                 "goal_id": data.get("goal_id"),
-                "synced_to_google": data.get("sync_to_google", True),
             }
+            if not sync_to_google:
+                updates["synced_to_google"] = False
 
             if "completed" in data:
                 updates["completed"] = str(data.get("completed")).lower() == "true"
@@ -1183,41 +967,17 @@ class UpdateWeeklyTodos(Resource):
                 )
                 return {"status": 0, "message": "Invalid date format", "payload": {}}
 
-            # --- Google Calendar Sync ---
-            if updates["synced_to_google"]:
-                try:
-                    if existing_todo and existing_todo.get("google_calendar_id"):
-                        update_calendar_event(
-                            uid,
-                            existing_todo["google_calendar_id"],
-                            updates["text"],
-                            start_dt,
-                            end_dt,
-                        )
-                    else:
-                        google_event_id = create_calendar_event(
-                            uid, updates["text"], start_dt, end_dt
-                        )
-                        updates["google_calendar_id"] = google_event_id
-                except Exception as e:
-                    updates["synced_to_google"] = False
-                    AuditLogger.log(
-                        user_id=uid,
-                        action="update_weekly_todo",
-                        resource_type="todo",
-                        resource_id=str(todo_id),
-                        success=False,
-                        error_message="Failed to sync todo update to Google Calendar",
-                        metadata={"input": data, "error": str(e)},
-                    )
-
             # --- Save Updates ---
-            DBHelper.update_one(
+            updated = DBHelper.update_one(
                 table_name="todos",
                 filters={"id": todo_id, "user_id": uid},
-                updates=updates,
+                updates={**updates, "span": day_span(start_dt)},
             )
 
+            # --- Google Calendar Sync (queued) ---
+            if updated and sync_to_google:
+                queue_calendar_upsert(uid, "todo", todo_id, updates["text"], start_dt, end_dt)
+
             # --- Success Log ---
             AuditLogger.log(
                 user_id=uid,
@@ -1460,34 +1220,32 @@ class AddSmartNote(Resource):
                 goal_date = parsed_datetime.strftime("%Y-%m-%d")
                 goal_time = parsed_datetime.strftime("%I:%M %p")
 
-                google_event_id = None
-                try:
-                    # Create Google Calendar event and get event ID
-                    google_event_id = create_calendar_event(
-                        uid,
-                        goal_text,
-                        parsed_datetime,
-                        parsed_datetime + timedelta(hours=1),
-                    )
-                except Exception as e:
-                    print("Failed to create Google Calendar event for goal:", e)
-
+                goal_id = uniqueId(digit=15, isNum=True)
                 try:
                     DBHelper.insert(
                         "goals",
-                        id=uniqueId(digit=15, isNum=True),
+                        id=goal_id,
                         user_id=uid,
                         goal=goal_text,
                         date=goal_date,
                         time=goal_time,
+                        span=day_span(goal_date),
                         priority=Priority.LOW.value,
                         goal_status=GoalStatus.YET_TO_START.value,
                         status=Status.ACTIVE.value,
-                        google_calendar_id=google_event_id,
+                        google_calendar_id=None,
                         outlook_calendar_id=None,
-                        synced_to_google=bool(google_event_id),
+                        synced_to_google=False,
                         synced_to_outlook=False,
                     )
+                    queue_calendar_upsert(
+                        uid,
+                        "goal",
+                        goal_id,
+                        goal_text,
+                        parsed_datetime,
+                        parsed_datetime + timedelta(hours=1),
+                    )
                 except Exception as e:
                     print("Failed to add goal:", e)
 
@@ -1497,34 +1255,32 @@ class AddSmartNote(Resource):
                 todo_date = parsed_datetime.strftime("%Y-%m-%d")
                 todo_time = parsed_datetime.strftime("%I:%M %p")
 
-                google_event_id = None
-                try:
-                    # Create Google Calendar event and get event ID
-                    google_event_id = create_calendar_event(
-                        uid,
-                        todo_text,
-                        parsed_datetime,
-                        parsed_datetime + timedelta(hours=1),
-                    )
-                except Exception as e:
-                    print("Failed to create Google Calendar event for todo:", e)
-
+                todo_id = uniqueId(digit=15, isNum=True)
                 try:
                     DBHelper.insert(
                         "todos",
-                        id=uniqueId(digit=15, isNum=True),
+                        id=todo_id,
                         user_id=uid,
                         text=todo_text,
                         date=todo_date,
                         time=todo_time,
+                        span=day_span(todo_date),
                         priority="medium",
                         completed=False,
                         goal_id=None,
-                        google_calendar_id=google_event_id,
+                        google_calendar_id=None,
                         outlook_calendar_id=None,
-                        synced_to_google=bool(google_event_id),
+                        synced_to_google=False,
                         synced_to_outlook=False,
                     )
+                    queue_calendar_upsert(
+                        uid,
+                        "todo",
+                        todo_id,
+                        todo_text,
+                        parsed_datetime,
+                        parsed_datetime + timedelta(hours=1),
+                    )
                 except Exception as e:
                     print("Failed to add todo:", e)
 
@@ -1669,82 +1425,6 @@ class GetSmartNotes(Resource):
             return {"status": 0, "message": "Failed to fetch smart notes"}
 
 
-def add_calendar_guests(user_id, calendar_event_id, guest_emails):
-    """
-    Adds new guests to an existing Google Calendar event.
-
-    user_id: ID of the goal creator (the owner of the event)
-    calendar_event_id: google_calendar_id stored in your DB
-    guest_emails: list of email addresses to add as guests
-    """
-    try:
-        if not guest_emails:
-            return None
-
-        # 1. Get creator's connected account credentials
-        user_cred = DBHelper.find_one(
-            "connected_accounts",
-            filters={"user_id": user_id},
-            select_fields=["access_token", "refresh_token", "email"],
-        )
-        if not user_cred:
-            raise Exception("No connected Google account found.")
-
-        creds = Credentials(
-            token=user_cred["access_token"],
-            refresh_token=user_cred["refresh_token"],
-            token_uri=uri,
-            client_id=CLIENT_ID,
-            client_secret=CLIENT_SECRET,
-            scopes=SCOPE.split(),
-        )
-
-        service = build("calendar", "v3", credentials=creds)
-
-        # 2. Fetch the existing event
-        event = (
-            service.events().get(calendarId="primary", eventId=calendar_event_id).execute()
-        )
-
-        # 3. Merge current attendees with new guests (avoid duplicates)
-        existing_attendees = event.get("attendees", [])
-        for email in guest_emails:
-            if not any(att.get("email") == email for att in existing_attendees):
-                existing_attendees.append({"email": email})
-
-        event["attendees"] = existing_attendees
-
-        # Keep guest permissions consistent
-        event["guestsCanModify"] = True
-        event["guestsCanInviteOthers"] = True
-        event["guestsCanSeeOtherGuests"] = True
-
-        # 4. Update the event with sendUpdates='all'
-        updated_event = (
-            service.events()
-            .update(
-                calendarId="primary",
-                eventId=calendar_event_id,
-                body=event,
-                sendUpdates="all",
-            )
-            .execute()
-        )
-
-        return updated_event.get("id")
-        
-    except Exception as e:
-        AuditLogger.log(
-            user_id=user_id,
-            action="add_calendar_guests",
-            resource_type="calendar_event",
-            resource_id=calendar_event_id,
-            success=False,
-            error_message="Failed to add calendar guests",
-            metadata={"guest_emails": guest_emails, "error": str(e)},
-        )
-        raise e
-
 class ShareGoal(Resource):
     @auth_required(isOptional=True)
     def post(self, uid, user):
@@ -1885,16 +1565,11 @@ class ShareGoal(Resource):
                     updates={"tagged_ids": pg_array_str},
                 )
 
-                # ✅ Add tagged members as Google Calendar guests
-                if goal_record.get("google_calendar_id"):
-                    try:
-                        add_calendar_guests(
-                            user_id=uid,  # goal creator
-                            calendar_event_id=goal_record["google_calendar_id"],
-                            guest_emails=tagged_members,  # list of emails
-                        )
-                    except Exception as e:
-                        print(f"⚠ Failed to add calendar guests: {str(e)}")
+                # ✅ Add tagged members as Google Calendar guests (queued)
+                try:
+                    queue_calendar_guests(uid, "goal", goal_record["id"], tagged_members)
+                except Exception as e:
+                    print(f"⚠ Failed to queue calendar guests: {str(e)}")
 
             if failures:
                 AuditLogger.log(
@@ -2160,16 +1835,11 @@ class ShareTodo(Resource):
                     filters={"id": todo.get("id")},
                     updates={"tagged_ids": pg_array_str},
                 )
-                # ✅ Add tagged members as Google Calendar guests
-                if todo_record.get("google_calendar_id"):
-                    try:
-                        add_calendar_guests(
-                            user_id=uid,  # goal creator
-                            calendar_event_id=todo_record["google_calendar_id"],
-                            guest_emails=tagged_members,  # list of emails
-                        )
-                    except Exception as e:
-                        print(f"⚠ Failed to add calendar guests: {str(e)}")
+                # ✅ Add tagged members as Google Calendar guests (queued)
+                try:
+                    queue_calendar_guests(uid, "todo", todo_record["id"], tagged_members)
+                except Exception as e:
+                    print(f"⚠ Failed to queue calendar guests: {str(e)}")
 
             if failures:
                 AuditLogger.log(
@@ -2389,6 +2059,9 @@ class AddHabit(Resource):
                 status=False,
                 added_time=now.isoformat(),
                 updated_at=now.isoformat(),
+                current_streak=0,
+                longest_streak=0,
+                completed_days=0,
             )
 
             # Create progress row for today
@@ -2433,7 +2106,7 @@ class GetHabits(Resource):
         try:
             user_id = request.args.get("userId")
             query_date = request.args.get("date", date.today().isoformat())
-            today_str = date.today().isoformat()
+            today = date.today()
 
             if not user_id:
                 AuditLogger.log(
@@ -2447,47 +2120,21 @@ class GetHabits(Resource):
                 )
                 return {"status": 0, "message": "Missing userId"}, 400
 
-            # Fetch all active habits for user
-            habits = DBHelper.find_all(
-                "habits", filters={"user_id": user_id, "is_active": 1}
+            requested = datetime.fromisoformat(query_date).date()
+
+            # Habits + progress for the requested day in a constant number of
+            # queries; today's missing progress rows are created in one insert
+            habits, progress = load_habits(
+                user_id,
+                requested,
+                create_for=requested if requested == today else None,
             )
             results = []
 
             for habit in habits:
-                # Fetch progress for the requested date
-                progress = DBHelper.find_one(
-                    "habit_progress",
-                    filters={"habit_id": habit["id"], "progress_date": query_date},
-                )
-
-                # Auto-create today's progress if not exists
-                if not progress and query_date == today_str:
-                    progress_id = DBHelper.insert(
-                        "habit_progress",
-                        return_column="id",
-                        habit_id=habit["id"],
-                        progress_date=query_date,
-                        status=False,
-                    )
-                    progress = {
-                        "id": progress_id,
-                        "habit_id": habit["id"],
-                        "progress_date": query_date,
-                        "status": False,
-                    }
-
-                # Default progress for past/future or if still None
-                if not progress:
-                    progress = {
-                        "id": None,
-                        "habit_id": habit["id"],
-                        "progress_date": query_date,
-                        "status": False,
-                    }
-
-                # Update habit status from progress
-                habit["status"] = progress["status"]
-                habit["progress_date"] = progress["progress_date"]
+                habit["status"] = progress.get(habit["id"], {}).get(requested, False)
+                habit["progress_date"] = query_date
+                habit.update(summarize_habit(habit, today))
 
                 # Serialize datetime/date fields to ISO
                 for key, value in habit.items():
@@ -2496,8 +2143,6 @@ class GetHabits(Resource):
 
                 results.append(habit)
 
-          
-
             return {
                 "status": 1,
                 "message": "Habits fetched successfully",
@@ -2516,6 +2161,68 @@ class GetHabits(Resource):
             )
             return {"status": 0, "message": f"Failed to fetch habits: {str(e)}"}, 500
 
+
+class GetHabitHeatmap(Resource):
+    @auth_required(isOptional=True)
+    def get(self, uid, user):
+        try:
+            user_id = request.args.get("userId")
+            view = request.args.get("view", "week")
+            anchor = request.args.get("date", date.today().isoformat())
+
+            if not user_id:
+                return {"status": 0, "message": "Missing userId"}, 400
+            if view not in ("week", "month"):
+                return {"status": 0, "message": "view must be 'week' or 'month'"}, 400
+
+            start, end = heatmap_window(view, anchor)
+            habits, progress = load_habits(user_id, start, end)
+
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            results = []
+            for habit in habits:
+                habit_progress = progress.get(habit["id"], {})
+                cells = [
+                    {"date": day.isoformat(), "status": habit_progress.get(day, False)}
+                    for day in days
+                ]
+                results.append(
+                    {
+                        "id": habit["id"],
+                        "name": habit["name"],
+                        "days": cells,
+                        "completed": sum(1 for cell in cells if cell["status"]),
+                        **summarize_habit(habit),
+                    }
+                )
+
+            return {
+                "status": 1,
+                "message": "Habit heatmap fetched successfully",
+                "payload": {
+                    "view": view,
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "habits": results,
+                },
+            }, 200
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="get_habit_heatmap",
+                resource_type="habit",
+                resource_id="multiple",
+                success=False,
+                error_message="Failed to fetch habit heatmap",
+                metadata={"error": str(e)},
+            )
+            return {
+                "status": 0,
+                "message": f"Failed to fetch habit heatmap: {str(e)}",
+            }, 500
+
+
 class UpdateHabitProgress(Resource):
     @auth_required(isOptional=True)
     def post(self, uid, user):
@@ -2559,51 +2266,25 @@ class UpdateHabitProgress(Resource):
                     "message": "Cannot update future habit progress",
                 }, 400
 
-                # Ensure habit exists
-                habit_db = DBHelper.find_one("habits", filters={"id": habit_id})
-                if not habit_db:
-                    AuditLogger.log(
-                        user_id=uid,
-                        action="update_habit_progress",
-                        resource_type="habit",
-                        resource_id=str(habit_id),
-                        success=False,
-                        error_message="Habit not found",
-                        metadata={"input": data if data else {}},
-                    )
-                    return {"status": 0, "message": "Habit not found"}, 404
-
-            # Find or create progress row
-            progress = DBHelper.find_one(
-                "habit_progress",
-                filters={"habit_id": habit_id, "progress_date": progress_date},
-            )
-            if not progress:
-                progress_id = DBHelper.insert(
-                    "habit_progress",
-                    return_column="id",
-                    habit_id=habit_id,
-                    progress_date=progress_date,
-                    status=False,
+            # Ensure habit exists
+            habit_db = DBHelper.find_one("habits", filters={"id": habit_id})
+            if not habit_db:
+                AuditLogger.log(
+                    user_id=uid,
+                    action="update_habit_progress",
+                    resource_type="habit",
+                    resource_id=str(habit_id),
+                    success=False,
+                    error_message="Habit not found",
+                    metadata={"input": data if data else {}},
                 )
-                if not progress:
-                    progress_id = DBHelper.insert(
-                        table_name="habit_progress",
-                        return_column="id",
-                        habit_id=habit_id,
-                        progress_date=progress_date,
-                        status=False,
-                    )
-                    progress = {"id": progress_id, "status": False}
-
-                # Toggle or set status
-                new_status = habit.get("status", not progress["status"])
+                return {"status": 0, "message": "Habit not found"}, 404
 
-                DBHelper.update_one(
-                    "habit_progress",
-                    filters={"habit_id": habit_id, "progress_date": progress_date},
-                    updates={"status": new_status},
-                )
+            # Upsert the day's progress (toggle when no status is given) and
+            # update the streak counters in the same pass
+            new_status, stats = record_habit_progress(
+                habit_id, progress_date, habit.get("status")
+            )
 
             DBHelper.update_one(
                 "habits",
@@ -2634,6 +2315,7 @@ class UpdateHabitProgress(Resource):
                     "habit_id": habit_id,
                     "progress_date": progress_date,
                     "status": new_status,
+                    **summarize_habit({**habit_db, **(stats or {})}),
                 },
             }, 200
 
@@ -2649,18 +2331,6 @@ class UpdateHabitProgress(Resource):
             )
             return {"status": 0, "message": f"Failed to update habit: {str(e)}"}, 500
 
-        except Exception as e:
-            AuditLogger.log(
-                user_id=uid,
-                action="UPDATE_HABIT_PROGRESS",
-                resource_type="habit",
-                resource_id=str(habit_id) if habit_id else "unknown",
-                success=False,
-                error_message="Failed to update habit progress",
-                metadata={"input": data if data else {}, "error": str(e)},
-            )
-            return {"status": 0, "message": "Failed to update habit progress"}
-
 
 class EditHabit(Resource):
     @auth_required(isOptional=True)
@@ -2787,3 +2457,383 @@ class DeleteHabit(Resource):
                 "message": f"Failed to delete habit: {str(e)}",
                 "payload": {},
             }, 500
+
+
+class SetRecurrence(Resource):
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        data = request.get_json(silent=True) or {}
+        source_type = data.get("source_type")
+        source_id = data.get("source_id")
+
+        if not source_type or not source_id:
+            return {"status": 0, "message": "source_type and source_id are required", "payload": {}}, 400
+
+        try:
+            if not data.get("rrule"):
+                clear_recurrence_rule(uid, source_type, source_id)
+                return {"status": 1, "message": "Recurrence removed", "payload": {}}, 200
+
+            if not data.get("dtstart"):
+                return {"status": 0, "message": "dtstart is required", "payload": {}}, 400
+
+            rule = set_recurrence_rule(
+                uid,
+                source_type,
+                source_id,
+                data["rrule"],
+                data["dtstart"],
+                duration_minutes=data.get("duration_minutes"),
+                timezone=data.get("timezone"),
+            )
+
+            AuditLogger.log(
+                user_id=uid,
+                action="SET_RECURRENCE",
+                resource_type=source_type,
+                resource_id=str(source_id),
+                success=True,
+                metadata={"input": data},
+            )
+
+            return {
+                "status": 1,
+                "message": "Recurrence saved",
+                "payload": {"rule_id": rule["id"] if rule else None},
+            }, 200
+
+        except ValueError as e:
+            return {"status": 0, "message": str(e), "payload": {}}, 400
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="SET_RECURRENCE",
+                resource_type=source_type,
+                resource_id=str(source_id),
+                success=False,
+                error_message="Failed to save recurrence",
+                metadata={"input": data, "error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to save recurrence: {str(e)}", "payload": {}}, 500
+
+
+class SetRecurrenceOverride(Resource):
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        data = request.get_json(silent=True) or {}
+        rule_id = data.get("rule_id")
+        occurrence_start = data.get("recurrence_id")
+
+        if not rule_id or not occurrence_start:
+            return {"status": 0, "message": "rule_id and recurrence_id are required", "payload": {}}, 400
+
+        try:
+            rule = DBHelper.find_one(
+                "recurrence_rules",
+                filters={"id": rule_id, "user_id": uid},
+                select_fields=["id"],
+            )
+            if not rule:
+                return {"status": 0, "message": "Recurrence not found", "payload": {}}, 404
+
+            set_recurrence_override(
+                rule_id,
+                occurrence_start,
+                cancelled=data.get("cancelled", False),
+                new_start=data.get("start"),
+                new_end=data.get("end"),
+                fields=data.get("fields"),
+            )
+
+            AuditLogger.log(
+                user_id=uid,
+                action="SET_RECURRENCE_OVERRIDE",
+                resource_type="recurrence_rules",
+                resource_id=str(rule_id),
+                success=True,
+                metadata={"input": data},
+            )
+
+            return {"status": 1, "message": "Occurrence updated", "payload": {}}, 200
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="SET_RECURRENCE_OVERRIDE",
+                resource_type="recurrence_rules",
+                resource_id=str(rule_id),
+                success=False,
+                error_message="Failed to update occurrence",
+                metadata={"input": data, "error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to update occurrence: {str(e)}", "payload": {}}, 500
+
+
+class GetOccurrences(Resource):
+    @auth_required(isOptional=True)
+    def get(self, uid, user):
+        try:
+            start = request.args.get("start")
+            end = request.args.get("end")
+            if not start or not end:
+                return {"status": 0, "message": "start and end are required", "payload": {}}, 400
+
+            types = request.args.get("types")
+            source_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+            limit = request.args.get("limit", type=int)
+
+            window_start = datetime.fromisoformat(start)
+            window_end = datetime.fromisoformat(end)
+            if len(end) == 10:
+                # A bare end date covers that whole day
+                window_end = window_end + timedelta(days=1) - timedelta(microseconds=1)
+
+            items = [
+                serialize_occurrence(item)
+                for item in recurrence_occurrences(
+                    [uid], window_start, window_end, source_types, limit=limit
+                )
+            ]
+
+            return {
+                "status": 1,
+                "message": "Occurrences fetched successfully",
+                "payload": {"occurrences": items},
+            }, 200
+
+        except ValueError as e:
+            return {"status": 0, "message": str(e), "payload": {}}, 400
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="GET_OCCURRENCES",
+                resource_type="recurrence_rules",
+                resource_id="multiple",
+                success=False,
+                error_message="Failed to fetch occurrences",
+                metadata={"args": dict(request.args), "error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to fetch occurrences: {str(e)}", "payload": {}}, 500
+
+
+class GetPlannerRange(GetPlannerDataComprehensive):
+    """Dockly events, goals and todos overlapping a window, one span query per table."""
+
+    @auth_required(isOptional=True)
+    def get(self, uid, user):
+        try:
+            window_start, window_end = parse_window(
+                request.args.get("start"), request.args.get("end")
+            )
+            types = request.args.get("types")
+            item_types = (
+                [t.strip() for t in types.split(",") if t.strip()]
+                if types
+                else ["event", "goal", "todo"]
+            )
+
+            # Only the requester and their family can be queried
+            family_members = self._get_family_members(uid, request.args.get("family_group_id"))
+            allowed_ids = {m["user_id"] for m in family_members if m.get("user_id")}
+            allowed_ids.add(uid)
+            requested_ids = request.args.getlist("user_ids[]")
+            user_ids = [u for u in requested_ids if u in allowed_ids] if requested_ids else list(allowed_ids)
+
+            data = {"goals": [], "todos": [], "events": []}
+            if "event" in item_types:
+                data["events"] = load_range(
+                    "events", PLANNER_EVENT_FIELDS, window_start, window_end, user_ids=user_ids
+                )
+            if "goal" in item_types:
+                data["goals"] = load_range(
+                    "goals",
+                    PLANNER_GOAL_FIELDS,
+                    window_start,
+                    window_end,
+                    user_ids=[uid],
+                    tagged_uid=uid,
+                    filters={"status": Status.ACTIVE.value},
+                )
+            if "todo" in item_types:
+                data["todos"] = load_range(
+                    "todos", PLANNER_TODO_FIELDS, window_start, window_end,
+                    user_ids=[uid], tagged_uid=uid,
+                )
+
+            owner_ids = {row["user_id"] for rows in data.values() for row in rows}
+            items = self._dockly_events_from_data(
+                data, MemberIndex(family_members), self._get_users_details(list(owner_ids))
+            )
+            items.sort(key=lambda e: e["start"]["dateTime"])
+
+            return {
+                "status": 1,
+                "message": "Planner range fetched successfully",
+                "payload": {
+                    "start": window_start.isoformat(),
+                    "end": window_end.isoformat(),
+                    "user_ids": user_ids,
+                    "events": items,
+                },
+            }, 200
+
+        except ValueError as e:
+            return {"status": 0, "message": str(e), "payload": {}}, 400
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="GET_PLANNER_RANGE",
+                resource_type="events",
+                resource_id="multiple",
+                success=False,
+                error_message="Failed to fetch planner range",
+                metadata={"args": dict(request.args), "error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to fetch planner range: {str(e)}", "payload": {}}, 500
+
+
+def revoke_calendar_feeds(uid, family_group_id=None, token=None):
+    """Deactivate the user's feed by token, or every live feed for a scope
+    (family_group_id None is the personal feed); returns the count."""
+    if token:
+        return DBHelper.update_all(
+            "calendar_feeds",
+            filters={"user_id": uid, "token": token, "is_active": 1},
+            updates={"is_active": 0, "updated_at": datetime.now()},
+        )
+    rows = DBHelper.execute_query(
+        """
+        UPDATE calendar_feeds SET is_active = 0, updated_at = NOW()
+        WHERE user_id = %s AND is_active = 1
+          AND family_group_id IS NOT DISTINCT FROM %s
+        RETURNING id
+        """,
+        (uid, family_group_id),
+    )
+    return len(rows)
+
+
+class CreateCalendarFeed(Resource):
+    """Issue (or rotate) the private ICS subscription link for the user or a family group."""
+
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        data = request.get_json(silent=True) or {}
+        family_group_id = data.get("family_group_id")
+
+        try:
+            if family_group_id and not DBHelper.find_one(
+                "family_members",
+                filters={"family_group_id": family_group_id, "fm_user_id": uid},
+                select_fields=["id"],
+            ):
+                return {"status": 0, "message": "Not a member of this family group", "payload": {}}, 403
+
+            # One live link per scope; rotating revokes the old one
+            revoke_calendar_feeds(uid, family_group_id=family_group_id)
+            token = secrets.token_urlsafe(32)
+            DBHelper.insert(
+                "calendar_feeds",
+                return_column="id",
+                user_id=uid,
+                family_group_id=family_group_id,
+                token=token,
+                is_active=1,
+                created_at=datetime.now(),
+                updated_at=datetime.now(),
+            )
+
+            AuditLogger.log(
+                user_id=uid,
+                action="CREATE_CALENDAR_FEED",
+                resource_type="calendar_feeds",
+                resource_id=family_group_id or uid,
+                success=True,
+                metadata={"family_group_id": family_group_id},
+            )
+
+            return {
+                "status": 1,
+                "message": "Calendar feed created",
+                "payload": {
+                    "token": token,
+                    "url": f"{API_URL}/calendar/feed/{token}.ics",
+                    "family_group_id": family_group_id,
+                },
+            }, 200
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="CREATE_CALENDAR_FEED",
+                resource_type="calendar_feeds",
+                resource_id=family_group_id or uid,
+                success=False,
+                error_message="Failed to create calendar feed",
+                metadata={"input": data, "error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to create calendar feed: {str(e)}", "payload": {}}, 500
+
+
+class RevokeCalendarFeed(Resource):
+    @auth_required(isOptional=True)
+    def post(self, uid, user):
+        data = request.get_json(silent=True) or {}
+        try:
+            revoked = revoke_calendar_feeds(
+                uid, family_group_id=data.get("family_group_id"), token=data.get("token")
+            )
+
+            AuditLogger.log(
+                user_id=uid,
+                action="REVOKE_CALENDAR_FEED",
+                resource_type="calendar_feeds",
+                resource_id=data.get("family_group_id") or uid,
+                success=True,
+                metadata={"family_group_id": data.get("family_group_id")},
+            )
+            return {"status": 1, "message": "Calendar feed revoked", "payload": {"revoked": bool(revoked)}}, 200
+
+        except Exception as e:
+            AuditLogger.log(
+                user_id=uid,
+                action="REVOKE_CALENDAR_FEED",
+                resource_type="calendar_feeds",
+                resource_id=data.get("family_group_id") or uid,
+                success=False,
+                error_message="Failed to revoke calendar feed",
+                metadata={"error": str(e)},
+            )
+            return {"status": 0, "message": f"Failed to revoke calendar feed: {str(e)}", "payload": {}}, 500
+
+
+class GetCalendarFeed(Resource):
+    """Public ICS feed; the unguessable token in the URL is the credential."""
+
+    def get(self, token):
+        feed = DBHelper.find_one("calendar_feeds", filters={"token": token, "is_active": 1})
+        if not feed:
+            return Response("Calendar feed not found", status=404, mimetype="text/plain")
+
+        user_ids = feed_user_ids(feed)
+        if user_ids is None:
+            return Response("Calendar feed not found", status=404, mimetype="text/plain")
+
+        last_modified, etag = feed_validators(feed["user_id"], user_ids)
+        headers = {"Cache-Control": "private, max-age=0, must-revalidate"}
+
+        # Pollers revalidate; unchanged feeds cost one aggregate query
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304, headers=headers)
+        else:
+            name = "Dockly Family Planner" if feed.get("family_group_id") else "Dockly Planner"
+            response = Response(
+                stream_with_context(generate_feed(feed["user_id"], user_ids, name)),
+                mimetype="text/calendar",
+                headers={**headers, "Content-Disposition": 'inline; filename="dockly.ics"'},
+            )
+
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        return response
@@ -157,6 +157,28 @@ def update_outlook_calendar_event(
         raise e
 
 
+def delete_outlook_calendar_event(access_token, event_id):
+    """Delete a calendar event in Microsoft Outlook"""
+    try:
+        headers = get_outlook_headers(access_token)
+
+        url = f"{MS_GRAPH_BASE_URL}/me/events/{event_id}"
+        response = requests.delete(url, headers=headers)
+
+        # Already gone counts as deleted
+        if response.status_code in (204, 404):
+            return True
+        else:
+            print(
+                f"Error deleting Outlook event: {response.status_code} - {response.text}"
+            )
+            raise Exception(f"Failed to delete Outlook event: {response.text}")
+
+    except Exception as e:
+        print(f"Exception deleting Outlook event: {e}")
+        raise e
+
+
 def transform_outlook_event(event, account_color="#0078D4", source_email=""):
     """Transform Outlook event to unified format"""
     try:
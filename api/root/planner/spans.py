@@ -0,0 +1,251 @@
+"""
+Time spans for planner items.
+
+Events, goals and todos keep their user-facing `date` / `time` strings, but
+each row also stores a normalized `span` (tstzrange, UTC) computed when it is
+written. A GiST index on `span` turns "what overlaps this window for these
+users" into one indexed query, and readers format times straight from the
+span instead of re-parsing the strings on every request.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+from psycopg2 import sql
+from psycopg2.extras import DateTimeTZRange
+
+from root.db.dbHelper import DBHelper
+
+TIME_FORMATS = ["%I:%M %p", "%I:%M:%S %p", "%H:%M:%S", "%H:%M"]
+ALL_DAY_END_TIMES = ["11:59 PM", "11:59:59 PM"]
+
+DEFAULT_EVENT_START = time(9, 0)
+DEFAULT_EVENT_END = time(10, 0)
+
+# table -> columns needed to compute its span
+SPAN_SOURCES = {
+    "events": ["id", "date", "end_date", "start_time", "end_time"],
+    "goals": ["id", "date"],
+    "todos": ["id", "date"],
+}
+
+BACKFILL_BATCH = 1000
+
+# Tables this process has already backfilled; writers always set span
+_backfilled = set()
+
+
+def _utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def parse_day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_time(value):
+    if isinstance(value, time):
+        return value
+    if not value:
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def to_range(start_dt, end_dt=None):
+    """Half-open UTC range; naive datetimes are taken as UTC.
+
+    A zero-length item becomes the single instant so it still overlaps.
+    """
+    start_dt = _utc(start_dt)
+    end_dt = max(_utc(end_dt), start_dt) if end_dt else start_dt
+    return DateTimeTZRange(start_dt, end_dt, "[)" if end_dt > start_dt else "[]")
+
+
+def day_span(value):
+    """Whole-day span for goals / todos, None when the date can't be parsed."""
+    day = parse_day(value)
+    if not day:
+        return None
+    start_dt = datetime.combine(day, time.min)
+    return to_range(start_dt, start_dt + timedelta(days=1))
+
+
+def event_span(start_date, end_date, start_time, end_time):
+    """Span for an events row from its date / time strings.
+
+    "12:00 AM" - "11:59 PM" is the all-day form and covers the dates through
+    the end of `end_date`; unparseable times fall back to 09:00 - 10:00.
+    """
+    start_day = parse_day(start_date)
+    if not start_day:
+        return None
+    end_day = parse_day(end_date) or start_day
+
+    if start_time == "12:00 AM" and end_time in ALL_DAY_END_TIMES:
+        return to_range(
+            datetime.combine(start_day, time.min),
+            datetime.combine(end_day + timedelta(days=1), time.min),
+        )
+
+    return to_range(
+        datetime.combine(start_day, parse_time(start_time) or DEFAULT_EVENT_START),
+        datetime.combine(end_day, parse_time(end_time) or DEFAULT_EVENT_END),
+    )
+
+
+def _parse_bound(value):
+    value = str(value).strip()
+    if len(value) == 10:
+        return datetime.combine(datetime.strptime(value, "%Y-%m-%d").date(), time.min)
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_window(start=None, end=None):
+    """(start, end) UTC datetimes from ISO date / datetime strings.
+
+    Defaults to the current Monday-based week; a missing end is a week
+    after start and a bare end date covers that whole day. Raises
+    ValueError for unparseable input.
+    """
+    if start:
+        start_dt = _utc(_parse_bound(start))
+    else:
+        today = datetime.now(timezone.utc).date()
+        start_dt = _utc(datetime.combine(today - timedelta(days=today.weekday()), time.min))
+
+    if not end:
+        end_dt = start_dt + timedelta(days=7)
+    else:
+        end_dt = _utc(_parse_bound(end))
+        if len(str(end).strip()) == 10:
+            end_dt += timedelta(days=1)
+    if end_dt < start_dt:
+        raise ValueError("end must not be before start")
+    return start_dt, end_dt
+
+
+def span_for_row(table, row):
+    if table == "events":
+        return event_span(row.get("date"), row.get("end_date"), row.get("start_time"), row.get("end_time"))
+    return day_span(row.get("date"))
+
+
+def span_strings(span):
+    """(start, end) as "YYYY-MM-DDTHH:MM:SS" UTC strings, (None, None) if unset."""
+    if not span or span.lower is None:
+        return None, None
+    start_dt = span.lower.astimezone(timezone.utc)
+    end_dt = (span.upper or span.lower).astimezone(timezone.utc)
+    return start_dt.strftime("%Y-%m-%dT%H:%M:%S"), end_dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def attach_span_strings(rows):
+    """Replace each row's `span` with JSON-friendly `start_at` / `end_at` strings."""
+    for row in rows:
+        row["start_at"], row["end_at"] = span_strings(row.pop("span", None))
+    return rows
+
+
+def backfill_spans(table):
+    """Compute spans for rows written before the column existed.
+
+    Runs once per table per process; the partial `span IS NULL` index keeps
+    the lookup cheap once everything is filled in.
+    """
+    if table in _backfilled:
+        return 0
+
+    columns = SPAN_SOURCES[table]
+    filled = 0
+    last_id = ""
+    while True:
+        rows = DBHelper.raw_sql(
+            sql.SQL(
+                "SELECT {fields} FROM {table} WHERE span IS NULL AND id > %s ORDER BY id LIMIT %s"
+            ).format(
+                fields=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                table=sql.Identifier(table),
+            ),
+            (last_id, BACKFILL_BATCH),
+        )
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        ids, lowers, uppers = [], [], []
+        for row in rows:
+            span = span_for_row(table, row)
+            if span:
+                ids.append(row["id"])
+                lowers.append(span.lower)
+                uppers.append(span.upper)
+
+        if ids:
+            DBHelper.execute_query(
+                sql.SQL(
+                    """
+                    UPDATE {table} t SET span = tstzrange(v.lo, v.hi, CASE WHEN v.hi > v.lo THEN '[)' ELSE '[]' END)
+                    FROM UNNEST(%s::text[], %s::timestamptz[], %s::timestamptz[]) AS v(id, lo, hi)
+                    WHERE t.id = v.id
+                    """
+                ).format(table=sql.Identifier(table)),
+                (ids, lowers, uppers),
+            )
+            filled += len(ids)
+
+    _backfilled.add(table)
+    return filled
+
+
+def load_range(table, select_fields, window_start, window_end, user_ids=None,
+               tagged_uid=None, filters=None):
+    """Active rows of `table` whose span overlaps [window_start, window_end).
+
+    Rows belong to `user_ids`; with `tagged_uid`, rows tagging that user
+    (tagged_ids) are included too. One query on the span GiST index.
+    """
+    backfill_spans(table)
+
+    owner_conditions = []
+    params = [to_range(window_start, window_end)]
+    if user_ids:
+        owner_conditions.append(sql.SQL("user_id = ANY(%s)"))
+        params.append(list(user_ids))
+    if tagged_uid:
+        owner_conditions.append(sql.SQL("%s = ANY(tagged_ids)"))
+        params.append(tagged_uid)
+    if not owner_conditions:
+        return []
+
+    conditions = [
+        sql.SQL("span && %s"),
+        sql.SQL("is_active = 1"),
+        sql.SQL("({})").format(sql.SQL(" OR ").join(owner_conditions)),
+    ]
+    for key, val in (filters or {}).items():
+        conditions.append(sql.SQL("{key} = %s").format(key=sql.Identifier(key)))
+        params.append(val)
+
+    query = sql.SQL(
+        "SELECT {fields}, span FROM {table} WHERE {where} ORDER BY lower(span)"
+    ).format(
+        fields=sql.SQL(", ").join(map(sql.Identifier, select_fields)),
+        table=sql.Identifier(table),
+        where=sql.SQL(" AND ").join(conditions),
+    )
+    return attach_span_strings(DBHelper.raw_sql(query, params))
@@ -0,0 +1,352 @@
+"""
+Recurrence rules shared by planner events, home maintenance, wellness tasks,
+family chores and meals.
+
+A series is stored once in `recurrence_rules` as an RFC 5545 RRULE plus its
+DTSTART; occurrences are expanded lazily for the window being read, with
+per-occurrence exceptions (cancellations) and overrides (moved / edited
+instances) kept in `recurrence_overrides`.
+"""
+
+import heapq
+import json
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from dateutil.rrule import rrulestr
+
+from root.db.dbHelper import DBHelper
+
+# Source type -> table of the items a series belongs to
+SOURCE_TABLES = {
+    "event": "events",
+    "goal": "goals",
+    "todo": "todos",
+    "maintenance": "property_maintenance",
+    "wellness": "wellness_tasks",
+    "chore": "chores",
+    "meal": "meals",
+}
+SOURCE_TYPES = tuple(SOURCE_TABLES)
+
+# Upper bound when walking a COUNT/UNTIL rule to find its last occurrence
+MAX_SERIES_LENGTH = 5000
+
+
+def _to_datetime(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value).replace("Z", "")).replace(tzinfo=None)
+
+
+def parse_rule(rule_text, dtstart):
+    """Build a dateutil rrule from an RRULE string ("RRULE:" prefix optional)."""
+    if not rule_text or not str(rule_text).strip():
+        raise ValueError("Recurrence rule is empty")
+
+    text = str(rule_text).strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+
+    try:
+        return rrulestr(text, dtstart=_to_datetime(dtstart), ignoretz=True)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid recurrence rule '{rule_text}': {str(e)}")
+
+
+def _series_end(rule_text, rule):
+    """Last occurrence of a bounded rule, None for open-ended series."""
+    upper = str(rule_text).upper()
+    if "COUNT=" not in upper and "UNTIL=" not in upper:
+        return None
+
+    last = None
+    for last in islice(rule, MAX_SERIES_LENGTH):
+        pass
+    return last
+
+
+def rule_input_error(data):
+    """Validate the optional rrule fields of a write request; returns an error message or None."""
+    rule_text = (data or {}).get("rrule")
+    if not rule_text:
+        return None
+    try:
+        parse_rule(rule_text, data.get("rrule_start") or datetime.now())
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def _owns_source(user_id, source_type, source_id):
+    rows = DBHelper.raw_sql(
+        f"""
+        SELECT 1 FROM {SOURCE_TABLES[source_type]}
+        WHERE id::text = %s AND user_id = %s AND is_active = 1
+        """,
+        (str(source_id), user_id),
+    )
+    return bool(rows)
+
+
+def set_rule(user_id, source_type, source_id, rule_text, dtstart,
+             duration_minutes=None, timezone=None):
+    """Create or replace the rule for a series (one row per source item).
+
+    `user_id` has to own the active source item, otherwise ValueError is
+    raised; a rule owned by someone else is left untouched and None is
+    returned.
+    """
+    if source_type not in SOURCE_TYPES:
+        raise ValueError(f"Unsupported recurrence source: {source_type}")
+    if not _owns_source(user_id, source_type, source_id):
+        raise ValueError(f"No {source_type} {source_id} found for this user")
+
+    dtstart = _to_datetime(dtstart)
+    rule = parse_rule(rule_text, dtstart)
+    until_at = _series_end(rule_text, rule)
+    now = datetime.now()
+
+    rows = DBHelper.execute_query(
+        """
+        INSERT INTO recurrence_rules (
+            user_id, source_type, source_id, rrule, dtstart, until_at,
+            duration_minutes, timezone, is_active, created_at, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, %s, %s)
+        ON CONFLICT (source_type, source_id) DO UPDATE SET
+            rrule = EXCLUDED.rrule,
+            dtstart = EXCLUDED.dtstart,
+            until_at = EXCLUDED.until_at,
+            duration_minutes = EXCLUDED.duration_minutes,
+            timezone = EXCLUDED.timezone,
+            is_active = 1,
+            updated_at = EXCLUDED.updated_at
+        WHERE recurrence_rules.user_id = EXCLUDED.user_id
+        RETURNING *
+        """,
+        (
+            user_id,
+            source_type,
+            str(source_id),
+            str(rule_text).strip(),
+            dtstart,
+            until_at,
+            duration_minutes,
+            timezone,
+            now,
+            now,
+        ),
+    )
+    return rows[0] if rows else None
+
+
+def clear_rule(user_id, source_type, source_id):
+    """Stop `user_id`'s series recurring; the source item itself is left untouched."""
+    return DBHelper.update_all(
+        "recurrence_rules",
+        filters={"user_id": user_id, "source_type": source_type, "source_id": str(source_id)},
+        updates={"is_active": 0, "updated_at": datetime.now()},
+    )
+
+
+def sync_rule_from_input(user_id, source_type, source_id, data,
+                         default_dtstart=None, duration_minutes=None):
+    """Apply the optional `rrule` / `rrule_start` fields of a write request.
+
+    Absent `rrule` leaves any existing rule alone, an empty one clears it.
+    """
+    if not data or "rrule" not in data:
+        return None
+    if not data.get("rrule"):
+        clear_rule(user_id, source_type, source_id)
+        return None
+
+    dtstart = data.get("rrule_start") or default_dtstart or datetime.now()
+    return set_rule(
+        user_id,
+        source_type,
+        source_id,
+        data["rrule"],
+        dtstart,
+        duration_minutes=data.get("duration_minutes", duration_minutes),
+        timezone=data.get("timezone"),
+    )
+
+
+def set_override(rule_id, occurrence_start, cancelled=False,
+                 new_start=None, new_end=None, fields=None):
+    """Cancel (exception) or reschedule/edit (override) a single occurrence."""
+    now = datetime.now()
+    rows = DBHelper.execute_query(
+        """
+        INSERT INTO recurrence_overrides (
+            rule_id, occurrence_start, is_cancelled, new_start, new_end,
+            fields, created_at, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (rule_id, occurrence_start) DO UPDATE SET
+            is_cancelled = EXCLUDED.is_cancelled,
+            new_start = EXCLUDED.new_start,
+            new_end = EXCLUDED.new_end,
+            fields = EXCLUDED.fields,
+            updated_at = EXCLUDED.updated_at
+        RETURNING *
+        """,
+        (
+            rule_id,
+            _to_datetime(occurrence_start),
+            bool(cancelled),
+            _to_datetime(new_start),
+            _to_datetime(new_end),
+            json.dumps(fields or {}),
+            now,
+            now,
+        ),
+    )
+    return rows[0] if rows else None
+
+
+def expand(rule, window_start, window_end, overrides=None):
+    """Lazily yield the occurrences of one rule row that overlap the window.
+
+    Occurrences are yielded in start order. `overrides` maps an original
+    occurrence start to its override row.
+    """
+    window_start = _to_datetime(window_start)
+    window_end = _to_datetime(window_end)
+    overrides = overrides or {}
+    duration = timedelta(minutes=rule.get("duration_minutes") or 0)
+    series = parse_rule(rule["rrule"], rule["dtstart"])
+
+    def occurrence(original_start, override=None):
+        start = original_start
+        end = original_start + duration
+        fields = {}
+        if override:
+            start = override.get("new_start") or start
+            end = override.get("new_end") or (start + duration)
+            fields = override.get("fields") or {}
+        return {
+            "rule_id": rule["id"],
+            "source_type": rule["source_type"],
+            "source_id": rule["source_id"],
+            "user_id": rule["user_id"],
+            "recurrence_id": original_start.isoformat(),
+            "start": start,
+            "end": end,
+            "is_override": bool(override),
+            "fields": fields,
+        }
+
+    def overlaps(item):
+        return item["start"] <= window_end and item["end"] >= window_start
+
+    def generate():
+        seen = set()
+        moved_in = sorted(
+            (o for o in overrides.values()
+             if not o.get("is_cancelled") and o.get("new_start")),
+            key=lambda o: o["new_start"],
+        )
+
+        for original_start in series.xafter(window_start - duration, inc=True):
+            if original_start > window_end:
+                break
+            seen.add(original_start)
+            override = overrides.get(original_start)
+            if override and override.get("is_cancelled"):
+                continue
+            item = occurrence(original_start, override)
+            if overlaps(item):
+                yield item
+
+        # Instances moved into the window from outside the expanded range
+        for override in moved_in:
+            if override["occurrence_start"] in seen:
+                continue
+            item = occurrence(override["occurrence_start"], override)
+            if overlaps(item):
+                yield item
+
+    # Overrides can move instances around, so keep the per-rule stream ordered
+    return iter(sorted(generate(), key=lambda item: item["start"])) if overrides else generate()
+
+
+def load_rules(user_ids, window_start, window_end, source_types=None):
+    """Active rules for the users whose series can produce occurrences in the
+    window; series of deleted (inactive) source items are left out."""
+    source_active = "\n              ".join(
+        f"WHEN '{source_type}' THEN EXISTS (SELECT 1 FROM {table} s"
+        f" WHERE s.id::text = r.source_id AND s.is_active = 1)"
+        for source_type, table in SOURCE_TABLES.items()
+    )
+    query = f"""
+        SELECT r.* FROM recurrence_rules r
+        WHERE r.user_id = ANY(%s)
+          AND r.is_active = 1
+          AND r.dtstart <= %s
+          AND (r.until_at IS NULL
+               OR r.until_at + make_interval(mins => COALESCE(r.duration_minutes, 0)) >= %s)
+          AND CASE r.source_type
+              {source_active}
+              ELSE FALSE
+          END
+    """
+    params = [list(user_ids), _to_datetime(window_end), _to_datetime(window_start)]
+    if source_types:
+        query += " AND r.source_type = ANY(%s)"
+        params.append(list(source_types))
+    return DBHelper.raw_sql(query, params)
+
+
+def load_overrides(rule_ids, window_start, window_end):
+    """{rule_id: {occurrence_start: override}} for overrides touching the window."""
+    if not rule_ids:
+        return {}
+    rows = DBHelper.raw_sql(
+        """
+        SELECT * FROM recurrence_overrides
+        WHERE rule_id = ANY(%s)
+          AND (occurrence_start BETWEEN %s AND %s
+               OR new_start BETWEEN %s AND %s
+               OR new_end BETWEEN %s AND %s)
+        """,
+        [list(rule_ids)] + [_to_datetime(window_start), _to_datetime(window_end)] * 3,
+    )
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row["rule_id"], {})[row["occurrence_start"]] = row
+    return grouped
+
+
+def occurrences(user_ids, window_start, window_end, source_types=None, limit=None):
+    """All occurrences for the users in the window, merged in start order.
+
+    Two queries (rules + overrides) regardless of series length; the
+    per-rule expansions are merged lazily so `limit` stops early.
+    """
+    window_start = _to_datetime(window_start)
+    window_end = _to_datetime(window_end)
+
+    rules = load_rules(user_ids, window_start, window_end, source_types)
+    overrides = load_overrides([rule["id"] for rule in rules], window_start, window_end)
+
+    streams = [
+        expand(rule, window_start, window_end, overrides.get(rule["id"]))
+        for rule in rules
+    ]
+    merged = heapq.merge(*streams, key=lambda item: item["start"])
+    return islice(merged, limit) if limit else merged
+
+
+def serialize_occurrence(item):
+    return {
+        **item,
+        "start": item["start"].isoformat(),
+        "end": item["end"].isoformat(),
+    }
@@ -1,4 +1,3 @@
-import io
 import json
 import json
 import random
@@ -19,7 +18,7 @@ from root.utilis import (
     uniqueId,
 )
 from werkzeug.utils import secure_filename
-from googleapiclient.http import MediaIoBaseUpload
+from root.files import uploads
 from root.files.models import DriveBaseResource
 from root.helpers.logs import AuditLogger
 from flask_restful import Resource
@@ -2032,11 +2031,7 @@ class UploadProfilePicture(DriveBaseResource):
                 "name": secure_filename(file.filename),
                 "parents": [profile_id],
             }
-            media = MediaIoBaseUpload(
-                io.BytesIO(file.read()),
-                mimetype=file.content_type or "application/octet-stream",
-                resumable=True,
-            )
+            media = uploads.drive_media(file)
 
             uploaded_file = (
                 service.files()
@@ -10,6 +10,8 @@ import requests
 from root.helpers.logs import AuditLogger
 from root.config import CLIENT_ID, CLIENT_SECRET, SCOPE, WEB_URL, uri
 from root.db.dbHelper import DBHelper
+from root import drive_folders
+from root.helpers.datetime_parser import extract_datetime as parse_natural_datetime
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 
@@ -121,6 +123,36 @@ def uniqueId(digit=4, isNum=False, ref={}, prefix=None, suffix=None):
         return _id
 
 
+
+def uniqueIds(count, digit=4, isNum=False, prefix=None, suffix=None):
+    """`count` ids reserved in the uuid table at once, like uniqueId.
+
+    Candidates are inserted together and the ones already taken are skipped
+    by the primary key, so a batch usually costs a single round trip.
+    """
+    ids = []
+    while len(ids) < count:
+        candidates = set()
+        while len(candidates) < count - len(ids):
+            _id = numGenerator(digit) if isNum else alphaNumGenerator(digit)
+            if prefix is not None:
+                _id = f"{prefix}X{_id}"
+            if suffix is not None:
+                _id = f"{_id}X{suffix}"
+            candidates.add(_id)
+
+        rows = DBHelper.execute_query(
+            """
+            INSERT INTO uuid (uid, created_at)
+            SELECT c, NOW() AT TIME ZONE 'UTC' FROM unnest(%s::varchar[]) AS c
+            ON CONFLICT (uid) DO NOTHING
+            RETURNING uid
+            """,
+            (sorted(candidates),),
+        )
+        ids.extend(r["uid"] for r in rows)
+    return ids
+
 def create_calendar_event(user_id, title, start_dt, end_dt=None, attendees=None):
     try:
         user_cred = DBHelper.find_one(
@@ -259,151 +291,85 @@ def delete_calendar_event(user_id, calendar_event_id):
         return False  # still continue with DB deletion
 
 
-def extract_datetime(text: str, now: datetime | None = None) -> datetime:
-    from datetime import datetime, timedelta, time
-    import pytz, re
-    from dateparser.search import search_dates
+def add_calendar_guests(user_id, calendar_event_id, guest_emails):
+    """
+    Adds new guests to an existing Google Calendar event.
 
-    us_tz = pytz.timezone("America/New_York")
-    now = now.astimezone(us_tz) if now else datetime.now(us_tz)
+    user_id: ID of the goal creator (the owner of the event)
+    calendar_event_id: google_calendar_id stored in your DB
+    guest_emails: list of email addresses to add as guests
+    """
+    try:
+        if not guest_emails:
+            return None
 
-    DEFAULT_HOUR = 10
-    DEFAULT_MINUTE = 0
+        # 1. Get creator's connected account credentials
+        user_cred = DBHelper.find_one(
+            "connected_accounts",
+            filters={"user_id": user_id},
+            select_fields=["access_token", "refresh_token", "email"],
+        )
+        if not user_cred:
+            raise Exception("No connected Google account found.")
 
-    cleaned_text = re.sub(r"@+\w+", "", text).strip()
+        creds = Credentials(
+            token=user_cred["access_token"],
+            refresh_token=user_cred["refresh_token"],
+            token_uri=uri,
+            client_id=CLIENT_ID,
+            client_secret=CLIENT_SECRET,
+            scopes=SCOPE.split(),
+        )
 
-    time_regex_12h = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b", re.I)
-    time_regex_24h = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+        service = build("calendar", "v3", credentials=creds)
 
-    time_match = time_regex_12h.search(cleaned_text) or time_regex_24h.search(
-        cleaned_text
-    )
+        # 2. Fetch the existing event
+        event = (
+            service.events().get(calendarId="primary", eventId=calendar_event_id).execute()
+        )
 
-    explicit_hour = explicit_minute = None
-    if time_match:
-        explicit_hour = int(time_match.group(1))
-        explicit_minute = int(time_match.group(2) or 0)
+        # 3. Merge current attendees with new guests (avoid duplicates)
+        existing_attendees = event.get("attendees", [])
+        for email in guest_emails:
+            if not any(att.get("email") == email for att in existing_attendees):
+                existing_attendees.append({"email": email})
 
-        meridian = (
-            time_match.group(3).lower()
-            if len(time_match.groups()) >= 3 and time_match.group(3)
-            else None
-        )
-        if meridian == "pm" and explicit_hour != 12:
-            explicit_hour += 12
-        if meridian == "am" and explicit_hour == 12:
-            explicit_hour = 0
-
-    custom_formats = [
-        r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b",
-        r"\b\d{1,2}(st|nd|rd|th)?\s+\w+\b",
-        r"\bon\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
-        r"\b(this|next)?\s*(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
-        r"\b\d{1,2}(st|nd|rd|th)\b",
-    ]
-
-    for pattern in custom_formats:
-        match = re.search(pattern, cleaned_text, re.I)
-        if not match:
-            continue
-
-        date_part = match.group(0).strip()
-
-        if re.fullmatch(r"\d{1,2}[./-]\d{1,2}[./-]\d{2,4}", date_part):
-            day_str, month_str, year_str = re.split(r"[./-]", date_part)
-            day = int(day_str)
-            month = int(month_str)
-            year = int(year_str)
-            if year < 100:
-                year += 2000 if year < 70 else 1900
-
-            hour = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
-            minute = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
-
-            try:
-                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
-            except ValueError:
-                pass
-            else:
-                return candidate
-
-        if re.fullmatch(r"\d{1,2}(st|nd|rd|th)", date_part, re.I):
-            day = int(re.sub(r"(st|nd|rd|th)", "", date_part, flags=re.I))
-            hour = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
-            minute = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
-            year, month = now.year, now.month
-            try:
-                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
-            except ValueError:
-                month += 1
-                if month == 13:
-                    month, year = 1, year + 1
-                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
-
-            if candidate < now:
-                month += 1
-                if month == 13:
-                    month, year = 1, year + 1
-                candidate = us_tz.localize(datetime(year, month, day, hour, minute))
-
-            return candidate
-
-        hh = explicit_hour if explicit_hour is not None else DEFAULT_HOUR
-        mm = explicit_minute if explicit_minute is not None else DEFAULT_MINUTE
-        full_phrase = f"{date_part} {hh}:{mm:02d}"
-
-        parsed = search_dates(
-            full_phrase,
-            settings={
-                "PREFER_DATES_FROM": "future",
-                "RELATIVE_BASE": now,
-                "TIMEZONE": "America/New_York",
-                "TO_TIMEZONE": "America/New_York",
-                "RETURN_AS_TIMEZONE_AWARE": True,
-                "DATE_ORDER": "DMY",
-            },
+        event["attendees"] = existing_attendees
+
+        # Keep guest permissions consistent
+        event["guestsCanModify"] = True
+        event["guestsCanInviteOthers"] = True
+        event["guestsCanSeeOtherGuests"] = True
+
+        # 4. Update the event with sendUpdates='all'
+        updated_event = (
+            service.events()
+            .update(
+                calendarId="primary",
+                eventId=calendar_event_id,
+                body=event,
+                sendUpdates="all",
+            )
+            .execute()
         )
-        if parsed:
-            return parsed[0][1].astimezone(us_tz)
-
-    if explicit_hour is not None:
-        target_date = now.date()
-        # Detect words like "tomorrow" or "day after"
-        if "tomorrow" in cleaned_text.lower():
-            target_date += timedelta(days=1)
-        elif "day after" in cleaned_text.lower():
-            target_date += timedelta(days=2)
-        elif "next" in cleaned_text.lower():
-            target_date += timedelta(days=7)
-
-        combined = us_tz.localize(
-            datetime.combine(target_date, time(explicit_hour, explicit_minute))
+
+        return updated_event.get("id")
+        
+    except Exception as e:
+        AuditLogger.log(
+            user_id=user_id,
+            action="add_calendar_guests",
+            resource_type="calendar_event",
+            resource_id=calendar_event_id,
+            success=False,
+            error_message="Failed to add calendar guests",
+            metadata={"guest_emails": guest_emails, "error": str(e)},
         )
-        if combined < now:
-            combined += timedelta(days=1)
-        return combined
-
-    results = search_dates(
-        cleaned_text,
-        settings={
-            "PREFER_DATES_FROM": "future",
-            "RELATIVE_BASE": now,
-            "TIMEZONE": "America/New_York",
-            "TO_TIMEZONE": "America/New_York",
-            "RETURN_AS_TIMEZONE_AWARE": True,
-            "DATE_ORDER": "DMY",
-        },
-    )
+        raise e
 
-    if results:
-        dt = results[0][1].astimezone(us_tz)
-        if dt.hour == 0 and dt.minute == 0 and explicit_hour is None:
-            dt = dt.replace(hour=DEFAULT_HOUR, minute=DEFAULT_MINUTE)
-        if dt < now:
-            dt += timedelta(days=1)
-        return dt
 
-    return now
+def extract_datetime(text: str, now: datetime | None = None) -> datetime:
+    return parse_natural_datetime(text, now)
 
 
 from user_agents import parse
@@ -450,154 +416,34 @@ def get_device_info():
 
 #     return {"status": "Notification sent"}
 
-import io
 import traceback
 from werkzeug.utils import secure_filename
-from googleapiclient.http import MediaIoBaseUpload
-
-
-def ensure_drive_folder_structure(service, user_id, storage_account_id, root_name="DOCKLY", subfolders=None):
-    if subfolders is None:
-        subfolders = ["Home", "Family", "Finance", "Health", "Planner"]
-
-    def find_or_create_folder(name, parent_id=None, parent_db_id=None):
-        # Search for folder in Google Drive
-        query = f"name='{name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        if parent_id:
-            query += f" and '{parent_id}' in parents"
-        else:
-            query += " and 'root' in parents"
-
-        response = service.files().list(q=query, fields="files(id, name, modifiedTime)").execute()
-        files = response.get("files", [])
-
-        if files:
-            folder = files[0]
-            folder_id = folder["id"]
-            modified_time = folder.get("modifiedTime")
-        else:
-            # Create folder in Google Drive
-            folder_metadata = {
-                "name": name,
-                "mimeType": "application/vnd.google-apps.folder",
-            }
-            if parent_id:
-                folder_metadata["parents"] = [parent_id]
-
-            folder = service.files().create(body=folder_metadata, fields="id, name, modifiedTime,webViewLink").execute()
-            folder_id = folder["id"]
-            modified_time = folder.get("modifiedTime")
-            web_link = folder.get("webViewLink") or folder["name"]
-        # Check if already in files_index
-        existing = DBHelper.find_one(
-            table_name="files_index",
-            filters={"external_file_id": folder_id, "user_id": user_id}
-        )
-
-        if existing:
-            db_id = existing["id"]
-        else:
-            db_id = str(uuid.uuid4())
-            DBHelper.insert(
-                table_name="files_index",
-                id=db_id,
-                user_id=user_id,
-                storage_account_id=storage_account_id,
-                file_path=web_link,
-                file_name=name,
-                file_size=0,
-                file_type="folder",
-                mime_type="application/vnd.google-apps.folder",
-                is_folder=True,
-                parent_folder_id=parent_db_id,
-                external_file_id=folder_id,
-                last_modified=modified_time or datetime.now().isoformat(),
-                created_at=datetime.now().isoformat(),
-                indexed_at=datetime.now().isoformat(),
-            )
 
-        return folder_id, db_id
 
-    # Ensure root folder
-    root_folder_id, root_db_id = find_or_create_folder(root_name)
+def ensure_drive_folder_structure(service, user_id, storage_account_id, root_name="DOCKLY", subfolders=None,
+                                  refresh=False):
+    """DOCKLY root and hub folders (Google and files_index ids), served from
+    the account's folder map; see root.drive_folders."""
+    return drive_folders.ensure_structure(
+        service, user_id, storage_account_id, root_name=root_name, subfolders=subfolders, refresh=refresh
+    )
 
-    # Ensure subfolders
-    folder_ids = {}
-    folder_db_ids = {}
-    for name in subfolders:
-        g_id, db_id = find_or_create_folder(name, parent_id=root_folder_id, parent_db_id=root_db_id)
-        folder_ids[name] = g_id
-        folder_db_ids[name] = db_id
 
-    return {
-        "root": root_folder_id,
-        "root_db": root_db_id,
-        "subfolders": folder_ids,       # Google IDs
-        "subfolders_db": folder_db_ids  # DB UUIDs
-    }
+def get_or_create_subfolder(service, folder_name: str, parent_google_id: str, parent_db_id: str = None,
+                            user_id: str = None, storage_account_id: str = None, refresh=False):
+    """Subfolder of a Drive folder, created if missing.
 
-
-def get_or_create_subfolder(service, folder_name: str, parent_google_id: str, parent_db_id: str,
-                            user_id: str, storage_account_id: str):
-    """Check if a subfolder exists under parent, else create it.
-       Always ensure it's in files_index and return both IDs.
+    With a storage account it is cached in the folder map and indexed in
+    files_index, returning both ids; without one (profile pictures) only the
+    Google id is returned.
     """
-    # Check in Google Drive
-    query = (
-        f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' "
-        f"and '{parent_google_id}' in parents and trashed = false"
+    if storage_account_id is None:
+        return drive_folders.find_or_create(service, folder_name, parent_google_id)["id"]
+    return drive_folders.subfolder(
+        service, user_id, storage_account_id, folder_name, parent_google_id,
+        parent_db_id=parent_db_id, refresh=refresh,
     )
-    response = service.files().list(q=query, fields="files(id, name, modifiedTime)").execute()
-    folders = response.get("files", [])
 
-    if folders:
-        folder = folders[0]
-        folder_id = folder["id"]
-        modified_time = folder.get("modifiedTime")
-    else:
-        # Create in Google Drive
-        metadata = {
-            "name": folder_name,
-            "mimeType": "application/vnd.google-apps.folder",
-            "parents": [parent_google_id],
-        }
-        folder = service.files().create(body=metadata, fields="id, name, modifiedTime,webViewLink").execute()
-        folder_id = folder["id"]
-        modified_time = folder.get("modifiedTime")
-        web_link = folder.get("webViewLink") or folder["name"]
-
-    # Check if already in files_index
-    existing = DBHelper.find_one(
-        table_name="files_index",
-        filters={"external_file_id": folder_id, "user_id": user_id}
-    )
-
-    if existing:
-        db_id = existing["id"]
-    else:
-        db_id = str(uuid.uuid4())
-        DBHelper.insert(
-            table_name="files_index",
-            id=db_id,
-            user_id=user_id,
-            storage_account_id=storage_account_id,
-            file_path=folder_name,
-            file_name=web_link,
-            file_size=0,
-            file_type="folder",
-            mime_type="application/vnd.google-apps.folder",
-            is_folder=True,
-            parent_folder_id=parent_db_id,
-            external_file_id=folder_id,
-            last_modified=modified_time or datetime.now().isoformat(),
-            created_at=datetime.now().isoformat(),
-            indexed_at=datetime.now().isoformat(),
-        )
-
-    return {
-        "google_id": folder_id,
-        "db_id": db_id
-    }
 
 def upload_file_to_hub_folder(service, file, hub_name, user_id, storage_account_id):
     try:
@@ -618,11 +464,10 @@ def upload_file_to_hub_folder(service, file, hub_name, user_id, storage_account_
             "name": secure_filename(file.filename),
             "parents": [parent_google_id],
         }
-        media = MediaIoBaseUpload(
-            io.BytesIO(file.read()),
-            mimetype=file.content_type or "application/octet-stream",
-            resumable=True,
-        )
+        # (imported here: root.files imports this module)
+        from root.files import uploads
+
+        media = uploads.drive_media(file)
 
         # Upload to Google Drive
         uploaded_file = (
@@ -650,6 +495,7 @@ def upload_file_to_hub_folder(service, file, hub_name, user_id, storage_account_
             is_folder=False,
             parent_folder_id=parent_db_id,      # DB UUID of hub folder
             external_file_id=uploaded_file["id"],  # Google Drive ID
+            external_parent_id=parent_google_id,
             last_modified=uploaded_file.get("modifiedTime", datetime.now().isoformat()),
             created_at=datetime.now().isoformat(),
             indexed_at=datetime.now().isoformat(),
@@ -670,15 +516,6 @@ def upload_file_to_hub_folder(service, file, hub_name, user_id, storage_account_
         }
 
 
-def get_or_create_subfolder(service, folder_name: str, parent_id: str):
-    """Check if a folder with name exists under parent, else create it"""
-    query = (
-        f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' "
-        f"and '{parent_id}' in parents and trashed = false"
-    )
-
-
-
 FAMILY_MEMBER_COLORS = [
     "#FFD1DC",  # Pastel Pink
     "#FFECB3",  # Pastel Yellow
@@ -704,21 +541,21 @@ FAMILY_MEMBER_COLORS = [
 
 
 def assign_family_member_color(group_id: str, fm_user_id: str, uid: str) -> str:
-    existing_members = DBHelper.find_all(
-        table_name="family_members",
-        filters={"family_group_id": group_id},
-        select_fields=["fm_user_id", "color"],
+    """Color for `fm_user_id` within the group; a member keeps their color.
+
+    Allocation runs in the database (allocate_family_color): the group's
+    used colors are a bitmap over FAMILY_MEMBER_COLORS on its
+    family_group_colors row, locked while the lowest free bit is taken, so
+    concurrent accepts get distinct colors. A member's color is freed once
+    they have no active row in the group (deleted or deactivated) and is
+    reused. Without `fm_user_id` the lowest free color is returned but not
+    reserved. Returns None once the palette is exhausted.
+    """
+    rows = DBHelper.execute_query(
+        "SELECT allocate_family_color(%s, %s, %s) AS color",
+        (group_id, fm_user_id or None, FAMILY_MEMBER_COLORS),
     )
-
-    used_colors = {m["color"] for m in existing_members if m.get("color")}
-    # if this fm_user_id already has a color, return it (avoid reassigning)
-    for m in existing_members:
-        if m["fm_user_id"] == fm_user_id and m.get("color"):
-            return m["color"]
-
-    for c in FAMILY_MEMBER_COLORS:
-        if c not in used_colors:
-            return c
+    return rows[0]["color"] if rows else None
 
 
 def format_timestamp(dt):